@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""build_cache.py — content-addressed cache of builder outputs.
+
+A cache key is a sha256 over the staged project tree (which includes its
+setup.sh and deps.json), the builder name, the builder image digest and the
+container entrypoint (data/start.sh). A hit restores out/<project> straight
+from the cache so build_artifact.sh can skip the container entirely.
+
+Entries live under BUILD_CACHE_DIR (default $WORKING_DIR/cache/builds):
+
+    <key>/entry.json   size + timestamps; its mtime is the LRU clock
+    <key>/out/         the builder output tree
+
+Usage (from build_artifact.sh):
+    build_cache.py key <src_dir> --builder B --image-id ID [--start-script F]
+    build_cache.py restore <key> <dest_dir>     exit 0 on hit, 3 on miss
+    build_cache.py save <key> <out_dir>
+    build_cache.py prune [--max-mb N]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import env_number, link_tree, tree_size  # noqa: E402
+
+CACHE_FORMAT = "repcid-build-cache-v1"
+DEFAULT_CACHE_DIR = os.getenv("BUILD_CACHE_DIR") or os.path.join(WORKING_DIR, "cache", "builds")
+DEFAULT_MAX_MB = 4096
+ENTRY_FILE = "entry.json"
+MISS_EXIT = 3
+
+_CHUNK = 1 << 20
+
+
+def _file_digest(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tree_digest(root: str) -> str:
+    """Hash a directory tree by path, type, executable bit and content.
+
+    Timestamps and ownership are deliberately ignored so that re-staging an
+    unchanged project yields the same digest.
+    """
+    h = hashlib.sha256()
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        rel_dir = os.path.relpath(dirpath, root)
+        for name in sorted(files + [d for d in dirs if os.path.islink(os.path.join(dirpath, d))]):
+            full = os.path.join(dirpath, name)
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            if os.path.islink(full):
+                record = f"L {rel} {os.readlink(full)}"
+            else:
+                exe = "x" if os.stat(full).st_mode & 0o111 else "-"
+                record = f"F {rel} {exe} {_file_digest(full)}"
+            h.update(record.encode() + b"\0")
+        for name in dirs:
+            if not os.path.islink(os.path.join(dirpath, name)):
+                h.update(f"D {os.path.normpath(os.path.join(rel_dir, name))}".encode() + b"\0")
+    return h.hexdigest()
+
+
+def cache_key(src_dir: str, builder: str, image_id: str, start_script: str = None) -> str:
+    """Combine everything that determines a build's output into one key."""
+    h = hashlib.sha256()
+    h.update(f"{CACHE_FORMAT}\0{builder}\0{image_id}\0".encode())
+    if start_script and os.path.isfile(start_script):
+        h.update(_file_digest(start_script).encode())
+    h.update(b"\0" + tree_digest(src_dir).encode())
+    return h.hexdigest()
+
+
+def restore(cache_dir: str, key: str, dest: str) -> bool:
+    """Restore a cached output tree to dest. Returns False on a miss."""
+    entry = os.path.join(cache_dir, key)
+    if not os.path.isfile(os.path.join(entry, ENTRY_FILE)):
+        return False
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    link_tree(os.path.join(entry, "out"), dest)
+    # Touch the entry so LRU eviction sees it as recently used
+    os.utime(os.path.join(entry, ENTRY_FILE))
+    return True
+
+
+def save(cache_dir: str, key: str, out_dir: str, builder: str = "") -> bool:
+    """Store out_dir under key. Returns False if the entry already existed."""
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return False
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=cache_dir)
+    try:
+        link_tree(out_dir, os.path.join(tmp, "out"))
+        with open(os.path.join(tmp, ENTRY_FILE), "w") as f:
+            json.dump({
+                "key": key,
+                "builder": builder,
+                "size": tree_size(os.path.join(tmp, "out")),
+                "created": int(time.time()),
+            }, f, indent=4)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # A concurrent build stored the same key first; theirs is as good as ours
+            return False
+    finally:
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+    return True
+
+
+def entries(cache_dir: str) -> list:
+    """List cache entries as (last_used, size, key), least recently used first."""
+    result = []
+    if not os.path.isdir(cache_dir):
+        return result
+    for key in os.listdir(cache_dir):
+        meta = os.path.join(cache_dir, key, ENTRY_FILE)
+        if key.startswith(".") or not os.path.isfile(meta):
+            continue
+        try:
+            with open(meta) as f:
+                size = int(json.load(f).get("size", 0))
+        except (OSError, ValueError):
+            size = 0
+        result.append((os.path.getmtime(meta), size, key))
+    result.sort()
+    return result
+
+
+def prune(cache_dir: str, max_bytes: int) -> list:
+    """Evict least recently used entries until the cache fits max_bytes."""
+    current = entries(cache_dir)
+    total = sum(size for _, size, _ in current)
+    evicted = []
+    for _, size, key in current:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total -= size
+        evicted.append(key)
+    return evicted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repman build output cache")
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Cache directory (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("key", help="Print the cache key for a staged project")
+    sp.add_argument("src_dir", help="Staged project directory (src/<project>)")
+    sp.add_argument("--builder", required=True, help="Builder name, e.g. ubuntu_amd64")
+    sp.add_argument("--image-id", required=True, help="Builder image digest")
+    sp.add_argument("--start-script", default=None, help="Container entrypoint script")
+
+    sp = sub.add_parser("restore", help="Restore a cached build output")
+    sp.add_argument("key")
+    sp.add_argument("dest_dir", help="Destination (out/<project>)")
+
+    sp = sub.add_parser("save", help="Store a build output in the cache")
+    sp.add_argument("key")
+    sp.add_argument("out_dir", help="Build output directory (out/<project>)")
+    sp.add_argument("--builder", default="", help="Builder name recorded with the entry")
+
+    sp = sub.add_parser("prune", help="Evict least recently used entries over the size cap")
+    sp.add_argument(
+        "--max-mb",
+        type=int,
+        default=None,
+        help=f"Cache size cap in MiB (default: BUILD_CACHE_MAX_MB, else {DEFAULT_MAX_MB})",
+    )
+
+    args = parser.parse_args()
+
+    if args.cmd == "key":
+        if not os.path.isdir(args.src_dir):
+            raise SystemExit(f"Source directory not found: {args.src_dir}")
+        print(cache_key(args.src_dir, args.builder, args.image_id, args.start_script))
+    elif args.cmd == "restore":
+        if not restore(args.cache_dir, args.key, args.dest_dir):
+            raise SystemExit(MISS_EXIT)
+    elif args.cmd == "save":
+        if not os.path.isdir(args.out_dir):
+            raise SystemExit(f"Build output not found: {args.out_dir}")
+        save(args.cache_dir, args.key, args.out_dir, args.builder)
+    elif args.cmd == "prune":
+        max_mb = args.max_mb
+        if max_mb is None:
+            max_mb = env_number("BUILD_CACHE_MAX_MB", DEFAULT_MAX_MB, prog="build_cache")
+        for key in prune(args.cache_dir, max_mb * 1024 * 1024):
+            print(f"[cache] evicted {key[:12]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""derived_images.py — builder images with a project's deps.json baked in.
+
+Installing deps.json packages at container start makes every build pay for
+`apt-get update` and the downloads. Instead, build_artifact.sh asks for a
+derived image: the builder image plus the declared packages, installed once
+by data/install_deps.sh in a `docker build` and tagged locally as
+
+    repcid-derived/<builder>:<key>
+
+where <key> hashes the base image ID, the normalized deps.json (package
+lists sorted and de-duplicated, empty lists dropped) and the install script.
+A project whose dependencies have not changed reuses the image; a rebuilt
+base image or an edited deps.json yields a new key. The image sets
+REPCID_DEPS_PREINSTALLED=1 so data/start.sh skips its own install.
+
+Last use of every derived image is recorded in DERIVED_IMAGES_STATE
+(default $WORKING_DIR/cache/derived_images.json); `gc` removes derived
+images unused for DERIVED_IMAGE_TTL_DAYS, or never recorded.
+
+Usage (from build_artifact.sh / publish_pipeline.sh):
+    derived_images.py ensure --builder B --base-image IMG --deps deps.json [--platform P]
+        prints the image to run (the base image when there is nothing to install)
+    derived_images.py gc [--ttl-days N] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import env_number, locked_json  # noqa: E402
+
+REPO = "repcid-derived"
+LABEL = "repcid.derived"
+INSTALL_SCRIPT = os.path.join(WORKING_DIR, "data", "install_deps.sh")
+DEFAULT_STATE = os.getenv("DERIVED_IMAGES_STATE") or os.path.join(WORKING_DIR, "cache", "derived_images.json")
+DEFAULT_TTL_DAYS = 14.0
+KEY_LENGTH = 16
+
+DOCKERFILE = """\
+FROM {base}
+COPY deps.json install_deps.sh /tmp/repcid/
+RUN bash /tmp/repcid/install_deps.sh /tmp/repcid/deps.json \\
+    && rm -rf /tmp/repcid
+ENV REPCID_DEPS_PREINSTALLED=1
+LABEL {label}=1 {label}.builder={builder} {label}.base={base_id} {label}.key={key}
+"""
+
+
+class DeriveError(Exception):
+    """Raised when a derived image cannot be resolved or built."""
+
+
+def normalize_deps(deps: dict) -> dict:
+    """Sorted, de-duplicated package lists; non-list and empty entries dropped."""
+    result = {}
+    for manager, packages in deps.items():
+        if not isinstance(packages, list):
+            continue
+        cleaned = sorted({str(p).strip() for p in packages if str(p).strip()})
+        if cleaned:
+            result[manager] = cleaned
+    return result
+
+
+def derived_key(base_id: str, deps: dict, install_script: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(base_id.encode())
+    digest.update(b"\0")
+    digest.update(json.dumps(deps, sort_keys=True, separators=(",", ":")).encode())
+    digest.update(b"\0")
+    digest.update(install_script)
+    return digest.hexdigest()[:KEY_LENGTH]
+
+
+def derived_tag(builder: str, key: str) -> str:
+    return f"{REPO}/{builder.lower()}:{key}"
+
+
+def _docker(*args: str, capture: bool = True) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker", *args], capture_output=capture, text=True)
+
+
+def image_id(image: str):
+    result = _docker("image", "inspect", "--format", "{{.Id}}", image)
+    out = result.stdout.strip()
+    return out if result.returncode == 0 and out else None
+
+
+def build(tag: str, base: str, base_id: str, builder: str, key: str,
+          deps: dict, platform: str = "") -> None:
+    with tempfile.TemporaryDirectory(prefix="repcid-derive.") as ctx:
+        with open(os.path.join(ctx, "deps.json"), "w") as f:
+            json.dump(deps, f, indent=4, sort_keys=True)
+        shutil.copy2(INSTALL_SCRIPT, os.path.join(ctx, "install_deps.sh"))
+        with open(os.path.join(ctx, "Dockerfile"), "w") as f:
+            f.write(DOCKERFILE.format(base=base, base_id=base_id, builder=builder,
+                                      key=key, label=LABEL))
+        cmd = ["build", "-t", tag]
+        if platform:
+            cmd += ["--platform", platform]
+        # Build output goes to stderr: stdout carries the image name
+        result = subprocess.run(["docker", *cmd, ctx], stdout=sys.stderr)
+        if result.returncode != 0:
+            raise DeriveError(f"docker build failed for {tag}")
+
+
+def ensure(builder: str, base: str, deps_file: str, state_path: str = DEFAULT_STATE,
+           platform: str = "") -> tuple:
+    """Return (image, status) with status "base", "hit" or "built"."""
+    try:
+        with open(deps_file, "r") as f:
+            deps = normalize_deps(json.load(f))
+    except FileNotFoundError:
+        deps = {}
+    except ValueError as exc:
+        raise DeriveError(f"invalid {deps_file}: {exc}")
+    if not deps:
+        return base, "base"
+
+    base_id = image_id(base)
+    if not base_id:
+        raise DeriveError(f"cannot resolve builder image '{base}'")
+    with open(INSTALL_SCRIPT, "rb") as f:
+        key = derived_key(base_id, deps, f.read())
+    tag = derived_tag(builder, key)
+
+    status = "hit"
+    if image_id(tag) is None:
+        build(tag, base, base_id, builder, key, deps, platform)
+        status = "built"
+    with locked_json(state_path) as state:
+        state[tag] = time.time()
+    return tag, status
+
+
+def list_derived() -> list:
+    result = _docker("image", "ls", "--filter", f"label={LABEL}=1",
+                     "--format", "{{.Repository}}:{{.Tag}}")
+    if result.returncode != 0:
+        raise DeriveError(f"cannot list images: {result.stderr.strip()}")
+    return [line for line in result.stdout.split() if line.startswith(f"{REPO}/")]
+
+
+def gc(ttl_days: float = DEFAULT_TTL_DAYS, state_path: str = DEFAULT_STATE,
+       dry_run: bool = False) -> list:
+    """Remove derived images not used within ttl_days; returns their tags."""
+    cutoff = time.time() - ttl_days * 86400
+    removed = []
+    with locked_json(state_path) as state:
+        present = list_derived()
+        for tag in present:
+            if state.get(tag, 0) >= cutoff:
+                continue
+            if not dry_run:
+                if _docker("image", "rm", tag).returncode != 0:
+                    # Still referenced (e.g. by a running build); retry next gc
+                    continue
+                state.pop(tag, None)
+            removed.append(tag)
+        if not dry_run:
+            for tag in [t for t in state if t not in present]:
+                del state[tag]
+    return removed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Derived builder images with dependencies preinstalled")
+    parser.add_argument(
+        "--state",
+        default=DEFAULT_STATE,
+        help="Last-used state file (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("ensure", help="Print the image to build with, deriving it if needed")
+    sp.add_argument("--builder", required=True, help="Builder name, e.g. ubuntu_amd64")
+    sp.add_argument("--base-image", required=True, help="Builder image from the compose file")
+    sp.add_argument("--deps", required=True, help="Project deps.json")
+    sp.add_argument("--platform", default="", help="Target platform for docker build")
+
+    sp = sub.add_parser("gc", help="Remove derived images unused for --ttl-days")
+    sp.add_argument(
+        "--ttl-days",
+        type=float,
+        default=None,
+        help=f"Keep images used within this many days "
+             f"(default: DERIVED_IMAGE_TTL_DAYS, else {DEFAULT_TTL_DAYS:g})",
+    )
+    sp.add_argument("--dry-run", action="store_true", help="Only list what would be removed")
+
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "ensure":
+            image, status = ensure(args.builder, args.base_image, args.deps, args.state, args.platform)
+            if status != "base":
+                print(f"[derived-image] {status.upper()} {image}", file=sys.stderr)
+            print(image)
+        elif args.cmd == "gc":
+            ttl_days = args.ttl_days
+            if ttl_days is None:
+                ttl_days = env_number("DERIVED_IMAGE_TTL_DAYS", DEFAULT_TTL_DAYS, float,
+                                      "derived_images")
+            for tag in gc(ttl_days, args.state, args.dry_run):
+                prefix = "would remove" if args.dry_run else "removed"
+                print(f"[derived-image] {prefix} {tag}")
+    except (OSError, DeriveError) as exc:
+        print(f"derived_images: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
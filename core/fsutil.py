@@ -0,0 +1,163 @@
+"""fsutil.py — filesystem helpers shared by the cache and staging code, and
+the environment parsing the core scripts' main() functions share."""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX
+    fcntl = None
+
+# ioctl(2) request that clones a file's extents (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Create dst as a copy-on-write clone of src; False when unsupported."""
+    if fcntl is None:
+        return False
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def link_or_copy(src: str, dst: str) -> str:
+    """Place src at dst, hardlinking when possible.
+
+    Falls back to a reflink, then to a metadata-preserving copy, when a
+    hardlink is not possible (different filesystem, protected_hardlinks, ...).
+    An existing dst is replaced unless it already is src. Returns "hardlink",
+    "reflink" or "copy" so callers can report savings.
+    """
+    if os.path.lexists(dst):
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return "hardlink"
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    if reflink(src, dst):
+        return "reflink"
+    shutil.copy2(src, dst)
+    return "copy"
+
+
+def link_tree(src: str, dst: str) -> dict:
+    """Recreate the tree at src under dst, hardlinking regular files.
+
+    Symlinks are recreated as symlinks and directories keep their mode.
+    Returns a {"hardlink": n, "reflink": n, "copy": n} tally of how files
+    were placed.
+    """
+    tally = {"hardlink": 0, "reflink": 0, "copy": 0}
+    for root, dirs, files in os.walk(src):
+        rel = os.path.relpath(root, src)
+        target_root = dst if rel == "." else os.path.join(dst, rel)
+        os.makedirs(target_root, exist_ok=True)
+        shutil.copystat(root, target_root)
+        for name in dirs:
+            full = os.path.join(root, name)
+            if os.path.islink(full):
+                os.symlink(os.readlink(full), os.path.join(target_root, name))
+        for name in files:
+            full = os.path.join(root, name)
+            target = os.path.join(target_root, name)
+            if os.path.islink(full):
+                os.symlink(os.readlink(full), target)
+                continue
+            tally[link_or_copy(full, target)] += 1
+    return tally
+
+
+def tree_size(root: str) -> int:
+    """Total size in bytes of the regular files under root."""
+    total = 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            full = os.path.join(dirpath, name)
+            if not os.path.islink(full):
+                total += os.path.getsize(full)
+    return total
+
+
+@contextmanager
+def locked_json(path: str):
+    """Locked read-modify-write access to a small JSON state file.
+
+    Yields the parsed dict (empty when the file is missing or unreadable)
+    while holding an exclusive flock on <path>.lock, then replaces the file
+    atomically with whatever the caller left in it.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, "r") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        yield state
+        fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, indent=4, sort_keys=True)
+        os.replace(tmp, path)
+
+
+class LockTimeout(Exception):
+    """Raised when a file lock is still held elsewhere when the wait runs out."""
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = None):
+    """Hold an exclusive flock on path for the duration of the block.
+
+    timeout None waits as long as it takes; otherwise LockTimeout is raised
+    once timeout seconds pass without the lock being released (0 tries once).
+    The lock file itself is left in place.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as lock:
+        if fcntl is not None:
+            if timeout is None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise LockTimeout(f"{path} is held by another process")
+                        time.sleep(0.05)
+        yield
+
+
+def env_number(name: str, default=None, kind=int, prog: str = ""):
+    """$name parsed with kind (int or float), or default when unset or empty.
+
+    For main() functions: a value that does not parse exits with
+    "<prog>: <name> must be a (whole) number, got '<value>'".
+    """
+    value = os.getenv(name, "")
+    try:
+        return kind(value) if value else default
+    except ValueError:
+        what = "a whole number" if kind is int else "a number"
+        prefix = f"{prog}: " if prog else ""
+        raise SystemExit(f"{prefix}{name} must be {what}, got {value!r}")
@@ -1,34 +1,206 @@
-from json import dump
-from os import fdopen, fsync, makedirs, path, remove, replace
+import gzip
+import re
+import shutil
+import subprocess
+from hashlib import sha256
+from json import dumps, load
+from copy import deepcopy
+from functools import lru_cache
+from os import fdopen, fsync, getenv, listdir, makedirs, path, remove, replace
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from tempfile import mkstemp
 
+from core.fsutil import file_lock
+
 PACKAGE_DIR = "https://example.com/package"
 
+# Index layouts: one index.json, or a root manifest plus one shard per package
+LAYOUT_MONOLITHIC = "monolithic"
+LAYOUT_SHARDED = "sharded"
+SHARD_DIR = "packages"
+
+# Root marker written into every index.json / manifest; load_index strips it.
+# It sits next to the package names of a monolithic root, so names starting
+# with RESERVED_PREFIX are kept for markers and never used for packages.
+INDEX_MARKER = "_index"
+RESERVED_PREFIX = "_"
+INDEX_FORMAT = 1
+
+# Extra encodings written next to each index document (index.json ->
+# index.min.json, index.min.json.gz, index.min.json.zst). Selected with
+# INDEX_ENCODINGS; zst is skipped when the zstd CLI is not installed.
+ENCODINGS = ("min", "gz", "zst")
+DEFAULT_ENCODINGS = "min,gz,zst"
+
+# Lock file next to the index that serializes every load-modify-write of it
+# (shared with scripts/locking.sh). LOCK_TIMEOUT bounds the wait, in seconds.
+INDEX_LOCK = ".index.lock"
+DEFAULT_LOCK_TIMEOUT = 3600
+
+# Fields of a signed artifact inlined into its target entry, so a client can
+# plan and verify a download from the index alone. "digest" is the tarball's
+# hex sha256 ("sha256" keeps naming the checksum file). INDEX_INLINE_MINISIG=0
+# leaves the signature text out (clients then fetch the .minisig).
+ARTIFACT_FIELDS = ("digest", "size", "unpacked_size", "minisig")
+_HASH_CHUNK = 1 << 20
+
+# Release notes live outside the index, content-addressed next to it
+# (notes/<sha256>.md); a version keeps {"sha256", "size"} of its notes. The
+# digest is covered by the index signature, so the files aren't signed.
+NOTES_DIR = "notes"
+
+# Every write that changes the index bumps the root marker's "generation" and
+# leaves deltas/<generation>.json: a JSON merge patch (RFC 7386) from the
+# previous generation, without the derived version_order, plus the digest of
+# the result. The last INDEX_DELTAS of them are kept (0 disables deltas), and
+# deltas/head.json names the current generation and the oldest delta kept.
+DELTA_DIR = "deltas"
+DELTA_HEAD = "head.json"
+DELTA_MARKER = "_delta"
+DELTA_FORMAT = 1
+DEFAULT_DELTAS = 20
+
+# semver.org 2.0.0 grammar
+_SEMVER_RE = re.compile(
+    r"^(0|[1-9]\d*)\.(0|[1-9]\d*)\.(0|[1-9]\d*)"
+    r"(?:-((?:0|[1-9]\d*|\d*[A-Za-z-][0-9A-Za-z-]*)"
+    r"(?:\.(?:0|[1-9]\d*|\d*[A-Za-z-][0-9A-Za-z-]*))*))?"
+    r"(?:\+([0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*))?$"
+)
+
+# Parsed versions kept by _parse_version; enough for every version of a
+# large index without growing with each distinct string a process ever sees
+VERSION_CACHE_SIZE = 4096
+
+
+class Version:
+    """A parsed, immutable semver version.
+
+    Recently parsed instances are cached by their text (the last
+    VERSION_CACHE_SIZE of them), so parsing the same string again returns the
+    same object and the sort key is computed once. Ordering follows semver
+    precedence (a pre-release sorts below its release, identifiers compare
+    numerically or lexically); build metadata does not affect precedence and
+    only breaks ties so the order is total.
+    """
+
+    __slots__ = ("major", "minor", "patch", "prerelease", "build", "_text", "_key")
+
+    def __new__(cls, text: str):
+        return _parse_version(text)
+
+    def __str__(self) -> str:
+        return self._text
+
+    def __repr__(self) -> str:
+        return f"Version({self._text!r})"
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __eq__(self, other):
+        return self._key == other._key if isinstance(other, Version) else NotImplemented
+
+    def __lt__(self, other):
+        return self._key < other._key if isinstance(other, Version) else NotImplemented
+
+    def __le__(self, other):
+        return self._key <= other._key if isinstance(other, Version) else NotImplemented
+
+    def __gt__(self, other):
+        return self._key > other._key if isinstance(other, Version) else NotImplemented
+
+    def __ge__(self, other):
+        return self._key >= other._key if isinstance(other, Version) else NotImplemented
+
+    @property
+    def is_prerelease(self) -> bool:
+        return bool(self.prerelease)
+
+
+@lru_cache(maxsize=VERSION_CACHE_SIZE)
+def _parse_version(text: str) -> Version:
+    m = _SEMVER_RE.match(text) if isinstance(text, str) else None
+    if m is None:
+        raise ValueError(f"Invalid semver version: {text!r}")
+    self = object.__new__(Version)
+    self.major, self.minor, self.patch = int(m[1]), int(m[2]), int(m[3])
+    self.prerelease = tuple(m[4].split(".")) if m[4] else ()
+    self.build = m[5] or ""
+    self._text = text
+    if self.prerelease:
+        pre = (0, tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in self.prerelease))
+    else:
+        pre = (1, ())
+    self._key = (self.major, self.minor, self.patch, pre, self.build)
+    return self
+
+
+def _bisect_version(order: list, version: str, right: bool = False) -> int:
+    """Where version goes in order, a semver-sorted list of version strings.
+
+    Like bisect_left (bisect_right with right); bisect's own key= argument
+    needs Python 3.10.
+    """
+    target = Version(version)
+    lo, hi = 0, len(order)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        v = Version(order[mid])
+        if v < target or (right and v == target):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
 
 # Index helpers for package metadata management
 
-def _make_target_entry(name, version, os, arch, url) -> dict:
-    """Build the single-target dict for a given os/arch build."""
-    return {
+def _make_target_entry(name, version, os, arch, url, artifact=None) -> dict:
+    """Build the single-target dict for a given os/arch build.
+
+    "sha256" names the checksum file; artifact holds the fields returned by
+    artifact_fields(), the digest among them.
+    """
+    entry = {
         "url": f"{url}",
         "signature": f"{package_name(name, version, os, arch, 1)}",
         "sha256": f"{package_name(name, version, os, arch, 2)}",
     }
+    if artifact:
+        entry.update({k: artifact[k] for k in ARTIFACT_FIELDS if k in artifact})
+    return entry
 
 
-def _new_version_entry(name, version, os, arch, url, notes=None) -> dict:
-    """Build a version entry containing a single os/arch target and optional notes."""
+def _new_version_entry(name, version, os, arch, url, notes=None, artifact=None) -> dict:
+    """Build a version entry containing a single os/arch target and optional notes.
+
+    notes is the text; write_index() moves it into a sidecar file. The
+    "published" UTC timestamp is what retention rules compare dates against.
+    """
     version_entry = {
+        "published": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "targets": {
-            f"{os}_{arch}": _make_target_entry(name, version, os, arch, url)
-        }
+            f"{os}_{arch}": _make_target_entry(name, version, os, arch, url, artifact)
+        },
     }
     if notes:
         version_entry["notes"] = notes
     return version_entry
 
 
-def create_index_mdata(metadata, name, version, os, arch, url=PACKAGE_DIR, notes=None) -> dict:
+def check_package_name(name: str) -> None:
+    """Raise ValueError for a name the index root cannot hold as a package."""
+    if not isinstance(name, str) or not name or name.startswith(RESERVED_PREFIX):
+        raise ValueError(
+            f"Invalid package name {name!r}: names starting with {RESERVED_PREFIX!r} "
+            f"are reserved for index markers"
+        )
+
+
+def create_index_mdata(metadata, name, version, os, arch, url=PACKAGE_DIR, notes=None,
+                       artifact=None) -> dict:
     """Initialize index metadata entry for a package.
 
     Args:
@@ -37,16 +209,93 @@ def create_index_mdata(metadata, name, version, os, arch, url=PACKAGE_DIR, notes
         version: Semver string (e.g., 1.2.3).
         os: Target operating system (e.g., linux, macos).
         arch: Target architecture (e.g., amd64, arm64).
+        artifact: Optional artifact_fields() to inline into the target.
     Returns:
         The mutated metadata dict.
+    Raises ValueError for a reserved name (see check_package_name).
     """
-    version_entry = _new_version_entry(name, version, os, arch, url, notes=notes)
+    check_package_name(name)
+    version_entry = _new_version_entry(name, version, os, arch, url, notes=notes,
+                                       artifact=artifact)
     metadata[name] = {
         "latest": version,
+        "latest_by_target": {f"{os}_{arch}": version},
+        "version_order": [version],
         "versions": {f"{version}": version_entry},
     }
     return metadata
 
+
+def _version_order(pkg: dict) -> list:
+    """Return the package's ascending version list, deriving it for older index files."""
+    if "version_order" not in pkg:
+        pkg["version_order"] = sorted(pkg.get("versions", {}), key=Version)
+    return pkg["version_order"]
+
+
+def rebuild_version_order(metadata: dict, name: str = None) -> dict:
+    """Recompute version_order for one package (or all) from its versions."""
+    names = [name] if name is not None else list(metadata.keys())
+    for pkg_name in names:
+        pkg = metadata.get(pkg_name)
+        if isinstance(pkg, dict) and "versions" in pkg:
+            pkg["version_order"] = sorted(pkg["versions"], key=Version)
+    return metadata
+
+
+def sorted_versions(metadata: dict, name: str) -> list:
+    """Return a package's versions in ascending semver order."""
+    pkg = metadata.get(name)
+    if pkg is None:
+        return []
+    order = pkg.get("version_order")
+    if order is None:
+        order = sorted(pkg.get("versions", {}), key=Version)
+    return list(order)
+
+
+def versions_in_range(metadata: dict, name: str, low: str = None, high: str = None) -> list:
+    """Return a package's versions v with low <= v <= high, ascending.
+
+    Either bound may be None for an open range. Runs two binary searches over
+    the package's version_order instead of filtering every version.
+    """
+    order = sorted_versions(metadata, name)
+    start = _bisect_version(order, low) if low else 0
+    end = _bisect_version(order, high, right=True) if high else len(order)
+    return order[start:end]
+
+
+def _scan_latest_by_target(pkg: dict) -> dict:
+    """Derive the os_arch -> highest version map from a package's versions."""
+    latest = {}
+    for ver, entry in pkg.get("versions", {}).items():
+        for os_arch in entry.get("targets", {}):
+            if greater_version(ver, latest.get(os_arch)):
+                latest[os_arch] = ver
+    return latest
+
+
+def _latest_map(pkg: dict) -> dict:
+    """Return the package's latest_by_target map, deriving it for older index files."""
+    if "latest_by_target" not in pkg:
+        pkg["latest_by_target"] = _scan_latest_by_target(pkg)
+    return pkg["latest_by_target"]
+
+
+def rebuild_latest_by_target(metadata: dict, name: str = None) -> dict:
+    """Recompute latest_by_target for one package (or all) from its versions.
+
+    Used to migrate index files written before the map existed, or to repair
+    one that was edited by hand. Returns the mutated metadata dict.
+    """
+    names = [name] if name is not None else list(metadata.keys())
+    for pkg_name in names:
+        pkg = metadata.get(pkg_name)
+        if isinstance(pkg, dict) and "versions" in pkg:
+            pkg["latest_by_target"] = _scan_latest_by_target(pkg)
+    return metadata
+
 def edit_target(metadata, name, version, os, arch, key, value) -> bool:
     """Edit a target for a given os/arch version."""
     if metadata.get(name) is None or metadata[name]["versions"].get(version) is None: return False
@@ -55,35 +304,35 @@ def edit_target(metadata, name, version, os, arch, key, value) -> bool:
     if key not in target: return False
 
     target[key] = value
+    # The target exists, so the map must account for it; this also heals a
+    # map that was stale before the edit.
+    latest = _latest_map(metadata[name])
+    if greater_version(version, latest.get(f"{os}_{arch}")):
+        latest[f"{os}_{arch}"] = version
     return True
 
 def greater_version(v1: str, v2: str) -> bool:
     """Return True if v1 is strictly greater than v2. If v2 is None, True."""
     if v2 is None:
         return True
-    v1_major, v1_minor, v1_patch = map(int, v1.split("."))
-    v2_major, v2_minor, v2_patch = map(int, v2.split("."))
-    if v1_major > v2_major:
-        return True
-    if v1_major == v2_major and v1_minor > v2_minor:
-        return True
-    if v1_major == v2_major and v1_minor == v2_minor and v1_patch > v2_patch:
-        return True
-    return False
+    return Version(v1) > Version(v2)
 
 
-def add_version(metadata, name, version, os, arch, url=PACKAGE_DIR, notes=None):
+def add_version(metadata, name, version, os, arch, url=PACKAGE_DIR, notes=None, artifact=None):
     """Add a version for a given os/arch target, updating latest if needed."""
     if metadata.get(name) is None:
-        create_index_mdata(metadata, name, version, os, arch, url, notes=notes)
+        create_index_mdata(metadata, name, version, os, arch, url, notes=notes,
+                           artifact=artifact)
         return metadata
 
     if greater_version(version, metadata[name]["latest"]):
         metadata[name]["latest"] = version
     if metadata[name]["versions"].get(version) is None:
+        order = _version_order(metadata[name])
         metadata[name]["versions"][version] = _new_version_entry(
-            name, version, os, arch, url, notes=notes
+            name, version, os, arch, url, notes=notes, artifact=artifact
         )
+        order.insert(_bisect_version(order, version, right=True), version)
     else:
         if (
             metadata[name]["versions"][version]
@@ -92,28 +341,42 @@ def add_version(metadata, name, version, os, arch, url=PACKAGE_DIR, notes=None):
             is None
         ):
             metadata[name]["versions"][version]["targets"][f"{os}_{arch}"] = (
-                _make_target_entry(name, version, os, arch, url)
+                _make_target_entry(name, version, os, arch, url, artifact)
             )
         else:
             print(f"Version {version} already exists for program {name}.")
             return None
+    latest = _latest_map(metadata[name])
+    if greater_version(version, latest.get(f"{os}_{arch}")):
+        latest[f"{os}_{arch}"] = version
     return metadata
 
 
 def update_version(version: str, update_type: str) -> str:
-    parts = version.split(".")
-    if len(parts) != 3:
+    """Bump version by update_type (major/minor/patch).
+
+    Pre-release and build metadata are dropped. Bumping a pre-release whose
+    release already matches the bump (1.1.0-rc.1 minor -> 1.1.0) releases it
+    rather than skipping ahead.
+    """
+    try:
+        v = Version(version)
+    except ValueError:
         raise ValueError("Version must be in 'major.minor.patch' format")
-    major, minor, patch = map(int, parts)
+    major, minor, patch = v.major, v.minor, v.patch
+    pre = v.is_prerelease
     if update_type == "major":
-        major += 1
+        if not (pre and minor == 0 and patch == 0):
+            major += 1
         minor = 0
         patch = 0
     elif update_type == "minor":
-        minor += 1
+        if not (pre and patch == 0):
+            minor += 1
         patch = 0
     elif update_type == "patch":
-        patch += 1
+        if not pre:
+            patch += 1
     else:
         raise ValueError("Invalid update type")
     return f"{major}.{minor}.{patch}"
@@ -143,18 +406,93 @@ def package_name(name: str, version: str="", os: str="", arch: str="", sig: int=
         return f"{name}_v{version}_{os}_{arch}".lower()
 
 
-def get_version(md, name, os, arch) -> str:
-    # get latest version of type os_arch
-    if md.get(name) is None:
-        return None
-    latest_version = None
+def _file_sha256(file_path: str) -> tuple:
+    """(hex sha256, size) of a file, read in chunks."""
+    digest = sha256()
+    size = 0
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _unpacked_size(tarball: str) -> int:
+    unpacked = 0
+    with gzip.open(tarball, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            unpacked += len(chunk)
+    return unpacked
+
+
+def artifact_fields(artifacts_dir: str, name: str, version: str, os: str, arch: str,
+                    minisig: bool = None) -> dict:
+    """Read what a target entry inlines about its signed artifact.
+
+    The digest and size are always taken from the tarball itself, since they
+    go into the signed index. The unpacked size comes from the packer's
+    .meta.json sidecar when the sidecar records that same digest, otherwise
+    from decompressing the tarball. minisig defaults to $INDEX_INLINE_MINISIG
+    (on); the signature text is only added when the .minisig file exists.
+    Raises OSError when the tarball is missing.
+    """
+    tarball = path.join(artifacts_dir, f"{package_name(name, version, os, arch)}.tar.gz")
+    digest, size = _file_sha256(tarball)
+    unpacked = None
+    try:
+        with open(f"{tarball}.meta.json", "r") as f:
+            meta = load(f)
+        if meta.get("sha256") == digest:
+            unpacked = meta.get("unpacked_size")
+    except (OSError, ValueError):
+        pass
+    if unpacked is None:
+        unpacked = _unpacked_size(tarball)
+    fields = {"digest": digest, "size": size, "unpacked_size": unpacked}
+    if minisig is None:
+        minisig = getenv("INDEX_INLINE_MINISIG", "1") != "0"
+    if minisig and path.isfile(f"{tarball}.minisig"):
+        with open(f"{tarball}.minisig", "r") as f:
+            fields["minisig"] = f.read()
+    return fields
 
-    for ver in md[name]["versions"].keys():
-        for os_arch in md[name]["versions"][ver]["targets"].keys():
-            if (os_arch == f"{os}_{arch}" and greater_version(ver, latest_version)):
-                latest_version = ver
 
-    return latest_version
+def inline_artifacts(metadata: dict, artifacts_dir: str, name: str = None) -> int:
+    """Inline artifact_fields() into every target whose tarball is in artifacts_dir.
+
+    Used to backfill indexes written before target entries carried digests.
+    Returns the number of targets updated.
+    """
+    updated = 0
+    names = [name] if name else list(metadata)
+    for pkg_name in names:
+        for version, entry in metadata.get(pkg_name, {}).get("versions", {}).items():
+            for target_key, target in entry.get("targets", {}).items():
+                op_sys, _, arch = target_key.partition("_")
+                try:
+                    fields = artifact_fields(artifacts_dir, pkg_name, version, op_sys, arch)
+                except OSError:
+                    continue
+                target.update(fields)
+                # Entries inlined before "digest" existed held it under "sha256"
+                target["sha256"] = package_name(pkg_name, version, op_sys, arch, 2)
+                updated += 1
+    return updated
+
+
+def get_version(md, name, os, arch) -> str:
+    """Return the latest version published for os_arch, or None.
+
+    Reads the package's latest_by_target map; index files written before the
+    map existed fall back to a scan of every version.
+    """
+    pkg = md.get(name)
+    if pkg is None:
+        return None
+    latest = pkg.get("latest_by_target")
+    if latest is None:
+        latest = _scan_latest_by_target(pkg)
+    return latest.get(f"{os}_{arch}")
 
 def remove_version(metadata: dict, name: str, version: str) -> bool:
     """Remove a version entry from the index.
@@ -168,26 +506,42 @@ def remove_version(metadata: dict, name: str, version: str) -> bool:
     versions = metadata[name].get("versions", {})
     if version not in versions:
         return False
+    latest = _latest_map(metadata[name])
+    order = _version_order(metadata[name])
+    removed_targets = versions[version].get("targets", {})
     del versions[version]
-    if metadata[name].get("latest") == version:
-        remaining = sorted(
-            versions.keys(),
-            key=lambda v: list(map(int, v.split("."))),
+    i = _bisect_version(order, version)
+    if i < len(order) and order[i] == version:
+        del order[i]
+    # Only targets whose latest was the removed version need a new answer;
+    # walk down from the top of the sorted store to find it.
+    for os_arch in removed_targets:
+        if latest.get(os_arch) != version:
+            continue
+        best = next(
+            (ver for ver in reversed(order) if os_arch in versions[ver].get("targets", {})),
+            None,
         )
-        if remaining:
-            metadata[name]["latest"] = remaining[-1]
+        if best is None:
+            latest.pop(os_arch, None)
+        else:
+            latest[os_arch] = best
+    if metadata[name].get("latest") == version:
+        if order:
+            metadata[name]["latest"] = order[-1]
         else:
             del metadata[name]
     return True
 
 
-def safe_write_json(file_path: str, data) -> None:
+def safe_write_bytes(file_path: str, data: bytes) -> None:
+    """Atomically replace file_path with data (temp file + fsync + rename)."""
     directory = path.dirname(file_path) or "."
     makedirs(directory, exist_ok=True)
     fd, tmp_path = mkstemp(prefix=".tmp_", dir=directory)
     try:
-        with fdopen(fd, "w") as tmp_file:
-            dump(data, tmp_file, indent=4)
+        with fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
             tmp_file.flush()
             fsync(tmp_file.fileno())
         replace(tmp_path, file_path)
@@ -197,3 +551,400 @@ def safe_write_json(file_path: str, data) -> None:
                 remove(tmp_path)
             except OSError:
                 pass
+
+
+def safe_write_json(file_path: str, data) -> None:
+    safe_write_bytes(file_path, dumps(data, indent=4).encode())
+
+
+# ---------------------------------------------------------------------------
+# Index layouts
+#
+# monolithic: index.json holds every package.
+# sharded:    index.json is a small root manifest
+#                 {"layout": "sharded",
+#                  "packages": {"<name>": {"latest": ..., "shard": ..., "sha256": ...}}}
+#             and packages/<name>.json holds {"<name>": {...}} for one package,
+#             i.e. a one-package monolithic index.
+# ---------------------------------------------------------------------------
+
+def is_manifest(doc) -> bool:
+    """True if doc is a sharded-layout root manifest."""
+    return isinstance(doc, dict) and doc.get("layout") == LAYOUT_SHARDED
+
+
+def shard_path(index_path: str, name: str) -> str:
+    """Path of a package's shard next to the root manifest at index_path."""
+    return path.join(path.dirname(index_path), SHARD_DIR, f"{name}.json")
+
+
+def canonical_json(doc) -> bytes:
+    """Compact, key-sorted JSON encoding of doc."""
+    return dumps(doc, sort_keys=True, separators=(",", ":")).encode()
+
+
+def encoding_paths(file_path: str) -> dict:
+    """Map each encoding name to its file next to file_path (x.json -> x.min.json...)."""
+    stem = file_path[: -len(".json")] if file_path.endswith(".json") else file_path
+    return {
+        "min": f"{stem}.min.json",
+        "gz": f"{stem}.min.json.gz",
+        "zst": f"{stem}.min.json.zst",
+    }
+
+
+def enabled_encodings() -> list:
+    """Encodings selected by $INDEX_ENCODINGS that can be produced here."""
+    raw = getenv("INDEX_ENCODINGS", DEFAULT_ENCODINGS)
+    wanted = [e.strip() for e in raw.split(",") if e.strip()]
+    unknown = [e for e in wanted if e not in ENCODINGS]
+    if unknown:
+        raise ValueError(f"Unknown index encoding(s): {', '.join(unknown)}")
+    if "zst" in wanted and shutil.which("zstd") is None:
+        wanted.remove("zst")
+    return wanted
+
+
+def _remove_with_sidecars(file_path: str) -> None:
+    for stale in (file_path, f"{file_path}.minisig", f"{file_path}.sha256"):
+        if path.exists(stale):
+            remove(stale)
+
+
+def _write_encodings(file_path: str, doc, encodings: list) -> None:
+    """Write the enabled encodings of doc next to file_path; drop disabled ones."""
+    targets = encoding_paths(file_path)
+    compact = canonical_json(doc)
+    for name in ENCODINGS:
+        target = targets[name]
+        if name not in encodings:
+            _remove_with_sidecars(target)
+            continue
+        if name == "min":
+            data = compact
+        elif name == "gz":
+            # mtime=0 keeps the output byte-identical for identical input
+            data = gzip.compress(compact, compresslevel=9, mtime=0)
+        else:
+            data = subprocess.run(
+                ["zstd", "-q", "-19", "-c"], input=compact, capture_output=True, check=True
+            ).stdout
+        safe_write_bytes(target, data)
+
+
+def _write_document(file_path: str, doc, encodings: list) -> None:
+    """Write doc (indented) and its encodings; the indented file goes last."""
+    _write_encodings(file_path, doc, encodings)
+    safe_write_json(file_path, doc)
+
+
+def notes_ref(text: str) -> dict:
+    """The {"sha256", "size"} reference a version keeps to its notes text."""
+    data = text.encode()
+    return {"sha256": sha256(data).hexdigest(), "size": len(data)}
+
+
+def notes_path(index_path: str, ref: dict) -> str:
+    return path.join(path.dirname(path.abspath(index_path)), NOTES_DIR, f"{ref['sha256']}.md")
+
+
+def read_notes(index_path: str, notes) -> str:
+    """Return the notes text of a version entry's "notes" value.
+
+    Text still inline (indexes written before sidecars) is returned as is.
+    Raises OSError when the sidecar is missing and ValueError when it does
+    not match its digest.
+    """
+    if isinstance(notes, str):
+        return notes
+    with open(notes_path(index_path, notes), "rb") as f:
+        data = f.read()
+    if sha256(data).hexdigest() != notes["sha256"]:
+        raise ValueError(f"Release notes {notes['sha256']} do not match their digest")
+    return data.decode()
+
+
+def _externalize_notes(index_path: str, metadata: dict) -> None:
+    """Move inline notes text into sidecars, replacing it with its reference."""
+    for pkg in metadata.values():
+        for entry in pkg.get("versions", {}).values():
+            text = entry.get("notes")
+            if not isinstance(text, str):
+                continue
+            ref = notes_ref(text)
+            sidecar = notes_path(index_path, ref)
+            if not path.exists(sidecar):
+                safe_write_bytes(sidecar, text.encode())
+            entry["notes"] = ref
+
+
+def index_generation(index_path: str) -> int:
+    """The generation recorded in the index root (0 if none yet)."""
+    if not path.exists(index_path):
+        return 0
+    with open(index_path, "r") as f:
+        doc = load(f)
+    return int(doc.get(INDEX_MARKER, {}).get("generation", 0))
+
+
+def _merge_patch(old: dict, new: dict) -> dict:
+    """The RFC 7386 merge patch turning old into new."""
+    patch = {key: None for key in old if key not in new}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            sub = _merge_patch(old[key], value)
+            if sub:
+                patch[key] = sub
+        elif old[key] != value:
+            patch[key] = value
+    return patch
+
+
+def _apply_merge_patch(target: dict, patch: dict) -> dict:
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _apply_merge_patch(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def _delta_view(metadata: dict) -> dict:
+    """metadata without version_order, which clients re-derive."""
+    return {
+        name: {k: v for k, v in pkg.items() if k != "version_order"}
+        for name, pkg in metadata.items()
+    }
+
+
+def delta_path(index_path: str, generation: int) -> str:
+    return path.join(path.dirname(path.abspath(index_path)), DELTA_DIR, f"{generation}.json")
+
+
+def apply_delta(metadata: dict, delta: dict, generation: int = None) -> dict:
+    """Apply a delta document to the metadata of its "from" generation.
+
+    Checks the generation (when given) and the digest of the result, raising
+    ValueError on a mismatch; version_order is rebuilt for the packages the
+    delta touches. metadata is updated in place and returned.
+    """
+    if generation is not None and delta.get("from") != generation:
+        raise ValueError(f"Delta {delta.get('from')} -> {delta.get('to')} "
+                         f"does not apply to generation {generation}")
+    patch = delta.get("patch", {})
+    _apply_merge_patch(metadata, deepcopy(patch))
+    for name in patch:
+        if name in metadata:
+            rebuild_version_order(metadata, name)
+    if sha256(canonical_json(_delta_view(metadata))).hexdigest() != delta.get("sha256"):
+        raise ValueError(f"Index after delta {delta.get('to')} does not match its digest")
+    return metadata
+
+
+def _delta_limit() -> int:
+    raw = getenv("INDEX_DELTAS", "")
+    return int(raw) if raw.strip() else DEFAULT_DELTAS
+
+
+def _index_patch(index_path: str, root: dict, metadata: dict, shards: dict) -> dict:
+    """The delta patch from the index on disk (parsed root: root) to metadata.
+
+    A monolithic root already holds every package. Against a sharded root
+    only the shards whose recorded digest differs from the new shard bytes
+    (shards: name -> bytes) are read.
+    """
+    if not is_manifest(root):
+        previous = {k: v for k, v in root.items() if k != INDEX_MARKER}
+        return _merge_patch(_delta_view(previous), _delta_view(metadata))
+    listed = root.get("packages", {})
+    patch = {name: None for name in listed if name not in metadata}
+    for name in sorted(metadata):
+        new = _delta_view({name: metadata[name]})
+        entry = listed.get(name)
+        if entry is None:
+            patch.update(new)
+            continue
+        if entry.get("sha256") == sha256(shards[name]).hexdigest():
+            continue
+        with open(shard_path(index_path, name), "r") as f:
+            patch.update(_merge_patch(_delta_view(load(f)), new))
+    return patch
+
+
+def _write_delta(index_path: str, patch, metadata: dict, generation: int) -> None:
+    """Record generation-1 -> generation and drop deltas beyond the limit.
+
+    patch is None for the first generation, which has nothing to patch.
+    """
+    keep = _delta_limit()
+    if patch is not None and keep > 0:
+        safe_write_json(delta_path(index_path, generation), {
+            DELTA_MARKER: {"format": DELTA_FORMAT},
+            "from": generation - 1,
+            "to": generation,
+            "sha256": sha256(canonical_json(_delta_view(metadata))).hexdigest(),
+            "patch": patch,
+        })
+    directory = path.dirname(delta_path(index_path, generation))
+    if not path.isdir(directory):
+        return
+    kept = []
+    for fname in listdir(directory):
+        stem = fname.split(".", 1)[0]
+        if not stem.isdigit():
+            continue
+        if int(stem) <= generation - keep:
+            remove(path.join(directory, fname))
+        elif fname == f"{stem}.json":
+            kept.append(int(stem))
+    safe_write_json(path.join(directory, DELTA_HEAD), {
+        DELTA_MARKER: {"format": DELTA_FORMAT},
+        "generation": generation,
+        "oldest": min(kept) if kept else None,
+    })
+
+
+def _shard_bytes(name: str, pkg: dict) -> bytes:
+    return dumps({name: pkg}, indent=4).encode()
+
+
+def index_lock_path(index_path: str) -> str:
+    return path.join(path.dirname(path.abspath(index_path)), INDEX_LOCK)
+
+
+@contextmanager
+def index_lock(index_path: str, timeout: float = None):
+    """Serialize read-modify-write cycles on the index at index_path.
+
+    Anything that changes the index loads and writes it inside this lock, so
+    concurrent writers merge instead of overwriting each other's updates.
+    timeout defaults to $LOCK_TIMEOUT; fsutil.LockTimeout is raised when it
+    runs out. Processes started by a holder of the lock (publish_pipeline.sh
+    exports INDEX_LOCK_HELD=1 around its publish section) must not take it
+    again and skip it.
+    """
+    if getenv("INDEX_LOCK_HELD") == "1":
+        yield
+        return
+    if timeout is None:
+        timeout = float(getenv("LOCK_TIMEOUT") or DEFAULT_LOCK_TIMEOUT)
+    with file_lock(index_lock_path(index_path), timeout):
+        yield
+
+
+def load_index(index_path: str) -> dict:
+    """Load the full index as a {name: package} dict, whatever the layout.
+
+    Raises ValueError when the root's "_index" key is not a format marker
+    (a package of that name, from before the names were reserved).
+    """
+    if not path.exists(index_path):
+        return {}
+    with open(index_path, "r") as f:
+        doc = load(f)
+    if not is_manifest(doc):
+        marker = doc.pop(INDEX_MARKER, None)
+        if marker is not None and not (isinstance(marker, dict) and "format" in marker):
+            raise ValueError(f"{index_path} has a package named {INDEX_MARKER!r}; names "
+                             f"starting with {RESERVED_PREFIX!r} are reserved for index markers")
+        return doc
+    md = {}
+    for name in doc.get("packages", {}):
+        with open(shard_path(index_path, name), "r") as f:
+            md.update(load(f))
+    return md
+
+
+def write_index(index_path: str, metadata: dict, layout: str = None) -> list:
+    """Write metadata to index_path in the configured layout.
+
+    layout defaults to $INDEX_LAYOUT (monolithic). Every document is also
+    written in the encodings from $INDEX_ENCODINGS, and the root carries an
+    "_index" format marker. In the sharded layout only shards whose content
+    changed are rewritten, shards of removed packages are deleted, and the
+    root manifest is written last as the commit point; the monolithic layout
+    removes the shard directory a sharded one left. Release notes text
+    is moved into sidecars first (metadata is updated in place). When the
+    content changed, the generation is bumped and a delta document written
+    before the root; the current root is parsed once for that, and of a
+    sharded index only the shards that changed are read. An existing root
+    that cannot be parsed raises ValueError rather than restarting the
+    generation count. Returns the index documents (not their encodings) that
+    were written or removed.
+    """
+    layout = layout or getenv("INDEX_LAYOUT") or LAYOUT_MONOLITHIC
+    if layout not in (LAYOUT_MONOLITHIC, LAYOUT_SHARDED):
+        raise ValueError(f"Unknown index layout: {layout!r}")
+    encodings = enabled_encodings()
+    _externalize_notes(index_path, metadata)
+
+    root = None
+    if path.exists(index_path):
+        with open(index_path, "r") as f:
+            try:
+                root = load(f)
+            except ValueError as exc:
+                raise ValueError(f"Cannot parse the current index {index_path} ({exc}); "
+                                 f"refusing to overwrite it and restart its generation")
+        if not isinstance(root, dict):
+            raise ValueError(f"The current index {index_path} is not a JSON object; "
+                             f"refusing to overwrite it and restart its generation")
+    shards = {}
+    if layout == LAYOUT_SHARDED or is_manifest(root):
+        shards = {name: _shard_bytes(name, metadata[name]) for name in metadata}
+    generation = int(root.get(INDEX_MARKER, {}).get("generation", 0)) if root else 0
+    patch = _index_patch(index_path, root, metadata, shards) if root is not None else None
+    if patch is None or patch:
+        generation += 1
+        _write_delta(index_path, patch, metadata, generation)
+    marker = {"format": INDEX_FORMAT, "layout": layout, "generation": generation}
+
+    if layout == LAYOUT_MONOLITHIC:
+        _write_document(index_path, {INDEX_MARKER: marker, **metadata}, encodings)
+        # Shards left by an earlier sharded layout (with their encodings and
+        # signatures) go once the new root is in place
+        removed = []
+        if is_manifest(root):
+            removed = [shard_path(index_path, name) for name in root.get("packages", {})]
+        shutil.rmtree(path.join(path.dirname(index_path), SHARD_DIR), ignore_errors=True)
+        return [index_path, *removed]
+
+    previous_shards = root.get("packages", {}) if is_manifest(root) else {}
+    changed = []
+    packages = {}
+    for name in sorted(metadata):
+        pkg = metadata[name]
+        data = shards[name]
+        digest = sha256(data).hexdigest()
+        target = shard_path(index_path, name)
+        variants = encoding_paths(target)
+        current = (
+            previous_shards.get(name, {}).get("sha256") == digest
+            and path.exists(target)
+            and all(path.exists(variants[e]) for e in encodings)
+        )
+        if not current:
+            _write_encodings(target, {name: pkg}, encodings)
+            safe_write_bytes(target, data)
+            changed.append(target)
+        packages[name] = {
+            "latest": pkg.get("latest"),
+            "shard": f"{SHARD_DIR}/{name}.json",
+            "sha256": digest,
+        }
+    for name in previous_shards:
+        if name in packages:
+            continue
+        target = shard_path(index_path, name)
+        for stale in (target, *encoding_paths(target).values()):
+            _remove_with_sidecars(stale)
+        changed.append(target)
+
+    manifest = {INDEX_MARKER: marker, "layout": LAYOUT_SHARDED, "packages": packages}
+    _write_document(index_path, manifest, encodings)
+    changed.append(index_path)
+    return changed
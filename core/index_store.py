@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""index_store.py — optional SQLite store behind the package index.
+
+With INDEX_BACKEND=sqlite the index lives in <index dir>/index.db (WAL mode)
+and index.json becomes a view of it: stage writers, `repcid` edits and
+queries read and write only the rows of the packages they touch, and the
+signed index.json (with its shards, encodings and delta documents, see
+index.write_index) is exported from the store at sign time. The default
+backend, json, keeps index.json as the source of truth.
+
+    packages (name, latest, fields)               fields: other package keys
+    versions (package, version, published, data)  data: the entry minus targets
+    targets  (package, version, target, data)
+    latest   (package, target, version)           latest_by_target
+
+version_order is derived from the versions table on read. An export lists
+packages by name, versions in semver order and targets and latest_by_target
+by key, so the same rows always export the same documents. The store is
+created, and filled from an existing index.json, by the first write (under
+the index lock); until then reads fall back to index.json.
+
+read_index / save_index / latest_version work the same way on either
+backend; callers still hold index.index_lock around a read-modify-write.
+
+Usage (from sign_index.sh):
+    index_store.py export <index.json> [--layout L]   write index.json from the store
+    index_store.py import <index.json>                refill the store from index.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import LockTimeout  # noqa: E402
+from core.index import (  # noqa: E402
+    Version,
+    get_version,
+    index_lock,
+    load_index,
+    write_index,
+)
+
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+STORE_FILE = "index.db"
+STORE_FORMAT = 1
+
+# Package keys kept in their own tables (or derived); any other key is kept
+# as is in packages.fields
+_PACKAGE_KEYS = ("latest", "latest_by_target", "version_order", "versions")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    name   TEXT PRIMARY KEY,
+    latest TEXT,
+    fields TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS versions (
+    package   TEXT NOT NULL REFERENCES packages(name) ON DELETE CASCADE,
+    version   TEXT NOT NULL,
+    published TEXT,
+    data      TEXT NOT NULL,
+    PRIMARY KEY (package, version)
+);
+CREATE INDEX IF NOT EXISTS versions_published ON versions(published);
+CREATE TABLE IF NOT EXISTS targets (
+    package TEXT NOT NULL,
+    version TEXT NOT NULL,
+    target  TEXT NOT NULL,
+    data    TEXT NOT NULL,
+    PRIMARY KEY (package, version, target),
+    FOREIGN KEY (package, version) REFERENCES versions(package, version) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS targets_by_target ON targets(package, target);
+CREATE TABLE IF NOT EXISTS latest (
+    package TEXT NOT NULL REFERENCES packages(name) ON DELETE CASCADE,
+    target  TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (package, target)
+);
+"""
+
+
+class StoreError(Exception):
+    """Raised when the index store cannot be used."""
+
+
+def backend() -> str:
+    """The configured index backend ($INDEX_BACKEND, default json)."""
+    name = os.getenv("INDEX_BACKEND") or BACKEND_JSON
+    if name not in (BACKEND_JSON, BACKEND_SQLITE):
+        raise StoreError(f"Unknown index backend: {name!r} (expected json or sqlite)")
+    return name
+
+
+def store_path(index_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(index_path)), STORE_FILE)
+
+
+def _dumps(doc) -> str:
+    return json.dumps(doc, sort_keys=True, separators=(",", ":"))
+
+
+class IndexStore:
+    """The package index as SQLite rows; see the module docstring for the schema."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Autocommit mode: transactions are opened explicitly (transaction())
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if row is None:
+            self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('format', ?)",
+                              (str(STORE_FORMAT),))
+        elif int(row[0]) > STORE_FORMAT:
+            raise StoreError(f"{db_path} has store format {row[0]}; this version reads "
+                             f"up to {STORE_FORMAT}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """One write transaction: committed on success, rolled back on error."""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def names(self) -> list:
+        return [r[0] for r in self.conn.execute("SELECT name FROM packages ORDER BY name")]
+
+    def package(self, name: str):
+        """The package as its index.json dict, or None."""
+        row = self.conn.execute("SELECT latest, fields FROM packages WHERE name = ?",
+                                (name,)).fetchone()
+        if row is None:
+            return None
+        versions = {}
+        for version, data in self.conn.execute(
+                "SELECT version, data FROM versions WHERE package = ?", (name,)):
+            versions[version] = json.loads(data)
+            versions[version]["targets"] = {}
+        for version, target, data in self.conn.execute(
+                "SELECT version, target, data FROM targets WHERE package = ? "
+                "ORDER BY version, target", (name,)):
+            versions[version]["targets"][target] = json.loads(data)
+        order = sorted(versions, key=Version)
+        latest_by_target = {
+            target: version for target, version in self.conn.execute(
+                "SELECT target, version FROM latest WHERE package = ? ORDER BY target", (name,))
+        }
+        return {
+            "latest": row[0],
+            "latest_by_target": latest_by_target,
+            "version_order": order,
+            "versions": {v: versions[v] for v in order},
+            **json.loads(row[1]),
+        }
+
+    def load(self, names: list = None) -> dict:
+        """{name: package} for names (every package when None), read as one snapshot."""
+        snapshot = not self.conn.in_transaction
+        if snapshot:
+            self.conn.execute("BEGIN")
+        try:
+            wanted = self.names() if names is None else sorted(set(names))
+            md = {}
+            for name in wanted:
+                pkg = self.package(name)
+                if pkg is not None:
+                    md[name] = pkg
+        finally:
+            if snapshot:
+                self.conn.execute("COMMIT")
+        return md
+
+    def latest_version(self, name: str, target: str):
+        """The latest version published for target (os_arch), or None."""
+        row = self.conn.execute("SELECT version FROM latest WHERE package = ? AND target = ?",
+                                (name, target)).fetchone()
+        return row[0] if row else None
+
+    def put_package(self, name: str, pkg: dict) -> None:
+        """Store one package, writing only the rows that changed."""
+        fields = _dumps({k: v for k, v in pkg.items() if k not in _PACKAGE_KEYS})
+        versions = pkg.get("versions", {})
+        latest = pkg.get("latest_by_target")
+        if latest is None:
+            latest = {}
+            for version in sorted(versions, key=Version):
+                for target in versions[version].get("targets", {}):
+                    latest[target] = version
+        with self.transaction():
+            c = self.conn
+            c.execute("INSERT INTO packages (name, latest, fields) VALUES (?, ?, ?) "
+                      "ON CONFLICT(name) DO UPDATE SET latest = excluded.latest, "
+                      "fields = excluded.fields", (name, pkg.get("latest"), fields))
+            stored = dict(c.execute("SELECT version, data FROM versions WHERE package = ?",
+                                    (name,)))
+            stored_targets = {}
+            for version, target, data in c.execute(
+                    "SELECT version, target, data FROM targets WHERE package = ?", (name,)):
+                stored_targets.setdefault(version, {})[target] = data
+            for version in set(stored) - set(versions):
+                c.execute("DELETE FROM versions WHERE package = ? AND version = ?",
+                          (name, version))
+            for version, entry in versions.items():
+                data = _dumps({k: v for k, v in entry.items() if k != "targets"})
+                if stored.get(version) != data:
+                    c.execute("INSERT INTO versions (package, version, published, data) "
+                              "VALUES (?, ?, ?, ?) ON CONFLICT(package, version) DO UPDATE "
+                              "SET published = excluded.published, data = excluded.data",
+                              (name, version, entry.get("published"), data))
+                targets = entry.get("targets", {})
+                old = stored_targets.get(version, {})
+                for target in set(old) - set(targets):
+                    c.execute("DELETE FROM targets WHERE package = ? AND version = ? "
+                              "AND target = ?", (name, version, target))
+                for target, target_entry in targets.items():
+                    data = _dumps(target_entry)
+                    if old.get(target) != data:
+                        c.execute("INSERT INTO targets (package, version, target, data) "
+                                  "VALUES (?, ?, ?, ?) ON CONFLICT(package, version, target) "
+                                  "DO UPDATE SET data = excluded.data",
+                                  (name, version, target, data))
+            c.execute("DELETE FROM latest WHERE package = ?", (name,))
+            c.executemany("INSERT INTO latest (package, target, version) VALUES (?, ?, ?)",
+                          [(name, t, v) for t, v in latest.items()])
+
+    def delete_package(self, name: str) -> None:
+        with self.transaction():
+            self.conn.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+    def save(self, metadata: dict, names: list = None) -> None:
+        """Store the named packages of metadata in one transaction.
+
+        A named package missing from metadata is deleted. With names None the
+        store is made to hold exactly metadata.
+        """
+        with self.transaction():
+            if names is None:
+                names = set(self.names()) | set(metadata)
+            for name in sorted(set(names)):
+                if name in metadata:
+                    self.put_package(name, metadata[name])
+                else:
+                    self.delete_package(name)
+
+
+def open_store(index_path: str, create: bool = True):
+    """The IndexStore for index_path, or None with the json backend.
+
+    A new store is filled from the index.json already at index_path, and only
+    moved into place once filled, so a reader never sees it half imported.
+    With create False, None is also returned while there is no store yet.
+    """
+    if backend() != BACKEND_SQLITE:
+        return None
+    db_path = store_path(index_path)
+    if not os.path.exists(db_path):
+        if not create:
+            return None
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        tmp_path = f"{db_path}.{os.getpid()}.tmp"
+        try:
+            store = IndexStore(tmp_path)
+            try:
+                if os.path.exists(index_path):
+                    store.save(load_index(index_path))
+            finally:
+                store.close()
+            os.replace(tmp_path, db_path)
+        except sqlite3.Error as exc:
+            raise StoreError(f"cannot create {db_path}: {exc}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    try:
+        return IndexStore(db_path)
+    except sqlite3.Error as exc:
+        raise StoreError(f"cannot open {db_path}: {exc}")
+
+
+def read_index(index_path: str, names: list = None) -> dict:
+    """Load the index, or at least the named packages of it.
+
+    The sqlite backend reads only those packages; the json backend always
+    returns the whole index. Reading never creates the store.
+    """
+    store = open_store(index_path, create=False)
+    if store is None:
+        return load_index(index_path)
+    try:
+        return store.load(names)
+    finally:
+        store.close()
+
+
+def save_index(index_path: str, metadata: dict, names: list = None, layout: str = None) -> None:
+    """Write back an index loaded with read_index(index_path, names).
+
+    The sqlite backend stores the named packages (all with names None) and
+    leaves index.json to the next export (creating the store on the first
+    save, under the caller's index lock); the json backend writes the whole
+    index in layout.
+    """
+    store = open_store(index_path)
+    if store is None:
+        write_index(index_path, metadata, layout)
+        return
+    try:
+        store.save(metadata, names)
+    finally:
+        store.close()
+
+
+def latest_version(index_path: str, name: str, os_name: str, arch: str):
+    """The latest version of name published for os_arch, or None."""
+    store = open_store(index_path, create=False)
+    if store is None:
+        return get_version(load_index(index_path), name, os_name, arch)
+    try:
+        return store.latest_version(name, f"{os_name}_{arch}")
+    finally:
+        store.close()
+
+
+def export_index(index_path: str, layout: str = None) -> list:
+    """Write index.json (and its shards, encodings and deltas) from the store."""
+    store = open_store(index_path)
+    if store is None:
+        raise StoreError("INDEX_BACKEND is not sqlite; index.json is the index")
+    try:
+        return write_index(index_path, store.load(), layout)
+    finally:
+        store.close()
+
+
+def import_index(index_path: str) -> int:
+    """Replace the store's content with index.json; returns the package count."""
+    store = open_store(index_path)
+    if store is None:
+        raise StoreError("INDEX_BACKEND is not sqlite; nothing to import into")
+    try:
+        metadata = load_index(index_path)
+        store.save(metadata)
+    finally:
+        store.close()
+    return len(metadata)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SQLite index store")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("export", help="Write index.json from the store")
+    sp.add_argument("index")
+    sp.add_argument("--layout", default=None, help="Default: $INDEX_LAYOUT")
+
+    sp = sub.add_parser("import", help="Replace the store's content with index.json")
+    sp.add_argument("index")
+
+    args = parser.parse_args()
+    try:
+        with index_lock(args.index):
+            if args.cmd == "export":
+                export_index(args.index, args.layout)
+            elif args.cmd == "import":
+                count = import_index(args.index)
+                print(f"Imported {count} package(s) into {store_path(args.index)}")
+    except (OSError, ValueError, sqlite3.Error, LockTimeout, StoreError) as exc:
+        print(f"index_store: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""orchestrator.py — overlapped publish: every target is packaged, signed,
+staged and uploaded as soon as its own build finishes.
+
+publish_pipeline.sh normally runs each step for all targets before starting
+the next one, so a fast target waits for the slowest build before it is even
+packaged. With PIPELINE_OVERLAP=1 (repcid run --overlap) it hands steps 2-7
+to this script instead. The version is resolved up front (stage.py --pending,
+the index is not touched), then one chain per target runs
+
+    build -> package + sign -> stage -> upload to the release
+
+with up to JOBS builds at a time and packaging one target at a time (the
+packer already uses every core). The GitHub release is created once, by
+whichever target is ready first. Only the shared-index work is a barrier:
+after every chain has ended, the published targets are merged into the index
+and the index is signed, staged and pushed under the index lock. A target
+that fails at any step is left out of the index; if none was published, or
+the barrier fails, the release and tag are rolled back.
+
+With --run-id, progress is recorded in that run's manifest (core/runs.py);
+with --resume as well, targets an earlier attempt signed are reused instead
+of being built and packaged again.
+
+Usage (from publish_pipeline.sh, after the workspace is prepared):
+    orchestrator.py <project> <update_type> <staging_dir> --builders b1,b2 [--jobs N]
+        DRY_RUN, EXPLICIT_VERSION and RELEASE_NOTES are read from the environment
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core import runs  # noqa: E402
+from core.fsutil import LockTimeout, link_tree  # noqa: E402
+from core.index import index_lock  # noqa: E402
+
+SCRIPTS_DIR = os.path.join(_lib_dir, "scripts")
+CORE_DIR = os.path.join(_lib_dir, "core")
+
+PASS = "PASS"
+FAIL = "FAIL"
+
+
+class OrchestratorError(Exception):
+    """Raised when the overlapped pipeline cannot run or finish."""
+
+
+class Orchestrator:
+    """Runs the per-target chains and the final index barrier for one project."""
+
+    def __init__(self, project: str, update_type: str, builders: list, staging_dir: str,
+                 builds_dir: str, jobs: int = 1, dry_run: bool = False,
+                 scripts_dir: str = SCRIPTS_DIR, core_dir: str = CORE_DIR,
+                 working_dir: str = WORKING_DIR, run_id: str = None, resume: bool = False,
+                 runs_dir: str = runs.DEFAULT_RUNS_DIR, index_path: str = None):
+        self.project = project
+        self.update_type = update_type
+        self.builders = builders
+        self.staging_dir = staging_dir
+        self.builds_dir = builds_dir
+        self.jobs = jobs
+        self.dry_run = dry_run
+        self.scripts_dir = scripts_dir
+        self.core_dir = core_dir
+        self.src_dir = os.path.join(working_dir, "src", project)
+        self.run_id = run_id
+        self.resume = resume
+        self.runs_dir = runs_dir
+        self.index_path = index_path
+        self.indexed = set()
+        self.out_dir = os.path.join(builds_dir, "out")
+        self.pending = os.path.join(builds_dir, "stage.json")
+        self.state_file = os.path.join(builds_dir, "publish.state")
+        self.status = {}
+        self.pkgs = {}
+        self.published = []
+        self._release = None  # None: not attempted yet, then True/False
+        self._release_pkg = None
+
+    # -- subprocess helpers -------------------------------------------------
+
+    async def _run(self, label: str, argv: list, env: dict = None) -> bool:
+        """Run one step, prefixing its output with the target's name."""
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env={**os.environ, **(env or {})},
+        )
+        async for line in proc.stdout:
+            print(f"  [{label}] {line.decode(errors='replace').rstrip()}", flush=True)
+        return await proc.wait() == 0
+
+    def _script(self, name: str) -> str:
+        return os.path.join(self.scripts_dir, name)
+
+    def _core(self, name: str) -> list:
+        return [sys.executable, os.path.join(self.core_dir, name)]
+
+    def _publish_env(self, phase: str) -> dict:
+        return {"PUBLISH_PHASE": phase, "PUBLISH_STATE": self.state_file}
+
+    def _record(self, update, *args, **kwargs) -> None:
+        """Apply one update to the run manifest; a failure is only a warning."""
+        if self.run_id is None or self.dry_run:
+            return
+        try:
+            update(self.runs_dir, self.run_id, *args, **kwargs)
+        except (OSError, runs.RunError) as exc:
+            print(f"[run] warning: could not update run {self.run_id}: {exc}", file=sys.stderr)
+
+    def _fail(self, builder: str, step: str) -> None:
+        print(f"  [{builder}] {step} FAILED (continuing with remaining builders)", file=sys.stderr)
+        # A target that failed to publish stays signed, so a resume reuses it
+        state = runs.SIGNED if step == "publish" else runs.FAILED
+        self._record(runs.mark, [builder], state, step=step)
+
+    def _already_indexed(self) -> None:
+        """Adopt reused targets an earlier attempt already merged into the index.
+
+        stage.py skips them, so they get no package name from it; they are
+        published with the kept one and left out of the index commit.
+        """
+        try:
+            targets = runs.load_run(self.runs_dir, self.run_id)["targets"]
+        except (OSError, runs.RunError):
+            return
+        for builder in self.builders:
+            target = targets.get(builder, {})
+            if builder not in self.pkgs and runs.reusable(target):
+                self.pkgs[builder] = target["pkg"]
+                self.indexed.add(builder)
+
+    def _reuse(self, builder: str, pkg: str) -> bool:
+        """Restore a target signed by an earlier attempt of a resumed run."""
+        if not self.resume or self.run_id is None:
+            return False
+        try:
+            if runs.restore(self.runs_dir, self.run_id, builder, self.out_dir) != pkg:
+                return False
+        except (OSError, runs.RunError):
+            return False
+        print(f"  [{builder}] reusing {pkg} signed by an earlier attempt", flush=True)
+        return True
+
+    # -- steps --------------------------------------------------------------
+
+    def stage_metadata(self) -> dict:
+        """Resolve the version for every target; returns {builder: package name}."""
+        md_dir = os.path.join(self.builds_dir, "md")
+        argv = self._core("stage.py") + [
+            self.project, self.update_type, "--builders", ",".join(self.builders),
+            "--out-dir", md_dir, "--pending", self.pending,
+        ]
+        if os.getenv("EXPLICIT_VERSION"):
+            argv += ["--version", os.environ["EXPLICIT_VERSION"]]
+        if os.getenv("RELEASE_NOTES"):
+            argv += ["--notes", os.environ["RELEASE_NOTES"]]
+        proc = subprocess.run(argv, stdout=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise OrchestratorError(f"metadata staging failed: {proc.stdout.strip()}")
+        pkgs = {}
+        for line in proc.stdout.splitlines():
+            if "\t" in line:
+                builder, pkg = line.split("\t", 1)
+                pkgs[builder] = pkg
+            else:
+                print(line, file=sys.stderr)
+        if pkgs:
+            with open(self.pending) as f:
+                self._record(runs.set_version, json.load(f)["version"])
+        return pkgs
+
+    async def _build(self, builder: str) -> bool:
+        ns = os.path.join(self.builds_dir, builder)
+        os.makedirs(os.path.join(ns, "out"), exist_ok=True)
+        await asyncio.to_thread(link_tree, self.src_dir, os.path.join(ns, "src", self.project))
+        return await self._run(builder, [self._script("build_artifact.sh"), self.project, builder],
+                               {"BUILD_ROOT": ns})
+
+    async def _package(self, builder: str, pkg: str) -> bool:
+        ns = os.path.join(self.builds_dir, builder)
+        md = os.path.join(self.builds_dir, "md", f"{pkg}_md.json")
+        project_out = os.path.join(ns, "out", self.project)
+        os.makedirs(project_out, exist_ok=True)
+        shutil.copyfile(md, os.path.join(project_out, "metadata.json"))
+        if not await self._run(builder, [self._script("package_sign.sh"), pkg], {"BUILD_ROOT": ns}):
+            return False
+        tarball = f"{pkg}.tar.gz"
+        for name in (tarball, f"{tarball}.minisig", f"{tarball}.sha256", f"{tarball}.meta.json"):
+            src = os.path.join(ns, "out", name)
+            if os.path.exists(src):
+                os.replace(src, os.path.join(self.out_dir, name))
+        return True
+
+    async def _ensure_release(self, builder: str, pkg: str) -> bool:
+        async with self._release_lock:
+            if self._release is None:
+                self._release_pkg = pkg
+                self._release = await self._run(
+                    builder, [self._script("publish_github.sh"), self.staging_dir, pkg],
+                    self._publish_env("release"))
+            return self._release
+
+    async def _publish(self, builder: str, pkg: str) -> bool:
+        if not await self._run(builder, self._core("stage_files.py") + [self.staging_dir, self.out_dir, pkg]):
+            return False
+        if not await self._ensure_release(builder, pkg):
+            print(f"  [{builder}] release was not created; not uploading", file=sys.stderr)
+            return False
+        return await self._run(builder, [self._script("publish_github.sh"), self.staging_dir, pkg],
+                               self._publish_env("upload"))
+
+    async def target(self, builder: str) -> None:
+        """One target's chain; records PASS/FAIL in self.status."""
+        pkg = self.pkgs.get(builder)
+        self.status[builder] = FAIL
+        if pkg is None:
+            self._fail(builder, "metadata")
+            return
+        if not self._reuse(builder, pkg):
+            async with self._build_slots:
+                ok = await self._build(builder)
+            if not ok:
+                self._fail(builder, "build")
+                return
+            async with self._package_slot:
+                ok = await self._package(builder, pkg)
+            if not ok:
+                self._fail(builder, "package")
+                return
+            self._record(runs.record_signed, builder, pkg, self.out_dir)
+        if not self.dry_run and not await self._publish(builder, pkg):
+            self._fail(builder, "publish")
+            return
+        self.status[builder] = PASS
+        self.published.append(builder)
+        print(f"  [{builder}] -> {pkg} {'packaged' if self.dry_run else 'uploaded'}", flush=True)
+
+    async def _finish(self, pkgs: list) -> bool:
+        """The barrier: merge, sign, stage and push the index under its lock.
+
+        The release and every upload are done by then (see target()), so the
+        lock is held only for the index work and other projects' updates
+        never wait for this run's network transfers.
+        """
+        print("")
+        print("[5] Updating, signing + hashing index")
+        env = {"INDEX_LOCK_HELD": "1"}
+        index_path = self.index_path
+        if index_path is None:
+            # The same index (and lock) stage.py resolved the version against
+            with open(self.pending) as f:
+                index_path = json.load(f)["index"]
+        commit = [b for b in self.published if b not in self.indexed]
+        with index_lock(index_path):
+            if not (
+                (not commit or await self._run("index", self._core("stage_commit.py") + [
+                    self.pending, "--builders", ",".join(commit),
+                    "--artifacts", self.out_dir], env))
+                and await self._run("index", [self._script("sign_index.sh")], env)
+                and await self._run("index", [self._script("stage_artifacts.sh"), *pkgs,
+                                              self.staging_dir],
+                                    {**env, "BUILD_ROOT": self.builds_dir})
+            ):
+                return False
+            print("")
+            print("[6] Pushing index")
+            if await self._run("index", [self._script("publish_github.sh"), self.staging_dir, *pkgs],
+                               {**env, **self._publish_env("commit")}):
+                self._record(runs.mark, self.published, runs.PUBLISHED)
+                return True
+            self._release = False  # the commit phase rolls back on its own failure
+            return False
+
+    async def _rollback(self) -> None:
+        if not self._release:
+            return
+        await self._run("release", [self._script("publish_github.sh"), self.staging_dir,
+                                    self._release_pkg], self._publish_env("rollback"))
+
+    async def run(self) -> int:
+        self._build_slots = asyncio.Semaphore(self.jobs)
+        self._package_slot = asyncio.Semaphore(1)
+        self._release_lock = asyncio.Lock()
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        print("[2] Resolving version for all targets")
+        self.pkgs = self.stage_metadata()
+        if self.resume and self.run_id is not None:
+            self._already_indexed()
+
+        print("")
+        print(f"[3] Building, packaging and publishing {len(self.builders)} target(s), "
+              f"{self.jobs} build(s) at a time")
+        await asyncio.gather(*(self.target(b) for b in self.builders))
+
+        pkgs = [self.pkgs[b] for b in self.builders if b in self.published]
+        if not pkgs:
+            print("")
+            print("All builders failed. Aborting.", file=sys.stderr)
+            await self._rollback()
+            return 1
+
+        if self.dry_run:
+            print("")
+            print("[DRY-RUN] Would sign index, stage artifacts, and publish GitHub release")
+            return 0
+
+        try:
+            ok = await self._finish(pkgs)
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"Cannot read {self.pending}: {exc}", file=sys.stderr)
+            ok = False
+        except LockTimeout as exc:
+            print(f"Index is locked: {exc}", file=sys.stderr)
+            ok = False
+        if not ok:
+            print("Index update FAILED", file=sys.stderr)
+            await self._rollback()
+            return 1
+        return 0
+
+    def summary(self) -> bool:
+        """Print the per-target summary; returns True when every target passed."""
+        print("")
+        print("Build summary:")
+        for builder in self.builders:
+            cache = ""
+            try:
+                with open(os.path.join(self.builds_dir, builder, "cache_result")) as f:
+                    cache = f.read().strip()
+            except OSError:
+                pass
+            status = self.status.get(builder, "SKIP")
+            print(f"  {builder}: {status}{f' (cache {cache})' if cache else ''}")
+        return all(self.status.get(b) == PASS for b in self.builders)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Overlapped build/package/publish for one project")
+    parser.add_argument("project", help="Project name (its source is staged in src/)")
+    parser.add_argument("update_type", choices=["major", "minor", "patch", "new"])
+    parser.add_argument("staging_dir", help="Staging git repository")
+    parser.add_argument("--builders", required=True, help="Comma-separated builders")
+    parser.add_argument("--jobs", type=int, default=1, help="Builds to run at a time (default: 1)")
+    parser.add_argument(
+        "--builds-dir",
+        default=None,
+        help="Per-run work dir (default: WORKING_DIR/builds/<project>)",
+    )
+    parser.add_argument("--index", default=None,
+                        help="Index to lock for the final update (default: the one stage.py used)")
+    parser.add_argument("--run-id", default=None, help="Record progress in this run's manifest")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse targets an earlier attempt of --run-id signed")
+    args = parser.parse_args()
+
+    builders = [b for b in args.builders.split(",") if b]
+    builds_dir = args.builds_dir or os.path.join(WORKING_DIR, "builds", args.project)
+    if args.jobs < 1 or not builders:
+        print("orchestrator: --jobs must be positive and --builders non-empty", file=sys.stderr)
+        raise SystemExit(1)
+
+    orchestrator = Orchestrator(args.project, args.update_type, builders, args.staging_dir,
+                                builds_dir, jobs=args.jobs, dry_run=os.getenv("DRY_RUN") == "1",
+                                run_id=args.run_id, resume=args.resume, index_path=args.index)
+    try:
+        code = asyncio.run(orchestrator.run())
+    except (OSError, OrchestratorError) as exc:
+        print(f"orchestrator: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+    if not orchestrator.summary() and code == 0:
+        print("")
+        print("Warning: one or more builders failed.", file=sys.stderr)
+        code = 1
+    raise SystemExit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""packer.py — single-pass tar + parallel gzip + sha256 for build outputs.
+
+Streams out/<project> through tarfile into a multi-member gzip writer that
+compresses fixed-size chunks on a thread pool (zlib releases the GIL), and
+hashes the compressed bytes as they are written. One read of the tree
+produces:
+
+    <pkg>.tar.gz            the artifact (standard gzip; tar/gzip read
+                            multi-member streams transparently)
+    <pkg>.tar.gz.sha256     sha256sum-compatible checksum line
+    <pkg>.tar.gz.meta.json  the project's metadata.json plus sha256 and
+                            sizes, so later steps never reopen the archive
+
+Usage (from package_sign.sh):
+    packer.py <out_dir> <project> <tarball> [--threads N] [--level N]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tarfile
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+sys.path.append(_lib_dir)
+from core.fsutil import env_number  # noqa: E402
+from core.index import safe_write_bytes, safe_write_json  # noqa: E402
+
+CHUNK_SIZE = 4 << 20
+DEFAULT_LEVEL = 6
+DEFAULT_THREADS = os.cpu_count() or 1
+META_SUFFIX = ".meta.json"
+
+
+class _ParallelGzipWriter:
+    """File-like sink that gzips CHUNK_SIZE blocks in parallel, in order.
+
+    Each block becomes its own gzip member (mtime=0, so output is
+    reproducible). Completed members are written to dest in submission order
+    and fed to the sha256 as they go; at most 2 * threads blocks are in
+    flight, which bounds memory.
+    """
+
+    def __init__(self, dest, threads: int, level: int):
+        self._dest = dest
+        self._level = level
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = deque()
+        self._max_pending = threads * 2
+        self._buf = bytearray()
+        self.sha256 = hashlib.sha256()
+        self.raw_size = 0
+        self.size = 0
+
+    def write(self, data) -> int:
+        self._buf += data
+        self.raw_size += len(data)
+        while len(self._buf) >= CHUNK_SIZE:
+            self._submit(bytes(self._buf[:CHUNK_SIZE]))
+            del self._buf[:CHUNK_SIZE]
+        return len(data)
+
+    def _submit(self, block: bytes) -> None:
+        self._pending.append(self._pool.submit(gzip.compress, block, self._level, mtime=0))
+        while len(self._pending) > self._max_pending:
+            self._drain_one()
+
+    def _drain_one(self) -> None:
+        member = self._pending.popleft().result()
+        self._dest.write(member)
+        self.sha256.update(member)
+        self.size += len(member)
+
+    def close(self) -> None:
+        if self._buf or not (self._pending or self.size):
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        while self._pending:
+            self._drain_one()
+        self._pool.shutdown()
+
+
+def _read_metadata(project_dir: str) -> dict:
+    meta_file = os.path.join(project_dir, "metadata.json")
+    if not os.path.isfile(meta_file):
+        return {}
+    with open(meta_file, "r") as f:
+        return json.load(f)
+
+
+def pack(out_dir: str, project: str, tarball: str,
+         threads: int = DEFAULT_THREADS, level: int = DEFAULT_LEVEL) -> dict:
+    """Archive out_dir/project into tarball in one pass.
+
+    Writes the tarball atomically, then its .sha256 and .meta.json sidecars.
+    Returns the sidecar document.
+    """
+    project_dir = os.path.join(out_dir, project)
+    if not os.path.isdir(project_dir):
+        raise FileNotFoundError(f"Build output directory not found: {project_dir}")
+
+    directory = os.path.dirname(os.path.abspath(tarball))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".tar.gz", dir=directory)
+    files = 0
+    try:
+        with os.fdopen(fd, "wb") as dest:
+            writer = _ParallelGzipWriter(dest, max(1, threads), level)
+            try:
+                with tarfile.open(fileobj=writer, mode="w|", format=tarfile.GNU_FORMAT) as tar:
+                    def _count(info):
+                        nonlocal files
+                        if info.isfile():
+                            files += 1
+                        return info
+                    tar.add(project_dir, arcname=project, filter=_count)
+            finally:
+                writer.close()
+            dest.flush()
+            os.fsync(dest.fileno())
+        os.chmod(tmp_path, 0o644)
+        # Sidecars of an earlier pack must never sit next to the new tarball:
+        # drop them first, so an interrupted run leaves none rather than stale ones
+        for stale in (f"{tarball}.sha256", f"{tarball}{META_SUFFIX}"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        os.replace(tmp_path, tarball)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    digest = writer.sha256.hexdigest()
+    safe_write_bytes(f"{tarball}.sha256", f"{digest}  {tarball}\n".encode())
+
+    sidecar = {
+        "metadata": _read_metadata(project_dir),
+        "archive": os.path.basename(tarball),
+        "sha256": digest,
+        "size": writer.size,
+        "unpacked_size": writer.raw_size,
+        "files": files,
+    }
+    safe_write_json(f"{tarball}{META_SUFFIX}", sidecar)
+    return sidecar
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack a build output into a .tar.gz in one pass")
+    parser.add_argument("out_dir", help="Directory containing <project>/")
+    parser.add_argument("project", help="Project directory name inside out_dir")
+    parser.add_argument("tarball", help="Path of the .tar.gz to write")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=env_number("PACK_THREADS", 0, prog="packer") or DEFAULT_THREADS,
+        help="Compression threads (default: PACK_THREADS, else one per CPU)",
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=env_number("PACK_LEVEL", DEFAULT_LEVEL, prog="packer"),
+        choices=range(1, 10),
+        metavar="1-9",
+        help="gzip compression level (default: PACK_LEVEL, else 6)",
+    )
+    args = parser.parse_args()
+    if args.level not in range(1, 10):
+        raise SystemExit(f"packer: PACK_LEVEL must be 1-9, got {args.level}")
+
+    try:
+        sidecar = pack(args.out_dir, args.project, args.tarball, args.threads, args.level)
+    except (OSError, ValueError) as exc:
+        print(f"packer: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+    print(
+        f"Packed {args.project}: {sidecar['files']} file(s), "
+        f"{sidecar['unpacked_size']} -> {sidecar['size']} bytes"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""pool.py — warm builder containers reused across builds (BUILD_POOL=1).
+
+Creating a compose project, its volumes and tearing them down again costs
+more than many small builds themselves. With the pool enabled,
+build_artifact.sh hands each build to a long-lived container of the builder
+instead: the container idles (`tail -f /dev/null`) and every job runs
+data/start.sh through `docker exec` in its own directories:
+
+    /jobs/<job>/todo/<project>   staged source (host: POOL_DIR/<container>/<job>)
+    /jobs/<job>/complete         build output and status record, moved to <build_root>/out
+    /in_progress/<job>           working copy, inside the container only
+
+Containers are started with the builder compose file's image and mounts
+(minus /todo, /complete and the in_progress volume), labelled repcid.pool=1.
+A container only serves jobs whose spec (image, platform, mounts, source
+mode and the digest of the project's deps.json) matches the one it was
+started with, so a changed derived image or cache directory gets a fresh
+container. start.sh installs declared dependencies into the container
+itself, outside the job directories, so a project with other deps never
+builds in (and caches output from) an environment another project changed.
+
+Lifecycle: a lease is checked with `docker exec <c> true` before every job
+and the container replaced when that fails; it is recycled after
+POOL_MAX_JOBS jobs and removed after POOL_IDLE_TIMEOUT seconds unused. At
+most POOL_SIZE containers run per builder; further jobs wait for one.
+Leases, job counts and last use live in POOL_DIR/state.json.
+
+Usage (from build_artifact.sh and `repcid pool`):
+    pool.py run --builder B --compose-file YML --image IMG --project P --build-root DIR
+    pool.py status
+    pool.py drain [--builder B]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import sys
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import env_number, link_tree, locked_json  # noqa: E402
+
+DEFAULT_POOL_DIR = os.getenv("POOL_DIR") or os.path.join(WORKING_DIR, "cache", "pool")
+DEFAULT_SIZE = 1
+DEFAULT_MAX_JOBS = 20
+DEFAULT_IDLE_TIMEOUT = 1800.0
+LABEL = "repcid.pool"
+JOBS_MOUNT = "/jobs"
+WORK_ROOT = "/in_progress"
+# Mounts the pool replaces with per-job directories
+JOB_TARGETS = ("/todo", "/complete", WORK_ROOT)
+HEALTH_TIMEOUT = 30
+WAIT_INTERVAL = 1.0
+
+
+class PoolError(Exception):
+    """Raised when a pool container cannot be started or used."""
+
+
+def _docker(*args: str, timeout: float = None) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(["docker", *args], capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return subprocess.CompletedProcess(["docker", *args], 124, "", "timed out")
+
+
+def _state_path(pool_dir: str) -> str:
+    return os.path.join(pool_dir, "state.json")
+
+
+def compose_service(yml: str) -> dict:
+    """Read image, platform, command and volumes of a builder compose file.
+
+    Builder files hold a single service, so a line scan is enough (the same
+    approach the CLI uses for 'image:'). ${VAR} references are expanded from
+    the environment, as docker compose would.
+    """
+    spec = {"image": "", "platform": "", "command": "", "volumes": []}
+    in_volumes = False
+    with open(yml, "r") as f:
+        for raw in f:
+            line = raw.split("#", 1)[0].rstrip()
+            if not line.strip():
+                continue
+            indent = len(line) - len(line.lstrip())
+            stripped = line.strip()
+            if indent == 0:
+                # Top-level keys (the named volumes section) end the service
+                in_volumes = False
+                if stripped != "services:":
+                    break
+                continue
+            if in_volumes and stripped.startswith("- "):
+                spec["volumes"].append(os.path.expandvars(stripped[2:].strip()))
+                continue
+            in_volumes = False
+            key, _, value = stripped.partition(":")
+            if key == "volumes" and not value.strip():
+                in_volumes = True
+            elif key in ("image", "platform", "command"):
+                spec[key] = os.path.expandvars(value.strip())
+    return spec
+
+
+def pool_mounts(volumes: list) -> list:
+    """Bind mounts a pool container keeps from the compose file."""
+    result = []
+    for volume in volumes:
+        parts = volume.split(":")
+        if len(parts) < 2 or not parts[0].startswith("/"):
+            continue  # named volume
+        if parts[1] in JOB_TARGETS:
+            continue
+        result.append(volume)
+    return result
+
+
+def spec_key(image: str, platform: str, mounts: list, source_mode: str, deps: str = "") -> str:
+    blob = json.dumps([image, platform, sorted(mounts), source_mode, deps])
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+def deps_digest(src_dir: str) -> str:
+    """Digest of the staged project's deps.json ("" when it has none)."""
+    try:
+        with open(os.path.join(src_dir, "deps.json"), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return ""
+
+
+def _alive(pid) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def healthy(name: str) -> bool:
+    return _docker("exec", name, "true", timeout=HEALTH_TIMEOUT).returncode == 0
+
+
+def _remove(name: str, pool_dir: str) -> None:
+    _docker("rm", "-f", name)
+    shutil.rmtree(os.path.join(pool_dir, name), ignore_errors=True)
+
+
+def start(name: str, builder: str, image: str, platform: str, mounts: list,
+          source_mode: str, key: str, pool_dir: str) -> None:
+    jobs_dir = os.path.join(pool_dir, name)
+    os.makedirs(jobs_dir, exist_ok=True)
+    for mount in mounts:
+        # docker would create a missing bind source owned by root
+        os.makedirs(mount.split(":")[0], exist_ok=True)
+    cmd = ["run", "-d", "--init", "--name", name,
+           "--label", f"{LABEL}=1", "--label", f"{LABEL}.builder={builder}",
+           "--label", f"{LABEL}.spec={key}",
+           "-v", f"{jobs_dir}:{JOBS_MOUNT}"]
+    for mount in mounts:
+        cmd += ["-v", mount]
+    if platform:
+        cmd += ["--platform", platform]
+    if source_mode == "overlay":
+        cmd += ["--cap-add", "SYS_ADMIN", "--security-opt", "apparmor:unconfined"]
+    cmd += [image, "tail", "-f", "/dev/null"]
+    result = _docker(*cmd)
+    if result.returncode != 0:
+        shutil.rmtree(jobs_dir, ignore_errors=True)
+        raise PoolError(f"cannot start {name}: {result.stderr.strip()}")
+
+
+def _expired(entry: dict, now: float, idle_timeout: float) -> bool:
+    return entry.get("lease") is None and now - entry.get("last_used", now) > idle_timeout
+
+
+def acquire(builder: str, image: str, platform: str, mounts: list, source_mode: str,
+            pool_dir: str = DEFAULT_POOL_DIR, size: int = DEFAULT_SIZE,
+            idle_timeout: float = DEFAULT_IDLE_TIMEOUT, deps: str = "") -> str:
+    """Lease a healthy container for builder with a matching spec; returns its name.
+
+    deps is the deps_digest() of the project to build.
+    """
+    key = spec_key(image, platform, mounts, source_mode, deps)
+    waiting = False
+    while True:
+        new_name, stale = None, []
+        with locked_json(_state_path(pool_dir)) as state:
+            now = time.time()
+            for name, entry in list(state.items()):
+                lease = entry.get("lease")
+                if lease is not None and not _alive(lease):
+                    entry["lease"] = None  # leaseholder died mid-job
+                if _expired(entry, now, idle_timeout) or (
+                        entry.get("lease") is None and entry.get("draining")):
+                    stale.append(name)
+                    del state[name]
+                elif (entry.get("lease") is None and entry["builder"] == builder
+                        and entry["spec"] != key):
+                    stale.append(name)  # started for another image, mounts or deps
+                    del state[name]
+            chosen = next((n for n, e in sorted(state.items())
+                           if e["builder"] == builder and e["spec"] == key
+                           and e.get("lease") is None and not e.get("draining")), None)
+            if chosen:
+                state[chosen]["lease"] = os.getpid()
+            elif sum(1 for e in state.values() if e["builder"] == builder) < max(1, size):
+                new_name = f"repcid-pool-{builder.lower()}-{secrets.token_hex(3)}"
+                state[new_name] = {"builder": builder, "image": image, "spec": key,
+                                   "jobs": 0, "created": now, "last_used": now,
+                                   "lease": os.getpid()}
+        for name in stale:
+            _remove(name, pool_dir)
+
+        if new_name:
+            try:
+                start(new_name, builder, image, platform, mounts, source_mode, key, pool_dir)
+            except PoolError:
+                with locked_json(_state_path(pool_dir)) as state:
+                    state.pop(new_name, None)
+                raise
+            print(f"[pool] started {new_name}")
+            return new_name
+        if chosen:
+            if healthy(chosen):
+                return chosen
+            print(f"[pool] {chosen} failed its health check — replacing it", file=sys.stderr)
+            with locked_json(_state_path(pool_dir)) as state:
+                state.pop(chosen, None)
+            _remove(chosen, pool_dir)
+            continue
+        if not waiting:
+            print(f"[pool] all {builder} containers busy — waiting")
+            waiting = True
+        time.sleep(WAIT_INTERVAL)
+
+
+def release(name: str, pool_dir: str = DEFAULT_POOL_DIR,
+            max_jobs: int = DEFAULT_MAX_JOBS) -> None:
+    """Return a leased container, recycling it after max_jobs jobs or a drain."""
+    with locked_json(_state_path(pool_dir)) as state:
+        entry = state.get(name)
+        if entry is None:
+            recycle = True
+        else:
+            entry["jobs"] += 1
+            entry["last_used"] = time.time()
+            entry["lease"] = None
+            recycle = entry["jobs"] >= max_jobs or entry.get("draining", False)
+            if recycle:
+                del state[name]
+    if recycle:
+        print(f"[pool] recycling {name}")
+        _remove(name, pool_dir)
+
+
+def run_job(name: str, project: str, build_root: str, command: str,
+            source_mode: str, pool_dir: str = DEFAULT_POOL_DIR) -> int:
+    """Run start.sh for project inside a leased container; returns its exit code."""
+    job = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', project)}-{os.getpid()}-{secrets.token_hex(2)}"
+    host_job = os.path.join(pool_dir, name, job)
+    src = os.path.join(build_root, "src", project)
+    if not os.path.isdir(src):
+        raise PoolError(f"staged source not found: {src}")
+    # start.sh copies (or overlays) the job before building, so links are safe
+    link_tree(src, os.path.join(host_job, "todo", project))
+    os.makedirs(os.path.join(host_job, "complete"), exist_ok=True)
+
+    env = {
+        "REPCID_TODO_DIR": f"{JOBS_MOUNT}/{job}/todo",
+        "REPCID_WORK_DIR": f"{WORK_ROOT}/{job}",
+        "REPCID_COMPLETE_DIR": f"{JOBS_MOUNT}/{job}/complete",
+        "SOURCE_MODE": source_mode,
+    }
+    cmd = ["docker", "exec"]
+    for k, v in env.items():
+        cmd += ["-e", f"{k}={v}"]
+    cmd += [name, *(command.split() or ["/bin/bash", "/startup/start.sh"])]
+    try:
+        sys.stdout.flush()
+        rc = subprocess.run(cmd).returncode
+        # complete/<project> holds the output, complete/.status the job record
+        complete = os.path.join(host_job, "complete")
+        for top in os.listdir(complete):
+            if rc != 0 and top == project:
+                continue
+            out = os.path.join(complete, top)
+            dest = os.path.join(build_root, "out", top)
+            os.makedirs(dest, exist_ok=True)
+            for entry in os.listdir(out):
+                target = os.path.join(dest, entry)
+                if os.path.isdir(target) and not os.path.islink(target):
+                    shutil.rmtree(target)
+                elif os.path.lexists(target):
+                    os.unlink(target)
+                shutil.move(os.path.join(out, entry), target)
+        return rc
+    finally:
+        # Files written in the container may belong to root: clean up in there
+        _docker("exec", name, "sh", "-c",
+                f'for m in {WORK_ROOT}/{job}/*; do umount "$m" 2>/dev/null; done; '
+                f"rm -rf {WORK_ROOT}/{job} {JOBS_MOUNT}/{job}")
+        shutil.rmtree(host_job, ignore_errors=True)
+
+
+def status(pool_dir: str = DEFAULT_POOL_DIR, max_jobs: int = DEFAULT_MAX_JOBS,
+           idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> list:
+    """Describe every pool container as a list of dicts (read-only)."""
+    with locked_json(_state_path(pool_dir)) as state:
+        entries = json.loads(json.dumps(state))
+    now = time.time()
+    result = []
+    for name, entry in sorted(entries.items()):
+        lease = entry.get("lease")
+        if lease is not None and _alive(lease):
+            phase = "busy"
+        elif entry.get("draining"):
+            phase = "draining"
+        elif _expired(entry, now, idle_timeout):
+            phase = "expired"
+        else:
+            phase = "idle"
+        result.append({
+            "name": name,
+            "builder": entry["builder"],
+            "image": entry["image"],
+            "state": phase,
+            "healthy": healthy(name),
+            "jobs": entry["jobs"],
+            "max_jobs": max_jobs,
+            "idle": now - entry.get("last_used", now),
+        })
+    return result
+
+
+def drain(builder: str = None, pool_dir: str = DEFAULT_POOL_DIR) -> tuple:
+    """Remove idle containers now and mark busy ones for removal on release.
+
+    Returns (removed, draining) name lists. Labelled containers missing from
+    the state file (left by a crashed run) are removed too.
+    """
+    removed, draining = [], []
+    with locked_json(_state_path(pool_dir)) as state:
+        for name, entry in list(state.items()):
+            if builder and entry["builder"] != builder:
+                continue
+            lease = entry.get("lease")
+            if lease is not None and _alive(lease):
+                entry["draining"] = True
+                draining.append(name)
+            else:
+                del state[name]
+                removed.append(name)
+        known = set(state)
+    labels = ["--filter", f"label={LABEL}=1"]
+    if builder:
+        labels += ["--filter", f"label={LABEL}.builder={builder}"]
+    listed = _docker("ps", "-a", *labels, "--format", "{{.Names}}")
+    if listed.returncode == 0:
+        removed += [n for n in listed.stdout.split() if n not in known and n not in removed]
+    for name in removed:
+        _remove(name, pool_dir)
+    return removed, draining
+
+
+def _print_status(rows: list) -> None:
+    if not rows:
+        print("No pool containers.")
+        return
+    width = max(len(r["name"]) for r in rows)
+    for r in rows:
+        health = "healthy" if r["healthy"] else "UNHEALTHY"
+        print(f"{r['name']:<{width}}  {r['builder']:<14} {r['state']:<8} {health:<9} "
+              f"jobs {r['jobs']}/{r['max_jobs']}  idle {int(r['idle'])}s  {r['image']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Warm builder container pool")
+    parser.add_argument(
+        "--pool-dir",
+        default=DEFAULT_POOL_DIR,
+        help="Pool state and job directories (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("run", help="Build a staged project in a pool container")
+    sp.add_argument("--builder", required=True, help="Builder name, e.g. ubuntu_amd64")
+    sp.add_argument("--compose-file", required=True, help="Builder compose file")
+    sp.add_argument("--image", default="", help="Image to run (default: the compose file's)")
+    sp.add_argument("--project", required=True, help="Project name under <build-root>/src")
+    sp.add_argument("--build-root", required=True, help="Directory holding src/ and out/")
+    sp.add_argument("--size", type=int, default=None,
+                    help=f"Containers per builder (default: POOL_SIZE, else {DEFAULT_SIZE})")
+    sp.add_argument("--max-jobs", type=int, default=None,
+                    help=f"Recycle a container after this many jobs "
+                         f"(default: POOL_MAX_JOBS, else {DEFAULT_MAX_JOBS})")
+
+    sp = sub.add_parser("status", help="List pool containers")
+    sp.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+
+    sp = sub.add_parser("drain", help="Remove pool containers (busy ones after their job)")
+    sp.add_argument("--builder", default=None, help="Only drain this builder")
+
+    args = parser.parse_args()
+    max_jobs = env_number("POOL_MAX_JOBS", DEFAULT_MAX_JOBS, prog="pool")
+    idle_timeout = env_number("POOL_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT, float, "pool")
+
+    try:
+        if args.cmd == "run":
+            size = args.size
+            if size is None:
+                size = env_number("POOL_SIZE", DEFAULT_SIZE, prog="pool")
+            if args.max_jobs is not None:
+                max_jobs = args.max_jobs
+            service = compose_service(args.compose_file)
+            image = args.image or service["image"]
+            mounts = pool_mounts(service["volumes"])
+            source_mode = os.getenv("SOURCE_MODE", "copy")
+            deps = deps_digest(os.path.join(args.build_root, "src", args.project))
+            name = acquire(args.builder, image, service["platform"], mounts, source_mode,
+                           args.pool_dir, size, idle_timeout, deps=deps)
+            print(f"[pool] {args.builder}: running {args.project} in {name}")
+            try:
+                rc = run_job(name, args.project, args.build_root, service["command"],
+                             source_mode, args.pool_dir)
+            finally:
+                release(name, args.pool_dir, max_jobs)
+            raise SystemExit(rc)
+        elif args.cmd == "status":
+            rows = status(args.pool_dir, max_jobs, idle_timeout)
+            if args.json:
+                print(json.dumps(rows, indent=4))
+            else:
+                _print_status(rows)
+        elif args.cmd == "drain":
+            removed, draining = drain(args.builder, args.pool_dir)
+            for name in removed:
+                print(f"[pool] removed {name}")
+            for name in draining:
+                print(f"[pool] {name} is busy — removing it after its job")
+            if not removed and not draining:
+                print("[pool] nothing to drain")
+    except (OSError, PoolError) as exc:
+        print(f"pool: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
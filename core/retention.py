@@ -0,0 +1,249 @@
+"""retention.py — index retention rules and staged-artifact garbage collection.
+
+`repcid gc` trims the index with declarative rules and removes what the
+trimmed index no longer references. A (version, target) pair is kept when
+any rule keeps it:
+
+    keep_last N   it is one of the N highest versions published for that
+                  target
+    since DATE    its version was published on or after DATE (versions
+                  published before dates were recorded count as older)
+    latest        always: the package's latest version and the latest
+                  version of every target
+
+Versions left without targets are dropped, and version_order,
+latest_by_target and latest are rebuilt from what remains. The whole plan is
+applied to the index in one write. Afterwards every tarball, signature,
+packer sidecar and release notes file in the staging tree that the index no
+longer references is an orphan and is removed; with a release cleanup, the
+GitHub assets (or whole releases) of the removed entries are deleted too.
+Projects with a pipeline in flight (their project lock is held) are left
+alone: an overlapped run stages its tarballs before they reach the index.
+"""
+
+import os
+import re
+import subprocess
+from copy import deepcopy
+from datetime import datetime, timezone
+
+from core.fsutil import LockTimeout, file_lock
+from core.index import (
+    NOTES_DIR,
+    Version,
+    canonical_json,
+    package_name,
+    rebuild_latest_by_target,
+    rebuild_version_order,
+)
+
+# <name>_v<version>_<os>_<arch>.tar.gz and the files staged next to it
+_ARTIFACT_RE = re.compile(
+    r"^(?P<pkg>.+_v.+_[^_]+_[^_]+)\.tar\.gz(?:\.minisig|\.sha256|\.meta\.json)?$"
+)
+# Top-level entries of the staging repo that are not package directories
+_STAGING_RESERVED = {"index", "keys"}
+
+
+class RetentionError(Exception):
+    """Raised when retention rules are invalid."""
+
+
+def parse_since(text: str) -> datetime:
+    """Parse a YYYY-MM-DD date or ISO 8601 timestamp (UTC when naive)."""
+    try:
+        when = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise RetentionError(f"Invalid date {text!r}: expected YYYY-MM-DD or an ISO 8601 timestamp")
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def _published(entry: dict):
+    stamp = entry.get("published")
+    if not stamp:
+        return None
+    try:
+        return parse_since(stamp)
+    except RetentionError:
+        return None
+
+
+def plan(metadata: dict, keep_last: int = None, since: datetime = None, names: list = None) -> list:
+    """Return the (name, version, target) entries the rules do not keep.
+
+    At least one of keep_last and since must be given; latest versions are
+    always kept.
+    """
+    if keep_last is None and since is None:
+        raise RetentionError("no retention rule given (keep-last and/or keep-since)")
+    if keep_last is not None and keep_last < 1:
+        raise RetentionError("keep-last must be at least 1")
+    removals = []
+    for name in sorted(names if names is not None else metadata):
+        pkg = metadata.get(name)
+        if not isinstance(pkg, dict):
+            continue
+        versions = pkg.get("versions", {})
+        latest = pkg.get("latest")
+        latest_by_target = pkg.get("latest_by_target", {})
+        by_target = {}
+        for version in sorted(versions, key=Version, reverse=True):
+            for target in versions[version].get("targets", {}):
+                by_target.setdefault(target, []).append(version)
+        for target, newest_first in sorted(by_target.items()):
+            for rank, version in enumerate(newest_first):
+                if version == latest or latest_by_target.get(target) == version:
+                    continue
+                if keep_last is not None and rank < keep_last:
+                    continue
+                published = _published(versions[version])
+                if since is not None and published is not None and published >= since:
+                    continue
+                removals.append((name, version, target))
+    return removals
+
+
+def apply(metadata: dict, removals: list) -> list:
+    """Remove the planned entries; returns the (name, version) pairs dropped whole."""
+    dropped = []
+    touched = set()
+    for name, version, target in removals:
+        entry = metadata[name]["versions"].get(version)
+        if entry is None:
+            continue
+        entry.get("targets", {}).pop(target, None)
+        touched.add(name)
+        if not entry.get("targets"):
+            del metadata[name]["versions"][version]
+            dropped.append((name, version))
+    for name in sorted(touched):
+        pkg = metadata[name]
+        if not pkg["versions"]:
+            del metadata[name]
+            continue
+        rebuild_version_order(metadata, name)
+        rebuild_latest_by_target(metadata, name)
+        pkg["latest"] = pkg["version_order"][-1]
+    return dropped
+
+
+def _referenced(metadata: dict) -> tuple:
+    """Package names and notes digests the index still points at."""
+    pkgs, notes = set(), set()
+    for name, pkg in metadata.items():
+        for version, entry in pkg.get("versions", {}).items():
+            for target in entry.get("targets", {}):
+                op_sys, _, arch = target.partition("_")
+                pkgs.add(package_name(name, version, op_sys, arch))
+            if isinstance(entry.get("notes"), dict):
+                notes.add(f"{entry['notes']['sha256']}.md")
+    return pkgs, notes
+
+
+def busy_projects(lock_dir: str) -> set:
+    """Projects whose pipeline currently holds its lock (locks/project-<name>.lock)."""
+    busy = set()
+    if not os.path.isdir(lock_dir):
+        return busy
+    for fname in os.listdir(lock_dir):
+        if not (fname.startswith("project-") and fname.endswith(".lock")):
+            continue
+        try:
+            with file_lock(os.path.join(lock_dir, fname), timeout=0):
+                pass
+        except LockTimeout:
+            busy.add(fname[len("project-"):-len(".lock")])
+    return busy
+
+
+def orphans(metadata: dict, staging_dir: str = None, index_dir: str = None,
+            skip: set = frozenset()) -> list:
+    """Files in the staging tree (and local notes) the index no longer references.
+
+    Package directories of the projects in skip are not scanned.
+    """
+    pkgs, notes = _referenced(metadata)
+    found = []
+    notes_dirs = []
+    if index_dir:
+        notes_dirs.append(os.path.join(index_dir, NOTES_DIR))
+    if staging_dir and os.path.isdir(staging_dir):
+        notes_dirs.append(os.path.join(staging_dir, "index", NOTES_DIR))
+        for project in sorted(os.listdir(staging_dir)):
+            project_dir = os.path.join(staging_dir, project)
+            if (project in _STAGING_RESERVED or project in skip or project.startswith(".")
+                    or not os.path.isdir(project_dir)):
+                continue
+            for directory in (project_dir, os.path.join(project_dir, "signatures")):
+                if not os.path.isdir(directory):
+                    continue
+                for fname in sorted(os.listdir(directory)):
+                    m = _ARTIFACT_RE.match(fname)
+                    if m and m.group("pkg") not in pkgs:
+                        found.append(os.path.join(directory, fname))
+    for directory in notes_dirs:
+        if os.path.isdir(directory):
+            found += [os.path.join(directory, f) for f in sorted(os.listdir(directory))
+                      if f.endswith(".md") and f not in notes]
+    return found
+
+
+def collect(metadata: dict, removals: list, staging_dir: str = None, index_dir: str = None,
+            skip: set = frozenset()) -> dict:
+    """Work out what a gc would reclaim, without changing anything on disk.
+
+    Returns {"metadata": trimmed copy, "removals", "dropped", "orphans",
+    "orphan_bytes", "index_bytes"}.
+    """
+    trimmed = deepcopy(metadata)
+    dropped = apply(trimmed, removals)
+    files = orphans(trimmed, staging_dir, index_dir, skip)
+    return {
+        "metadata": trimmed,
+        "removals": removals,
+        "dropped": dropped,
+        "orphans": files,
+        "orphan_bytes": sum(os.path.getsize(f) for f in files if os.path.isfile(f)),
+        "index_bytes": len(canonical_json(metadata)) - len(canonical_json(trimmed)),
+    }
+
+
+def remove_orphans(files: list, staging_dir: str = None) -> None:
+    """Delete orphaned files; tracked ones are also removed from the staging git index."""
+    for fname in files:
+        if os.path.exists(fname):
+            os.remove(fname)
+    tracked = [f for f in files if staging_dir and f.startswith(os.path.join(staging_dir, ""))]
+    if tracked and os.path.isdir(os.path.join(staging_dir, ".git")):
+        subprocess.run(
+            ["git", "-C", staging_dir, "rm", "-q", "--cached", "--ignore-unmatch", "--",
+             *[os.path.relpath(f, staging_dir) for f in tracked]],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False,
+        )
+
+
+def release_cleanup(removals: list, dropped: list) -> list:
+    """Delete the GitHub releases of dropped versions and the assets of removed targets.
+
+    Returns a warning line per gh call that failed.
+    """
+    warnings = []
+    whole = set(dropped)
+    for name, version in dropped:
+        tag = f"{name}-v{version}"
+        result = subprocess.run(["gh", "release", "delete", tag, "--yes", "--cleanup-tag"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        if result.returncode != 0:
+            warnings.append(f"failed to delete GitHub release {tag}")
+    for name, version, target in removals:
+        if (name, version) in whole:
+            continue
+        tag = f"{name}-v{version}"
+        op_sys, _, arch = target.partition("_")
+        tarball = f"{package_name(name, version, op_sys, arch)}.tar.gz"
+        for asset in (tarball, f"{tarball}.minisig", f"{tarball}.sha256"):
+            result = subprocess.run(["gh", "release", "delete-asset", tag, asset, "--yes"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            if result.returncode != 0:
+                warnings.append(f"failed to delete asset {asset} from GitHub release {tag}")
+    return warnings
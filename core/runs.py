@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""runs.py — run manifests, so a partly failed pipeline can be resumed.
+
+Every publish_pipeline.sh run (dry runs excepted) gets an id and a manifest
+at runs/<run-id>/manifest.json recording the project, the version it
+resolved and, per builder, how far that target got:
+
+    pending -> signed -> published      (or failed, with the failing step)
+
+A signed target's tarball, .minisig, .sha256 and .meta.json are linked into
+runs/<run-id>/out/ together with the tarball's digest, so they outlive the
+next run of the project wiping builds/<project>/. `repcid resume <run-id>`
+runs the pipeline again for the targets that were not published, at the
+recorded version: signed targets whose artifacts still match their digest
+are reused as they are, the rest are rebuilt. Artifacts of published
+targets are dropped from the run; the manifest is kept.
+
+Usage (from publish_pipeline.sh):
+    runs.py start <project> --project-path P --update-type T --builders b1,b2
+                  --staging-dir S [--id RUN_ID]       prints the run id
+    runs.py version <run-id> <version>
+    runs.py signed <run-id> <builder> <pkg> <out_dir>
+    runs.py mark <run-id> <state> <builder> [builder ...] [--step STEP]
+    runs.py restore <run-id> <builder> <out_dir>       exit 1 if not reusable
+    runs.py finish <run-id>
+    runs.py show <run-id> [--json] | runs.py list
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import link_or_copy, locked_json  # noqa: E402
+
+DEFAULT_RUNS_DIR = os.getenv("RUNS_DIR") or os.path.join(WORKING_DIR, "runs")
+
+PENDING = "pending"
+SIGNED = "signed"
+PUBLISHED = "published"
+FAILED = "failed"
+TARGET_STATES = (PENDING, SIGNED, PUBLISHED, FAILED)
+
+ARTIFACT_SUFFIXES = (".tar.gz", ".tar.gz.minisig", ".tar.gz.sha256", ".tar.gz.meta.json")
+
+
+class RunError(Exception):
+    """Raised for unknown runs and invalid manifest updates."""
+
+
+def new_run_id(project: str) -> str:
+    return f"{project}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid() % 10000:04d}"
+
+
+def run_dir(runs_dir: str, run_id: str) -> str:
+    if not run_id or os.sep in run_id or run_id.startswith("."):
+        raise RunError(f"invalid run id: {run_id!r}")
+    return os.path.join(runs_dir, run_id)
+
+
+def manifest_path(runs_dir: str, run_id: str) -> str:
+    return os.path.join(run_dir(runs_dir, run_id), "manifest.json")
+
+
+def load_run(runs_dir: str, run_id: str) -> dict:
+    try:
+        with open(manifest_path(runs_dir, run_id), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise RunError(f"no such run: {run_id}")
+    except ValueError as exc:
+        raise RunError(f"unreadable manifest for {run_id}: {exc}")
+
+
+def _update(runs_dir: str, run_id: str):
+    path = manifest_path(runs_dir, run_id)
+    if not os.path.isfile(path):
+        raise RunError(f"no such run: {run_id}")
+    return locked_json(path)
+
+
+def start_run(runs_dir: str, project: str, project_path: str, update_type: str,
+              builders: list, staging_dir: str, run_id: str = None) -> str:
+    """Create a manifest, or reopen run_id's for another attempt; returns the id."""
+    if run_id is None:
+        run_id = new_run_id(project)
+        os.makedirs(run_dir(runs_dir, run_id))
+        with locked_json(manifest_path(runs_dir, run_id)) as run:
+            run.update({
+                "id": run_id,
+                "project": project,
+                "project_path": project_path,
+                "update_type": update_type,
+                "staging_dir": staging_dir,
+                "version": None,
+                "attempts": 0,
+                "created": time.time(),
+                "targets": {},
+            })
+    with _update(runs_dir, run_id) as run:
+        if run["project"] != project:
+            raise RunError(f"run {run_id} belongs to project {run['project']}, not {project}")
+        run["attempts"] += 1
+        run["state"] = "running"
+        run["updated"] = time.time()
+        for builder in builders:
+            target = run["targets"].setdefault(builder, {"state": PENDING})
+            if target["state"] == FAILED:
+                target.update(state=PENDING, step=None)
+    return run_id
+
+
+def set_version(runs_dir: str, run_id: str, version: str) -> None:
+    with _update(runs_dir, run_id) as run:
+        if run["version"] not in (None, version):
+            raise RunError(f"run {run_id} already published version {run['version']}")
+        run["version"] = version
+
+
+def mark(runs_dir: str, run_id: str, builders: list, state: str, step: str = None) -> None:
+    if state not in TARGET_STATES:
+        raise RunError(f"unknown target state: {state}")
+    with _update(runs_dir, run_id) as run:
+        for builder in builders:
+            target = run["targets"].setdefault(builder, {})
+            target.update(state=state, step=step)
+        run["updated"] = time.time()
+
+
+def file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def record_signed(runs_dir: str, run_id: str, builder: str, pkg: str, out_dir: str) -> dict:
+    """Keep one signed target's artifacts with the run and record their digest."""
+    keep = os.path.join(run_dir(runs_dir, run_id), "out")
+    os.makedirs(keep, exist_ok=True)
+    for suffix in ARTIFACT_SUFFIXES:
+        src = os.path.join(out_dir, pkg + suffix)
+        if os.path.isfile(src):
+            dst = os.path.join(keep, pkg + suffix)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            link_or_copy(src, dst)
+    artifact = os.path.join(keep, f"{pkg}.tar.gz")
+    entry = {
+        "state": SIGNED,
+        "step": None,
+        "pkg": pkg,
+        "artifact": artifact,
+        "sha256": file_digest(artifact),
+        "signed": os.path.isfile(f"{artifact}.minisig"),
+    }
+    with _update(runs_dir, run_id) as run:
+        run["targets"][builder] = entry
+        run["updated"] = time.time()
+    return entry
+
+
+def reusable(target: dict) -> bool:
+    """True when a signed target's kept artifacts are intact."""
+    artifact = target.get("artifact")
+    if target.get("state") != SIGNED or not target.get("signed") or not artifact:
+        return False
+    if not (os.path.isfile(artifact) and os.path.isfile(f"{artifact}.minisig")):
+        return False
+    return file_digest(artifact) == target.get("sha256")
+
+
+def restore(runs_dir: str, run_id: str, builder: str, out_dir: str) -> str:
+    """Link a reusable target's artifacts into out_dir; returns its package name."""
+    target = load_run(runs_dir, run_id)["targets"].get(builder, {})
+    if not reusable(target):
+        raise RunError(f"{builder} has no reusable artifacts in run {run_id}")
+    os.makedirs(out_dir, exist_ok=True)
+    keep = os.path.dirname(target["artifact"])
+    for suffix in ARTIFACT_SUFFIXES:
+        src = os.path.join(keep, target["pkg"] + suffix)
+        if os.path.isfile(src):
+            dst = os.path.join(out_dir, target["pkg"] + suffix)
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            link_or_copy(src, dst)
+    return target["pkg"]
+
+
+def remaining(run: dict) -> list:
+    """Builders of a run that still have to be published."""
+    return [b for b, t in run["targets"].items() if t.get("state") != PUBLISHED]
+
+
+def finish(runs_dir: str, run_id: str) -> str:
+    """Settle the run's state and drop the kept artifacts of published targets."""
+    with _update(runs_dir, run_id) as run:
+        left = remaining(run)
+        if not left:
+            run["state"] = "complete"
+        elif len(left) < len(run["targets"]):
+            run["state"] = "partial"
+        else:
+            run["state"] = "failed"
+        run["updated"] = time.time()
+        state = run["state"]
+        done = [t for t in run["targets"].values() if t.get("state") == PUBLISHED and t.get("pkg")]
+    keep = os.path.join(run_dir(runs_dir, run_id), "out")
+    for target in done:
+        for suffix in ARTIFACT_SUFFIXES:
+            try:
+                os.unlink(os.path.join(keep, target["pkg"] + suffix))
+            except FileNotFoundError:
+                pass
+    if os.path.isdir(keep) and not os.listdir(keep):
+        os.rmdir(keep)
+    return state
+
+
+def list_runs(runs_dir: str) -> list:
+    runs = []
+    if not os.path.isdir(runs_dir):
+        return runs
+    for run_id in sorted(os.listdir(runs_dir)):
+        try:
+            runs.append(load_run(runs_dir, run_id))
+        except RunError:
+            continue
+    return sorted(runs, key=lambda r: r.get("created", 0))
+
+
+def _print_run(run: dict) -> None:
+    print(f"Run      : {run['id']} ({run.get('state', '?')}, attempt {run.get('attempts', 0)})")
+    print(f"Project  : {run['project']} ({run.get('update_type')})")
+    print(f"Version  : {run.get('version') or '-'}")
+    for builder, target in run["targets"].items():
+        detail = target.get("pkg") or ""
+        if target.get("state") == FAILED and target.get("step"):
+            detail = f"at {target['step']}"
+        print(f"  {builder:<16} {target.get('state', '?'):<10} {detail}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pipeline run manifests")
+    parser.add_argument("--runs-dir", default=DEFAULT_RUNS_DIR, help="Default: %(default)s")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("start", help="Create (or reopen, with --id) a run; prints its id")
+    sp.add_argument("project")
+    sp.add_argument("--project-path", required=True)
+    sp.add_argument("--update-type", required=True)
+    sp.add_argument("--builders", required=True, help="Comma-separated builders")
+    sp.add_argument("--staging-dir", required=True)
+    sp.add_argument("--id", dest="run_id", default=None, help="Reopen this run")
+
+    sp = sub.add_parser("version", help="Record the version the run publishes")
+    sp.add_argument("run_id")
+    sp.add_argument("version")
+
+    sp = sub.add_parser("signed", help="Keep a signed target's artifacts with the run")
+    sp.add_argument("run_id")
+    sp.add_argument("builder")
+    sp.add_argument("pkg")
+    sp.add_argument("out_dir")
+
+    sp = sub.add_parser("mark", help="Set the state of one or more targets")
+    sp.add_argument("run_id")
+    sp.add_argument("state", choices=TARGET_STATES)
+    sp.add_argument("builders", nargs="+")
+    sp.add_argument("--step", default=None, help="Step that failed")
+
+    sp = sub.add_parser("restore", help="Link a signed target's artifacts into out_dir")
+    sp.add_argument("run_id")
+    sp.add_argument("builder")
+    sp.add_argument("out_dir")
+
+    sp = sub.add_parser("finish", help="Settle the run's state; prints it")
+    sp.add_argument("run_id")
+
+    sp = sub.add_parser("show", help="Print one run")
+    sp.add_argument("run_id")
+    sp.add_argument("--json", action="store_true")
+
+    sub.add_parser("list", help="List runs")
+
+    args = parser.parse_args()
+    try:
+        if args.cmd == "start":
+            builders = [b for b in args.builders.split(",") if b]
+            print(start_run(args.runs_dir, args.project, args.project_path, args.update_type,
+                            builders, args.staging_dir, args.run_id))
+        elif args.cmd == "version":
+            set_version(args.runs_dir, args.run_id, args.version)
+        elif args.cmd == "signed":
+            record_signed(args.runs_dir, args.run_id, args.builder, args.pkg, args.out_dir)
+        elif args.cmd == "mark":
+            mark(args.runs_dir, args.run_id, args.builders, args.state, args.step)
+        elif args.cmd == "restore":
+            print(restore(args.runs_dir, args.run_id, args.builder, args.out_dir))
+        elif args.cmd == "finish":
+            print(finish(args.runs_dir, args.run_id))
+        elif args.cmd == "show":
+            run = load_run(args.runs_dir, args.run_id)
+            if args.json:
+                print(json.dumps(run, indent=2, sort_keys=True))
+            else:
+                _print_run(run)
+        elif args.cmd == "list":
+            for run in list_runs(args.runs_dir):
+                left = len(remaining(run))
+                print(f"{run['id']:<40} {run.get('state', '?'):<9} "
+                      f"{run.get('version') or '-':<10} {left} target(s) left")
+    except (OSError, RunError) as exc:
+        print(f"runs: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""scheduler.py — host-level publish queue behind `repcid serve`.
+
+`repcid run` is a foreground process that owns the terminal (or SSH session)
+for the whole pipeline. The scheduler daemon instead accepts publish jobs on
+a Unix socket, keeps them in a durable on-disk queue and runs them as
+`repcid run` children, QUEUE_WORKERS at a time:
+
+    QUEUE_DIR/jobs/<id>.json        job record (state, timing, exit code)
+    QUEUE_DIR/logs/<id>.log         pipeline output
+    QUEUE_DIR/src/<id>/<project>    source snapshot taken at submit time
+
+The snapshot means the submitter's tree (e.g. the temporary copy made by
+repcid-remote) may go away as soon as `submit` returns. A queued job starts
+once a worker is free, every builder it targets is below its concurrency
+limit (QUEUE_BUILDER_LIMIT, overridden per builder by QUEUE_BUILDER_LIMITS,
+e.g. "windows_amd64=1,ubuntu_amd64=2") and no other job of the same project
+is running; jobs that do not fit yet are skipped, not waited on. SIGTERM stops
+the daemon once its running jobs have finished. Records survive a restart:
+queued jobs run when the daemon comes back, jobs that were still running
+(the daemon was killed) are marked failed. Finished records are dropped after
+QUEUE_RETENTION_DAYS.
+
+Protocol: one JSON object per line in each direction.
+    {"op": "ping"}                     -> {"ok": true}
+    {"op": "submit", "job": {...}}     -> {"ok": true, "job": {...}}
+    {"op": "status", "id": ID|null}    -> {"ok": true, "jobs": [...]}
+    {"op": "cancel", "id": ID}         -> {"ok": true, "job": {...}}
+    {"op": "shutdown"}                 -> {"ok": true}
+
+Usage (from `repcid serve|submit|status|wait|cancel`):
+    scheduler.py serve [--workers N] [--builder-limit N]
+    scheduler.py submit --project-path P --update-type T --builders b1,b2 [...]
+    scheduler.py status [ID] [--json]
+    scheduler.py wait ID [--timeout S] [--log]
+    scheduler.py cancel ID
+"""
+
+import argparse
+import json
+import os
+import secrets
+import shutil
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import LockTimeout, env_number, file_lock  # noqa: E402
+from core.index import safe_write_json  # noqa: E402
+
+MAIN = os.path.join(_lib_dir, "main.py")
+DEFAULT_QUEUE_DIR = os.getenv("QUEUE_DIR") or os.path.join(WORKING_DIR, "queue")
+DEFAULT_SOCKET = os.getenv("QUEUE_SOCKET") or os.path.join(DEFAULT_QUEUE_DIR, "repcid.sock")
+DEFAULT_WORKERS = 2
+DEFAULT_BUILDER_LIMIT = 1
+DEFAULT_BUILDER_LIMITS = os.getenv("QUEUE_BUILDER_LIMITS", "")
+DEFAULT_RETENTION_DAYS = 7.0
+TICK = 0.5
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueError(Exception):
+    """Raised for invalid jobs, unknown ids and an unreachable daemon."""
+
+
+def parse_limits(spec: str) -> dict:
+    """Parse "builder=N,builder=N" into {builder: N}."""
+    limits = {}
+    for item in spec.replace(" ", ",").split(","):
+        if not item:
+            continue
+        builder, sep, value = item.partition("=")
+        if not sep or not value.isdigit() or int(value) < 1:
+            raise QueueError(f"invalid builder limit {item!r} (expected builder=N, N >= 1)")
+        limits[builder] = int(value)
+    return limits
+
+
+def pick_next(queued: list, running: list, workers: int, limits: dict,
+              default_limit: int):
+    """The first queued job (in submit order) that may start now, or None."""
+    if len(running) >= workers:
+        return None
+    busy_projects = {job["project"] for job in running}
+    in_use = {}
+    for job in running:
+        for builder in job["builders"]:
+            in_use[builder] = in_use.get(builder, 0) + 1
+    for job in queued:
+        if job["project"] in busy_projects:
+            continue
+        if all(in_use.get(b, 0) < limits.get(b, default_limit) for b in job["builders"]):
+            return job
+        # Later jobs of this project must not overtake this one
+        busy_projects.add(job["project"])
+    return None
+
+
+def job_command(job: dict) -> list:
+    """The `repcid run` invocation for a job."""
+    cmd = [sys.executable, MAIN, "run", job["source"], job["update_type"],
+           "-b", ",".join(job["builders"])]
+    if job.get("stage_dir"):
+        cmd += ["--stage-dir", job["stage_dir"]]
+    if job.get("version"):
+        cmd += ["--version", job["version"]]
+    if job.get("dry_run"):
+        cmd.append("--dry-run")
+    if job.get("jobs"):
+        cmd += ["--jobs", str(job["jobs"])]
+    if job.get("overlap"):
+        cmd.append("--overlap")
+    if job.get("notes"):
+        cmd += ["--notes", job["notes"]]
+    return cmd
+
+
+def snapshot(project_path: str, dest: str) -> None:
+    """Copy a project tree into the queue.
+
+    With rsync installed the project's .repcidignore is honoured, so build
+    junk is not copied; otherwise the whole tree is (prepare_stage.sh still
+    applies the patterns when the job runs).
+    """
+    if shutil.which("rsync") is None:
+        shutil.copytree(project_path, dest, symlinks=True)
+        return
+    os.makedirs(dest, exist_ok=True)
+    cmd = ["rsync", "-a"]
+    ignore = os.path.join(project_path, ".repcidignore")
+    if os.path.isfile(ignore):
+        cmd.append(f"--exclude-from={ignore}")
+    result = subprocess.run(cmd + [project_path.rstrip("/") + "/", dest + "/"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise QueueError(f"cannot snapshot {project_path}: {result.stderr.strip()}")
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except (QueueError, OSError, ValueError, KeyError) as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class Scheduler(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, queue_dir: str = DEFAULT_QUEUE_DIR,
+                 workers: int = DEFAULT_WORKERS, limits: dict = None,
+                 default_limit: int = DEFAULT_BUILDER_LIMIT,
+                 retention_days: float = DEFAULT_RETENTION_DAYS, command=job_command):
+        self.socket_path = socket_path
+        self.queue_dir = queue_dir
+        self.workers = max(1, workers)
+        self.limits = limits or {}
+        self.default_limit = max(1, default_limit)
+        self.retention = retention_days * 86400
+        self.command = command
+        self.jobs = {}
+        self.procs = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        for sub in ("jobs", "logs", "src"):
+            os.makedirs(os.path.join(queue_dir, sub), exist_ok=True)
+        self._load()
+        old_umask = os.umask(0o177)  # socket is owner-only
+        try:
+            super().__init__(socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    # -- persistence -------------------------------------------------------
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.queue_dir, "jobs", f"{job_id}.json")
+
+    def _save(self, job: dict) -> None:
+        safe_write_json(self._record_path(job["id"]), job)
+
+    def _load(self) -> None:
+        jobs_dir = os.path.join(self.queue_dir, "jobs")
+        for entry in sorted(os.listdir(jobs_dir)):
+            if not entry.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(jobs_dir, entry), "r") as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get("state") == RUNNING:
+                # The daemon went away mid-run; the pipeline may have published
+                # part of the release, so it is not retried automatically
+                job.update(state=FAILED, finished=time.time(),
+                           error="interrupted: the scheduler stopped while it ran")
+                self._cleanup(job)
+                self._save(job)
+            self.jobs[job["id"]] = job
+
+    def _cleanup(self, job: dict) -> None:
+        shutil.rmtree(os.path.join(self.queue_dir, "src", job["id"]), ignore_errors=True)
+
+    # -- requests ----------------------------------------------------------
+
+    def dispatch(self, request: dict) -> dict:
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op == "submit":
+            return {"ok": True, "job": self.submit(request.get("job") or {})}
+        if op == "status":
+            return {"ok": True, "jobs": self.status(request.get("id"))}
+        if op == "cancel":
+            return {"ok": True, "job": self.cancel(request.get("id"))}
+        raise QueueError(f"unknown op: {op!r}")
+
+    def submit(self, spec: dict) -> dict:
+        project_path = spec.get("project_path") or ""
+        if not os.path.isdir(project_path):
+            raise QueueError(f"project path is not a directory: {project_path!r}")
+        if spec.get("update_type") not in ("major", "minor", "patch", "new"):
+            raise QueueError(f"invalid update type: {spec.get('update_type')!r}")
+        builders = [b for b in spec.get("builders") or [] if b]
+        if not builders:
+            raise QueueError("a job needs at least one builder")
+
+        job_id = time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(2)
+        project = os.path.basename(os.path.normpath(project_path))
+        source = os.path.join(self.queue_dir, "src", job_id, project)
+        snapshot(project_path, source)
+        job = {
+            "id": job_id,
+            "project": project,
+            "project_path": project_path,
+            "source": source,
+            "update_type": spec["update_type"],
+            "builders": builders,
+            "stage_dir": spec.get("stage_dir"),
+            "version": spec.get("version"),
+            "dry_run": bool(spec.get("dry_run")),
+            "jobs": spec.get("jobs"),
+            "overlap": bool(spec.get("overlap")),
+            "notes": spec.get("notes"),
+            "lock_timeout": spec.get("lock_timeout"),
+            "state": QUEUED,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "exit_code": None,
+            "log": os.path.join(self.queue_dir, "logs", f"{job_id}.log"),
+        }
+        with self._lock:
+            self._save(job)
+            self.jobs[job_id] = job
+        return job
+
+    def status(self, job_id: str = None) -> list:
+        with self._lock:
+            if job_id:
+                if job_id not in self.jobs:
+                    raise QueueError(f"no such job: {job_id}")
+                return [dict(self.jobs[job_id])]
+            return [dict(j) for j in sorted(self.jobs.values(), key=lambda j: j["submitted"])]
+
+    def cancel(self, job_id: str) -> dict:
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise QueueError(f"no such job: {job_id}")
+            if job["state"] == QUEUED:
+                job.update(state=CANCELLED, finished=time.time())
+                self._cleanup(job)
+                self._save(job)
+            elif job["state"] == RUNNING:
+                job["cancel_requested"] = True
+                self._save(job)
+                proc = self.procs.get(job_id)
+                if proc is not None:
+                    try:
+                        os.killpg(proc.pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+            else:
+                raise QueueError(f"job {job_id} already {job['state']}")
+            return dict(job)
+
+    # -- scheduling --------------------------------------------------------
+
+    def _start(self, job: dict) -> None:
+        env = os.environ.copy()
+        env["PYTHONUNBUFFERED"] = "1"
+        env["LOCK_WAIT"] = "1"  # queue behind a foreground run of the same project
+        if job.get("lock_timeout") is not None:
+            env["LOCK_TIMEOUT"] = str(job["lock_timeout"])
+        with open(job["log"], "ab") as log:
+            proc = subprocess.Popen(self.command(job), stdin=subprocess.DEVNULL,
+                                    stdout=log, stderr=subprocess.STDOUT, env=env,
+                                    cwd=self.queue_dir, start_new_session=True)
+        self.procs[job["id"]] = proc
+        job.update(state=RUNNING, started=time.time(), pid=proc.pid)
+        self._save(job)
+
+    def tick(self) -> None:
+        """Reap finished jobs, start whatever fits, drop expired records."""
+        with self._lock:
+            for job_id, proc in list(self.procs.items()):
+                rc = proc.poll()
+                if rc is None:
+                    continue
+                del self.procs[job_id]
+                job = self.jobs[job_id]
+                if job.pop("cancel_requested", False):
+                    state = CANCELLED
+                else:
+                    state = SUCCEEDED if rc == 0 else FAILED
+                job.update(state=state, finished=time.time(), exit_code=rc)
+                self._cleanup(job)
+                self._save(job)
+
+            if self._stopping.is_set():
+                return
+            while True:
+                running = [j for j in self.jobs.values() if j["state"] == RUNNING]
+                queued = sorted((j for j in self.jobs.values() if j["state"] == QUEUED),
+                                key=lambda j: (j["submitted"], j["id"]))
+                job = pick_next(queued, running, self.workers, self.limits, self.default_limit)
+                if job is None:
+                    break
+                try:
+                    self._start(job)
+                except OSError as exc:
+                    job.update(state=FAILED, finished=time.time(), error=str(exc))
+                    self._cleanup(job)
+                    self._save(job)
+
+            cutoff = time.time() - self.retention
+            for job_id, job in list(self.jobs.items()):
+                if job["state"] in FINISHED and (job["finished"] or 0) < cutoff:
+                    del self.jobs[job_id]
+                    for stale in (self._record_path(job_id), job["log"]):
+                        if os.path.exists(stale):
+                            os.remove(stale)
+
+    def run_loop(self) -> None:
+        while not self._stopping.is_set():
+            self.tick()
+            time.sleep(TICK)
+
+    def finish(self) -> None:
+        """Start nothing new and wait for the running pipelines to end."""
+        self._stopping.set()
+        if self.procs:
+            print(f"[queue] stopping: waiting for {len(self.procs)} running job(s)", flush=True)
+        while True:
+            self.tick()
+            with self._lock:
+                if not self.procs:
+                    return
+            time.sleep(TICK)
+
+    def server_close(self):
+        self._stopping.set()
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path: str, queue_dir: str = DEFAULT_QUEUE_DIR, **kwargs) -> None:
+    """Run the daemon in the foreground; only one per queue directory."""
+    os.makedirs(queue_dir, exist_ok=True)
+    try:
+        with file_lock(os.path.join(queue_dir, "serve.lock"), timeout=0):
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = Scheduler(socket_path, queue_dir, **kwargs)
+
+            def _stop(signum, frame):
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+            signal.signal(signal.SIGTERM, _stop)
+            signal.signal(signal.SIGINT, _stop)
+            threading.Thread(target=server.run_loop, daemon=True).start()
+            print(f"[queue] serving {socket_path} ({server.workers} worker(s))", flush=True)
+            try:
+                server.serve_forever(poll_interval=0.2)
+            finally:
+                # A half-finished pipeline would be marked failed on restart,
+                # so running jobs are allowed to complete first
+                server.finish()
+                server.server_close()
+    except LockTimeout:
+        raise QueueError(f"a scheduler is already serving {queue_dir}")
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def request(socket_path: str, payload: dict, timeout: float = None) -> dict:
+    """Send one request to the daemon and return its reply."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(payload).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise QueueError(f"no scheduler on {socket_path} (start one with `repcid serve`)")
+    if not line:
+        raise QueueError("scheduler closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise QueueError(reply.get("error", "scheduler request failed"))
+    return reply
+
+
+def wait_for(socket_path: str, job_id: str, timeout: float = None, log: bool = False,
+             interval: float = 1.0) -> dict:
+    """Poll until a job finishes and return its record; optionally echo its log."""
+    deadline = time.monotonic() + timeout if timeout else None
+    offset = 0
+    while True:
+        job = request(socket_path, {"op": "status", "id": job_id})["jobs"][0]
+        if log and os.path.exists(job["log"]):
+            with open(job["log"], "rb") as f:
+                f.seek(offset)
+                chunk = f.read()
+            offset += len(chunk)
+            sys.stdout.write(chunk.decode(errors="replace"))
+            sys.stdout.flush()
+        if job["state"] in FINISHED:
+            return job
+        if deadline is not None and time.monotonic() >= deadline:
+            raise QueueError(f"timed out waiting for job {job_id} ({job['state']})")
+        time.sleep(interval)
+
+
+def _print_status(jobs: list) -> None:
+    if not jobs:
+        print("No jobs.")
+        return
+    now = time.time()
+    for job in jobs:
+        if job["state"] == QUEUED:
+            when = f"waiting {int(now - job['submitted'])}s"
+        elif job["state"] == RUNNING:
+            when = f"running {int(now - job['started'])}s"
+        elif job["started"]:
+            when = f"took {int(job['finished'] - job['started'])}s"
+        else:
+            when = "-"
+        code = "" if job["exit_code"] is None else f" (exit {job['exit_code']})"
+        print(f"{job['id']}  {job['state']:<9} {job['project']:<16} {job['update_type']:<5} "
+              f"{when:<14} {','.join(job['builders'])}{code}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repman publish queue")
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help="Scheduler socket (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("serve", help="Run the scheduler daemon in the foreground")
+    sp.add_argument("--queue-dir", default=DEFAULT_QUEUE_DIR,
+                    help="Job records, logs and snapshots (default: %(default)s)")
+    sp.add_argument("--workers", type=int, default=None,
+                    help=f"Pipelines run at once (default: QUEUE_WORKERS, else {DEFAULT_WORKERS})")
+    sp.add_argument("--builder-limit", type=int, default=None,
+                    help=f"Jobs per builder at once "
+                         f"(default: QUEUE_BUILDER_LIMIT, else {DEFAULT_BUILDER_LIMIT})")
+    sp.add_argument("--builder-limits", default=DEFAULT_BUILDER_LIMITS,
+                    help="Per-builder overrides, e.g. windows_amd64=1,ubuntu_amd64=2")
+
+    sp = sub.add_parser("submit", help="Queue a publish job")
+    sp.add_argument("--project-path", required=True)
+    sp.add_argument("--update-type", required=True, choices=["major", "minor", "patch", "new"])
+    sp.add_argument("--builders", required=True, help="Comma-separated builders")
+    sp.add_argument("--stage-dir", default=None)
+    sp.add_argument("--version", dest="explicit_version", default=None)
+    sp.add_argument("--dry-run", action="store_true")
+    sp.add_argument("--jobs", type=int, default=None)
+    sp.add_argument("--overlap", action="store_true")
+    sp.add_argument("--notes", default=None)
+    sp.add_argument("--lock-timeout", type=int, default=None)
+
+    sp = sub.add_parser("status", help="List jobs")
+    sp.add_argument("id", nargs="?", default=None)
+    sp.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+
+    sp = sub.add_parser("wait", help="Wait for a job; exits with its exit code")
+    sp.add_argument("id")
+    sp.add_argument("--timeout", type=float, default=None, help="Give up after this many seconds")
+    sp.add_argument("--log", action="store_true", help="Print the job's output as it runs")
+
+    sp = sub.add_parser("cancel", help="Cancel a queued or running job")
+    sp.add_argument("id")
+
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "serve":
+            workers = args.workers
+            if workers is None:
+                workers = env_number("QUEUE_WORKERS", DEFAULT_WORKERS, prog="scheduler")
+            default_limit = args.builder_limit
+            if default_limit is None:
+                default_limit = env_number("QUEUE_BUILDER_LIMIT", DEFAULT_BUILDER_LIMIT,
+                                           prog="scheduler")
+            retention_days = env_number("QUEUE_RETENTION_DAYS", DEFAULT_RETENTION_DAYS, float,
+                                        "scheduler")
+            serve(args.socket, args.queue_dir, workers=workers,
+                  limits=parse_limits(args.builder_limits), default_limit=default_limit,
+                  retention_days=retention_days)
+        elif args.cmd == "submit":
+            spec = {
+                "project_path": os.path.abspath(args.project_path),
+                "update_type": args.update_type,
+                "builders": [b for b in args.builders.split(",") if b],
+                "stage_dir": os.path.abspath(args.stage_dir) if args.stage_dir else None,
+                "version": args.explicit_version,
+                "dry_run": args.dry_run,
+                "jobs": args.jobs,
+                "overlap": args.overlap,
+                "notes": args.notes,
+                "lock_timeout": args.lock_timeout,
+            }
+            job = request(args.socket, {"op": "submit", "job": spec})["job"]
+            print(f"[queue] submitted {job['id']} ({job['project']} {job['update_type']}, "
+                  f"{','.join(job['builders'])})", file=sys.stderr)
+            print(job["id"])
+        elif args.cmd == "status":
+            jobs = request(args.socket, {"op": "status", "id": args.id})["jobs"]
+            if args.json:
+                print(json.dumps(jobs if args.id is None else jobs[0], indent=4))
+            else:
+                _print_status(jobs)
+        elif args.cmd == "wait":
+            job = wait_for(args.socket, args.id, args.timeout, args.log)
+            print(f"[queue] {job['id']}: {job['state']}", file=sys.stderr)
+            if job["state"] != SUCCEEDED:
+                rc = job["exit_code"]
+                raise SystemExit(rc if rc and rc > 0 else 1)
+        elif args.cmd == "cancel":
+            job = request(args.socket, {"op": "cancel", "id": args.id})["job"]
+            verb = "cancelled" if job["state"] == CANCELLED else "cancelling"
+            print(f"[queue] {verb} {job['id']}")
+    except (OSError, QueueError) as exc:
+        print(f"scheduler: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
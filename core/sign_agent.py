@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""sign_agent.py — unlock the minisign key once and sign files over a socket.
+
+minisign re-derives the key-encryption key with scrypt on every call, which
+dominates signing time when a release signs a dozen files. The agent does
+that derivation once, keeps the decrypted Ed25519 key in memory for the
+length of one pipeline run, and signs batches of files in parallel for
+clients on a private Unix socket.
+
+Signatures use minisign's default prehashed ("ED", BLAKE2b-512) format with
+the same comments minisign writes, so the .minisig files verify with
+`minisign -V` like any other.
+
+Protocol: one JSON object per line in each direction.
+    {"op": "ping"}                         -> {"ok": true}
+    {"op": "sign", "files": [...]}         -> {"ok": true, "signed": [...]}
+    {"op": "shutdown"}                     -> {"ok": true}
+
+Usage (from publish_pipeline.sh / scripts/signing.sh):
+    echo "$SIG_PASS" | sign_agent.py serve --socket S --key CI_KEY [--parent PID]
+    sign_agent.py ping [--wait SECONDS] [--pid PID]
+    sign_agent.py sign FILE [FILE ...]
+    sign_agent.py stop
+
+Requires the optional `cryptography` package; without it `serve` exits with
+status 2 and callers fall back to plain minisign.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+sys.path.append(_lib_dir)
+from core.fsutil import env_number  # noqa: E402
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+except ImportError:  # optional dependency
+    Ed25519PrivateKey = None
+
+DEFAULT_SOCKET = os.getenv("SIGN_AGENT_SOCK", "")
+DEFAULT_JOBS = os.cpu_count() or 1
+DEFAULT_IDLE_TIMEOUT = 3600
+UNAVAILABLE_EXIT = 2
+
+UNTRUSTED_COMMENT = "signature from minisign secret key"
+_SIG_ALG_HASHED = b"ED"
+_KEY_SIG_ALG = b"Ed"
+_KDF_SCRYPT = b"Sc"
+_KDF_NONE = b"\0\0"
+_CHK_BLAKE2B = b"B2"
+_SECRET_KEY_LEN = 2 + 2 + 2 + 32 + 8 + 8 + 104
+_CHUNK = 1 << 20
+
+
+class AgentError(Exception):
+    """Raised for key, protocol and signing failures."""
+
+
+# ---------------------------------------------------------------------------
+# minisign secret key
+# ---------------------------------------------------------------------------
+
+def _scrypt_params(opslimit: int, memlimit: int) -> tuple:
+    """Translate libsodium's opslimit/memlimit into scrypt (N, r, p).
+
+    Mirrors crypto_pwhash_scryptsalsa208sha256's pickparams(), which is what
+    minisign uses to encrypt its secret keys.
+    """
+    opslimit = max(opslimit, 32768)
+    r = 8
+    if opslimit < memlimit // 32:
+        p = 1
+        max_n = opslimit // (r * 4)
+        n_log2 = next(i for i in range(1, 63) if (1 << i) > max_n // 2)
+    else:
+        max_n = memlimit // (r * 128)
+        n_log2 = next(i for i in range(1, 63) if (1 << i) > max_n // 2)
+        max_rp = min((opslimit // 4) // (1 << n_log2), 0x3FFFFFFF)
+        p = max_rp // r
+    return 1 << n_log2, r, p
+
+
+class SecretKey:
+    """A decrypted minisign secret key."""
+
+    __slots__ = ("key_id", "_private")
+
+    def __init__(self, key_id: bytes, seed: bytes):
+        self.key_id = key_id
+        self._private = Ed25519PrivateKey.from_private_bytes(seed)
+
+    @classmethod
+    def load(cls, key_path: str, password: bytes) -> "SecretKey":
+        """Parse and decrypt a minisign secret key file."""
+        if Ed25519PrivateKey is None:
+            raise AgentError("the 'cryptography' package is not installed")
+        try:
+            with open(key_path, "r") as f:
+                lines = f.read().splitlines()
+            blob = base64.b64decode(lines[1], validate=True)
+        except (OSError, IndexError, ValueError) as exc:
+            raise AgentError(f"cannot read minisign secret key {key_path}: {exc}")
+        if len(blob) != _SECRET_KEY_LEN or blob[:2] != _KEY_SIG_ALG or blob[4:6] != _CHK_BLAKE2B:
+            raise AgentError(f"unsupported minisign secret key format: {key_path}")
+
+        kdf_alg = blob[2:4]
+        salt = blob[6:38]
+        opslimit, memlimit = struct.unpack("<QQ", blob[38:54])
+        keynum_sk = bytearray(blob[54:])
+        if kdf_alg == _KDF_SCRYPT:
+            n, r, p = _scrypt_params(opslimit, memlimit)
+            stream = hashlib.scrypt(
+                password, salt=salt, n=n, r=r, p=p,
+                maxmem=128 * r * (n + p + 2), dklen=len(keynum_sk),
+            )
+            for i, b in enumerate(stream):
+                keynum_sk[i] ^= b
+        elif kdf_alg != _KDF_NONE:
+            raise AgentError(f"unsupported key derivation in {key_path}")
+
+        key_id, secret, checksum = keynum_sk[:8], keynum_sk[8:72], keynum_sk[72:]
+        expected = hashlib.blake2b(_KEY_SIG_ALG + key_id + secret, digest_size=32).digest()
+        try:
+            if expected != checksum:
+                raise AgentError("wrong passphrase or corrupted secret key")
+            return cls(bytes(key_id), bytes(secret[:32]))
+        finally:
+            for i in range(len(keynum_sk)):
+                keynum_sk[i] = 0
+
+    def sign_file(self, file_path: str, trusted_comment: str = None) -> str:
+        """Sign file_path and return the .minisig document."""
+        h = hashlib.blake2b(digest_size=64)
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                h.update(chunk)
+        signature = self._private.sign(h.digest())
+        if trusted_comment is None:
+            trusted_comment = (
+                f"timestamp:{int(time.time())}\tfile:{os.path.basename(file_path)}\thashed"
+            )
+        global_sig = self._private.sign(signature + trusted_comment.encode())
+        return (
+            f"untrusted comment: {UNTRUSTED_COMMENT}\n"
+            f"{base64.b64encode(_SIG_ALG_HASHED + self.key_id + signature).decode()}\n"
+            f"trusted comment: {trusted_comment}\n"
+            f"{base64.b64encode(global_sig).decode()}\n"
+        )
+
+
+def write_signature(key: SecretKey, file_path: str, trusted_comment: str = None) -> str:
+    """Sign file_path and atomically write file_path.minisig. Returns its path."""
+    sig_path = f"{file_path}.minisig"
+    document = key.sign_file(file_path, trusted_comment)
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(os.path.abspath(sig_path)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(document)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, sig_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return sig_path
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except (AgentError, OSError, ValueError) as exc:
+                reply = {"ok": False, "error": str(exc)}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class SignAgent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, key: SecretKey, jobs: int = DEFAULT_JOBS,
+                 parent_pid: int = None, idle_timeout: int = DEFAULT_IDLE_TIMEOUT):
+        self.key = key
+        self.socket_path = socket_path
+        self.parent_pid = parent_pid
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+        old_umask = os.umask(0o177)  # socket is owner-only
+        try:
+            super().__init__(socket_path, _Handler)
+        finally:
+            os.umask(old_umask)
+
+    def dispatch(self, request: dict) -> dict:
+        self.last_used = time.monotonic()
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op == "sign":
+            files = request.get("files") or []
+            missing = [f for f in files if not os.path.isfile(f)]
+            if missing:
+                raise AgentError(f"not a file: {', '.join(missing)}")
+            comment = request.get("trusted_comment")
+            signed = list(self._pool.map(lambda f: write_signature(self.key, f, comment), files))
+            return {"ok": True, "signed": signed}
+        raise AgentError(f"unknown op: {op!r}")
+
+    def watchdog(self) -> None:
+        """Stop serving once the parent pipeline is gone or the agent sits idle."""
+        while True:
+            time.sleep(0.5)
+            if self.parent_pid:
+                try:
+                    os.kill(self.parent_pid, 0)
+                except ProcessLookupError:
+                    break
+            if time.monotonic() - self.last_used > self.idle_timeout:
+                break
+        self.shutdown()
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+        self.key = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path: str, key: SecretKey, **kwargs) -> None:
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    agent = SignAgent(socket_path, key, **kwargs)
+    threading.Thread(target=agent.watchdog, daemon=True).start()
+    try:
+        agent.serve_forever(poll_interval=0.2)
+    finally:
+        agent.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def request(socket_path: str, payload: dict, timeout: float = None) -> dict:
+    """Send one request to the agent and return its reply."""
+    if not socket_path:
+        raise AgentError("no agent socket (set SIGN_AGENT_SOCK)")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise AgentError("agent closed the connection")
+    reply = json.loads(line)
+    if not reply.get("ok"):
+        raise AgentError(reply.get("error", "agent request failed"))
+    return reply
+
+
+def wait_ready(socket_path: str, timeout: float, pid: int = None) -> bool:
+    """Poll until the agent answers a ping, it exits, or timeout passes."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(socket_path, {"op": "ping"}, timeout=1)
+            return True
+        except (OSError, AgentError, ValueError):
+            pass
+        if pid:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return False
+        time.sleep(0.1)
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repman minisign signing agent")
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help="Agent socket path (default: $SIGN_AGENT_SOCK)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("serve", help="Unlock the key (passphrase on stdin) and serve")
+    sp.add_argument("--key", required=True, help="minisign secret key (CI_KEY)")
+    sp.add_argument("--parent", type=int, default=None, help="Exit when this PID exits")
+    sp.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="Parallel signing threads (default: SIGN_AGENT_JOBS, else one per CPU)",
+    )
+    sp.add_argument(
+        "--idle-timeout",
+        type=int,
+        default=None,
+        help=f"Exit after this many idle seconds "
+             f"(default: SIGN_AGENT_IDLE_TIMEOUT, else {DEFAULT_IDLE_TIMEOUT})",
+    )
+
+    sp = sub.add_parser("ping", help="Check that the agent is up")
+    sp.add_argument("--wait", type=float, default=0, help="Keep trying for this many seconds")
+    sp.add_argument("--pid", type=int, default=None, help="Give up early if this PID exits")
+
+    sp = sub.add_parser("sign", help="Sign files, writing FILE.minisig next to each")
+    sp.add_argument("files", nargs="+")
+    sp.add_argument("-t", "--trusted-comment", default=None, help="Trusted comment override")
+
+    sub.add_parser("stop", help="Ask the agent to shut down")
+
+    args = parser.parse_args()
+
+    try:
+        if args.cmd == "serve":
+            jobs = args.jobs
+            if jobs is None:
+                jobs = env_number("SIGN_AGENT_JOBS", 0, prog="sign_agent")
+            idle_timeout = args.idle_timeout
+            if idle_timeout is None:
+                idle_timeout = env_number("SIGN_AGENT_IDLE_TIMEOUT", DEFAULT_IDLE_TIMEOUT,
+                                          prog="sign_agent")
+            if Ed25519PrivateKey is None:
+                print("sign_agent: 'cryptography' is not installed", file=sys.stderr)
+                raise SystemExit(UNAVAILABLE_EXIT)
+            password = bytearray(sys.stdin.buffer.readline().rstrip(b"\r\n"))
+            try:
+                key = SecretKey.load(args.key, bytes(password))
+            finally:
+                password[:] = bytes(len(password))
+            serve(args.socket, key, jobs=jobs or DEFAULT_JOBS, parent_pid=args.parent,
+                  idle_timeout=idle_timeout)
+        elif args.cmd == "ping":
+            if args.wait:
+                if not wait_ready(args.socket, args.wait, args.pid):
+                    raise SystemExit(1)
+            else:
+                request(args.socket, {"op": "ping"})
+        elif args.cmd == "sign":
+            files = [os.path.abspath(f) for f in args.files]
+            payload = {"op": "sign", "files": files}
+            if args.trusted_comment is not None:
+                payload["trusted_comment"] = args.trusted_comment
+            for sig in request(args.socket, payload)["signed"]:
+                print(f"[sign-agent] Signed: {sig[: -len('.minisig')]}")
+        elif args.cmd == "stop":
+            request(args.socket, {"op": "shutdown"}, timeout=5)
+    except (AgentError, OSError) as exc:
+        print(f"sign_agent: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
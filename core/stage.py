@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import os
-import re
 import json
 import argparse
 from dotenv import load_dotenv
@@ -12,15 +11,20 @@ _lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/.
 WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
 sys.path.append(_lib_dir)
 from core.builders import parse_builder
+from core.fsutil import LockTimeout
 from core.index import (
     add_version,
-    create_index_mdata,
+    check_package_name,
     create_pkg_md,
     get_version,
+    greater_version,
+    index_lock,
     package_name,
     safe_write_json,
     update_version,
+    Version,
 )
+from core.index_store import read_index, save_index
 
 
 ENV_FILE = os.path.join(WORKING_DIR, "data", "config.env")
@@ -33,15 +37,131 @@ DEFAULT_OUT_DIR = os.path.join(WORKING_DIR, "out")
 PKG_URL = os.getenv("GITHUB_REPO", "https://example.com/package")
 INITIAL_VERSION = "1.0.0"
 
-SEMVER_RE = re.compile(r'^\d+\.\d+\.\d+$')
+
+def _split_builders(spec: str) -> list:
+    return [b.strip() for b in spec.replace(" ", ",").split(",") if b.strip()]
 
 
 def ensure_environment(metadata_file: str, out_dir: str) -> None:
     os.makedirs(os.path.dirname(metadata_file), exist_ok=True)
     os.makedirs(out_dir, exist_ok=True)
-    if not os.path.exists(metadata_file):
-        with open(metadata_file, "w") as f:
+    if os.path.exists(metadata_file):
+        return
+    # Runs outside the index lock: link a complete empty index into place so
+    # a concurrent run neither reads a half-written file nor has its index
+    # replaced by this one
+    tmp_path = f"{metadata_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
             json.dump({}, f, indent=4)
+        try:
+            os.link(tmp_path, metadata_file)
+        except FileExistsError:
+            pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def resolve_version(metadata: dict, name: str, update_type: str, targets: list,
+                    explicit_version: str = None) -> str:
+    """Resolve the single version a staging run publishes for all targets.
+
+    An explicit version wins. Otherwise a new package starts at
+    INITIAL_VERSION and an existing one bumps from the highest version any of
+    the requested targets already has, falling back to the package's global
+    latest when none of them has been built yet. Raises ValueError when the
+    update type does not fit the package's state.
+    """
+    if explicit_version:
+        return explicit_version
+    if name not in metadata:
+        if update_type != "new":
+            raise ValueError(
+                f"Package '{name}' is not in the index; "
+                f"use update_type 'new' to register it."
+            )
+        return INITIAL_VERSION
+    if update_type == "new":
+        raise ValueError(
+            f"update_type 'new' is only valid for packages not yet in the index; "
+            f"'{name}' already exists. Use major/minor/patch instead."
+        )
+    curr_version = None
+    for op_sys, arch in targets:
+        ver = get_version(metadata, name, op_sys, arch)
+        if ver is not None and greater_version(ver, curr_version):
+            curr_version = ver
+    if curr_version is None:
+        # No prior build for these os_arch targets; bump from the package's
+        # global latest so a new platform tracks the real version.
+        curr_version = metadata[name]["latest"]
+    return update_version(curr_version, update_type)
+
+
+def stage_targets(metadata: dict, name: str, version: str, targets: list, notes=None) -> list:
+    """Add every (os, arch) target of one version to the in-memory index.
+
+    Targets already published at this version are reported and skipped.
+    Returns the (os, arch) pairs that were actually added.
+    """
+    pkg_url = f"{PKG_URL}/{name}-v{version}"
+    staged = []
+    for op_sys, arch in targets:
+        if add_version(metadata, name, version, op_sys, arch, pkg_url, notes=notes) is None:
+            print(
+                f"Version {version} for {name} "
+                f"({op_sys}_{arch}) already published; nothing to do."
+            )
+            continue
+        staged.append((op_sys, arch))
+    return staged
+
+
+def pending_record(metadata_file: str, name: str, version: str, staged: list,
+                   notes=None) -> dict:
+    """The index update of one staging run, for stage_commit.py to apply later."""
+    return {
+        "index": os.path.abspath(metadata_file),
+        "name": name,
+        "version": version,
+        "url": f"{PKG_URL}/{name}-v{version}",
+        "notes": notes,
+        "targets": [[op_sys, arch] for op_sys, arch in staged],
+    }
+
+
+def commit_staging(metadata_file: str, metadata: dict, out_dir: str, name: str,
+                   version: str, staged: list, pending: str = None, notes=None) -> list:
+    """Write every per-target metadata document, then the index, as one unit.
+
+    The index write is the commit point: if it fails, the per-target files
+    written before it are removed again so no half-staged state is left
+    behind. With pending, the index is left alone and the update is recorded
+    in that file instead (see stage_commit.py). Returns the package names in
+    target order.
+    """
+    written = []
+    pkg_names = []
+    try:
+        for op_sys, arch in staged:
+            pkg_name = package_name(name, version, op_sys, arch)
+            out_path = os.path.join(out_dir, f"{pkg_name}_md.json")
+            safe_write_json(out_path, create_pkg_md(name, version, op_sys, arch))
+            written.append(out_path)
+            pkg_names.append(pkg_name)
+        if pending:
+            safe_write_json(pending, pending_record(metadata_file, name, version, staged, notes))
+        else:
+            save_index(metadata_file, metadata, [name])
+    except Exception:
+        for out_path in written:
+            try:
+                os.remove(out_path)
+            except OSError:
+                pass
+        raise
+    return pkg_names
 
 
 def main() -> None:
@@ -59,6 +179,13 @@ def main() -> None:
         default=DEFAULT_BUILDER,
         help="Name of the builder to use for the program.",
     )
+    parser.add_argument(
+        "--builders",
+        type=str,
+        default=None,
+        help="Comma-separated builders to stage in one transaction (overrides -b). "
+             "Prints one '<builder>\\t<package name>' line per staged target.",
+    )
     parser.add_argument("-e", "--env", type=str, help="Path to environment file")
     parser.add_argument(
         "--metadata-file",
@@ -85,6 +212,14 @@ def main() -> None:
         default=None,
         help="Release notes to attach to this version in the index.",
     )
+    parser.add_argument(
+        "--pending",
+        default=None,
+        metavar="FILE",
+        help="Resolve the version and write the package metadata, but record the "
+             "index update in FILE instead of writing the index (applied later by "
+             "stage_commit.py).",
+    )
     args = parser.parse_args()
 
     metadata_file = args.metadata_file
@@ -93,89 +228,77 @@ def main() -> None:
     if args.env:
         load_dotenv(args.env)
 
+    try:
+        check_package_name(args.name)
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
     # Validate explicit version if provided
     explicit_version = None
     if args.explicit_version:
-        if not SEMVER_RE.match(args.explicit_version):
+        try:
+            Version(args.explicit_version)
+        except ValueError:
             raise SystemExit(
-                f"Invalid version '{args.explicit_version}'. Expected X.Y.Z format (e.g. 1.2.3)."
+                f"Invalid version '{args.explicit_version}'. "
+                f"Expected semver X.Y.Z[-pre][+build] (e.g. 1.2.3 or 2.0.0-rc.1)."
             )
         explicit_version = args.explicit_version
 
+    batch = args.builders is not None
+    builders = _split_builders(args.builders) if batch else [args.builder]
     try:
-        ensure_environment(metadata_file, out_dir)
-        with open(metadata_file, "r") as f:
-            metadata = json.load(f)
-    except Exception as exc:
-        print(f"Failed to initialize environment or read metadata: {exc}")
-        raise SystemExit(1)
-
-    try:
-        op_sys, arch = parse_builder(args.builder)
+        targets = [parse_builder(b) for b in builders]
     except ValueError as exc:
         raise SystemExit(str(exc))
+    if not targets:
+        raise SystemExit("--builders must name at least one builder")
 
     notes = args.notes or None
 
-    if explicit_version:
-        version = explicit_version
-        pkg_url = f"{PKG_URL}/{args.name}-v{version}"
-        if args.name not in metadata:
-            create_index_mdata(metadata, args.name, version, op_sys, arch, pkg_url, notes=notes)
-        else:
-            if add_version(metadata, args.name, version, op_sys, arch, pkg_url, notes=notes) is None:
-                print(
-                    f"Version {version} for {args.name} "
-                    f"({op_sys}_{arch}) already published; nothing to do."
-                )
-                raise SystemExit(0)
-    else:
-        version = INITIAL_VERSION
-        pkg_url = f"{PKG_URL}/{args.name}-v{version}"
-        if args.name not in metadata:
-            if args.update_type != "new":
-                raise SystemExit(
-                    f"Package '{args.name}' is not in the index; "
-                    f"use update_type 'new' to register it."
-                )
-            create_index_mdata(metadata, args.name, version, op_sys, arch, pkg_url, notes=notes)
-        else:
-            if args.update_type == "new":
-                raise SystemExit(
-                    f"update_type 'new' is only valid for packages not yet in the index; "
-                    f"'{args.name}' already exists. Use major/minor/patch instead."
-                )
-            curr_version = get_version(metadata, args.name, op_sys, arch)
-            if curr_version is None:
-                # No prior build for this os_arch; bump from the package's
-                # global latest so a new platform tracks the real version.
-                curr_version = metadata[args.name]["latest"]
-            version = update_version(curr_version, args.update_type)
-            pkg_url = f"{PKG_URL}/{args.name}-v{version}"
-            if add_version(metadata, args.name, version, op_sys, arch, pkg_url, notes=notes) is None:
-                print(
-                    f"Version {version} for {args.name} "
-                    f"({op_sys}_{arch}) already published; nothing to do."
-                )
-                raise SystemExit(0)
-
     try:
-        safe_write_json(metadata_file, metadata)
+        ensure_environment(metadata_file, out_dir)
     except Exception as exc:
-        print(f"Failed to write metadata file: {exc}")
+        print(f"Failed to initialize environment or read metadata: {exc}")
         raise SystemExit(1)
 
-    pkg_md = create_pkg_md(args.name, version, op_sys, arch)
-    pkg_name = package_name(args.name, version, op_sys, arch)
-    out_path = os.path.join(out_dir, f"{pkg_name}_md.json")
+    # The index is re-read under the lock so a concurrent writer's update is
+    # merged rather than overwritten
     try:
-        safe_write_json(out_path, pkg_md)
-    except Exception as exc:
-        print(f"Failed to write output file: {exc}")
+        with index_lock(metadata_file):
+            try:
+                metadata = read_index(metadata_file, [args.name])
+            except Exception as exc:
+                print(f"Failed to initialize environment or read metadata: {exc}")
+                raise SystemExit(1)
+
+            try:
+                version = resolve_version(metadata, args.name, args.update_type, targets,
+                                          explicit_version)
+            except ValueError as exc:
+                raise SystemExit(str(exc))
+
+            staged = stage_targets(metadata, args.name, version, targets, notes=notes)
+            if not staged:
+                raise SystemExit(0)
+
+            try:
+                pkg_names = commit_staging(metadata_file, metadata, out_dir, args.name,
+                                           version, staged, args.pending, notes)
+            except Exception as exc:
+                print(f"Failed to write staging output: {exc}")
+                raise SystemExit(1)
+    except LockTimeout as exc:
+        print(f"Index is locked: {exc}")
         raise SystemExit(1)
 
     print(f"Program {args.name} has been staged.")
-    print(pkg_name)
+    if batch:
+        # One "<builder>\t<package name>" line per staged target
+        for (op_sys, arch), pkg_name in zip(staged, pkg_names):
+            print(f"{op_sys}_{arch}\t{pkg_name}")
+    else:
+        print(pkg_names[0])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""stage_commit.py — apply an index update recorded by `stage.py --pending`.
+
+publish_pipeline.sh resolves a project's version and writes its package
+metadata right after the build, but only adds the version to the shared
+index once the artifacts are packaged and signed. This script does that
+last step: under the index lock it re-reads the index, merges the recorded
+targets into it and writes it back, so updates other projects committed in
+the meantime are kept (with INDEX_BACKEND=sqlite only the project's own
+rows are read and written, see index_store.py). A target that is already in the index at the
+recorded version is a conflict and nothing is written.
+
+With --artifacts, each target entry also gets its artifact's sha256 digest,
+compressed and unpacked sizes and minisign signature (see
+index.artifact_fields), read before the lock is taken.
+
+Usage (from publish_pipeline.sh):
+    stage_commit.py <pending.json> [--builders b1,b2] [--artifacts <dir>]
+        --builders limits the commit to the targets that were published
+        --artifacts is the directory holding the signed <pkg>.tar.gz files
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.builders import parse_builder  # noqa: E402
+from core.fsutil import LockTimeout  # noqa: E402
+from core.index import (  # noqa: E402
+    add_version,
+    artifact_fields,
+    index_lock,
+)
+from core.index_store import StoreError, read_index, save_index  # noqa: E402
+
+
+class CommitError(Exception):
+    """Raised when a pending index update cannot be applied."""
+
+
+def commit_pending(pending: dict, builders: list = None, artifacts_dir: str = None) -> list:
+    """Merge one pending staging run into its index; returns the targets added.
+
+    builders, when given, restricts the commit to those os_arch targets.
+    artifacts_dir, when given, holds the signed tarballs whose digest, sizes
+    and signature are inlined into the target entries.
+    """
+    targets = [tuple(t) for t in pending["targets"]]
+    if builders is not None:
+        wanted = {parse_builder(b) for b in builders}
+        targets = [t for t in targets if t in wanted]
+    if not targets:
+        raise CommitError("no pending target to commit")
+
+    index_path = pending["index"]
+    name, version = pending["name"], pending["version"]
+    artifacts = {}
+    if artifacts_dir is not None:
+        for op_sys, arch in targets:
+            artifacts[(op_sys, arch)] = artifact_fields(artifacts_dir, name, version, op_sys, arch)
+    with index_lock(index_path):
+        metadata = read_index(index_path, [name])
+        for op_sys, arch in targets:
+            entry = add_version(metadata, name, version, op_sys, arch, pending["url"],
+                                notes=pending.get("notes"),
+                                artifact=artifacts.get((op_sys, arch)))
+            if entry is None:
+                raise CommitError(
+                    f"{name} {version} ({op_sys}_{arch}) is already in the index; "
+                    f"was it published by another run?"
+                )
+        save_index(index_path, metadata, [name])
+    return targets
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply a pending index update from stage.py --pending")
+    parser.add_argument("pending", help="File written by stage.py --pending")
+    parser.add_argument(
+        "--builders",
+        default=None,
+        help="Comma-separated builders to commit (default: every pending target)",
+    )
+    parser.add_argument(
+        "--artifacts",
+        default=None,
+        help="Directory with the signed tarballs to inline digests and sizes from",
+    )
+    args = parser.parse_args()
+
+    builders = None
+    if args.builders is not None:
+        builders = [b for b in args.builders.split(",") if b]
+    try:
+        with open(args.pending, "r") as f:
+            pending = json.load(f)
+        targets = commit_pending(pending, builders, args.artifacts)
+    except (OSError, ValueError, KeyError, LockTimeout, CommitError, StoreError,
+            sqlite3.Error) as exc:
+        print(f"stage_commit: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+    print(f"Index updated: {pending['name']} {pending['version']} "
+          f"({', '.join(f'{o}_{a}' for o, a in targets)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""stage_files.py — place built artifacts into the staging repo without copying.
+
+For every package, the tarball (plus the packer's .meta.json sidecar when
+present) goes to <staging>/<project>/ and its .minisig and .sha256 go to
+<staging>/<project>/signatures/. Tarballs are hardlinked when out/ and the
+staging repo share a filesystem, reflinked where hardlinks are refused, and
+copied otherwise; packer.py replaces them atomically, so a link never sees a
+later run's partial output. The small sidecars are always copied because
+minisign rewrites its signature files in place.
+
+Usage (from stage_artifacts.sh):
+    stage_files.py <staging_dir> <out_dir> PKG [PKG ...]
+
+Prints one summary line with the bytes copied versus linked.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+sys.path.append(_lib_dir)
+from core.fsutil import link_or_copy  # noqa: E402
+
+
+def artifact_placements(staging_dir: str, out_dir: str, pkg: str) -> list:
+    """Return (src, dst, link) triples for one package's artifacts."""
+    project = pkg.split("_v", 1)[0]
+    project_dir = os.path.join(staging_dir, project)
+    signatures_dir = os.path.join(project_dir, "signatures")
+    tarball = f"{pkg}.tar.gz"
+    pairs = [
+        (os.path.join(out_dir, tarball), os.path.join(project_dir, tarball), True),
+        (os.path.join(out_dir, f"{tarball}.minisig"), os.path.join(signatures_dir, f"{tarball}.minisig"), False),
+        (os.path.join(out_dir, f"{tarball}.sha256"), os.path.join(signatures_dir, f"{tarball}.sha256"), False),
+    ]
+    sidecar = os.path.join(out_dir, f"{tarball}.meta.json")
+    if os.path.isfile(sidecar):
+        pairs.append((sidecar, os.path.join(project_dir, f"{tarball}.meta.json"), False))
+    return pairs
+
+
+def _copy(src: str, dst: str) -> None:
+    # Never write through a hardlink left by an older staging run
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    shutil.copy2(src, dst)
+
+
+def stage_packages(staging_dir: str, out_dir: str, pkgs: list) -> dict:
+    """Place every package's artifacts; returns byte and file counts per method."""
+    totals = {method: {"files": 0, "bytes": 0} for method in ("hardlink", "reflink", "copy")}
+    for pkg in pkgs:
+        for src, dst, link in artifact_placements(staging_dir, out_dir, pkg):
+            if not os.path.isfile(src):
+                raise FileNotFoundError(f"Artifact not found: {src}")
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if link:
+                method = link_or_copy(src, dst)
+            else:
+                _copy(src, dst)
+                method = "copy"
+            totals[method]["files"] += 1
+            totals[method]["bytes"] += os.path.getsize(src)
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Link built artifacts into the staging repo")
+    parser.add_argument("staging_dir", help="Staging git repository")
+    parser.add_argument("out_dir", help="Directory holding the packed artifacts")
+    parser.add_argument("pkgs", nargs="+", help="Package names (<project>_v<version>_<os>_<arch>)")
+    args = parser.parse_args()
+
+    try:
+        totals = stage_packages(args.staging_dir, args.out_dir, args.pkgs)
+    except OSError as exc:
+        print(f"stage_files: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+    files = sum(t["files"] for t in totals.values())
+    linked = totals["hardlink"]["bytes"] + totals["reflink"]["bytes"]
+    print(
+        f"Staged {files} file(s) for {len(args.pkgs)} package(s): "
+        f"{totals['copy']['bytes']} bytes copied, {linked} bytes linked "
+        f"({totals['hardlink']['files']} hardlink, {totals['reflink']['files']} reflink, "
+        f"{totals['copy']['files']} copy)"
+    )
+
+
+if __name__ == "__main__":
+    main()
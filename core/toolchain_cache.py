@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""toolchain_cache.py — persistent per-builder toolchain caches.
+
+Each builder gets a host directory, mounted at /cache in its container, with
+one subdirectory per toolchain (pip, go-mod, go-build, cargo, ccache and the
+package managers' download caches). Because they are bind mounts rather than
+named volumes they survive `docker compose down -v`. data/start.sh exports
+REPCID_CACHE_DIR=/cache, and the setup templates point their toolchains at it.
+
+Layout under TOOLCHAIN_CACHE_DIR (default $WORKING_DIR/cache/toolchains):
+
+    <builder>/<toolchain>/             toolchain-managed cache contents
+    <builder>/<toolchain>/.last_used   mtime = last build that touched it
+
+Hit rate: `begin` resets each cached file's atime to its mtime and prints a
+timestamp; after the build, `report` counts files read since then (atime
+advanced, content older) as hits and files written since then as misses.
+Resetting the atime makes this work under the default relatime mount
+option; on noatime mounts only misses can be counted. Concurrent builds of
+the same builder share the cache, so their numbers blend.
+
+Pruning evicts whole toolchain directories, least recently used first, until
+the total fits TOOLCHAIN_CACHE_MAX_MB; toolchains do not tolerate single
+files vanishing from their caches.
+
+Usage (from build_artifact.sh):
+    toolchain_cache.py begin <builder_cache_dir>          prints the stamp
+    toolchain_cache.py report <builder_cache_dir> --since STAMP
+    toolchain_cache.py prune [--max-mb N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+# Support installed layout (core/ inside lib/) or dev layout (core/ at root)
+WORKING_DIR = os.path.dirname(_lib_dir) if os.path.basename(_lib_dir) == "lib" else _lib_dir
+sys.path.append(_lib_dir)
+from core.fsutil import env_number, tree_size  # noqa: E402
+
+DEFAULT_CACHE_DIR = os.getenv("TOOLCHAIN_CACHE_DIR") or os.path.join(WORKING_DIR, "cache", "toolchains")
+DEFAULT_MAX_MB = 10240
+TOOLCHAINS = ("pip", "go-mod", "go-build", "cargo", "ccache", "apt", "pacman", "apk")
+LAST_USED = ".last_used"
+
+
+def _files(root: str):
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name == LAST_USED and dirpath == root:
+                continue
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(full)
+            except OSError:
+                continue
+            if not os.path.islink(full):
+                yield full, st
+
+
+def atime_tracked(path: str) -> bool:
+    """False when path's filesystem is mounted noatime."""
+    noatime = getattr(os, "ST_NOATIME", 0)
+    try:
+        return not (noatime and os.statvfs(path).f_flag & noatime)
+    except OSError:
+        return False
+
+
+def begin(builder_dir: str) -> float:
+    """Create the toolchain dirs and arm atime tracking; returns the stamp."""
+    for toolchain in TOOLCHAINS:
+        root = os.path.join(builder_dir, toolchain)
+        os.makedirs(root, exist_ok=True)
+        for full, st in _files(root):
+            # relatime only refreshes an atime that is not newer than mtime
+            if st.st_atime > st.st_mtime:
+                try:
+                    os.utime(full, (st.st_mtime, st.st_mtime), follow_symlinks=False)
+                except OSError:
+                    pass
+    return time.time()
+
+
+def stats(builder_dir: str, since: float) -> dict:
+    """Return {toolchain: {"hits", "misses", "files", "bytes"}} since a stamp."""
+    result = {}
+    for toolchain in TOOLCHAINS:
+        root = os.path.join(builder_dir, toolchain)
+        if not os.path.isdir(root):
+            continue
+        entry = {"hits": 0, "misses": 0, "files": 0, "bytes": 0}
+        for _, st in _files(root):
+            entry["files"] += 1
+            entry["bytes"] += st.st_size
+            if st.st_mtime >= since:
+                entry["misses"] += 1
+            elif st.st_atime >= since:
+                entry["hits"] += 1
+        if entry["hits"] or entry["misses"]:
+            # Touched by this build: refresh its LRU clock
+            with open(os.path.join(root, LAST_USED), "w"):
+                pass
+        result[toolchain] = entry
+    return result
+
+
+def entries(cache_dir: str) -> list:
+    """List toolchain dirs as (last_used, size, path), least recently used first."""
+    result = []
+    if not os.path.isdir(cache_dir):
+        return result
+    for builder in sorted(os.listdir(cache_dir)):
+        builder_dir = os.path.join(cache_dir, builder)
+        if not os.path.isdir(builder_dir):
+            continue
+        for toolchain in sorted(os.listdir(builder_dir)):
+            root = os.path.join(builder_dir, toolchain)
+            if not os.path.isdir(root):
+                continue
+            marker = os.path.join(root, LAST_USED)
+            last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0.0
+            result.append((last_used, tree_size(root), root))
+    result.sort()
+    return result
+
+
+def prune(cache_dir: str, max_bytes: int) -> list:
+    """Evict least recently used toolchain dirs until the total fits max_bytes."""
+    current = entries(cache_dir)
+    total = sum(size for _, size, _ in current)
+    evicted = []
+    for _, size, root in current:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(root, ignore_errors=True)
+        total -= size
+        evicted.append(os.path.relpath(root, cache_dir))
+    return evicted
+
+
+def _format_report(builder: str, result: dict, tracked: bool) -> list:
+    lines = []
+    for toolchain, s in result.items():
+        if not (s["hits"] or s["misses"]):
+            continue
+        if tracked:
+            looked_up = s["hits"] + s["misses"]
+            rate = f"{100.0 * s['hits'] / looked_up:.1f}% hit rate"
+            counts = f"{s['hits']} hit, {s['misses']} miss"
+        else:
+            rate = "hit rate n/a (noatime)"
+            counts = f"{s['misses']} miss"
+        lines.append(
+            f"[toolchain-cache] {builder}/{toolchain}: {counts} ({rate}), "
+            f"{s['bytes'] / (1 << 20):.1f} MiB cached"
+        )
+    if not lines:
+        lines.append(f"[toolchain-cache] {builder}: no cache activity")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repman per-builder toolchain caches")
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Toolchain cache root (default: %(default)s)",
+    )
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sp = sub.add_parser("begin", help="Prepare a builder's cache for a build; prints a stamp")
+    sp.add_argument("builder_dir", help="Builder cache directory (<cache-dir>/<builder>)")
+
+    sp = sub.add_parser("report", help="Print per-toolchain hits and misses since a stamp")
+    sp.add_argument("builder_dir", help="Builder cache directory (<cache-dir>/<builder>)")
+    sp.add_argument("--since", type=float, required=True, help="Stamp printed by 'begin'")
+
+    sp = sub.add_parser("prune", help="Evict least recently used toolchain caches over the size cap")
+    sp.add_argument(
+        "--max-mb",
+        type=int,
+        default=None,
+        help=f"Total size cap in MiB (default: TOOLCHAIN_CACHE_MAX_MB, else {DEFAULT_MAX_MB})",
+    )
+
+    args = parser.parse_args()
+
+    if args.cmd == "begin":
+        print(f"{begin(args.builder_dir):.6f}")
+    elif args.cmd == "report":
+        if not os.path.isdir(args.builder_dir):
+            raise SystemExit(f"Cache directory not found: {args.builder_dir}")
+        result = stats(args.builder_dir, args.since)
+        builder = os.path.basename(os.path.normpath(args.builder_dir))
+        for line in _format_report(builder, result, atime_tracked(args.builder_dir)):
+            print(line)
+    elif args.cmd == "prune":
+        max_mb = args.max_mb
+        if max_mb is None:
+            max_mb = env_number("TOOLCHAIN_CACHE_MAX_MB", DEFAULT_MAX_MB, prog="toolchain_cache")
+        for evicted in prune(args.cache_dir, max_mb * 1024 * 1024):
+            print(f"[toolchain-cache] evicted {evicted}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""uploader.py — upload release assets concurrently, skipping identical ones.
+
+Lists the release's existing assets once (`gh release view --json assets`)
+and skips every local file whose name and sha256 already match an uploaded
+asset, so re-running a publish after a partial failure only sends what is
+missing or changed. The rest are uploaded one asset per `gh release upload
+--clobber` call on a bounded thread pool, each retried with exponential
+backoff on failure.
+
+Local digests are always computed from the files themselves: a sidecar
+cannot prove it belongs to the bytes on disk, and skipping a changed asset
+would leave a release that doesn't match its signatures.
+
+Usage (from publish_github.sh):
+    uploader.py <tag> FILE [FILE ...] [--jobs N] [--retries N] [--backoff S]
+
+Exits non-zero if any asset still fails after its retries.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # core/../ = lib/ or root
+sys.path.append(_lib_dir)
+from core.fsutil import env_number  # noqa: E402
+
+DEFAULT_JOBS = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0
+_CHUNK = 1 << 20
+
+_print_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """Raised when gh cannot list or upload release assets."""
+
+
+def _log(message: str) -> None:
+    with _print_lock:
+        print(message, flush=True)
+
+
+def _gh(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(["gh", *args], capture_output=True, text=True)
+
+
+def remote_assets(tag: str) -> dict:
+    """Return {name: {"size": int, "digest": "sha256:..." or None}} for tag."""
+    result = _gh("release", "view", tag, "--json", "assets")
+    if result.returncode != 0:
+        raise UploadError(f"cannot list assets of {tag}: {result.stderr.strip()}")
+    try:
+        assets = json.loads(result.stdout or "{}").get("assets") or []
+    except json.JSONDecodeError as exc:
+        raise UploadError(f"unexpected gh output for {tag}: {exc}")
+    return {
+        a["name"]: {"size": a.get("size"), "digest": a.get("digest") or None}
+        for a in assets
+        if "name" in a
+    }
+
+
+def local_digest(path: str) -> str:
+    """sha256 of path as "sha256:<hex>"."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def plan(files: list, remote: dict) -> tuple:
+    """Split files into (to_upload, unchanged) against the remote asset list.
+
+    An asset is unchanged only when the remote reports the same digest;
+    a remote asset without a digest is re-uploaded.
+    """
+    to_upload, unchanged = [], []
+    for path in files:
+        asset = remote.get(os.path.basename(path))
+        if asset and asset["digest"] and asset["digest"] == local_digest(path):
+            unchanged.append(path)
+        else:
+            to_upload.append(path)
+    return to_upload, unchanged
+
+
+def upload_one(tag: str, path: str, retries: int, backoff: float) -> None:
+    """Upload a single asset, retrying with exponential backoff plus jitter."""
+    name = os.path.basename(path)
+    for attempt in range(retries + 1):
+        result = _gh("release", "upload", tag, path, "--clobber")
+        if result.returncode == 0:
+            _log(f"  uploaded {name}")
+            return
+        error = result.stderr.strip() or f"exit {result.returncode}"
+        if attempt == retries:
+            raise UploadError(f"{name}: {error}")
+        delay = backoff * (2 ** attempt) * (1 + random.random() / 2)
+        _log(f"  {name}: upload failed ({error}); retry {attempt + 1}/{retries} in {delay:.1f}s")
+        time.sleep(delay)
+
+
+def upload(tag: str, files: list, jobs: int = DEFAULT_JOBS,
+           retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF) -> dict:
+    """Upload files to the release tag; returns {"uploaded", "skipped", "failed"}.
+
+    "failed" maps asset name to the last error for assets that exhausted
+    their retries. Uploads that did not fail are not undone.
+    """
+    missing = [p for p in files if not os.path.isfile(p)]
+    if missing:
+        raise UploadError(f"asset not found: {missing[0]}")
+
+    to_upload, unchanged = plan(files, remote_assets(tag))
+    for path in unchanged:
+        _log(f"  unchanged {os.path.basename(path)}")
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {pool.submit(upload_one, tag, p, retries, backoff): p for p in to_upload}
+        for future, path in futures.items():
+            try:
+                future.result()
+            except UploadError as exc:
+                failed[os.path.basename(path)] = str(exc)
+
+    return {
+        "uploaded": [os.path.basename(p) for p in to_upload if os.path.basename(p) not in failed],
+        "skipped": [os.path.basename(p) for p in unchanged],
+        "failed": failed,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload release assets, skipping identical ones")
+    parser.add_argument("tag", help="Release tag")
+    parser.add_argument("files", nargs="+", help="Asset files to upload")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=env_number("UPLOAD_JOBS", DEFAULT_JOBS, prog="uploader"),
+        help="Concurrent uploads (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=env_number("UPLOAD_RETRIES", DEFAULT_RETRIES, prog="uploader"),
+        help="Retries per asset after the first attempt (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=env_number("UPLOAD_BACKOFF", DEFAULT_BACKOFF, float, "uploader"),
+        help="Initial retry delay in seconds, doubled per retry (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    try:
+        result = upload(args.tag, args.files, args.jobs, args.retries, args.backoff)
+    except (OSError, UploadError) as exc:
+        print(f"uploader: {exc}", file=sys.stderr)
+        raise SystemExit(1)
+
+    print(f"Assets: {len(result['uploaded'])} uploaded, {len(result['skipped'])} unchanged"
+          + (f", {len(result['failed'])} failed" if result["failed"] else ""))
+    if result["failed"]:
+        for error in result["failed"].values():
+            print(f"uploader: {error}", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
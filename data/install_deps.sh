@@ -0,0 +1,57 @@
+#!/bin/bash
+# install_deps.sh — install the packages a project declares in deps.json.
+# Used by start.sh inside the builder container, and by
+# core/derived_images.py when it bakes a project's dependencies into a
+# derived builder image.
+#
+# Usage: install_deps.sh <deps.json>
+# Picks the list for the image's package manager (apt, pacman or apk) and
+# keeps downloads in $REPCID_CACHE_DIR when it is set.
+set -Eeuo pipefail
+
+DEPS_FILE="$1"
+
+if command -v apt-get >/dev/null 2>&1; then
+    PM="apt"
+elif command -v pacman >/dev/null 2>&1; then
+    PM="pacman"
+elif command -v apk >/dev/null 2>&1; then
+    PM="apk"
+else
+    exit 0
+fi
+
+pkg_list=$(python3 -c \
+    "import json, sys; print(' '.join(json.load(open(sys.argv[1])).get(sys.argv[2], [])))" \
+    "$DEPS_FILE" "$PM" 2>/dev/null) || exit 0
+[[ -z "$pkg_list" ]] && exit 0
+
+case "$PM" in
+    apt)
+        apt_cache=()
+        if [[ -n "${REPCID_CACHE_DIR:-}" ]]; then
+            mkdir -p "$REPCID_CACHE_DIR/apt/partial"
+            apt_cache=(-o "Dir::Cache::archives=$REPCID_CACHE_DIR/apt" -o APT::Keep-Downloaded-Packages=true)
+        fi
+        # shellcheck disable=SC2086
+        apt-get update -qq && apt-get install -y --no-install-recommends "${apt_cache[@]}" $pkg_list
+        ;;
+    pacman)
+        pacman_cache=()
+        if [[ -n "${REPCID_CACHE_DIR:-}" ]]; then
+            mkdir -p "$REPCID_CACHE_DIR/pacman"
+            pacman_cache=(--cachedir "$REPCID_CACHE_DIR/pacman")
+        fi
+        # shellcheck disable=SC2086
+        pacman -Sy --noconfirm "${pacman_cache[@]}" $pkg_list
+        ;;
+    apk)
+        # shellcheck disable=SC2086
+        if [[ -n "${REPCID_CACHE_DIR:-}" ]]; then
+            mkdir -p "$REPCID_CACHE_DIR/apk"
+            apk add --update-cache --cache-dir "$REPCID_CACHE_DIR/apk" $pkg_list
+        else
+            apk add --no-cache $pkg_list
+        fi
+        ;;
+esac
@@ -2,90 +2,195 @@
 set -Eeuo pipefail
 err() { echo "[start.sh][ERROR] $*" >&2; }
 
-TODO_DIR="/todo"
-WORKING_DIR="/in_progress"
-COMPLETE_ROOT="/complete"
+# A pooled container (core/pool.py) runs each job in its own directories
+TODO_DIR="${REPCID_TODO_DIR:-/todo}"
+WORKING_DIR="${REPCID_WORK_DIR:-/in_progress}"
+COMPLETE_ROOT="${REPCID_COMPLETE_DIR:-/complete}"
+# Unset: build the most recently modified job in /todo and exit.
+# N (or "auto" for one per CPU): worker mode — N workers drain the whole of
+# /todo, each job claimed exactly once.
+WORKERS="${REPCID_WORKERS:-}"
+
+CLAIM_DIR="$WORKING_DIR/.claims"
+STATUS_DIR="$COMPLETE_ROOT/.status"
+START_DIR="$(dirname "$(readlink -f "$0")")"
+
+mkdir -p "$WORKING_DIR" "$COMPLETE_ROOT" "$CLAIM_DIR" "$STATUS_DIR"
+
+# Persistent toolchain caches (bind mounted by the builder compose file).
+# The setup templates point pip, Go and ccache at $REPCID_CACHE_DIR.
+CACHE_DIR="/cache"
+if [[ -d "$CACHE_DIR" ]]; then
+  export REPCID_CACHE_DIR="$CACHE_DIR"
+fi
 
-mkdir -p "$WORKING_DIR" "$COMPLETE_ROOT"
+# /todo is mounted read-only, so jobs cannot be renamed out of it; a job is
+# claimed by the worker whose mkdir of its claim directory succeeds.
+_claim() {
+  mkdir "$CLAIM_DIR/$1" 2>/dev/null
+}
 
-# Find the most recently modified item in /todo
-if ! SCHEDULED=$(ls -t "$TODO_DIR" 2>/dev/null | head -n 1); then
-  err "Failed to list $TODO_DIR"
-  exit 1
-fi
+# /todo is mounted read-only. SOURCE_MODE=overlay gives the build a
+# copy-on-write view of it (needs CAP_SYS_ADMIN, which build_artifact.sh
+# grants in that mode); otherwise, or if the mount fails, the job is copied.
+_stage_job() {
+  local job="$1" src="$TODO_DIR/$1" dest="$WORKING_DIR/$1"
+  if [[ "${SOURCE_MODE:-copy}" == "overlay" ]]; then
+    local upper="$WORKING_DIR/.overlay/$job/upper"
+    local work="$WORKING_DIR/.overlay/$job/work"
+    mkdir -p "$upper" "$work" "$dest"
+    if mount -t overlay overlay \
+         -o "lowerdir=$src,upperdir=$upper,workdir=$work" "$dest" 2>/dev/null; then
+      echo "[start.sh] building on an overlay of $src"
+      return 0
+    fi
+    echo "[start.sh] overlay mount failed, copying $src instead" >&2
+    rm -rf "$WORKING_DIR/.overlay/$job" "$dest"
+  fi
+  cp -a "$src" "$WORKING_DIR/"
+}
 
-if [[ -z "${SCHEDULED:-}" ]]; then
-  exit 0
-fi
+# Install per-project runtime dependencies declared in deps.json, unless the
+# image is a derived builder image that already has them baked in
+# (core/derived_images.py sets REPCID_DEPS_PREINSTALLED there). Package
+# managers hold a global lock, so concurrent jobs install one at a time.
+_install_deps() {
+  local deps="$1"
+  [[ -f "$deps" && "${REPCID_DEPS_PREINSTALLED:-0}" != "1" ]] || return 0
+  if command -v flock >/dev/null 2>&1; then
+    flock "$WORKING_DIR/.deps.lock" bash "$START_DIR/install_deps.sh" "$deps"
+  else
+    bash "$START_DIR/install_deps.sh" "$deps"
+  fi
+}
 
-SRC_JOB_DIR="$TODO_DIR/$SCHEDULED"
-JOB_WORK_DIR="$WORKING_DIR/$SCHEDULED"
-COMPLETE_DIR="$COMPLETE_ROOT/$SCHEDULED"
+_build_job() {
+  local job="$1"
+  local src="$TODO_DIR/$job"
+  local job_work_dir="$WORKING_DIR/$job"
+  local complete_dir="$COMPLETE_ROOT/$job"
 
-# Validate job structure before moving
-if [[ ! -d "$SRC_JOB_DIR" ]]; then
-  err "Scheduled item $SRC_JOB_DIR is not a directory"
-  exit 1
-fi
+  # Validate job structure before staging
+  if [[ ! -d "$src" ]]; then
+    err "Scheduled item $src is not a directory"
+    return 1
+  fi
 
-# Move job into working directory atomically
-cp -a "$SRC_JOB_DIR" "$WORKING_DIR/"
+  _stage_job "$job"
+  _install_deps "$job_work_dir/deps.json"
 
-# Install per-project runtime dependencies declared in deps.json
-_install_deps() {
-    local deps_file="$1"
-    local pkg_list
-
-    if command -v apt-get >/dev/null 2>&1; then
-        pkg_list=$(python3 -c \
-            "import json; d=json.load(open('$deps_file')); print(' '.join(d.get('apt',[])))" \
-            2>/dev/null) || return 0
-        [[ -z "$pkg_list" ]] && return 0
-        apt-get update -qq && apt-get install -y --no-install-recommends $pkg_list
-
-    elif command -v pacman >/dev/null 2>&1; then
-        pkg_list=$(python3 -c \
-            "import json; d=json.load(open('$deps_file')); print(' '.join(d.get('pacman',[])))" \
-            2>/dev/null) || return 0
-        [[ -z "$pkg_list" ]] && return 0
-        pacman -Sy --noconfirm $pkg_list
-
-    elif command -v apk >/dev/null 2>&1; then
-        pkg_list=$(python3 -c \
-            "import json; d=json.load(open('$deps_file')); print(' '.join(d.get('apk',[])))" \
-            2>/dev/null) || return 0
-        [[ -z "$pkg_list" ]] && return 0
-        apk add --no-cache $pkg_list
+  local setup_sh="$job_work_dir/setup.sh"
+  if [[ ! -f "$setup_sh" ]]; then
+    err "Missing setup.sh in $job_work_dir"
+    return 1
+  fi
+
+  chmod +x "$setup_sh"
+
+  # Execute setup with job working dir as argument
+  "$setup_sh" "$job_work_dir"
+
+  # Prepare complete dir and move outputs if present
+  mkdir -p "$complete_dir"
+  chown 1000:1000 "$complete_dir" || true
+
+  local out_dir="$job_work_dir/out"
+  if [[ -d "$out_dir" ]]; then
+    shopt -s nullglob dotglob
+    local files=("$out_dir"/*)
+    if (( ${#files[@]} > 0 )); then
+      mv "${files[@]}" "$complete_dir/"
     fi
+    shopt -u nullglob dotglob
+  fi
+
+  chown -R 1000:1000 "$complete_dir" || true
 }
 
-if [[ -f "$JOB_WORK_DIR/deps.json" ]]; then
-    _install_deps "$JOB_WORK_DIR/deps.json"
-fi
+# Build one claimed job and write $STATUS_DIR/<job>.json; returns its status.
+# The build runs in a subshell with errexit so a failing job stops there
+# without taking its worker down.
+_run_job() {
+  local job="$1" worker="$2" started finished rc status
+  started="$(date +%s)"
+  set +e
+  if [[ "$WORKERS_N" -gt 1 ]]; then
+    ( set -e; _build_job "$job" ) 2>&1 | sed -u "s/^/[$job] /"
+  else
+    ( set -e; _build_job "$job" )
+  fi
+  rc=$?
+  set -e
+  finished="$(date +%s)"
+  status="ok"
+  [[ "$rc" -eq 0 ]] || status="failed"
+  printf '{"job": "%s", "status": "%s", "exit_code": %d, "worker": %d, "started": %d, "finished": %d, "duration_s": %d}\n' \
+    "$job" "$status" "$rc" "$worker" "$started" "$finished" "$((finished - started))" \
+    > "$STATUS_DIR/$job.json"
+  chown 1000:1000 "$STATUS_DIR" "$STATUS_DIR/$job.json" 2>/dev/null || true
+  echo "[start.sh] $job: $status in $((finished - started))s"
+  return "$rc"
+}
 
-SETUP_SH="$JOB_WORK_DIR/setup.sh"
-if [[ ! -f "$SETUP_SH" ]]; then
-  err "Missing setup.sh in $JOB_WORK_DIR"
-  exit 1
-fi
+# Claim and build jobs until a full pass over /todo finds nothing left.
+_worker() {
+  local worker="$1" failed=0 claimed job
+  while :; do
+    claimed=0
+    while IFS= read -r job; do
+      [[ -n "$job" ]] || continue
+      _claim "$job" || continue
+      claimed=1
+      # Not `_run_job || ...`: errexit is ignored in a condition's callees
+      set +e
+      _run_job "$job" "$worker"
+      [[ $? -eq 0 ]] || failed=1
+      set -e
+    done < <(ls -t "$TODO_DIR" 2>/dev/null)
+    [[ "$claimed" -eq 1 ]] || break
+  done
+  return "$failed"
+}
 
-chmod +x "$SETUP_SH"
+if [[ -z "$WORKERS" ]]; then
+  WORKERS_N=1
+  # Find the most recently modified item in /todo
+  if ! SCHEDULED=$(ls -t "$TODO_DIR" 2>/dev/null | head -n 1); then
+    err "Failed to list $TODO_DIR"
+    exit 1
+  fi
 
-# Execute setup with job working dir as argument
-"$SETUP_SH" "$JOB_WORK_DIR"
+  if [[ -z "${SCHEDULED:-}" ]]; then
+    exit 0
+  fi
 
-# Prepare complete dir and move outputs if present
-mkdir -p "$COMPLETE_DIR"
-chown 1000:1000 "$COMPLETE_DIR" || true
+  _claim "$SCHEDULED" || true
+  _run_job "$SCHEDULED" 1
+  exit 0
+fi
 
-OUT_DIR="$JOB_WORK_DIR/out"
-if [[ -d "$OUT_DIR" ]]; then
-  shopt -s nullglob dotglob
-  files=("$OUT_DIR"/*)
-  if (( ${#files[@]} > 0 )); then
-    mv "${files[@]}" "$COMPLETE_DIR/"
-  fi
-  shopt -u nullglob dotglob
+if [[ "$WORKERS" == "auto" ]]; then
+  WORKERS_N="$(nproc 2>/dev/null || echo 1)"
+elif [[ "$WORKERS" =~ ^[1-9][0-9]*$ ]]; then
+  WORKERS_N="$WORKERS"
+else
+  err "REPCID_WORKERS must be a positive integer or 'auto', got '$WORKERS'"
+  exit 1
 fi
 
-chown -R 1000:1000 "$COMPLETE_DIR" || true
+echo "[start.sh] worker mode: $WORKERS_N worker(s) draining $TODO_DIR"
+pids=()
+for ((i = 1; i <= WORKERS_N; i++)); do
+  _worker "$i" &
+  pids+=("$!")
+done
+
+rc=0
+for pid in "${pids[@]}"; do
+  wait "$pid" || rc=1
+done
+
+total=$(find "$STATUS_DIR" -maxdepth 1 -name '*.json' | wc -l)
+failed=$({ grep -l '"status": "failed"' "$STATUS_DIR"/*.json 2>/dev/null || true; } | wc -l)
+echo "[start.sh] worker mode: $total job(s), $failed failed"
+exit "$rc"
@@ -16,8 +16,20 @@ BUILD_DIR="$JOB_DIR/_build"
 
 mkdir -p "$OUT_DIR/bin" "$BUILD_DIR"
 
+# Compile through ccache when the image has it, with its store in the
+# persistent toolchain cache (REPCID_CACHE_DIR is set by data/start.sh)
+CMAKE_LAUNCHER=()
+if command -v ccache >/dev/null 2>&1; then
+    [[ -n "${REPCID_CACHE_DIR:-}" ]] && export CCACHE_DIR="$REPCID_CACHE_DIR/ccache"
+    CMAKE_LAUNCHER=(-DCMAKE_C_COMPILER_LAUNCHER=ccache -DCMAKE_CXX_COMPILER_LAUNCHER=ccache)
+    # Compiler wrappers for plain Makefiles (Debian/Ubuntu/Arch layouts)
+    for _wrappers in /usr/lib/ccache /usr/lib/ccache/bin; do
+        [[ -x "$_wrappers/gcc" ]] && { export PATH="$_wrappers:$PATH"; break; }
+    done
+fi
+
 if [[ -f "$JOB_DIR/CMakeLists.txt" ]]; then
-    cmake -S "$JOB_DIR" -B "$BUILD_DIR" -DCMAKE_BUILD_TYPE=Release
+    cmake -S "$JOB_DIR" -B "$BUILD_DIR" -DCMAKE_BUILD_TYPE=Release "${CMAKE_LAUNCHER[@]}"
     cmake --build "$BUILD_DIR" --parallel "$(nproc)"
     find "$BUILD_DIR" -maxdepth 3 -type f -executable ! -name "*.so" ! -name "*.a" \
         -exec cp -t "$OUT_DIR/bin/" {} +
@@ -14,6 +14,12 @@ OUT_DIR="$JOB_DIR/out"
 
 mkdir -p "$OUT_DIR/bin"
 
+# Persistent module and build caches (REPCID_CACHE_DIR is set by data/start.sh)
+if [[ -n "${REPCID_CACHE_DIR:-}" ]]; then
+    export GOMODCACHE="$REPCID_CACHE_DIR/go-mod"
+    export GOCACHE="$REPCID_CACHE_DIR/go-build"
+fi
+
 if [[ ! -f "$JOB_DIR/go.mod" ]]; then
     echo "No go.mod found in $JOB_DIR" >&2
     exit 1
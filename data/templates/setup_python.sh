@@ -15,6 +15,11 @@ OUT_DIR="$JOB_DIR/out"
 
 mkdir -p "$OUT_DIR/bin" "$OUT_DIR/lib"
 
+# Persistent pip cache (REPCID_CACHE_DIR is set by data/start.sh)
+if [[ -n "${REPCID_CACHE_DIR:-}" ]]; then
+    export PIP_CACHE_DIR="$REPCID_CACHE_DIR/pip"
+fi
+
 # Build the venv inside lib/
 python3 -m venv "$OUT_DIR/lib/venv"
 VENV_PIP="$OUT_DIR/lib/venv/bin/pip"
@@ -6,6 +6,9 @@ import json
 import os
 import sys
 import shutil
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from subprocess import run, CalledProcessError, DEVNULL
 
 from dotenv import load_dotenv
@@ -16,6 +19,9 @@ WORKING_DIR = os.path.dirname(_self_dir) if os.path.basename(_self_dir) == "lib"
 # Code lives in _self_dir (lib/ when installed, root in dev); config lives at WORKING_DIR root
 STAGE_SCRIPT = os.path.join(_self_dir, "core", "stage.py")
 PUBLISH_PIPELINE = os.path.join(_self_dir, "scripts", "publish_pipeline.sh")
+POOL_SCRIPT = os.path.join(_self_dir, "core", "pool.py")
+QUEUE_SCRIPT = os.path.join(_self_dir, "core", "scheduler.py")
+RUNS_SCRIPT = os.path.join(_self_dir, "core", "runs.py")
 BUILDERS_DIR = os.path.join(_self_dir, "builders")
 ENV_FILE = os.path.join(WORKING_DIR, "data", "config.env")
 
@@ -23,12 +29,31 @@ ENV_FILE = os.path.join(WORKING_DIR, "data", "config.env")
 sys.path.append(_self_dir)
 from core.keygen import update_config_env  # noqa: E402
 from core.builders import parse_builder  # noqa: E402
+from core.fsutil import LockTimeout, env_number  # noqa: E402
+from core.index_store import (  # noqa: E402
+    BACKEND_SQLITE,
+    StoreError,
+    backend as index_backend,
+    export_index,
+    import_index,
+    latest_version,
+    read_index,
+    save_index,
+    store_path,
+)
+from core.runs import RunError, load_run, remaining  # noqa: E402
+from core import retention  # noqa: E402
 from core.index import (  # noqa: E402
-    edit_target,
-    get_version,
-    package_name,
+    canonical_json,
+    index_lock,
+    inline_artifacts,
+    read_notes,
+    rebuild_latest_by_target,
+    rebuild_version_order,
     remove_version,
-    safe_write_json,
+    sorted_versions,
+    versions_in_range,
+    Version,
 )
 
 load_dotenv(ENV_FILE)
@@ -54,18 +79,40 @@ ALL_LINUX_BUILDERS = [
 ]
 
 
-def _load_index(path: str = INDEX_PATH) -> dict:
-    if not os.path.exists(path):
-        return {}
-    with open(path, "r") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            raise SystemExit(f"Metadata file is invalid JSON: {path}")
+@contextmanager
+def _reading_index(path: str):
+    try:
+        yield
+    except json.JSONDecodeError:
+        raise SystemExit(f"Metadata file is invalid JSON: {path}")
+    except OSError as exc:
+        raise SystemExit(f"Failed to read index shard: {exc}")
+    except (sqlite3.Error, StoreError) as exc:
+        raise SystemExit(f"Failed to read index store: {exc}")
 
 
-def _write_index(md: dict, path: str = INDEX_PATH) -> None:
-    safe_write_json(path, md)
+def _load_index(path: str = INDEX_PATH, names: list = None) -> dict:
+    """Load the index; with INDEX_BACKEND=sqlite only the named packages are read."""
+    with _reading_index(path):
+        return read_index(path, names)
+
+
+def _write_index(md: dict, path: str = INDEX_PATH, layout: str = None,
+                 names: list = None) -> None:
+    try:
+        save_index(path, md, names, layout)
+    except (sqlite3.Error, StoreError) as exc:
+        raise SystemExit(f"Failed to write index store: {exc}")
+
+
+@contextmanager
+def _locked_index(path: str = INDEX_PATH):
+    """Hold the index lock across a load/modify/write cycle."""
+    try:
+        with index_lock(path):
+            yield
+    except LockTimeout as exc:
+        raise SystemExit(f"Index is locked: {exc}")
 
 
 def _resolve_builders(spec: str) -> list:
@@ -78,6 +125,8 @@ def _resolve_builders(spec: str) -> list:
         return result
     if spec == "all-linux":
         return list(ALL_LINUX_BUILDERS)
+    if "," in spec:
+        return [b.strip() for b in spec.split(",") if b.strip()]
     # Check named group from env: BUILDER_GROUP_<NAME>
     env_key = f"BUILDER_GROUP_{spec.upper().replace('-', '_')}"
     group = os.getenv(env_key)
@@ -88,7 +137,10 @@ def _resolve_builders(spec: str) -> list:
 
 def cmd_get_index(args: argparse.Namespace) -> int:
     md = _load_index(args.index)
-    print(json.dumps(md, indent=4))
+    if args.compact:
+        print(canonical_json(md).decode())
+    else:
+        print(json.dumps(md, indent=4))
     return 0
 
 
@@ -107,7 +159,6 @@ def cmd_get_builders(_: argparse.Namespace) -> int:
 
 
 def cmd_get_version(args: argparse.Namespace) -> int:
-    md = _load_index(args.index)
     if not args.name:
         raise SystemExit("--name is required")
     if not args.builder:
@@ -116,7 +167,8 @@ def cmd_get_version(args: argparse.Namespace) -> int:
         os_name, arch = parse_builder(args.builder)
     except ValueError as exc:
         raise SystemExit(str(exc))
-    ver = get_version(md, args.name, os_name, arch)
+    with _reading_index(args.index):
+        ver = latest_version(args.index, args.name, os_name, arch)
     if ver is None:
         print("None")
     else:
@@ -142,29 +194,54 @@ def cmd_get_env(_: argparse.Namespace) -> int:
 
 
 def cmd_list(args: argparse.Namespace) -> int:
-    md = _load_index(args.index)
-    if not md:
+    md = _load_index(args.index, [args.name] if args.name else None)
+    if not md and not args.name:
         print("Index is empty.")
         return 0
-    for pkg_name in sorted(md.keys()):
+    for bound in (args.min_version, args.max_version):
+        if bound:
+            try:
+                Version(bound)
+            except ValueError as exc:
+                raise SystemExit(str(exc))
+    names = sorted(md.keys())
+    if args.name:
+        if args.name not in md:
+            raise SystemExit(f"Package '{args.name}' not found in index.")
+        names = [args.name]
+    for pkg_name in names:
         pkg = md[pkg_name]
         latest = pkg.get("latest", "?")
         versions = pkg.get("versions", {})
         print(f"{pkg_name}  (latest: {latest})")
-        for ver in sorted(versions.keys(), key=lambda v: list(map(int, v.split(".")))):
+        if args.min_version or args.max_version:
+            listed = versions_in_range(md, pkg_name, args.min_version, args.max_version)
+        else:
+            listed = sorted_versions(md, pkg_name)
+        for ver in listed:
             targets = versions[ver].get("targets", {})
             target_list = ", ".join(sorted(targets.keys()))
             marker = " *" if ver == latest else ""
             print(f"  {ver}{marker}  [{target_list}]")
+            if args.notes and versions[ver].get("notes"):
+                # Notes live in sidecar files and are only read when asked for
+                try:
+                    text = read_notes(args.index, versions[ver]["notes"])
+                except (OSError, ValueError) as exc:
+                    print(f"    (release notes unavailable: {exc})")
+                    continue
+                for line in text.splitlines():
+                    print(f"    {line}")
     return 0
 
 
 def cmd_remove_version(args: argparse.Namespace) -> int:
-    md = _load_index(args.index)
-    removed = remove_version(md, args.name, args.version)
-    if not removed:
-        raise SystemExit(f"Version {args.version} of '{args.name}' not found in index.")
-    _write_index(md, args.index)
+    with _locked_index(args.index):
+        md = _load_index(args.index, [args.name])
+        removed = remove_version(md, args.name, args.version)
+        if not removed:
+            raise SystemExit(f"Version {args.version} of '{args.name}' not found in index.")
+        _write_index(md, args.index, names=[args.name])
     print(f"Removed {args.name} {args.version} from index.")
     if args.delete_release:
         if not shutil.which("gh"):
@@ -179,6 +256,93 @@ def cmd_remove_version(args: argparse.Namespace) -> int:
     return 0
 
 
+def cmd_gc(args: argparse.Namespace) -> int:
+    keep_last = args.keep_last if args.keep_last is not None else env_number("GC_KEEP_LAST")
+    keep_days = args.keep_days if args.keep_days is not None else env_number("GC_KEEP_DAYS")
+    try:
+        since = None
+        if args.keep_since:
+            since = retention.parse_since(args.keep_since)
+        elif keep_days is not None:
+            since = datetime.now(timezone.utc) - timedelta(days=keep_days)
+        staging = args.staging or None
+        lock_dir = os.getenv("LOCK_DIR") or os.path.join(WORKING_DIR, "locks")
+        with _locked_index(args.index):
+            md = _load_index(args.index)
+            if args.name and args.name not in md:
+                raise SystemExit(f"Package '{args.name}' not found in index.")
+            removals = retention.plan(md, keep_last, since, [args.name] if args.name else None)
+            report = retention.collect(md, removals, staging, os.path.dirname(args.index),
+                                       retention.busy_projects(lock_dir))
+            if not args.dry_run:
+                if removals:
+                    _write_index(report["metadata"], args.index,
+                                 names=sorted({name for name, _, _ in removals}))
+                retention.remove_orphans(report["orphans"], staging)
+    except retention.RetentionError as exc:
+        raise SystemExit(f"gc: {exc}")
+
+    verb = "Would remove" if args.dry_run else "Removed"
+    versions = {}
+    for name, version, target in removals:
+        versions.setdefault((name, version), []).append(target)
+    print(f"{verb} {len(removals)} target(s) in {len(versions)} version(s) "
+          f"({len(report['dropped'])} version(s) entirely)")
+    for (name, version), targets in versions.items():
+        print(f"  {name} {version}  [{', '.join(sorted(targets))}]")
+    print(f"{verb} {len(report['orphans'])} orphaned file(s) from the staging tree: "
+          f"{report['orphan_bytes']} bytes")
+    print(f"Index: {report['index_bytes']} bytes smaller")
+
+    if args.delete_releases and removals:
+        if args.dry_run:
+            partial = [r for r in removals if (r[0], r[1]) not in set(report["dropped"])]
+            print(f"Would delete {len(report['dropped'])} GitHub release(s) and the assets "
+                  f"of {len(partial)} other target(s)")
+        elif not shutil.which("gh"):
+            print("Warning: 'gh' not found, skipping GitHub release cleanup.")
+        else:
+            for warning in retention.release_cleanup(removals, report["dropped"]):
+                print(f"Warning: {warning}.")
+    if removals and not args.dry_run:
+        print("The trimmed index is signed and pushed with the next publish.")
+    return 0
+
+
+def cmd_reindex(args: argparse.Namespace) -> int:
+    with _locked_index(args.index):
+        md = _load_index(args.index)
+        if not md:
+            print("Index is empty.")
+            return 0
+        rebuild_latest_by_target(md)
+        rebuild_version_order(md)
+        inlined = inline_artifacts(md, args.artifacts) if args.artifacts else 0
+        _write_index(md, args.index, args.layout)
+        if args.layout and index_backend() == BACKEND_SQLITE:
+            # The layout only exists in the exported view
+            export_index(args.index, args.layout)
+    print(f"Rebuilt latest_by_target and version_order for {len(md)} package(s).")
+    if args.artifacts:
+        print(f"Inlined artifact digests and sizes into {inlined} target(s).")
+    return 0
+
+
+def cmd_index_store(args: argparse.Namespace) -> int:
+    try:
+        with _locked_index(args.index):
+            if args.action == "export":
+                export_index(args.index, args.layout)
+                print(f"Exported {args.index} from {store_path(args.index)}")
+            else:
+                count = import_index(args.index)
+                print(f"Imported {count} package(s) from {args.index} "
+                      f"into {store_path(args.index)}")
+    except (OSError, ValueError, sqlite3.Error, StoreError) as exc:
+        raise SystemExit(f"index-store: {exc}")
+    return 0
+
+
 def _resolve_notes(args: argparse.Namespace):
     """Return notes text from --notes, --notes-file, or None."""
     if getattr(args, "notes", None):
@@ -197,7 +361,12 @@ def cmd_stage(args: argparse.Namespace) -> int:
     # Proxy to core/stage.py so logic stays single-sourced
     cmd = [sys.executable, STAGE_SCRIPT, args.name, args.update_type]
     if args.builder:
-        cmd += ["-b", args.builder]
+        builders = _resolve_builders(args.builder)
+        if len(builders) > 1:
+            # One index transaction for the whole group
+            cmd += ["--builders", ",".join(builders)]
+        else:
+            cmd += ["-b", builders[0]]
     if args.env:
         cmd += ["-e", args.env]
     if args.metadata_file:
@@ -233,6 +402,18 @@ def cmd_run(args: argparse.Namespace) -> int:
         env["EXPLICIT_VERSION"] = args.explicit_version
     if args.dry_run:
         env["DRY_RUN"] = "1"
+    if args.jobs is not None:
+        if args.jobs < 1:
+            raise SystemExit("--jobs must be at least 1")
+        env["JOBS"] = str(args.jobs)
+    if args.overlap:
+        env["PIPELINE_OVERLAP"] = "1"
+    if args.wait:
+        env["LOCK_WAIT"] = "1"
+    if args.lock_timeout is not None:
+        if args.lock_timeout < 0:
+            raise SystemExit("--lock-timeout must not be negative")
+        env["LOCK_TIMEOUT"] = str(args.lock_timeout)
 
     notes = _resolve_notes(args)
     if notes:
@@ -249,11 +430,13 @@ def cmd_run(args: argparse.Namespace) -> int:
         if args.stage_dir:
             cmd.append(args.stage_dir)
     else:
-        # Multi-builder: pass BUILDERS env var, pipeline loops internally
+        # Multi-builder: pass BUILDERS env var, pipeline loops internally.
+        # The [builder] positional is ignored when BUILDERS is set, but it
+        # must still be filled so --stage-dir lands in the staging_dir slot.
         env["BUILDERS"] = " ".join(builders)
         cmd = base_cmd + [args.project_path, args.update_type]
         if args.stage_dir:
-            cmd.append(args.stage_dir)
+            cmd += [builders[0], args.stage_dir]
 
     try:
         run(cmd, check=True, env=env)
@@ -263,20 +446,147 @@ def cmd_run(args: argparse.Namespace) -> int:
         return exc.returncode or 1
 
 
-def cmd_add_sha256(args: argparse.Namespace) -> int:
-    # Update sha256 field for a specific target to its canonical filename
-    if not all([args.name, args.version, args.os, args.arch]):
-        raise SystemExit("name, version, os, and arch are required")
-    md = _load_index(args.index)
-    fname = package_name(args.name, args.version, args.os, args.arch, 2)
-    ok = edit_target(md, args.name, args.version, args.os, args.arch, "sha256", fname)
-    if not ok:
-        raise SystemExit("Failed to update sha256 field (missing entry?)")
-    _write_index(md, args.index)
-    print("updated")
+def _runs_dir() -> str:
+    return os.getenv("RUNS_DIR") or os.path.join(WORKING_DIR, "runs")
+
+
+def cmd_resume(args: argparse.Namespace) -> int:
+    if not os.path.isfile(PUBLISH_PIPELINE):
+        raise SystemExit(f"Pipeline script not found: {PUBLISH_PIPELINE}")
+    try:
+        manifest = load_run(_runs_dir(), args.run_id)
+    except RunError as exc:
+        raise SystemExit(str(exc))
+
+    builders = remaining(manifest)
+    if not builders:
+        print(f"Run {args.run_id} is complete; nothing to resume.")
+        return 0
+    project_path = os.path.abspath(args.project_path or manifest["project_path"])
+    if not os.path.isdir(project_path):
+        raise SystemExit(f"Project source no longer exists: {project_path} "
+                         f"(pass --project-path)")
+    if os.path.basename(project_path) != manifest["project"]:
+        raise SystemExit(f"{project_path} is not project '{manifest['project']}'")
+
+    env = os.environ.copy()
+    env["PYTHONUNBUFFERED"] = "1"
+    env["RUN_ID"] = args.run_id
+    env["BUILDERS"] = " ".join(builders)
+    # The missing targets join the version (and release) the run already has
+    if manifest.get("version"):
+        env["EXPLICIT_VERSION"] = manifest["version"]
+    if args.jobs is not None:
+        if args.jobs < 1:
+            raise SystemExit("--jobs must be at least 1")
+        env["JOBS"] = str(args.jobs)
+    if args.overlap:
+        env["PIPELINE_OVERLAP"] = "1"
+    if args.wait:
+        env["LOCK_WAIT"] = "1"
+
+    print(f"Resuming run {args.run_id}: {', '.join(builders)}"
+          f"{' at ' + manifest['version'] if manifest.get('version') else ''}")
+    cmd = ["bash", PUBLISH_PIPELINE, project_path, manifest["update_type"], builders[0],
+           manifest["staging_dir"]]
+    try:
+        run(cmd, check=True, env=env)
+        return 0
+    except CalledProcessError as exc:
+        print(f"pipeline failed: {exc}")
+        return exc.returncode or 1
+
+
+def cmd_runs(args: argparse.Namespace) -> int:
+    cmd = [sys.executable, RUNS_SCRIPT, "--runs-dir", _runs_dir()]
+    if args.run_id:
+        cmd += ["show", args.run_id]
+        if args.json:
+            cmd.append("--json")
+    else:
+        cmd.append("list")
+    return run(cmd).returncode
+
+
+def cmd_pool(args: argparse.Namespace) -> int:
+    cmd = [sys.executable, POOL_SCRIPT, args.action]
+    if args.action == "status" and args.json:
+        cmd.append("--json")
+    if args.action == "drain" and args.builder:
+        cmd += ["--builder", args.builder]
+    return run(cmd).returncode
+
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    cmd = [sys.executable, QUEUE_SCRIPT, "serve"]
+    if args.workers is not None:
+        cmd += ["--workers", str(args.workers)]
+    if args.builder_limit is not None:
+        cmd += ["--builder-limit", str(args.builder_limit)]
+    # exec so that signals (systemd stop, Ctrl-C) reach the daemon itself
+    os.execv(sys.executable, cmd)
+
+
+def cmd_submit(args: argparse.Namespace) -> int:
+    if not os.path.isdir(args.project_path):
+        raise SystemExit(f"Project path is not a directory: {args.project_path}")
+    builders = _resolve_builders(
+        args.builder or os.getenv("DEFAULT_BUILDER", "ubuntu_amd64")
+    )
+    cmd = [sys.executable, QUEUE_SCRIPT, "submit",
+           "--project-path", os.path.abspath(args.project_path),
+           "--update-type", args.update_type,
+           "--builders", ",".join(builders)]
+    if args.stage_dir:
+        cmd += ["--stage-dir", os.path.abspath(args.stage_dir)]
+    if args.explicit_version:
+        cmd += ["--version", args.explicit_version]
+    if args.dry_run:
+        cmd.append("--dry-run")
+    if args.jobs is not None:
+        if args.jobs < 1:
+            raise SystemExit("--jobs must be at least 1")
+        cmd += ["--jobs", str(args.jobs)]
+    if args.overlap:
+        cmd.append("--overlap")
+    if args.lock_timeout is not None:
+        cmd += ["--lock-timeout", str(args.lock_timeout)]
+    notes = _resolve_notes(args)
+    if notes:
+        cmd += ["--notes", notes]
+    result = run(cmd, capture_output=True, text=True)
+    sys.stderr.write(result.stderr)
+    if result.returncode != 0:
+        return result.returncode
+    job_id = result.stdout.strip()
+    print(job_id)
+    if args.wait:
+        return run([sys.executable, QUEUE_SCRIPT, "wait", job_id, "--log"]).returncode
     return 0
 
 
+def cmd_queue_status(args: argparse.Namespace) -> int:
+    cmd = [sys.executable, QUEUE_SCRIPT, "status"]
+    if args.id:
+        cmd.append(args.id)
+    if args.json:
+        cmd.append("--json")
+    return run(cmd).returncode
+
+
+def cmd_wait(args: argparse.Namespace) -> int:
+    cmd = [sys.executable, QUEUE_SCRIPT, "wait", args.id]
+    if args.timeout is not None:
+        cmd += ["--timeout", str(args.timeout)]
+    if not args.quiet:
+        cmd.append("--log")
+    return run(cmd).returncode
+
+
+def cmd_cancel(args: argparse.Namespace) -> int:
+    return run([sys.executable, QUEUE_SCRIPT, "cancel", args.id]).returncode
+
+
 def cmd_config(_: argparse.Namespace) -> int:
     editor = os.environ.get("EDITOR", "nano")
     try:
@@ -455,6 +765,16 @@ def cmd_doctor(args: argparse.Namespace) -> int:
     return 0
 
 
+def _add_wait_lock(sp: argparse.ArgumentParser) -> None:
+    sp.add_argument(
+        "--wait",
+        action="store_true",
+        default=False,
+        help="Wait for a running pipeline of the same project instead of failing "
+             "(default: LOCK_WAIT from config).",
+    )
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Repman CI Runner")
     sub = p.add_subparsers(dest="cmd", required=True)
@@ -482,12 +802,34 @@ def build_parser() -> argparse.ArgumentParser:
         default=False,
         help="Print what would happen without executing builds or publishing.",
     )
+    _run_parent.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Run up to N builders concurrently (default: PIPELINE_JOBS from config, else 1).",
+    )
+    _run_parent.add_argument(
+        "--overlap",
+        action="store_true",
+        default=False,
+        help="Package, sign and upload each target as soon as its build finishes "
+             "(default: PIPELINE_OVERLAP from config).",
+    )
+    _run_parent.add_argument(
+        "--lock-timeout",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="Give up waiting for a project or index lock after SECONDS "
+             "(default: LOCK_TIMEOUT from config, else 3600).",
+    )
     _notes_group = _run_parent.add_mutually_exclusive_group()
     _notes_group.add_argument(
         "-n", "--notes",
         dest="notes",
         default=None,
-        help="Release notes text (attached to GitHub release and stored in index).",
+        help="Release notes text (attached to GitHub release; stored next to the index).",
     )
     _notes_group.add_argument(
         "-N", "--notes-file",
@@ -500,6 +842,7 @@ def build_parser() -> argparse.ArgumentParser:
     # get-index
     sp = sub.add_parser("get-index", help="Print the metadata index JSON")
     sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
+    sp.add_argument("--compact", action="store_true", help="Print the compact canonical encoding")
     sp.set_defaults(func=cmd_get_index)
 
     # get-builders
@@ -520,13 +863,23 @@ def build_parser() -> argparse.ArgumentParser:
     # list
     sp = sub.add_parser("list", help="List all packages, versions, and targets")
     sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
+    sp.add_argument("--name", default=None, help="Only list this package")
+    sp.add_argument("--min", dest="min_version", default=None, metavar="X.Y.Z",
+                    help="Only list versions >= X.Y.Z")
+    sp.add_argument("--max", dest="max_version", default=None, metavar="X.Y.Z",
+                    help="Only list versions <= X.Y.Z")
+    sp.add_argument("--notes", action="store_true",
+                    help="Also print each listed version's release notes")
     sp.set_defaults(func=cmd_list)
 
     # stage
     sp = sub.add_parser("stage", help="Stage a program version (metadata + pkg md)")
     sp.add_argument("name", help="Program name to stage")
     sp.add_argument("update_type", choices=["major", "minor", "patch", "new"], help="Version update type")
-    sp.add_argument("-b", "--builder", help="Builder to use (e.g. ubuntu_amd64)")
+    sp.add_argument(
+        "-b", "--builder",
+        help="Builder or builder group (e.g. ubuntu_amd64, all-linux); a group is staged in one transaction",
+    )
     sp.add_argument("-e", "--env", help="Path to env file to load")
     sp.add_argument("--metadata-file", help="Path to index.json (override)")
     sp.add_argument("--out-dir", help="Output directory for package metadata")
@@ -555,12 +908,59 @@ def build_parser() -> argparse.ArgumentParser:
 
     # run (pipeline)
     sp = sub.add_parser("run", parents=[_run_parent], help="Run full publish pipeline for a project")
+    _add_wait_lock(sp)
     sp.set_defaults(func=cmd_run)
 
     # update (alias of run — shares same parser and function)
     sp = sub.add_parser("update", parents=[_run_parent], help="Alias of 'run'")
+    _add_wait_lock(sp)
     sp.set_defaults(func=cmd_run)
 
+    # publish queue
+    sp = sub.add_parser("serve", help="Run the publish queue daemon (foreground)")
+    sp.add_argument("--workers", type=int, default=None,
+                    help="Pipelines run at once (default: QUEUE_WORKERS from config, else 2)")
+    sp.add_argument("--builder-limit", type=int, default=None,
+                    help="Jobs per builder at once (default: QUEUE_BUILDER_LIMIT, else 1)")
+    sp.set_defaults(func=cmd_serve)
+
+    sp = sub.add_parser("submit", parents=[_run_parent], help="Queue a publish job with the daemon")
+    sp.add_argument("--wait", action="store_true", default=False,
+                    help="Block until the job finishes, printing its output; exit with its status.")
+    sp.set_defaults(func=cmd_submit)
+
+    sp = sub.add_parser("status", help="List queued, running and finished publish jobs")
+    sp.add_argument("id", nargs="?", default=None, help="Only this job")
+    sp.add_argument("--json", action="store_true", help="Print JSON")
+    sp.set_defaults(func=cmd_queue_status)
+
+    sp = sub.add_parser("wait", help="Wait for a queued publish job; exits with its status")
+    sp.add_argument("id", help="Job id printed by submit")
+    sp.add_argument("--timeout", type=float, default=None, help="Give up after SECONDS")
+    sp.add_argument("-q", "--quiet", action="store_true", help="Do not print the job's output")
+    sp.set_defaults(func=cmd_wait)
+
+    sp = sub.add_parser("cancel", help="Cancel a queued or running publish job")
+    sp.add_argument("id", help="Job id printed by submit")
+    sp.set_defaults(func=cmd_cancel)
+
+    # run manifests
+    sp = sub.add_parser("resume", help="Finish a partly failed run: rebuild only its unpublished targets")
+    sp.add_argument("run_id", help="Run id printed by run/update")
+    sp.add_argument("--project-path", default=None,
+                    help="Project source (default: the path the run was started from)")
+    sp.add_argument("-j", "--jobs", type=int, default=None, metavar="N",
+                    help="Run up to N builders concurrently")
+    sp.add_argument("--overlap", action="store_true", default=False,
+                    help="Package, sign and upload each target as soon as it is built")
+    _add_wait_lock(sp)
+    sp.set_defaults(func=cmd_resume)
+
+    sp = sub.add_parser("runs", help="List pipeline runs, or show one run's targets")
+    sp.add_argument("run_id", nargs="?", default=None, help="Only this run")
+    sp.add_argument("--json", action="store_true", help="Print the manifest as JSON")
+    sp.set_defaults(func=cmd_runs)
+
     # remove-version
     sp = sub.add_parser("remove-version", help="Remove a version entry from the index")
     sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
@@ -573,14 +973,57 @@ def build_parser() -> argparse.ArgumentParser:
     )
     sp.set_defaults(func=cmd_remove_version)
 
-    # add-sha256
-    sp = sub.add_parser("add-sha256", help="Update sha256 field for a specific target")
+    # gc
+    sp = sub.add_parser("gc", help="Apply retention rules to the index and remove orphaned staged artifacts")
     sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
-    sp.add_argument("name", help="Package name")
-    sp.add_argument("version", help="Version (e.g., 1.2.3)")
-    sp.add_argument("os", help="Target OS (e.g., ubuntu)")
-    sp.add_argument("arch", help="Target arch (e.g., amd64)")
-    sp.set_defaults(func=cmd_add_sha256)
+    sp.add_argument("--staging", default=os.getenv("DEFAULT_STAGE"),
+                    help="Staging repo to remove orphaned artifacts from (default: DEFAULT_STAGE)")
+    sp.add_argument("--name", default=None, help="Only apply the rules to this package")
+    sp.add_argument("--keep-last", type=int, default=None, metavar="N",
+                    help="Keep the N highest versions of every target (default: GC_KEEP_LAST)")
+    _gc_since = sp.add_mutually_exclusive_group()
+    _gc_since.add_argument("--keep-days", type=int, default=None, metavar="N",
+                           help="Keep versions published in the last N days (default: GC_KEEP_DAYS)")
+    _gc_since.add_argument("--keep-since", default=None, metavar="DATE",
+                           help="Keep versions published on or after DATE (YYYY-MM-DD)")
+    sp.add_argument("--delete-releases", action="store_true",
+                    help="Also delete the GitHub releases (or assets) of removed entries via gh")
+    sp.add_argument("--dry-run", action="store_true",
+                    help="Report what would be removed and reclaimed without changing anything")
+    sp.set_defaults(func=cmd_gc)
+
+    # reindex
+    sp = sub.add_parser("reindex", help="Rebuild derived index fields (latest_by_target, version_order)")
+    sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
+    sp.add_argument(
+        "--layout",
+        choices=["monolithic", "sharded"],
+        default=None,
+        help="Rewrite the index in this layout (default: INDEX_LAYOUT from config, else monolithic)",
+    )
+    sp.add_argument(
+        "--artifacts",
+        default=None,
+        help="Directory of published tarballs; inline their digests, sizes and signatures",
+    )
+    sp.set_defaults(func=cmd_reindex)
+
+    # index-store
+    sp = sub.add_parser("index-store",
+                        help="Export index.json from the SQLite index store, or refill the store "
+                             "from index.json (INDEX_BACKEND=sqlite)")
+    sp.add_argument("action", choices=["export", "import"])
+    sp.add_argument("--index", default=INDEX_PATH, help="Path to index.json (default: %(default)s)")
+    sp.add_argument("--layout", choices=["monolithic", "sharded"], default=None,
+                    help="Layout of the exported index (default: INDEX_LAYOUT from config)")
+    sp.set_defaults(func=cmd_index_store)
+
+    # pool
+    sp = sub.add_parser("pool", help="Inspect or drain the warm builder container pool (BUILD_POOL=1)")
+    sp.add_argument("action", choices=["status", "drain"], help="status: list containers; drain: remove them")
+    sp.add_argument("--builder", default=None, help="drain: only this builder's containers")
+    sp.add_argument("--json", action="store_true", help="status: print JSON")
+    sp.set_defaults(func=cmd_pool)
 
     # config
     sp = sub.add_parser("config", help="Open config.env in $EDITOR (default nano)")
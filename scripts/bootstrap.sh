@@ -22,3 +22,10 @@ else
 fi
 WORKING_DIR="$_p"; unset _p _cfg
 export WORKING_DIR
+
+# Settings read by the Python helpers in core/ (they do not parse config.env
+# themselves when it lives under XDG_CONFIG_HOME)
+export INDEX_BACKEND INDEX_LAYOUT INDEX_ENCODINGS INDEX_INLINE_MINISIG INDEX_DELTAS BUILD_CACHE_DIR BUILD_CACHE_MAX_MB PACK_THREADS PACK_LEVEL \
+  SIGN_AGENT_JOBS SIGN_AGENT_IDLE_TIMEOUT UPLOAD_JOBS UPLOAD_RETRIES UPLOAD_BACKOFF \
+  TOOLCHAIN_CACHE_DIR TOOLCHAIN_CACHE_MAX_MB DERIVED_IMAGES_STATE DERIVED_IMAGE_TTL_DAYS \
+  POOL_DIR POOL_SIZE POOL_MAX_JOBS POOL_IDLE_TIMEOUT LOCK_TIMEOUT RUNS_DIR
@@ -8,26 +8,149 @@ PROJECT="$1"
 BUILDER="${2:-$DEFAULT_BUILDER}"
 
 BUILD_DIR="$SCRIPT_DIR/../builders"
+CORE="$SCRIPT_DIR/../core"
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
 DRY_RUN="${DRY_RUN:-0}"
+BUILD_CACHE="${BUILD_CACHE:-1}"
+
+# BUILD_ROOT holds the src/ and out/ dirs mounted into the builder container.
+# publish_pipeline.sh points it at a per-builder namespace so builders can run
+# side by side; standalone invocations keep using WORKING_DIR directly.
+BUILD_ROOT="${BUILD_ROOT:-$WORKING_DIR}"
+export BUILD_ROOT
+
+# Compose project name scopes the container and its named volumes
+# (in_progress, caches) so concurrent builds never share them.
+COMPOSE_PROJECT="$(printf 'repcid_%s_%s' "$PROJECT" "$BUILDER" \
+  | tr '[:upper:]' '[:lower:]' | tr -c 'a-z0-9_-' '_')"
+
+# Toolchain caches (pip, Go, ccache, package downloads) are host dirs bind
+# mounted at /cache, so they survive `compose down -v` between builds.
+TOOLCHAIN_CACHE_DIR="${TOOLCHAIN_CACHE_DIR:-$WORKING_DIR/cache/toolchains}"
+TOOLCHAIN_CACHE="$TOOLCHAIN_CACHE_DIR/$BUILDER"
+export TOOLCHAIN_CACHE
+
+# REPCID_WORKERS=N (or auto) runs start.sh in worker mode: every project in
+# src/ is built, N at a time, with a status record in out/.status/.
+export REPCID_WORKERS="${REPCID_WORKERS:-}"
+
+YML="$BUILD_DIR/$BUILDER-builder.yml"
+IMAGE="$(grep -m1 'image:' "$YML" | awk '{print $2}')"
+COMPOSE_FILES=(-f "$YML")
+SOURCE_MODE="${SOURCE_MODE:-copy}"
+DERIVED_IMAGES="${DERIVED_IMAGES:-1}"
+DERIVED_IMAGES_STATE="${DERIVED_IMAGES_STATE:-$WORKING_DIR/cache/derived_images.json}"
+BUILD_POOL="${BUILD_POOL:-0}"
+COMPOSE_OVERRIDE=""
 
 compose_up() {
-  docker compose -f "$BUILD_DIR/$BUILDER-builder.yml" up \
+  docker compose -p "$COMPOSE_PROJECT" "${COMPOSE_FILES[@]}" up \
     --abort-on-container-exit \
     --exit-code-from "${BUILDER}_builder"
 }
 
 compose_down() {
-  docker compose -f "$BUILD_DIR/$BUILDER-builder.yml" down -v
+  docker compose -p "$COMPOSE_PROJECT" "${COMPOSE_FILES[@]}" down -v
+  [[ -z "$COMPOSE_OVERRIDE" ]] || rm -f "$COMPOSE_OVERRIDE"
 }
 
 if [[ "$DRY_RUN" == "1" ]]; then
-  echo "[DRY-RUN] Would run: docker compose -f $BUILD_DIR/$BUILDER-builder.yml up --exit-code-from ${BUILDER}_builder"
+  if [[ "$BUILD_POOL" == "1" ]]; then
+    echo "[DRY-RUN] Would run: start.sh for $PROJECT in a warm $BUILDER pool container"
+  else
+    echo "[DRY-RUN] Would run: docker compose -p $COMPOSE_PROJECT -f $YML up --exit-code-from ${BUILDER}_builder"
+  fi
   exit 0
 fi
 
-trap compose_down EXIT
-compose_up
-trap - EXIT
-compose_down
+# Record hit/miss for the pipeline summary (only inside a pipeline namespace)
+record_cache_result() {
+  [[ "$BUILD_ROOT" != "$WORKING_DIR" ]] && echo "$1" > "$BUILD_ROOT/cache_result"
+  return 0
+}
+
+# Build cache: key on the staged source tree + builder image digest.
+# A hit restores out/<project> and skips the container.
+CACHE_KEY=""
+if [[ "$BUILD_CACHE" == "1" ]]; then
+  IMAGE_ID="$(docker image inspect --format '{{.Id}}' "$IMAGE" 2>/dev/null || true)"
+  if [[ -z "$IMAGE_ID" ]]; then
+    echo "[cache] skipped: cannot resolve digest for image '$IMAGE'"
+  else
+    CACHE_KEY="$("$PYTHON" "$CORE/build_cache.py" key "$BUILD_ROOT/src/$PROJECT" \
+      --builder "$BUILDER" --image-id "$IMAGE_ID" --start-script "$WORKING_DIR/data/start.sh")"
+    if "$PYTHON" "$CORE/build_cache.py" restore "$CACHE_KEY" "$BUILD_ROOT/out/$PROJECT"; then
+      echo "[cache] HIT  $BUILDER (${CACHE_KEY:0:12}) — skipping container"
+      record_cache_result hit
+      echo "Build completed for $PROJECT (cached)"
+      exit 0
+    fi
+    echo "[cache] MISS $BUILDER (${CACHE_KEY:0:12})"
+    record_cache_result miss
+  fi
+fi
+
+# Derived image: the builder image with this project's deps.json packages
+# preinstalled, built once per (image digest, deps) and reused afterwards.
+# On failure the build runs on the base image and installs at start.
+RUN_IMAGE="$IMAGE"
+DEPS_FILE="$BUILD_ROOT/src/$PROJECT/deps.json"
+if [[ "$DERIVED_IMAGES" == "1" && -f "$DEPS_FILE" ]]; then
+  PLATFORM="$(grep -m1 'platform:' "$YML" | awk '{print $2}' || true)"
+  RUN_IMAGE="$("$PYTHON" "$CORE/derived_images.py" --state "$DERIVED_IMAGES_STATE" \
+    ensure --builder "$BUILDER" \
+    --base-image "$IMAGE" --deps "$DEPS_FILE" --platform "$PLATFORM")" || {
+    echo "[derived-image] warning: falling back to $IMAGE" >&2
+    RUN_IMAGE="$IMAGE"
+  }
+fi
+
+TC_STAMP="$("$PYTHON" "$CORE/toolchain_cache.py" begin "$TOOLCHAIN_CACHE")"
+
+if [[ "$BUILD_POOL" == "1" ]]; then
+  # Warm pool: exec start.sh in a long-lived builder container instead of
+  # bringing a compose project up and down for this build.
+  "$PYTHON" "$CORE/pool.py" run --builder "$BUILDER" --compose-file "$YML" \
+    --image "$RUN_IMAGE" --project "$PROJECT" --build-root "$BUILD_ROOT"
+else
+  # Per-build compose override: the derived image, and for SOURCE_MODE=overlay
+  # the CAP_SYS_ADMIN that start.sh needs to mount an overlay over the
+  # read-only /todo instead of copying the project into /in_progress.
+  if [[ "$RUN_IMAGE" != "$IMAGE" || "$SOURCE_MODE" == "overlay" ]]; then
+    COMPOSE_OVERRIDE="$(mktemp "${TMPDIR:-/tmp}/repcid-compose.XXXXXX.yml")"
+    {
+      echo "services:"
+      echo "  ${BUILDER}_builder:"
+      [[ "$RUN_IMAGE" == "$IMAGE" ]] || echo "    image: $RUN_IMAGE"
+      if [[ "$SOURCE_MODE" == "overlay" ]]; then
+        cat <<YML
+    environment:
+      SOURCE_MODE: overlay
+    cap_add:
+      - SYS_ADMIN
+    security_opt:
+      - apparmor:unconfined
+YML
+      fi
+    } > "$COMPOSE_OVERRIDE"
+    COMPOSE_FILES+=(-f "$COMPOSE_OVERRIDE")
+  fi
+
+  trap compose_down EXIT
+  compose_up
+  trap - EXIT
+  compose_down
+fi
+
+"$PYTHON" "$CORE/toolchain_cache.py" report "$TOOLCHAIN_CACHE" --since "$TC_STAMP" \
+  && "$PYTHON" "$CORE/toolchain_cache.py" --cache-dir "$TOOLCHAIN_CACHE_DIR" prune \
+  || echo "[toolchain-cache] warning: failed to report or prune" >&2
+
+if [[ -n "$CACHE_KEY" && -d "$BUILD_ROOT/out/$PROJECT" ]]; then
+  "$PYTHON" "$CORE/build_cache.py" save "$CACHE_KEY" "$BUILD_ROOT/out/$PROJECT" --builder "$BUILDER" \
+    && "$PYTHON" "$CORE/build_cache.py" prune \
+    || echo "[cache] warning: failed to store build output" >&2
+fi
 
 echo "Build completed for $PROJECT"
@@ -4,12 +4,25 @@ set -euo pipefail
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
 
+# Usage:
+#   generate_metadata.sh <project> <update_type> <builder>
+#       Stage one target; prints the package name.
+#   BUILDS_DIR=<dir> generate_metadata.sh <project> <update_type> <builder> [builder ...]
+#       Stage all targets in one index transaction (one version for all).
+#       metadata.json lands in $BUILDS_DIR/<builder>/out/<project>/ and one
+#       "<builder> <package name>" line is printed per staged target.
+#   STAGE_PENDING=<file> ...
+#       Leave the index alone and record the update in <file> for
+#       core/stage_commit.py to apply later (publish_pipeline.sh).
+
 PROJECT="$1"
 UPDATE_TYPE="$2"
-BUILDER="$3"
+shift 2
+BUILDERS_ARG=("$@")
+BUILDER="${BUILDERS_ARG[0]}"
 
 CORE="$SCRIPT_DIR/../core"
-OUT_DIR="$WORKING_DIR/out"
+OUT_DIR="${BUILD_ROOT:-$WORKING_DIR}/out"
 PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
 [[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
 
@@ -19,9 +32,35 @@ VERSION_ARGS=()
 NOTES_ARGS=()
 [[ -n "${RELEASE_NOTES:-}" ]] && NOTES_ARGS=(--notes "$RELEASE_NOTES")
 
+PENDING_ARGS=()
+[[ -n "${STAGE_PENDING:-}" ]] && PENDING_ARGS=(--pending "$STAGE_PENDING")
+
+if [[ ${#BUILDERS_ARG[@]} -gt 1 && -z "${BUILDS_DIR:-}" ]]; then
+  echo "BUILDS_DIR must be set when staging more than one builder" >&2
+  exit 1
+fi
+
+if [[ -n "${BUILDS_DIR:-}" ]]; then
+  mkdir -p "$OUT_DIR"
+  PY_OUTPUT=$(
+    IFS=,
+    "$PYTHON" "$CORE/stage.py" "$PROJECT" "$UPDATE_TYPE" --builders "${BUILDERS_ARG[*]}" \
+      --out-dir "$OUT_DIR" "${VERSION_ARGS[@]}" "${NOTES_ARGS[@]}" "${PENDING_ARGS[@]}"
+  )
+  echo "$PY_OUTPUT" | grep -v $'\t' >&2 || true
+
+  while IFS=$'\t' read -r STAGED_BUILDER PKG_NAME; do
+    TARGET_DIR="$BUILDS_DIR/$STAGED_BUILDER/out/$PROJECT"
+    mkdir -p "$TARGET_DIR"
+    mv "$OUT_DIR/${PKG_NAME}_md.json" "$TARGET_DIR/metadata.json"
+    echo "$STAGED_BUILDER $PKG_NAME"
+  done < <(echo "$PY_OUTPUT" | grep $'\t' || true)
+  exit 0
+fi
+
 PY_OUTPUT=$(
   "$PYTHON" "$CORE/stage.py" "$PROJECT" "$UPDATE_TYPE" -b "$BUILDER" \
-    "${VERSION_ARGS[@]}" "${NOTES_ARGS[@]}"
+    --out-dir "$OUT_DIR" "${VERSION_ARGS[@]}" "${NOTES_ARGS[@]}" "${PENDING_ARGS[@]}"
 )
 
 PKG_NAME="$(echo "$PY_OUTPUT" | tail -n 1)"
@@ -0,0 +1,66 @@
+#!/usr/bin/env bash
+# locking.sh — sourced by the pipeline scripts. Defines the project and index
+# lock helpers; do NOT execute this script directly.
+#
+# A pipeline run holds its project's lock ($LOCK_DIR/project-<name>.lock, fd 9)
+# from start to finish, so different projects build side by side while a
+# second run of the same project fails fast, or with LOCK_WAIT=1 queues for
+# up to LOCK_TIMEOUT seconds. The index lock (<index dir>/.index.lock, fd 8,
+# the same file core/index.py locks) is only held for the short section that
+# merges the update into the index, signs it and publishes.
+
+LOCK_DIR="${LOCK_DIR:-$WORKING_DIR/locks}"
+LOCK_WAIT="${LOCK_WAIT:-0}"
+LOCK_TIMEOUT="${LOCK_TIMEOUT:-3600}"
+INDEX_LOCK_FILE="$WORKING_DIR/${INDEX_DIR:-metadata}/.index.lock"
+
+project_lock_file() {
+  echo "$LOCK_DIR/project-$1.lock"
+}
+
+# lock_project <project>: take the project lock for the rest of this shell.
+lock_project() {
+  local file
+  file="$(project_lock_file "$1")"
+  mkdir -p "$LOCK_DIR"
+  exec 9>"$file"
+  flock -n 9 && return 0
+  if [[ "$LOCK_WAIT" != "1" ]]; then
+    echo "Another pipeline for '$1' is already running ($file). Exiting." >&2
+    echo "Set LOCK_WAIT=1 (repcid run --wait) to wait for it instead." >&2
+    return 1
+  fi
+  echo "[lock] '$1' is being published by another run; waiting up to ${LOCK_TIMEOUT}s"
+  flock -w "$LOCK_TIMEOUT" 9 || {
+    echo "Timed out after ${LOCK_TIMEOUT}s waiting for $file" >&2
+    return 1
+  }
+}
+
+# project_locked <project>: true while some run holds that project's lock.
+project_locked() {
+  local file
+  file="$(project_lock_file "$1")"
+  [[ -f "$file" ]] || return 1
+  ! flock -n "$file" true 2>/dev/null
+}
+
+# lock_index: take the index lock until unlock_index (or exit). Processes
+# started meanwhile see INDEX_LOCK_HELD=1 and do not lock the index again.
+lock_index() {
+  mkdir -p "$(dirname "$INDEX_LOCK_FILE")"
+  exec 8>"$INDEX_LOCK_FILE"
+  if ! flock -n 8; then
+    echo "[lock] index is being updated by another run; waiting up to ${LOCK_TIMEOUT}s"
+    flock -w "$LOCK_TIMEOUT" 8 || {
+      echo "Timed out after ${LOCK_TIMEOUT}s waiting for $INDEX_LOCK_FILE" >&2
+      return 1
+    }
+  fi
+  export INDEX_LOCK_HELD=1
+}
+
+unlock_index() {
+  unset INDEX_LOCK_HELD
+  exec 8>&-
+}
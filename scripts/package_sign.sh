@@ -3,18 +3,22 @@ set -euo pipefail
 
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
+source "$SCRIPT_DIR/signing.sh"
 
 PKG_NAME="$1"
-OUT_DIR="$WORKING_DIR/out"
+OUT_DIR="${BUILD_ROOT:-$WORKING_DIR}/out"
 DRY_RUN="${DRY_RUN:-0}"
 
+CORE="$SCRIPT_DIR/../core"
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
+
 TARBALL="$OUT_DIR/${PKG_NAME}.tar.gz"
 PROJECT_NAME="${PKG_NAME%%_v*}"
 
 if [[ "$DRY_RUN" == "1" ]]; then
-  echo "[DRY-RUN] Would tar: $OUT_DIR/$PROJECT_NAME -> $TARBALL"
+  echo "[DRY-RUN] Would pack: $OUT_DIR/$PROJECT_NAME -> $TARBALL (+ .sha256, .meta.json)"
   echo "[DRY-RUN] Would sign: minisign -S -s $CI_KEY -m $TARBALL"
-  echo "[DRY-RUN] Would hash: sha256sum $TARBALL > $TARBALL.sha256"
   touch "$TARBALL" "${TARBALL}.minisig" "${TARBALL}.sha256"
   exit 0
 fi
@@ -29,15 +33,10 @@ fi
   exit 1
 }
 
-(
-  cd "$OUT_DIR"
-  tar -czf "$TARBALL" "$PROJECT_NAME"
-)
-
-echo "$SIG_PASS" | minisign -S \
-  -s "$CI_KEY" \
-  -m "$TARBALL"
+# One pass over out/<project>: tar + parallel gzip + sha256, plus the
+# .sha256 and .meta.json sidecars
+"$PYTHON" "$CORE/packer.py" "$OUT_DIR" "$PROJECT_NAME" "$TARBALL"
 
-sha256sum "$TARBALL" > "$TARBALL.sha256"
+sign_files "$TARBALL"
 
 echo "Packaged and signed $PKG_NAME"
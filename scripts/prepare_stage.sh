@@ -3,6 +3,7 @@ set -euo pipefail
 
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
+source "$SCRIPT_DIR/locking.sh"
 
 PROJECT_PATH="$1"
 CI_DIR="$WORKING_DIR"
@@ -15,8 +16,41 @@ OUT_DIR="$CI_DIR/out"
   exit 1
 }
 
+PROJECT_NAME="$(basename "$PROJECT_PATH")"
+IGNORE_FILE="$PROJECT_PATH/.repcidignore"
+
 mkdir -p "$SRC_DIR" "$OUT_DIR"
-rm -rf "$SRC_DIR"/* "$OUT_DIR"/*
+# Other projects' trees and all previous outputs go; this project's staged
+# tree is kept and synced in place, so unchanged files are not copied again.
+# Trees and outputs of projects whose pipeline is running right now are left
+# alone.
+for STALE in "$SRC_DIR"/* "$SRC_DIR"/.[!.]*; do
+  [[ -e "$STALE" ]] || continue
+  STALE_NAME="$(basename "$STALE")"
+  [[ "$STALE_NAME" == "$PROJECT_NAME" ]] && continue
+  project_locked "$STALE_NAME" && continue
+  rm -rf "$STALE"
+done
+for STALE in "$OUT_DIR"/* "$OUT_DIR"/.[!.]*; do
+  [[ -e "$STALE" ]] || continue
+  STALE_NAME="$(basename "$STALE")"
+  # Packaged files are named <project>_v<version>_<os>_<arch>...
+  [[ "$STALE_NAME" =~ ^(.+)_v[0-9]+\.[0-9]+\.[0-9]+ ]] && STALE_NAME="${BASH_REMATCH[1]}"
+  project_locked "$STALE_NAME" && continue
+  rm -rf "$STALE"
+done
+
+# .repcidignore holds rsync exclude patterns (one per line, # comments),
+# e.g. ".git/", "target/", "node_modules/". Newly ignored paths are also
+# removed from the staged tree.
+RSYNC_ARGS=(-a --delete)
+if [[ -f "$IGNORE_FILE" ]]; then
+  RSYNC_ARGS+=(--delete-excluded --exclude-from="$IGNORE_FILE")
+fi
+rsync "${RSYNC_ARGS[@]}" "${PROJECT_PATH%/}/" "$SRC_DIR/$PROJECT_NAME/"
 
-cp -a "$PROJECT_PATH" "$SRC_DIR/"
-echo "Prepared stage for $(basename "$PROJECT_PATH")"
+if [[ -f "$IGNORE_FILE" ]]; then
+  echo "Prepared stage for $PROJECT_NAME (honouring .repcidignore)"
+else
+  echo "Prepared stage for $PROJECT_NAME"
+fi
@@ -6,6 +6,8 @@ source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
 
 usage() {
   echo "Usage: publish_github.sh <staging_dir> <pkg1> [pkg2 ...]" >&2
+  echo "  PUBLISH_PHASE=release|upload|commit|rollback runs one part of the publish" >&2
+  echo "  (default: all); PUBLISH_STATE=<file> carries the rollback state between them." >&2
   exit 1
 }
 
@@ -16,11 +18,32 @@ shift
 PKG_NAMES=("$@")
 
 DRY_RUN="${DRY_RUN:-0}"
+# The overlapped pipeline (core/orchestrator.py) runs the publish in parts:
+# release (tag + release, once), upload (per target, as each one is ready),
+# commit (index, at the end) and rollback. "all" does everything in one go.
+PHASE="${PUBLISH_PHASE:-all}"
+PUBLISH_STATE="${PUBLISH_STATE:-}"
+case "$PHASE" in
+  all|release|upload|commit|rollback) ;;
+  *) echo "Unknown PUBLISH_PHASE: $PHASE" >&2; exit 1 ;;
+esac
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
 
 # Rollback state — track what was created so we can undo on failure
 _TAG_CREATED=0
 _TAG_PUSHED=0
 _RELEASE_CREATED=0
+if [[ "$PHASE" != "release" && -n "$PUBLISH_STATE" && -f "$PUBLISH_STATE" ]]; then
+  # shellcheck disable=SC1090
+  source "$PUBLISH_STATE"
+fi
+
+_save_state() {
+  [[ -n "$PUBLISH_STATE" ]] || return 0
+  printf '_TAG_CREATED=%s\n_TAG_PUSHED=%s\n_RELEASE_CREATED=%s\n' \
+    "$_TAG_CREATED" "$_TAG_PUSHED" "$_RELEASE_CREATED" > "$PUBLISH_STATE"
+}
 
 _on_failure() {
     echo "publish_github.sh: failure detected, rolling back..." >&2
@@ -40,7 +63,8 @@ _on_failure() {
             echo "  Warning: could not delete local tag $TAG" >&2
     fi
 }
-trap '_on_failure' ERR
+# Failed uploads are left to the caller: other targets may still publish
+[[ "$PHASE" == "upload" ]] || trap '_on_failure' ERR
 
 # Derive project name and extract metadata from the first package
 FIRST_PKG="${PKG_NAMES[0]}"
@@ -57,22 +81,33 @@ if [[ "$DRY_RUN" == "1" ]]; then
   VERSION="${_rest%%_*}"
   TAG="${NAME}-v${VERSION}"
   TITLE="$NAME $VERSION"
-  echo "[DRY-RUN] Would create/update release: $TAG ($TITLE)"
-  for PKG in "${PKG_NAMES[@]}"; do
-    echo "[DRY-RUN] Would upload: $PKG (.tar.gz + .minisig + .sha256)"
-  done
-  echo "[DRY-RUN] Would git push to: ${PUBLISH_BRANCH:-main}"
+  [[ "$PHASE" == "all" || "$PHASE" == "release" ]] && \
+    echo "[DRY-RUN] Would create/update release: $TAG ($TITLE)"
+  if [[ "$PHASE" == "all" || "$PHASE" == "upload" ]]; then
+    for PKG in "${PKG_NAMES[@]}"; do
+      echo "[DRY-RUN] Would upload: $PKG (.tar.gz + .minisig + .sha256)"
+    done
+  fi
+  [[ "$PHASE" == "all" || "$PHASE" == "commit" ]] && \
+    echo "[DRY-RUN] Would git push to: ${PUBLISH_BRANCH:-main}"
   exit 0
 fi
 
 TMP_DIR="$(mktemp -d)"
 trap 'rm -rf "$TMP_DIR"' EXIT
 
-tar -xzf "$PKG_DIR/${FIRST_PKG}.tar.gz" \
-  -C "$TMP_DIR" \
-  "$PROJECT_NAME/metadata.json"
-
-METADATA="$TMP_DIR/$PROJECT_NAME/metadata.json"
+# Prefer the uncompressed sidecar written by packer.py; fall back to
+# extracting metadata.json for artifacts packed without one.
+SIDECAR="$PKG_DIR/${FIRST_PKG}.tar.gz.meta.json"
+if [[ -f "$SIDECAR" ]]; then
+  METADATA="$TMP_DIR/metadata.json"
+  jq '.metadata' "$SIDECAR" > "$METADATA"
+else
+  tar -xzf "$PKG_DIR/${FIRST_PKG}.tar.gz" \
+    -C "$TMP_DIR" \
+    "$PROJECT_NAME/metadata.json"
+  METADATA="$TMP_DIR/$PROJECT_NAME/metadata.json"
+fi
 
 VERSION="$(jq -r '.version' "$METADATA")"
 NAME="$(jq -r '.name' "$METADATA")"
@@ -90,12 +125,14 @@ TAG="${NAME}-v${VERSION}"
 TITLE="$NAME $VERSION"
 TARGET_COUNT="${#PKG_NAMES[@]}"
 
-echo "Publishing GitHub release:"
-echo "  Package : $NAME"
-echo "  Version : $VERSION"
-echo "  Tag     : $TAG"
-echo "  Targets : $TARGET_COUNT"
-echo
+if [[ "$PHASE" == "all" ]]; then
+  echo "Publishing GitHub release:"
+  echo "  Package : $NAME"
+  echo "  Version : $VERSION"
+  echo "  Tag     : $TAG"
+  echo "  Targets : $TARGET_COUNT"
+  echo
+fi
 
 [[ -d "$STAGING_DIR/.git" ]] || {
   echo "Staging directory is not a git repository: $STAGING_DIR" >&2
@@ -106,43 +143,66 @@ cd "$STAGING_DIR"
 
 PUBLISH_BRANCH="${PUBLISH_BRANCH:-main}"
 
-# Create git tag (idempotent)
-if git rev-parse "$TAG" >/dev/null 2>&1; then
-  echo "Tag $TAG already exists"
-else
-  git tag -a "$TAG" -m "Release $NAME $VERSION"
-  _TAG_CREATED=1
-  git push origin "$TAG"
-  _TAG_PUSHED=1
+if [[ "$PHASE" == "rollback" ]]; then
+  trap - ERR
+  _on_failure
+  exit 0
 fi
 
-# Create GitHub release (idempotent)
-if gh release view "$TAG" >/dev/null 2>&1; then
-  echo "GitHub release exists — uploading assets"
-else
-  if [[ -n "${RELEASE_NOTES:-}" ]]; then
-    NOTES_FILE="$TMP_DIR/release_notes.md"
-    printf '%s\n' "$RELEASE_NOTES" > "$NOTES_FILE"
-    gh release create "$TAG" --title "$TITLE" --notes-file "$NOTES_FILE"
+if [[ "$PHASE" == "all" || "$PHASE" == "release" ]]; then
+  # Create git tag (idempotent)
+  if git rev-parse "$TAG" >/dev/null 2>&1; then
+    echo "Tag $TAG already exists"
+  else
+    git tag -a "$TAG" -m "Release $NAME $VERSION"
+    _TAG_CREATED=1
+    git push origin "$TAG"
+    _TAG_PUSHED=1
+  fi
+
+  # Create GitHub release (idempotent)
+  if gh release view "$TAG" >/dev/null 2>&1; then
+    echo "GitHub release exists — uploading assets"
   else
-    gh release create "$TAG" --title "$TITLE" \
-      --notes "Automated release of $NAME version $VERSION"
+    if [[ -n "${RELEASE_NOTES:-}" ]]; then
+      NOTES_FILE="$TMP_DIR/release_notes.md"
+      printf '%s\n' "$RELEASE_NOTES" > "$NOTES_FILE"
+      gh release create "$TAG" --title "$TITLE" --notes-file "$NOTES_FILE"
+    else
+      gh release create "$TAG" --title "$TITLE" \
+        --notes "Automated release of $NAME version $VERSION"
+    fi
+    _RELEASE_CREATED=1
+  fi
+
+  if [[ "$PHASE" == "release" ]]; then
+    _save_state
+    trap - ERR
+    echo "GitHub release $TAG ready"
+    exit 0
   fi
-  _RELEASE_CREATED=1
 fi
 
-# Upload artifacts for every target
-for PKG in "${PKG_NAMES[@]}"; do
-  PKG_PROJECT="${PKG%%_v*}"
-  PKG_DIR_CURRENT="$STAGING_DIR/$PKG_PROJECT"
-  gh release upload "$TAG" \
-    "$PKG_DIR_CURRENT/${PKG}.tar.gz" \
-    "$PKG_DIR_CURRENT/signatures/${PKG}.tar.gz.minisig" \
-    "$PKG_DIR_CURRENT/signatures/${PKG}.tar.gz.sha256" \
-    --clobber
-done
-
-echo "GitHub release published successfully"
+if [[ "$PHASE" == "all" || "$PHASE" == "upload" ]]; then
+  # Upload artifacts for every target: assets already on the release with the
+  # same digest are skipped, the rest go up in parallel with per-asset retries
+  ASSETS=()
+  for PKG in "${PKG_NAMES[@]}"; do
+    PKG_PROJECT="${PKG%%_v*}"
+    PKG_DIR_CURRENT="$STAGING_DIR/$PKG_PROJECT"
+    ASSETS+=(
+      "$PKG_DIR_CURRENT/${PKG}.tar.gz"
+      "$PKG_DIR_CURRENT/signatures/${PKG}.tar.gz.minisig"
+      "$PKG_DIR_CURRENT/signatures/${PKG}.tar.gz.sha256"
+    )
+  done
+  "$PYTHON" "$SCRIPT_DIR/../core/uploader.py" "$TAG" "${ASSETS[@]}"
+
+  if [[ "$PHASE" == "upload" ]]; then
+    exit 0
+  fi
+  echo "GitHub release published successfully"
+fi
 
 # Commit and push index update (skip if nothing changed — avoids rollback
 # on re-publish where index/keys are byte-identical to prior commit)
@@ -4,12 +4,18 @@ set -euo pipefail
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
 source "$SCRIPT_DIR/validate_env.sh"
+source "$SCRIPT_DIR/signing.sh"
+source "$SCRIPT_DIR/locking.sh"
 
 usage() {
   echo "Usage:"
   echo "  publish_pipeline.sh <project_path> <update_type> [builder] [staging_dir]"
   echo ""
   echo "  Multi-builder: set BUILDERS env var to a space-separated list, omit [builder]."
+  echo "  Parallel builds: set JOBS=N to run up to N builders concurrently."
+  echo "  Waiting: set LOCK_WAIT=1 to queue behind a running pipeline of the same project."
+  echo "  Overlap: set PIPELINE_OVERLAP=1 to package, sign and upload each target as soon as it is built."
+  echo "  Resume: set RUN_ID=<run-id> to continue that run (repcid resume <run-id>)."
   exit 1
 }
 
@@ -21,7 +27,16 @@ STAGING_DIR="${4:-$DEFAULT_STAGE}"
 PROJECT_NAME="$(basename "$PROJECT_PATH")"
 DRY_RUN="${DRY_RUN:-0}"
 EXPLICIT_VERSION="${EXPLICIT_VERSION:-}"
+JOBS="${JOBS:-${PIPELINE_JOBS:-1}}"
+PIPELINE_OVERLAP="${PIPELINE_OVERLAP:-0}"
 export EXPLICIT_VERSION DRY_RUN
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
+
+[[ "$JOBS" =~ ^[1-9][0-9]*$ ]] || {
+  echo "JOBS must be a positive integer (got '$JOBS')" >&2
+  exit 1
+}
 
 # Resolve builder list
 if [[ -n "${BUILDERS:-}" ]]; then
@@ -35,14 +50,35 @@ fi
 # Config validation
 validate_config
 
-# Acquire project-scoped lock (non-blocking — fail fast if already running)
-LOCK_FILE="$WORKING_DIR/.pipeline.lock"
-exec 9>"$LOCK_FILE"
-flock -n 9 || {
-  echo "Another pipeline is already running ($LOCK_FILE). Exiting." >&2
-  exit 1
+# Acquire the project lock: other projects may run alongside this one, a
+# second run of this project fails fast (or waits, with LOCK_WAIT=1)
+lock_project "$PROJECT_NAME" || exit 1
+
+# Run manifest (runs/<run-id>/manifest.json): per-target progress and the
+# signed artifacts, so `repcid resume <run-id>` can finish a partly failed
+# run. RUN_ID set on entry reopens that run instead of starting a new one.
+RUNS="$SCRIPT_DIR/../core/runs.py"
+RESUMING=0
+[[ -n "${RUN_ID:-}" ]] && RESUMING=1
+RUN_ID="${RUN_ID:-}"
+if [[ "$DRY_RUN" != "1" ]]; then
+  RUN_ID="$("$PYTHON" "$RUNS" start "$PROJECT_NAME" --project-path "$(cd "$PROJECT_PATH" && pwd)" \
+    --update-type "$UPDATE_TYPE" --builders "$(IFS=,; echo "${BUILDER_LIST[*]}")" \
+    --staging-dir "$STAGING_DIR" ${RUN_ID:+--id "$RUN_ID"})" || exit 1
+  export RUN_ID
+fi
+
+run_record() {
+  [[ -z "$RUN_ID" ]] && return 0
+  "$PYTHON" "$RUNS" "$1" "$RUN_ID" "${@:2}" >/dev/null \
+    || echo "[run] warning: could not update run $RUN_ID" >&2
 }
 
+finish_run() {
+  [[ -z "$RUN_ID" ]] || "$PYTHON" "$RUNS" finish "$RUN_ID" >/dev/null 2>&1 || true
+}
+trap finish_run EXIT
+
 # Check that each builder image exists before starting any work
 check_builder_image() {
   local builder="$1"
@@ -79,6 +115,9 @@ echo "=== Repman publish pipeline ==="
 echo "Project  : $PROJECT_NAME"
 echo "Update   : $UPDATE_TYPE"
 echo "Builders : ${BUILDER_LIST[*]}"
+echo "Jobs     : $JOBS"
+[[ -n "$RUN_ID" ]] && echo "Run      : $RUN_ID$([[ "$RESUMING" == "1" ]] && echo " (resumed)")"
+[[ "$PIPELINE_OVERLAP" == "1" ]] && echo "Overlap  : on"
 echo "Stage    : $STAGING_DIR"
 [[ "$DRY_RUN" == "1" ]] && echo "Mode     : DRY RUN"
 [[ -n "$EXPLICIT_VERSION" ]] && echo "Version  : $EXPLICIT_VERSION (explicit)"
@@ -96,26 +135,190 @@ echo "[1] Preparing stage"
 "$SCRIPT_DIR/prepare_stage.sh" "$PROJECT_PATH"
 
 # -----------------------------------------------
-# Steps 2-4: Build + metadata + sign (per builder)
+# Step 2: Build (up to $JOBS builders concurrently)
 # -----------------------------------------------
+# Every builder gets its own namespace under builds/<project>/<builder> with
+# private src/ and out/ dirs, so concurrent builds never see each other's
+# output. The staged source is hardlinked in (the builder only reads it).
+BUILDS_DIR="$WORKING_DIR/builds/$PROJECT_NAME"
+rm -rf "$BUILDS_DIR"
+mkdir -p "$BUILDS_DIR"
+
+# Drop derived builder images (deps.json preinstalled) nobody used lately
+gc_derived_images() {
+  if [[ "$DRY_RUN" != "1" && "${DERIVED_IMAGES:-1}" == "1" ]]; then
+    "$PYTHON" "$SCRIPT_DIR/../core/derived_images.py" \
+      --state "${DERIVED_IMAGES_STATE:-$WORKING_DIR/cache/derived_images.json}" gc \
+      || echo "[derived-image] warning: garbage collection failed" >&2
+  fi
+}
+
+# Overlapped mode: core/orchestrator.py runs steps 2-7 per target, so each
+# one is packaged, signed, staged and uploaded as soon as its build is done;
+# only the index update stays a final barrier. The project lock (fd 9) and
+# the signing agent belong to this shell and cover the whole run.
+if [[ "$PIPELINE_OVERLAP" == "1" ]]; then
+  if [[ "${SIGN_AGENT:-1}" == "1" && "$DRY_RUN" != "1" ]]; then
+    start_sign_agent
+    trap 'stop_sign_agent; finish_run' EXIT
+  fi
+  RC=0
+  "$PYTHON" "$SCRIPT_DIR/../core/orchestrator.py" "$PROJECT_NAME" "$UPDATE_TYPE" "$STAGING_DIR" \
+    --builders "$(IFS=,; echo "${BUILDER_LIST[*]}")" --jobs "$JOBS" --builds-dir "$BUILDS_DIR" \
+    --index "$WORKING_DIR/$INDEX_DIR/$INDEX_FILE" ${RUN_ID:+--run-id "$RUN_ID"} $([[ "$RESUMING" == "1" ]] && echo --resume) || RC=$?
+  gc_derived_images
+  echo ""
+  if [[ "$DRY_RUN" == "1" ]]; then
+    echo "=== Dry run complete ==="
+  else
+    echo "=== Publish pipeline complete ==="
+    echo "Project  : $PROJECT_NAME"
+    [[ "$RC" -eq 0 ]] || echo "Resume   : repcid resume $RUN_ID"
+  fi
+  exit "$RC"
+fi
+
+build_one() {
+  local builder="$1"
+  local ns="$BUILDS_DIR/$builder"
+
+  mkdir -p "$ns/src" "$ns/out" || return 1
+  if ! cp -al "$WORKING_DIR/src/$PROJECT_NAME" "$ns/src/" 2>/dev/null; then
+    rm -rf "${ns:?}/src/$PROJECT_NAME"
+    cp -a "$WORKING_DIR/src/$PROJECT_NAME" "$ns/src/" || return 1
+  fi
+  BUILD_ROOT="$ns" "$SCRIPT_DIR/build_artifact.sh" "$PROJECT_NAME" "$builder"
+}
+
+# Resumed run: targets signed by an earlier attempt are reused as they are
+declare -A REUSED=()
+if [[ "$RESUMING" == "1" ]]; then
+  for BUILDER in "${BUILDER_LIST[@]}"; do
+    if PKG="$("$PYTHON" "$RUNS" restore "$RUN_ID" "$BUILDER" "$BUILDS_DIR/out" 2>/dev/null)"; then
+      REUSED[$BUILDER]="$PKG"
+      echo PASS > "$BUILDS_DIR/$BUILDER.status"
+      echo "[run] $BUILDER: reusing $PKG signed by an earlier attempt"
+    fi
+  done
+fi
+
+echo ""
+echo "[2] Building $(( ${#BUILDER_LIST[@]} - ${#REUSED[@]} )) target(s), $JOBS at a time"
+
+for BUILDER in "${BUILDER_LIST[@]}"; do
+  [[ -n "${REUSED[$BUILDER]:-}" ]] && continue
+  if [[ "$JOBS" -eq 1 ]]; then
+    echo ""
+    echo "--- Builder: $BUILDER ---"
+    if build_one "$BUILDER"; then
+      echo PASS > "$BUILDS_DIR/$BUILDER.status"
+    else
+      echo FAIL > "$BUILDS_DIR/$BUILDER.status"
+    fi
+    continue
+  fi
+
+  # Throttle: wait for a slot before launching the next builder
+  while [[ "$(jobs -rp | wc -l)" -ge "$JOBS" ]]; do
+    wait -n || true
+  done
+  echo "--- Builder: $BUILDER (started) ---"
+  (
+    if build_one "$BUILDER"; then
+      echo PASS > "$BUILDS_DIR/$BUILDER.status"
+    else
+      echo FAIL > "$BUILDS_DIR/$BUILDER.status"
+    fi
+  ) 2>&1 | sed -u "s/^/  [$BUILDER] /" &
+done
+wait
+
+gc_derived_images
+
+# -----------------------------------------------
+# Step 3: Metadata (one version for all built targets)
+# -----------------------------------------------
+# The version is resolved now, but the index update is only recorded in
+# $BUILDS_DIR/stage.json; step 5 merges it into the index once the
+# artifacts are signed, so no other run ever sees an unpublished version.
 PKG_NAMES=()
 declare -A BUILD_STATUS
+declare -A STAGED_PKG=()
+BUILT=()
+INDEXED=()
 
 for BUILDER in "${BUILDER_LIST[@]}"; do
+  if [[ "$(cat "$BUILDS_DIR/$BUILDER.status" 2>/dev/null)" == "PASS" ]]; then
+    BUILT+=("$BUILDER")
+  else
+    BUILD_STATUS[$BUILDER]="FAIL"
+    run_record mark failed "$BUILDER" --step build
+    echo "  $BUILDER: build FAILED (continuing with remaining builders)" >&2
+  fi
+done
+
+if [[ ${#BUILT[@]} -gt 0 ]]; then
   echo ""
-  echo "--- Builder: $BUILDER ---"
+  echo "[3] Staging metadata for ${#BUILT[@]} target(s)"
+  if STAGE_OUTPUT="$(BUILDS_DIR="$BUILDS_DIR" BUILD_ROOT="$BUILDS_DIR" \
+        STAGE_PENDING="$BUILDS_DIR/stage.json" "$SCRIPT_DIR/generate_metadata.sh" \
+        "$PROJECT_NAME" "$UPDATE_TYPE" "${BUILT[@]}")"; then
+    while read -r STAGED_BUILDER STAGED_NAME; do
+      [[ -n "$STAGED_BUILDER" ]] && STAGED_PKG[$STAGED_BUILDER]="$STAGED_NAME"
+    done <<< "$STAGE_OUTPUT"
+    [[ -f "$BUILDS_DIR/stage.json" ]] && run_record version "$(jq -r '.version' "$BUILDS_DIR/stage.json")"
+    # A reused target the earlier attempt already merged into the index is
+    # not staged again; it only has to be published
+    for BUILDER in "${!REUSED[@]}"; do
+      if [[ -z "${STAGED_PKG[$BUILDER]:-}" ]]; then
+        STAGED_PKG[$BUILDER]="${REUSED[$BUILDER]}"
+        INDEXED+=("$BUILDER")
+      fi
+    done
+  else
+    echo "  -> metadata staging FAILED" >&2
+  fi
+fi
 
-  # Clear previous builder's output to avoid cross-builder contamination
-  [[ "$DRY_RUN" != "1" ]] && rm -rf "$WORKING_DIR/out/$PROJECT_NAME"
+# -----------------------------------------------
+# Step 4: Package + sign (per staged target)
+# -----------------------------------------------
+# One signing agent for the rest of the run: the key is decrypted once and
+# every artifact and index file is signed through it (SIGN_AGENT=0 disables).
+if [[ "${SIGN_AGENT:-1}" == "1" && "$DRY_RUN" != "1" && ${#STAGED_PKG[@]} -gt 0 ]]; then
+  start_sign_agent
+  trap 'stop_sign_agent; finish_run' EXIT
+fi
+
+# Signed artifacts are collected in this project's own out/ dir
+mkdir -p "$BUILDS_DIR/out"
+PUBLISHED=()
+
+for BUILDER in "${BUILT[@]}"; do
+  echo ""
+  echo "--- Package: $BUILDER ---"
+  NS="$BUILDS_DIR/$BUILDER"
+  PKG="${STAGED_PKG[$BUILDER]:-}"
 
-  if  "$SCRIPT_DIR/build_artifact.sh" "$PROJECT_NAME" "$BUILDER" && \
-      PKG="$("$SCRIPT_DIR/generate_metadata.sh" "$PROJECT_NAME" "$UPDATE_TYPE" "$BUILDER")" && \
-      "$SCRIPT_DIR/package_sign.sh" "$PKG"; then
+  if [[ -n "${REUSED[$BUILDER]:-}" && "$PKG" == "${REUSED[$BUILDER]}" ]]; then
     BUILD_STATUS[$BUILDER]="PASS"
     PKG_NAMES+=("$PKG")
+    PUBLISHED+=("$BUILDER")
+    echo "  -> $PKG (reused)"
+  elif [[ -n "$PKG" ]] && \
+      BUILD_ROOT="$NS" "$SCRIPT_DIR/package_sign.sh" "$PKG" && \
+      mv "$NS/out/${PKG}.tar.gz" "$NS/out/${PKG}.tar.gz.minisig" "$NS/out/${PKG}.tar.gz.sha256" \
+         "$BUILDS_DIR/out/" && \
+      { [[ ! -f "$NS/out/${PKG}.tar.gz.meta.json" ]] || \
+        mv "$NS/out/${PKG}.tar.gz.meta.json" "$BUILDS_DIR/out/"; }; then
+    BUILD_STATUS[$BUILDER]="PASS"
+    PKG_NAMES+=("$PKG")
+    PUBLISHED+=("$BUILDER")
+    [[ "$DRY_RUN" == "1" ]] || run_record signed "$BUILDER" "$PKG" "$BUILDS_DIR/out"
     echo "  -> $PKG"
   else
     BUILD_STATUS[$BUILDER]="FAIL"
+    run_record mark failed "$BUILDER" --step "$([[ -n "$PKG" ]] && echo package || echo metadata)"
     echo "  -> FAILED (continuing with remaining builders)" >&2
   fi
 done
@@ -123,6 +326,7 @@ done
 if [[ ${#PKG_NAMES[@]} -eq 0 ]]; then
   echo ""
   echo "All builders failed. Aborting." >&2
+  [[ -z "$RUN_ID" ]] || echo "Retry the run with: repcid resume $RUN_ID" >&2
   exit 1
 fi
 
@@ -135,27 +339,56 @@ if [[ "$DRY_RUN" == "1" ]]; then
 fi
 
 # -----------------------------------------------
-# Step 5: Sign + hash index (once, after all builds)
+# Step 5: Publish GitHub release + upload artifacts (all targets at once)
 # -----------------------------------------------
+# The release and its assets belong to this project alone, so they go up
+# before the index lock is taken: other projects' index updates never wait
+# for this run's uploads. Any later failure rolls the release back.
 echo ""
-echo "[5] Signing + hashing index"
-"$SCRIPT_DIR/sign_index.sh"
+echo "[5] Publishing GitHub release"
+export PUBLISH_STATE="$BUILDS_DIR/publish.state"
+rm -f "$PUBLISH_STATE"
+"$PYTHON" "$SCRIPT_DIR/../core/stage_files.py" "$STAGING_DIR" "$BUILDS_DIR/out" "${PKG_NAMES[@]}"
+PUBLISH_PHASE=release "$SCRIPT_DIR/publish_github.sh" "$STAGING_DIR" "${PKG_NAMES[@]}"
+rollback_release() {
+  PUBLISH_PHASE=rollback "$SCRIPT_DIR/publish_github.sh" "$STAGING_DIR" "${PKG_NAMES[@]}" || true
+}
+PUBLISH_PHASE=upload "$SCRIPT_DIR/publish_github.sh" "$STAGING_DIR" "${PKG_NAMES[@]}" || {
+  rollback_release
+  exit 1
+}
 
 # -----------------------------------------------
-# Step 6: Stage artifacts (per successful package)
+# Step 6: Update, sign + hash index, stage it (once, after all builds)
 # -----------------------------------------------
+# Only the shared index and its staged copy are touched under the index lock:
+# the index is re-read and this run's targets merged into it, keeping updates
+# other projects published while this one was building.
 echo ""
-echo "[6] Staging artifacts"
-for PKG in "${PKG_NAMES[@]}"; do
-  "$SCRIPT_DIR/stage_artifacts.sh" "$PKG" "$STAGING_DIR"
+echo "[6] Updating, signing + hashing index"
+lock_index || { rollback_release; exit 1; }
+COMMIT=()
+for BUILDER in "${PUBLISHED[@]}"; do
+  [[ " ${INDEXED[*]} " == *" $BUILDER "* ]] || COMMIT+=("$BUILDER")
 done
+if ! {
+  { [[ ${#COMMIT[@]} -eq 0 ]] || "$PYTHON" "$SCRIPT_DIR/../core/stage_commit.py" "$BUILDS_DIR/stage.json"       --builders "$(IFS=,; echo "${COMMIT[*]}")" --artifacts "$BUILDS_DIR/out"; } &&
+  "$SCRIPT_DIR/sign_index.sh" &&
+  BUILD_ROOT="$BUILDS_DIR" "$SCRIPT_DIR/stage_artifacts.sh" "${PKG_NAMES[@]}" "$STAGING_DIR"
+}; then
+  echo "Index update FAILED" >&2
+  rollback_release
+  exit 1
+fi
 
 # -----------------------------------------------
-# Step 7: Publish GitHub release (all targets at once)
+# Step 7: Push the index (the commit phase rolls back on its own failure)
 # -----------------------------------------------
 echo ""
-echo "[7] Publishing GitHub release"
-"$SCRIPT_DIR/publish_github.sh" "$STAGING_DIR" "${PKG_NAMES[@]}"
+echo "[7] Pushing index"
+PUBLISH_PHASE=commit "$SCRIPT_DIR/publish_github.sh" "$STAGING_DIR" "${PKG_NAMES[@]}"
+unlock_index
+run_record mark published "${PUBLISHED[@]}"
 
 # -----------------------------------------------
 # Summary
@@ -167,7 +400,8 @@ echo ""
 echo "Build summary:"
 for BUILDER in "${BUILDER_LIST[@]}"; do
   STATUS="${BUILD_STATUS[$BUILDER]:-SKIP}"
-  echo "  $BUILDER: $STATUS"
+  CACHE="$(cat "$BUILDS_DIR/$BUILDER/cache_result" 2>/dev/null || true)"
+  echo "  $BUILDER: $STATUS${CACHE:+ (cache $CACHE)}"
 done
 
 # Exit non-zero if any builder failed (but we still published what succeeded)
@@ -175,6 +409,7 @@ for BUILDER in "${BUILDER_LIST[@]}"; do
   if [[ "${BUILD_STATUS[$BUILDER]:-}" == "FAIL" ]]; then
     echo ""
     echo "Warning: one or more builders failed." >&2
+    [[ -z "$RUN_ID" ]] || echo "Rebuild only the failed targets with: repcid resume $RUN_ID" >&2
     exit 1
   fi
 done
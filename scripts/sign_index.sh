@@ -3,8 +3,16 @@ set -euo pipefail
 
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
+source "$SCRIPT_DIR/signing.sh"
+source "$SCRIPT_DIR/locking.sh"
+
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
+CORE="$SCRIPT_DIR/../core"
 
 INDEX="$WORKING_DIR/$INDEX_DIR/$INDEX_FILE"
+SHARD_DIR="$(dirname "$INDEX")/packages"
+DELTA_DIR="$(dirname "$INDEX")/deltas"
 DRY_RUN="${DRY_RUN:-0}"
 
 if [[ "$DRY_RUN" == "1" ]]; then
@@ -14,15 +22,73 @@ if [[ "$DRY_RUN" == "1" ]]; then
   exit 0
 fi
 
+# Sign a consistent snapshot (publish_pipeline.sh already holds the lock)
+[[ "${INDEX_LOCK_HELD:-0}" == "1" ]] || lock_index
+
+# With the SQLite backend index.json is only a view of index.db: export it
+# (shards, encodings and delta included) right before it is signed
+if [[ "${INDEX_BACKEND:-json}" == "sqlite" ]]; then
+  INDEX_LOCK_HELD=1 "$PYTHON" "$CORE/index_store.py" export "$INDEX"
+fi
+
 [[ -f "$INDEX" ]] || {
   echo "Index not found: $INDEX" >&2
   exit 1
 }
 
-echo "$SIG_PASS" | minisign -S \
-  -s "$CI_KEY" \
-  -m "$INDEX"
+# Everything that needs a fresh signature is collected first and signed as
+# one batch (in parallel when a signing agent is running).
+TO_SIGN=("$INDEX")
+
+# Compact / precompressed encodings written next to the index (INDEX_ENCODINGS)
+INDEX_STEM="${INDEX%.json}"
+for VARIANT in "$INDEX_STEM.min.json" "$INDEX_STEM.min.json.gz" "$INDEX_STEM.min.json.zst"; do
+  if [[ -f "$VARIANT" ]]; then TO_SIGN+=("$VARIANT"); fi
+done
 
-sha256sum "$INDEX" > "$INDEX.sha256"
+# Sharded layout: the root manifest is always re-signed; a shard is only
+# re-signed when its content no longer matches its recorded .sha256.
+SHARDED=0
+SHARDS_SIGNED=0
+SKIPPED=0
+if jq -e '.layout == "sharded"' "$INDEX" >/dev/null 2>&1; then
+  SHARDED=1
+  shopt -s nullglob
+  for SHARD in "$SHARD_DIR"/*.json "$SHARD_DIR"/*.json.gz "$SHARD_DIR"/*.json.zst; do
+    if [[ -f "$SHARD.minisig" && -f "$SHARD.sha256" ]] && \
+       sha256sum -c --status "$SHARD.sha256" 2>/dev/null; then
+      SKIPPED=$((SKIPPED + 1))
+      continue
+    fi
+    TO_SIGN+=("$SHARD")
+    SHARDS_SIGNED=$((SHARDS_SIGNED + 1))
+  done
+  shopt -u nullglob
+fi
+
+# Delta documents never change once written, so only new ones are signed
+DELTAS_SIGNED=0
+shopt -s nullglob
+for DELTA in "$DELTA_DIR"/*.json; do
+  if [[ -f "$DELTA.minisig" && -f "$DELTA.sha256" ]] && \
+     sha256sum -c --status "$DELTA.sha256" 2>/dev/null; then
+    continue
+  fi
+  TO_SIGN+=("$DELTA")
+  DELTAS_SIGNED=$((DELTAS_SIGNED + 1))
+done
+shopt -u nullglob
+
+sign_files "${TO_SIGN[@]}"
+for FILE in "${TO_SIGN[@]}"; do
+  sha256sum "$FILE" > "$FILE.sha256"
+done
+
+if [[ "$SHARDED" == "1" ]]; then
+  echo "Shards: $SHARDS_SIGNED signed, $SKIPPED unchanged"
+fi
+if [[ "$DELTAS_SIGNED" -gt 0 ]]; then
+  echo "Deltas: $DELTAS_SIGNED signed"
+fi
 
 echo "$INDEX_FILE signed successfully"
@@ -0,0 +1,57 @@
+#!/usr/bin/env bash
+# signing.sh — sourced by the scripts that produce .minisig files.
+# Defines sign_files() and the signing-agent lifecycle helpers; do NOT
+# execute this script directly.
+#
+# When SIGN_AGENT_SOCK points at a live agent (core/sign_agent.py, started by
+# publish_pipeline.sh), files are signed there in one parallel batch with the
+# key unlocked once per run. Otherwise each file goes through minisign.
+
+_SIGNING_PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$_SIGNING_PYTHON" ]] && _SIGNING_PYTHON="python3"  # fallback for dev layout without a venv
+_SIGN_AGENT="$SCRIPT_DIR/../core/sign_agent.py"
+
+sign_files() {
+  if [[ -n "${SIGN_AGENT_SOCK:-}" && -S "$SIGN_AGENT_SOCK" ]]; then
+    "$_SIGNING_PYTHON" "$_SIGN_AGENT" --socket "$SIGN_AGENT_SOCK" sign "$@"
+    return
+  fi
+  local file
+  for file in "$@"; do
+    echo "$SIG_PASS" | minisign -S \
+      -s "$CI_KEY" \
+      -m "$file"
+  done
+}
+
+# Start an agent for this shell's lifetime; exports SIGN_AGENT_SOCK on success.
+# Failure (no 'cryptography', unsupported key, wrong passphrase) is not fatal:
+# signing falls back to minisign.
+start_sign_agent() {
+  SIGN_AGENT_DIR="$(mktemp -d "${TMPDIR:-/tmp}/repcid-sign.XXXXXX")"
+  chmod 700 "$SIGN_AGENT_DIR"
+  local sock="$SIGN_AGENT_DIR/agent.sock"
+  printf '%s\n' "$SIG_PASS" | "$_SIGNING_PYTHON" "$_SIGN_AGENT" --socket "$sock" \
+    serve --key "$CI_KEY" --parent $$ &
+  SIGN_AGENT_PID=$!
+  if "$_SIGNING_PYTHON" "$_SIGN_AGENT" --socket "$sock" ping \
+       --wait "${SIGN_AGENT_START_TIMEOUT:-60}" --pid "$SIGN_AGENT_PID"; then
+    export SIGN_AGENT_SOCK="$sock"
+    echo "[sign-agent] key unlocked (pid $SIGN_AGENT_PID)"
+  else
+    echo "[sign-agent] unavailable — signing with minisign per file" >&2
+    stop_sign_agent
+  fi
+}
+
+stop_sign_agent() {
+  if [[ -n "${SIGN_AGENT_PID:-}" ]]; then
+    if [[ -n "${SIGN_AGENT_SOCK:-}" ]]; then
+      "$_SIGNING_PYTHON" "$_SIGN_AGENT" --socket "$SIGN_AGENT_SOCK" stop 2>/dev/null || true
+    fi
+    kill "$SIGN_AGENT_PID" 2>/dev/null || true
+    wait "$SIGN_AGENT_PID" 2>/dev/null || true
+  fi
+  [[ -n "${SIGN_AGENT_DIR:-}" ]] && rm -rf "$SIGN_AGENT_DIR"
+  unset SIGN_AGENT_SOCK SIGN_AGENT_PID SIGN_AGENT_DIR
+}
@@ -3,16 +3,26 @@ set -euo pipefail
 
 # shellcheck source=scripts/bootstrap.sh
 source "$(cd "$(dirname "$(readlink -f "$0")")" && pwd)/bootstrap.sh"
+source "$SCRIPT_DIR/locking.sh"
 
-PKG="$1"
-STAGING="$2"
+# Usage: stage_artifacts.sh <pkg> [pkg ...] <staging_dir>
+# The shared index and key files are copied once; every package's artifacts
+# are then hardlinked (or reflinked, or copied) into the staging repo.
+# Artifacts are read from ${BUILD_ROOT:-$WORKING_DIR}/out.
+[[ $# -lt 2 ]] && { echo "Usage: stage_artifacts.sh <pkg> [pkg ...] <staging_dir>" >&2; exit 1; }
+PKGS=("${@:1:$#-1}")
+STAGING="${!#}"
 
-PROJECT_NAME="${PKG%%_v*}"
-echo "Staging artifacts for $PKG"
+PYTHON="$SCRIPT_DIR/../.venv/bin/python3"
+[[ ! -x "$PYTHON" ]] && PYTHON="python3"  # fallback for dev layout without a venv
+
+echo "Staging artifacts for ${PKGS[*]}"
 echo "Staging directory: $STAGING"
-echo "Project name: $PROJECT_NAME"
 
-mkdir -p "$STAGING/$PROJECT_NAME/signatures"
+# The index must not change while it is copied (publish_pipeline.sh already
+# holds the lock)
+[[ "${INDEX_LOCK_HELD:-0}" == "1" ]] || lock_index
+
 mkdir -p "$STAGING/index"
 INDEX="$WORKING_DIR/$INDEX_DIR/$INDEX_FILE"
 
@@ -23,9 +33,32 @@ rsync -a "$INDEX" "$STAGING/index/"
 rsync -a "$INDEX.sha256" "$STAGING/index/"
 rsync -a "$INDEX.minisig" "$STAGING/index/"
 
-rsync -a "$WORKING_DIR/out/${PKG}.tar.gz" "$STAGING/$PROJECT_NAME/"
-rsync -a "$WORKING_DIR/out/${PKG}.tar.gz.minisig" "$STAGING/$PROJECT_NAME/signatures/"
-rsync -a "$WORKING_DIR/out/${PKG}.tar.gz.sha256" "$STAGING/$PROJECT_NAME/signatures/"
+INDEX_STEM="${INDEX%.json}"
+for VARIANT in "$INDEX_STEM.min.json" "$INDEX_STEM.min.json.gz" "$INDEX_STEM.min.json.zst"; do
+  [[ -f "$VARIANT" ]] || continue
+  rsync -a "$VARIANT" "$VARIANT.sha256" "$VARIANT.minisig" "$STAGING/index/"
+done
+
+# Sharded layout: only shards whose content changed are transferred, and
+# shards of removed packages are dropped from staging. Any other layout
+# drops the staged shards (and their signatures) of an earlier sharded one.
+if [[ -d "$(dirname "$INDEX")/packages" ]] && jq -e '.layout == "sharded"' "$INDEX" >/dev/null 2>&1; then
+  rsync -a --delete "$(dirname "$INDEX")/packages/" "$STAGING/index/packages/"
+else
+  rm -rf "$STAGING/index/packages"
+fi
+
+# Delta documents: the staging tree keeps the same last INDEX_DELTAS as the
+# index dir
+if [[ -d "$(dirname "$INDEX")/deltas" ]]; then
+  rsync -a --delete "$(dirname "$INDEX")/deltas/" "$STAGING/index/deltas/"
+fi
+
+# Release notes sidecars are content-addressed, so existing ones never change
+if [[ -d "$(dirname "$INDEX")/notes" ]]; then
+  rsync -a "$(dirname "$INDEX")/notes/" "$STAGING/index/notes/"
+fi
 
+"$PYTHON" "$SCRIPT_DIR/../core/stage_files.py" "$STAGING" "${BUILD_ROOT:-$WORKING_DIR}/out" "${PKGS[@]}"
 
-echo "Artifacts staged for $PKG"
+echo "Artifacts staged for ${#PKGS[@]} package(s)"
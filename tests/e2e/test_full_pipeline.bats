@@ -38,6 +38,15 @@ teardown() {
     [ "$VER" = "1.0.0" ]
 }
 
+@test "index target carries the staged tarball's digest, size and signature" {
+    bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
+    TARGET='.test.versions["1.0.0"].targets.ubuntu_amd64'
+    TARBALL="$STAGING_DIR/test/test_v1.0.0_ubuntu_amd64.tar.gz"
+    [ "$(jq -r "$TARGET.digest" "$STAGING_DIR/index/index.json")" = "$(sha256sum "$TARBALL" | cut -d' ' -f1)" ]
+    [ "$(jq -r "$TARGET.size" "$STAGING_DIR/index/index.json")" -eq "$(stat -c %s "$TARBALL")" ]
+    [ "$(jq -r "$TARGET.minisig" "$STAGING_DIR/index/index.json")" = "$(cat "$STAGING_DIR/test/signatures/test_v1.0.0_ubuntu_amd64.tar.gz.minisig")" ]
+}
+
 @test "gh mock has release test-v1.0.0 after run" {
     bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
     EXISTS="$(jq -r '.releases["test-v1.0.0"] // "null"' "$GH_MOCK_STATE")"
@@ -88,3 +97,73 @@ teardown() {
         ! grep -q "release create" "$GH_MOCK_LOG"
     fi
 }
+
+@test "JOBS=2 builds multiple builders in parallel and publishes all targets" {
+    run env JOBS=2 BUILDERS="ubuntu_amd64 arch_amd64" EXPLICIT_VERSION=1.0.0 \
+        bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    # Each builder built in its own namespace
+    [ -d "$WORKING_DIR/builds/test/ubuntu_amd64/out/test" ]
+    [ -d "$WORKING_DIR/builds/test/arch_amd64/out/test" ]
+    TARGETS="$(jq -r '.test.versions["1.0.0"].targets | keys | join(",")' "$STAGING_DIR/index/index.json")"
+    [ "$TARGETS" = "arch_amd64,ubuntu_amd64" ]
+    [[ "$output" == *"ubuntu_amd64: PASS"* ]]
+    [[ "$output" == *"arch_amd64: PASS"* ]]
+}
+
+@test "PIPELINE_OVERLAP=1 publishes every target as it is built, then the index once" {
+    run env PIPELINE_OVERLAP=1 JOBS=2 BUILDERS="ubuntu_amd64 arch_amd64" \
+        bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    TARGETS="$(jq -r '.test.versions["1.0.0"].targets | keys | join(",")' "$STAGING_DIR/index/index.json")"
+    [ "$TARGETS" = "arch_amd64,ubuntu_amd64" ]
+    [ "$(jq '.releases["test-v1.0.0"].assets | length' "$GH_MOCK_STATE")" -eq 6 ]
+    [ "$(grep -c "release create" "$GH_MOCK_LOG")" -eq 1 ]
+    [[ "$output" == *"[arch_amd64] -> test_v1.0.0_arch_amd64 uploaded"* ]]
+    [[ "$output" == *"ubuntu_amd64: PASS"* ]]
+}
+
+@test "two projects publish concurrently and both land in the index" {
+    cp -a "$REPO_ROOT/test" "$TEST_ROOT/other"
+    bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR" > "$TEST_ROOT/a.log" 2>&1 &
+    A=$!
+    bash "$PIPELINE" "$TEST_ROOT/other" "new" "ubuntu_amd64" "$STAGING_DIR" > "$TEST_ROOT/b.log" 2>&1 &
+    B=$!
+    wait "$A"
+    wait "$B"
+    PKGS="$(jq -r 'del(._index) | keys | join(",")' "$STAGING_DIR/index/index.json")"
+    [ "$PKGS" = "other,test" ]
+}
+
+@test "another project's index update does not wait for a running upload" {
+    cp -a "$REPO_ROOT/test" "$TEST_ROOT/other"
+    GH_MOCK_UPLOAD_DELAY=15 bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR" \
+        > "$TEST_ROOT/a.log" 2>&1 &
+    A=$!
+    for _ in $(seq 150); do
+        grep -q "release upload test-v1.0.0" "$GH_MOCK_LOG" 2>/dev/null && break
+        sleep 0.2
+    done
+    run bash "$PIPELINE" "$TEST_ROOT/other" "new" "ubuntu_amd64" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    # other's index commit landed while test was still uploading
+    kill -0 "$A"
+    [ "$(jq -r '.other.latest' "$STAGING_DIR/index/index.json")" = "1.0.0" ]
+    [ "$(jq -r '.test.latest // "none"' "$STAGING_DIR/index/index.json")" = "none" ]
+    wait "$A"
+    PKGS="$(jq -r 'del(._index) | keys | join(",")' "$STAGING_DIR/index/index.json")"
+    [ "$PKGS" = "other,test" ]
+}
+
+@test "a second run of the same project fails fast unless LOCK_WAIT=1" {
+    mkdir -p "$WORKING_DIR/locks"
+    exec 7>"$WORKING_DIR/locks/project-test.lock"
+    flock -n 7
+    run bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
+    [ "$status" -ne 0 ]
+    [[ "$output" == *"already running"* ]]
+    run env LOCK_WAIT=1 LOCK_TIMEOUT=1 bash "$PIPELINE" "$REPO_ROOT/test" "new" "ubuntu_amd64" "$STAGING_DIR"
+    [ "$status" -ne 0 ]
+    [[ "$output" == *"Timed out"* ]]
+    exec 7>&-
+}
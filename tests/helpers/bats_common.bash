@@ -53,10 +53,15 @@ EOF
 
     # Mock log/state paths
     export DOCKER_MOCK_LOG="$TEST_ROOT/mock_docker.log"
+    export DOCKER_MOCK_IMAGES="$TEST_ROOT/mock_docker_images"
+    export DOCKER_MOCK_CONTAINERS="$TEST_ROOT/mock_docker_containers"
     export GH_MOCK_LOG="$TEST_ROOT/mock_gh.log"
     export GH_MOCK_STATE="$TEST_ROOT/gh_state.json"
     export MINISIGN_MOCK_LOG="$TEST_ROOT/mock_minisign.log"
 
+    # Retry failed uploads immediately instead of backing off
+    export UPLOAD_BACKOFF=0
+
     # Git identity for any git operations (needed in clean CI environments)
     export GIT_AUTHOR_NAME="Repman Test"
     export GIT_AUTHOR_EMAIL="test@repman-ci.test"
@@ -55,3 +55,87 @@ teardown() {
     [ "$status" -eq 0 ]
     grep -q "would install.*libcurl4-openssl-dev" "$DOCKER_MOCK_LOG"
 }
+
+@test "second build of unchanged source is a cache hit and skips docker compose up" {
+    bash "$SCRIPT" "test" "ubuntu_amd64"
+    rm -rf "$WORKING_DIR/out/test"
+    : > "$DOCKER_MOCK_LOG"
+    run bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[cache] HIT"* ]]
+    [ -f "$WORKING_DIR/out/test/bin/program" ]
+    ! grep -q "compose.* up" "$DOCKER_MOCK_LOG"
+}
+
+@test "changing the source is a cache miss" {
+    bash "$SCRIPT" "test" "ubuntu_amd64"
+    echo "# changed" >> "$WORKING_DIR/src/test/setup.sh"
+    run bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[cache] MISS"* ]]
+}
+
+@test "BUILD_CACHE=0 always runs the container" {
+    bash "$SCRIPT" "test" "ubuntu_amd64"
+    : > "$DOCKER_MOCK_LOG"
+    run env BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    grep -q "compose.* up" "$DOCKER_MOCK_LOG"
+}
+
+@test "SOURCE_MODE=overlay adds a compose override granting the mount" {
+    run env SOURCE_MODE=overlay BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    grep "compose .* up" "$DOCKER_MOCK_LOG" | grep -q -- "-f .*repcid-compose\..*\.yml"
+    # The generated override is removed once the container is down
+    [ -z "$(ls "${TMPDIR:-/tmp}"/repcid-compose.*.yml 2>/dev/null)" ]
+}
+
+@test "builders mount the staged source read-only" {
+    for yml in "$REPO_ROOT"/builders/*-builder.yml; do
+        grep -q '/todo:ro$' "$yml"
+    done
+}
+
+@test "deps.json: packages are baked into a derived image that later builds reuse" {
+    printf '{"apt":["libcurl4-openssl-dev"]}' > "$WORKING_DIR/src/test/deps.json"
+    run env BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[derived-image] BUILT repcid-derived/ubuntu_amd64:"* ]]
+    grep -q "preinstalled in repcid-derived/ubuntu_amd64:" "$DOCKER_MOCK_LOG"
+
+    run env BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[derived-image] HIT repcid-derived/ubuntu_amd64:"* ]]
+    [ "$(grep -c "^docker build" "$DOCKER_MOCK_LOG")" -eq 1 ]
+}
+
+@test "DERIVED_IMAGES=0 installs deps.json packages in the container" {
+    printf '{"apt":["libcurl4-openssl-dev"]}' > "$WORKING_DIR/src/test/deps.json"
+    run env DERIVED_IMAGES=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [ -z "$(grep "^docker build" "$DOCKER_MOCK_LOG")" ]
+    grep -q "would install.*libcurl4-openssl-dev" "$DOCKER_MOCK_LOG"
+}
+
+@test "BUILD_POOL=1 runs builds in a reused warm container without compose" {
+    run env BUILD_POOL=1 BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[pool] started repcid-pool-ubuntu_amd64-"* ]]
+    [ -f "$WORKING_DIR/out/test/bin/program" ]
+
+    rm -rf "$WORKING_DIR/out/test"
+    run env BUILD_POOL=1 BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" != *"[pool] started"* ]]
+    [ -f "$WORKING_DIR/out/test/bin/program" ]
+    [ "$(ls "$DOCKER_MOCK_CONTAINERS" | wc -l)" -eq 1 ]
+    [ -z "$(grep "compose" "$DOCKER_MOCK_LOG")" ]
+}
+
+@test "BUILD_POOL=1 recycles a container after POOL_MAX_JOBS builds" {
+    run env BUILD_POOL=1 POOL_MAX_JOBS=1 BUILD_CACHE=0 bash "$SCRIPT" "test" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"[pool] recycling repcid-pool-ubuntu_amd64-"* ]]
+    [ -z "$(ls "$DOCKER_MOCK_CONTAINERS")" ]
+}
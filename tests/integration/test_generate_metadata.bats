@@ -62,3 +62,30 @@ teardown() {
     VER="$(jq -r '.test.latest' "$WORKING_DIR/metadata/index.json")"
     [ "$VER" = "5.0.0" ]
 }
+
+@test "batch mode stages all builders at one version" {
+    mkdir -p "$WORKING_DIR/builds/test/ubuntu_amd64/out" "$WORKING_DIR/builds/test/arch_amd64/out"
+    run env BUILDS_DIR="$WORKING_DIR/builds/test" bash "$SCRIPT" "test" "new" "ubuntu_amd64" "arch_amd64"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"ubuntu_amd64 test_v1.0.0_ubuntu_amd64"* ]]
+    [[ "$output" == *"arch_amd64 test_v1.0.0_arch_amd64"* ]]
+    [ -f "$WORKING_DIR/builds/test/ubuntu_amd64/out/test/metadata.json" ]
+    [ -f "$WORKING_DIR/builds/test/arch_amd64/out/test/metadata.json" ]
+    TARGETS="$(jq -r '.test.versions["1.0.0"].targets | keys | join(",")' "$WORKING_DIR/metadata/index.json")"
+    [ "$TARGETS" = "arch_amd64,ubuntu_amd64" ]
+}
+
+@test "STAGE_PENDING records the index update instead of writing it" {
+    mkdir -p "$WORKING_DIR/builds/test/ubuntu_amd64/out"
+    run env BUILDS_DIR="$WORKING_DIR/builds/test" STAGE_PENDING="$WORKING_DIR/builds/test/stage.json" \
+        bash "$SCRIPT" "test" "new" "ubuntu_amd64"
+    [ "$status" -eq 0 ]
+    [ -f "$WORKING_DIR/builds/test/ubuntu_amd64/out/test/metadata.json" ]
+    [ "$(jq -r '.test // "none"' "$WORKING_DIR/metadata/index.json")" = "none" ]
+    [ "$(jq -r '.version' "$WORKING_DIR/builds/test/stage.json")" = "1.0.0" ]
+}
+
+@test "multiple builders without BUILDS_DIR is rejected" {
+    run bash "$SCRIPT" "test" "new" "ubuntu_amd64" "arch_amd64"
+    [ "$status" -ne 0 ]
+}
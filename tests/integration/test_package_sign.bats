@@ -79,3 +79,13 @@ teardown() {
     run bash "$SCRIPT" "$PKG_NAME"
     [ "$status" -ne 0 ]
 }
+
+@test "creates .tar.gz.meta.json sidecar with metadata and digest" {
+    run bash "$SCRIPT" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    META="$WORKING_DIR/out/${PKG_NAME}.tar.gz.meta.json"
+    [ -f "$META" ]
+    [ "$(jq -r '.metadata.version' "$META")" = "1.0.0" ]
+    SUM="$(cut -d' ' -f1 "$WORKING_DIR/out/${PKG_NAME}.tar.gz.sha256")"
+    [ "$(jq -r '.sha256' "$META")" = "$SUM" ]
+}
@@ -37,6 +37,17 @@ teardown() {
     [ ! -d "$WORKING_DIR/src/stale_project" ]
 }
 
+@test "keeps the src tree of a project whose pipeline is running" {
+    mkdir -p "$WORKING_DIR/src/busy" "$WORKING_DIR/locks"
+    touch "$WORKING_DIR/src/busy/file"
+    exec 7>"$WORKING_DIR/locks/project-busy.lock"
+    flock -n 7
+    run bash "$SCRIPT" "$REPO_ROOT/test"
+    exec 7>&-
+    [ "$status" -eq 0 ]
+    [ -f "$WORKING_DIR/src/busy/file" ]
+}
+
 @test "clears prior contents of out/" {
     mkdir -p "$WORKING_DIR/out/old_output"
     touch "$WORKING_DIR/out/old_output/artifact"
@@ -45,7 +56,48 @@ teardown() {
     [ ! -d "$WORKING_DIR/out/old_output" ]
 }
 
+@test "keeps the outputs of a project whose pipeline is running" {
+    mkdir -p "$WORKING_DIR/out/busy" "$WORKING_DIR/out/idle" "$WORKING_DIR/locks"
+    touch "$WORKING_DIR/out/busy/artifact" "$WORKING_DIR/out/busy_v1.0.0_ubuntu_amd64.tar.gz" \
+          "$WORKING_DIR/out/idle_v1.0.0_ubuntu_amd64.tar.gz"
+    exec 7>"$WORKING_DIR/locks/project-busy.lock"
+    flock -n 7
+    run bash "$SCRIPT" "$REPO_ROOT/test"
+    exec 7>&-
+    [ "$status" -eq 0 ]
+    [ -f "$WORKING_DIR/out/busy/artifact" ]
+    [ -f "$WORKING_DIR/out/busy_v1.0.0_ubuntu_amd64.tar.gz" ]
+    [ ! -e "$WORKING_DIR/out/idle" ]
+    [ ! -e "$WORKING_DIR/out/idle_v1.0.0_ubuntu_amd64.tar.gz" ]
+}
+
 @test "exits non-zero when project path does not exist" {
     run bash "$SCRIPT" "/nonexistent/path/to/project"
     [ "$status" -ne 0 ]
 }
+
+@test "honours .repcidignore patterns" {
+    local project="$TEST_ROOT/proj/ignored"
+    mkdir -p "$project/.git" "$project/target" "$project/src"
+    touch "$project/setup.sh" "$project/.git/HEAD" "$project/target/big.o" "$project/src/main.c"
+    printf '# build junk\n.git/\ntarget/\n' > "$project/.repcidignore"
+    run bash "$SCRIPT" "$project"
+    [ "$status" -eq 0 ]
+    [ -f "$WORKING_DIR/src/ignored/src/main.c" ]
+    [ ! -e "$WORKING_DIR/src/ignored/.git" ]
+    [ ! -e "$WORKING_DIR/src/ignored/target" ]
+}
+
+@test "re-staging syncs in place: unchanged files are kept, deleted files removed" {
+    local project="$TEST_ROOT/proj/sync"
+    mkdir -p "$project"
+    touch "$project/setup.sh" "$project/keep.c" "$project/gone.c"
+    run bash "$SCRIPT" "$project"
+    [ "$status" -eq 0 ]
+    inode_before="$(stat -c %i "$WORKING_DIR/src/sync/keep.c")"
+    rm "$project/gone.c"
+    run bash "$SCRIPT" "$project"
+    [ "$status" -eq 0 ]
+    [ "$(stat -c %i "$WORKING_DIR/src/sync/keep.c")" = "$inode_before" ]
+    [ ! -e "$WORKING_DIR/src/sync/gone.c" ]
+}
@@ -57,7 +57,7 @@ _make_staging_artifacts() {
 @test "uploads all three asset files" {
     run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
     [ "$status" -eq 0 ]
-    ASSETS="$(jq -r '.releases["test-v1.0.0"].assets[]' "$GH_MOCK_STATE")"
+    ASSETS="$(jq -r '.releases["test-v1.0.0"].assets[].name' "$GH_MOCK_STATE")"
     [[ "$ASSETS" == *"${PKG_NAME}.tar.gz"* ]]
     [[ "$ASSETS" == *"${PKG_NAME}.tar.gz.minisig"* ]]
     [[ "$ASSETS" == *"${PKG_NAME}.tar.gz.sha256"* ]]
@@ -109,3 +109,86 @@ _make_staging_artifacts() {
     # But should have called release upload
     grep -q "release upload" "$GH_MOCK_LOG"
 }
+
+@test "reads version from the .meta.json sidecar when present" {
+    pkg_dir="$STAGING_DIR/test"
+    printf '{"metadata":{"name":"test","version":"2.0.0"}}' > "$pkg_dir/${PKG_NAME}.tar.gz.meta.json"
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    EXISTS="$(jq -r '.releases["test-v2.0.0"] // "null"' "$GH_MOCK_STATE")"
+    [ "$EXISTS" != "null" ]
+}
+
+@test "records a digest for every uploaded asset" {
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    expected="sha256:$(sha256sum "$STAGING_DIR/test/${PKG_NAME}.tar.gz" | cut -d' ' -f1)"
+    actual="$(jq -r --arg n "${PKG_NAME}.tar.gz" '.releases["test-v1.0.0"].assets[] | select(.name == $n) | .digest' "$GH_MOCK_STATE")"
+    [ "$actual" = "$expected" ]
+}
+
+@test "re-publish skips assets already uploaded with the same digest" {
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    : > "$GH_MOCK_LOG"
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"0 uploaded, 3 unchanged"* ]]
+    ! grep -q "release upload" "$GH_MOCK_LOG"
+}
+
+@test "re-publish uploads only the asset whose content changed" {
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    printf 'new-signature\n' > "$STAGING_DIR/test/signatures/${PKG_NAME}.tar.gz.minisig"
+    : > "$GH_MOCK_LOG"
+    run bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"1 uploaded, 2 unchanged"* ]]
+    [ "$(grep -c "release upload" "$GH_MOCK_LOG")" -eq 1 ]
+    grep -q "release upload test-v1.0.0 .*${PKG_NAME}.tar.gz.minisig --clobber" "$GH_MOCK_LOG"
+}
+
+@test "transient upload failures are retried" {
+    run env GH_MOCK_UPLOAD_FAILURES=2 bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [ "$(jq '.releases["test-v1.0.0"].assets | length' "$GH_MOCK_STATE")" -eq 3 ]
+}
+
+@test "rollback when an upload exhausts its retries" {
+    run env GH_MOCK_UPLOAD_FAILURES=100 UPLOAD_RETRIES=1 bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -ne 0 ]
+    EXISTS="$(jq -r '.releases["test-v1.0.0"] // "null"' "$GH_MOCK_STATE")"
+    [ "$EXISTS" = "null" ]
+}
+
+@test "phases: release, upload and commit publish in parts" {
+    export PUBLISH_STATE="$TEST_ROOT/publish.state"
+    run env PUBLISH_PHASE=release bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    ! grep -q "release upload" "$GH_MOCK_LOG"
+    grep -q "_RELEASE_CREATED=1" "$PUBLISH_STATE"
+
+    run env PUBLISH_PHASE=upload bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [ "$(jq '.releases["test-v1.0.0"].assets | length' "$GH_MOCK_STATE")" -eq 3 ]
+    [ "$(git -C "$STAGING_DIR" rev-list --count HEAD)" -eq 1 ]
+
+    run env PUBLISH_PHASE=commit bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [[ "$(git -C "$STAGING_DIR" log -1 --format=%s)" == "Publish test 1.0.0 (1 target(s))" ]]
+}
+
+@test "phases: a failed upload leaves the release for the caller to roll back" {
+    export PUBLISH_STATE="$TEST_ROOT/publish.state"
+    PUBLISH_PHASE=release bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    run env PUBLISH_PHASE=upload GH_MOCK_FAIL_OP=upload bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -ne 0 ]
+    [ "$(jq -r '.releases["test-v1.0.0"] // "null"' "$GH_MOCK_STATE")" != "null" ]
+
+    run env PUBLISH_PHASE=rollback bash "$SCRIPT" "$STAGING_DIR" "$PKG_NAME"
+    [ "$status" -eq 0 ]
+    [ "$(jq -r '.releases["test-v1.0.0"] // "null"' "$GH_MOCK_STATE")" = "null" ]
+    run git -C "$STAGING_DIR" tag -l "test-v1.0.0"
+    [ -z "$output" ]
+}
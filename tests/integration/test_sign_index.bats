@@ -59,3 +59,38 @@ teardown() {
         ! grep -q "minisign" "$MINISIGN_MOCK_LOG"
     fi
 }
+
+@test "sharded layout signs the manifest and every new shard" {
+    mkdir -p "$WORKING_DIR/metadata/packages"
+    printf '{"layout":"sharded","packages":{"test":{"latest":"1.0.0","shard":"packages/test.json","sha256":"x"}}}' > "$INDEX_PATH"
+    printf '{"test":{"latest":"1.0.0","versions":{}}}' > "$WORKING_DIR/metadata/packages/test.json"
+    run bash "$SCRIPT"
+    [ "$status" -eq 0 ]
+    [ -f "${INDEX_PATH}.minisig" ]
+    [ -f "$WORKING_DIR/metadata/packages/test.json.minisig" ]
+    [ -f "$WORKING_DIR/metadata/packages/test.json.sha256" ]
+    [[ "$output" == *"Shards: 1 signed, 0 unchanged"* ]]
+}
+
+@test "sharded layout skips shards whose content is unchanged" {
+    mkdir -p "$WORKING_DIR/metadata/packages"
+    printf '{"layout":"sharded","packages":{"test":{"latest":"1.0.0","shard":"packages/test.json","sha256":"x"}}}' > "$INDEX_PATH"
+    printf '{"test":{"latest":"1.0.0","versions":{}}}' > "$WORKING_DIR/metadata/packages/test.json"
+    bash "$SCRIPT" > /dev/null
+    : > "$MINISIGN_MOCK_LOG"
+    run bash "$SCRIPT"
+    [ "$status" -eq 0 ]
+    [[ "$output" == *"Shards: 0 signed, 1 unchanged"* ]]
+    ! grep -q "packages/test.json" "$MINISIGN_MOCK_LOG"
+}
+
+@test "signs compact and compressed index encodings when present" {
+    printf '{"test":{}}' > "$WORKING_DIR/metadata/index.min.json"
+    gzip -c "$WORKING_DIR/metadata/index.min.json" > "$WORKING_DIR/metadata/index.min.json.gz"
+    run bash "$SCRIPT"
+    [ "$status" -eq 0 ]
+    [ -f "$WORKING_DIR/metadata/index.min.json.minisig" ]
+    [ -f "$WORKING_DIR/metadata/index.min.json.sha256" ]
+    [ -f "$WORKING_DIR/metadata/index.min.json.gz.minisig" ]
+    [ -f "$WORKING_DIR/metadata/index.min.json.gz.sha256" ]
+}
@@ -56,3 +56,49 @@ teardown() {
     [ "$status" -eq 0 ]
     [ -f "$STAGING_DIR/keys/ci.pub" ]
 }
+
+@test "sharded layout stages shards and drops removed ones" {
+    mkdir -p "$WORKING_DIR/metadata/packages" "$STAGING_DIR/index/packages"
+    printf '{"layout":"sharded","packages":{"test":{}}}' > "$INDEX_PATH"
+    printf '{"test":{}}' > "$WORKING_DIR/metadata/packages/test.json"
+    touch "$STAGING_DIR/index/packages/gone.json"
+    run bash "$SCRIPT" "$PKG_NAME" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    [ -f "$STAGING_DIR/index/packages/test.json" ]
+    [ ! -f "$STAGING_DIR/index/packages/gone.json" ]
+}
+
+@test "monolithic layout drops shards staged by an earlier sharded layout" {
+    mkdir -p "$STAGING_DIR/index/packages"
+    touch "$STAGING_DIR/index/packages/test.json" "$STAGING_DIR/index/packages/test.json.minisig"
+    run bash "$SCRIPT" "$PKG_NAME" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    [ ! -e "$STAGING_DIR/index/packages" ]
+    [ -f "$STAGING_DIR/index/index.json" ]
+}
+
+@test "stages release notes sidecars under STAGING/index/notes/" {
+    mkdir -p "$WORKING_DIR/metadata/notes"
+    printf 'notes' > "$WORKING_DIR/metadata/notes/abc.md"
+    run bash "$SCRIPT" "$PKG_NAME" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    [ "$(cat "$STAGING_DIR/index/notes/abc.md")" = "notes" ]
+}
+
+@test "stages several packages in one call and reports linked bytes" {
+    local second="test_v1.0.0_arch_amd64"
+    printf 'tarball' > "$WORKING_DIR/out/${second}.tar.gz"
+    touch "$WORKING_DIR/out/${second}.tar.gz.minisig" "$WORKING_DIR/out/${second}.tar.gz.sha256"
+    run bash "$SCRIPT" "$PKG_NAME" "$second" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    [ -f "$STAGING_DIR/test/${PKG_NAME}.tar.gz" ]
+    [ -f "$STAGING_DIR/test/signatures/${second}.tar.gz.minisig" ]
+    [[ "$output" == *"0 bytes copied, 7 bytes linked"* ]]
+}
+
+@test "tarballs are hardlinked into staging" {
+    printf 'tarball' > "$WORKING_DIR/out/${PKG_NAME}.tar.gz"
+    run bash "$SCRIPT" "$PKG_NAME" "$STAGING_DIR"
+    [ "$status" -eq 0 ]
+    [ "$WORKING_DIR/out/${PKG_NAME}.tar.gz" -ef "$STAGING_DIR/test/${PKG_NAME}.tar.gz" ]
+}
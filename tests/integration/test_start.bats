@@ -0,0 +1,82 @@
+#!/usr/bin/env bats
+# Integration tests for data/start.sh (the builder container entrypoint),
+# run on the host with its /todo, /in_progress and /complete redirected.
+
+load "../helpers/bats_common"
+
+SCRIPT=""
+
+setup() {
+    _common_setup
+    SCRIPT="$REPO_ROOT/data/start.sh"
+    export REPCID_TODO_DIR="$TEST_ROOT/todo"
+    export REPCID_WORK_DIR="$TEST_ROOT/in_progress"
+    export REPCID_COMPLETE_DIR="$TEST_ROOT/complete"
+    mkdir -p "$REPCID_TODO_DIR"
+}
+
+teardown() {
+    _common_teardown
+}
+
+# make_job <name> [exit code] — a project whose setup.sh writes out/<name>.txt
+# and logs every run to $TEST_ROOT/runs
+make_job() {
+    mkdir -p "$REPCID_TODO_DIR/$1"
+    cat > "$REPCID_TODO_DIR/$1/setup.sh" <<SH
+#!/bin/sh
+echo "$1" >> "$TEST_ROOT/runs"
+mkdir -p "\$1/out"
+echo "$1" > "\$1/out/$1.txt"
+exit ${2:-0}
+SH
+}
+
+@test "builds only the most recently modified job by default" {
+    make_job old
+    touch -d '1 hour ago' "$REPCID_TODO_DIR/old"
+    make_job new
+    run bash "$SCRIPT"
+    [ "$status" -eq 0 ]
+    [ -f "$REPCID_COMPLETE_DIR/new/new.txt" ]
+    [ ! -e "$REPCID_COMPLETE_DIR/old" ]
+    grep -q '"status": "ok"' "$REPCID_COMPLETE_DIR/.status/new.json"
+}
+
+@test "REPCID_WORKERS drains every job once into its own output dir" {
+    for job in a b c d e; do make_job "$job"; done
+    run env REPCID_WORKERS=3 bash "$SCRIPT"
+    [ "$status" -eq 0 ]
+    for job in a b c d e; do
+        [ -f "$REPCID_COMPLETE_DIR/$job/$job.txt" ]
+        grep -q '"status": "ok"' "$REPCID_COMPLETE_DIR/.status/$job.json"
+    done
+    [ "$(wc -l < "$TEST_ROOT/runs")" -eq 5 ]
+    [[ "$output" == *"5 job(s), 0 failed"* ]]
+}
+
+@test "concurrent entrypoints claim each job exactly once" {
+    for job in a b c d e f; do make_job "$job"; done
+    REPCID_WORKERS=2 bash "$SCRIPT" >/dev/null &
+    REPCID_WORKERS=2 bash "$SCRIPT" >/dev/null &
+    wait
+    [ "$(sort "$TEST_ROOT/runs" | uniq | wc -l)" -eq 6 ]
+    [ "$(wc -l < "$TEST_ROOT/runs")" -eq 6 ]
+}
+
+@test "a failing job is recorded without stopping the others" {
+    make_job good
+    make_job broken 3
+    run env REPCID_WORKERS=2 bash "$SCRIPT"
+    [ "$status" -ne 0 ]
+    [ -f "$REPCID_COMPLETE_DIR/good/good.txt" ]
+    grep -q '"status": "failed", "exit_code": 3' "$REPCID_COMPLETE_DIR/.status/broken.json"
+    grep -q '"duration_s"' "$REPCID_COMPLETE_DIR/.status/good.json"
+}
+
+@test "rejects an invalid REPCID_WORKERS" {
+    make_job a
+    run env REPCID_WORKERS=many bash "$SCRIPT"
+    [ "$status" -ne 0 ]
+    [[ "$output" == *"REPCID_WORKERS must be"* ]]
+}
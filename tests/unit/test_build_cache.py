@@ -0,0 +1,155 @@
+"""Unit tests for core/build_cache.py"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.build_cache import (  # noqa: E402
+    cache_key,
+    entries,
+    prune,
+    restore,
+    save,
+    tree_digest,
+)
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "core", "build_cache.py")
+
+
+def _write(path, content, mode=0o644):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, mode)
+
+
+def _project(root):
+    _write(os.path.join(root, "setup.sh"), "#!/bin/sh\nmake\n", 0o755)
+    _write(os.path.join(root, "deps.json"), '{"apt": []}')
+    _write(os.path.join(root, "src", "main.c"), "int main(){}\n")
+    return root
+
+
+# ---------------------------------------------------------------------------
+# tree_digest / cache_key
+# ---------------------------------------------------------------------------
+
+class TestTreeDigest:
+    def test_same_content_same_digest(self):
+        with tempfile.TemporaryDirectory() as d:
+            a = _project(os.path.join(d, "a"))
+            b = _project(os.path.join(d, "b"))
+            assert tree_digest(a) == tree_digest(b)
+
+    def test_ignores_mtime(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = _project(os.path.join(d, "p"))
+            before = tree_digest(p)
+            os.utime(os.path.join(p, "setup.sh"), (0, 0))
+            assert tree_digest(p) == before
+
+    def test_content_change_changes_digest(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = _project(os.path.join(d, "p"))
+            before = tree_digest(p)
+            _write(os.path.join(p, "deps.json"), '{"apt": ["libfoo"]}')
+            assert tree_digest(p) != before
+
+    def test_exec_bit_changes_digest(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = _project(os.path.join(d, "p"))
+            before = tree_digest(p)
+            os.chmod(os.path.join(p, "setup.sh"), 0o644)
+            assert tree_digest(p) != before
+
+
+class TestCacheKey:
+    def test_image_digest_is_part_of_key(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = _project(os.path.join(d, "p"))
+            assert cache_key(p, "ubuntu_amd64", "sha256:aaa") != cache_key(p, "ubuntu_amd64", "sha256:bbb")
+
+    def test_builder_is_part_of_key(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = _project(os.path.join(d, "p"))
+            assert cache_key(p, "ubuntu_amd64", "x") != cache_key(p, "debian_amd64", "x")
+
+
+# ---------------------------------------------------------------------------
+# save / restore / prune
+# ---------------------------------------------------------------------------
+
+class TestSaveRestore:
+    def test_miss_returns_false(self):
+        with tempfile.TemporaryDirectory() as d:
+            assert restore(os.path.join(d, "cache"), "nokey", os.path.join(d, "dest")) is False
+
+    def test_roundtrip_restores_tree(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = os.path.join(d, "out", "proj")
+            _write(os.path.join(out, "bin", "prog"), "binary", 0o755)
+            cache = os.path.join(d, "cache")
+            assert save(cache, "k1", out) is True
+            dest = os.path.join(d, "restored", "proj")
+            assert restore(cache, "k1", dest) is True
+            with open(os.path.join(dest, "bin", "prog")) as f:
+                assert f.read() == "binary"
+            assert os.stat(os.path.join(dest, "bin", "prog")).st_mode & 0o111
+
+    def test_restore_replaces_existing_dest(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = os.path.join(d, "out")
+            _write(os.path.join(out, "a"), "new")
+            cache = os.path.join(d, "cache")
+            save(cache, "k1", out)
+            dest = os.path.join(d, "dest")
+            _write(os.path.join(dest, "stale"), "old")
+            restore(cache, "k1", dest)
+            assert os.listdir(dest) == ["a"]
+
+    def test_second_save_is_noop(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = os.path.join(d, "out")
+            _write(os.path.join(out, "a"), "x")
+            cache = os.path.join(d, "cache")
+            assert save(cache, "k1", out) is True
+            assert save(cache, "k1", out) is False
+
+
+class TestPrune:
+    def test_evicts_least_recently_used_first(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = os.path.join(d, "cache")
+            for key in ("old", "mid", "new"):
+                out = os.path.join(d, key)
+                _write(os.path.join(out, "blob"), "x" * 100)
+                save(cache, key, out)
+            now = time.time()
+            for age, key in ((300, "old"), (200, "mid"), (100, "new")):
+                meta = os.path.join(cache, key, "entry.json")
+                os.utime(meta, (now - age, now - age))
+            # A hit on "old" makes it the most recently used entry
+            restore(cache, "old", os.path.join(d, "dest"))
+            evicted = prune(cache, 200)
+            assert evicted == ["mid"]
+            assert sorted(k for _, _, k in entries(cache)) == ["new", "old"]
+
+    def test_under_cap_evicts_nothing(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = os.path.join(d, "cache")
+            out = os.path.join(d, "out")
+            _write(os.path.join(out, "blob"), "x" * 10)
+            save(cache, "k", out)
+            assert prune(cache, 1024) == []
+
+    def test_bad_max_mb_env_is_a_clear_error(self):
+        with tempfile.TemporaryDirectory() as d:
+            env = dict(os.environ, BUILD_CACHE_MAX_MB="4G")
+            proc = subprocess.run(
+                [sys.executable, SCRIPT, "--cache-dir", d, "prune"],
+                env=env, capture_output=True, text=True,
+            )
+            assert proc.returncode == 1
+            assert "BUILD_CACHE_MAX_MB must be a whole number, got '4G'" in proc.stderr
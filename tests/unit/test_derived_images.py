@@ -0,0 +1,102 @@
+"""Unit tests for core/derived_images.py (against the tests/mocks/docker stand-in)"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.derived_images import (  # noqa: E402
+    DeriveError,
+    derived_key,
+    ensure,
+    gc,
+    list_derived,
+    normalize_deps,
+)
+
+MOCKS = os.path.join(os.path.dirname(__file__), "..", "mocks")
+BASE = "local/builder:ubuntu22"
+
+
+@pytest.fixture
+def docker_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", f"{os.path.abspath(MOCKS)}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("DOCKER_MOCK_LOG", str(tmp_path / "docker.log"))
+    monkeypatch.setenv("DOCKER_MOCK_IMAGES", str(tmp_path / "images"))
+    return tmp_path
+
+
+def _deps(path, deps):
+    path.write_text(json.dumps(deps))
+    return str(path)
+
+
+def _builds(env):
+    log = env / "docker.log"
+    return [l for l in log.read_text().splitlines() if l.startswith("docker build")] if log.exists() else []
+
+
+class TestNormalize:
+    def test_sorts_dedupes_and_drops_empty(self):
+        deps = {"apt": ["zlib1g-dev", "curl", "curl", " "], "apk": [], "note": "x"}
+        assert normalize_deps(deps) == {"apt": ["curl", "zlib1g-dev"]}
+
+    def test_order_does_not_change_key(self):
+        a = normalize_deps({"apt": ["b", "a"]})
+        b = normalize_deps({"apt": ["a", "b", "a"]})
+        assert derived_key("sha256:1", a, b"s") == derived_key("sha256:1", b, b"s")
+
+    def test_base_image_changes_key(self):
+        deps = normalize_deps({"apt": ["a"]})
+        assert derived_key("sha256:1", deps, b"s") != derived_key("sha256:2", deps, b"s")
+
+
+class TestEnsure:
+    def test_builds_once_then_reuses(self, docker_env):
+        deps = _deps(docker_env / "deps.json", {"apt": ["libcurl4-openssl-dev"]})
+        state = str(docker_env / "state.json")
+        image, status = ensure("ubuntu_amd64", BASE, deps, state)
+        assert status == "built"
+        assert image.startswith("repcid-derived/ubuntu_amd64:")
+        again, status = ensure("ubuntu_amd64", BASE, deps, state)
+        assert (again, status) == (image, "hit")
+        assert len(_builds(docker_env)) == 1
+        assert image in json.loads((docker_env / "state.json").read_text())
+
+    def test_changed_deps_derive_a_new_image(self, docker_env):
+        state = str(docker_env / "state.json")
+        first, _ = ensure("ubuntu_amd64", BASE, _deps(docker_env / "a.json", {"apt": ["a"]}), state)
+        second, _ = ensure("ubuntu_amd64", BASE, _deps(docker_env / "b.json", {"apt": ["a", "b"]}), state)
+        assert first != second
+
+    def test_no_packages_uses_base_image(self, docker_env):
+        deps = _deps(docker_env / "deps.json", {"apt": []})
+        assert ensure("ubuntu_amd64", BASE, deps, str(docker_env / "state.json")) == (BASE, "base")
+        assert _builds(docker_env) == []
+
+    def test_invalid_deps_raises(self, docker_env):
+        (docker_env / "deps.json").write_text("{not json")
+        with pytest.raises(DeriveError):
+            ensure("ubuntu_amd64", BASE, str(docker_env / "deps.json"), str(docker_env / "state.json"))
+
+
+class TestGc:
+    def test_removes_images_past_ttl_and_keeps_recent(self, docker_env):
+        state = str(docker_env / "state.json")
+        old, _ = ensure("ubuntu_amd64", BASE, _deps(docker_env / "a.json", {"apt": ["a"]}), state)
+        recent, _ = ensure("ubuntu_amd64", BASE, _deps(docker_env / "b.json", {"apt": ["b"]}), state)
+        data = json.loads((docker_env / "state.json").read_text())
+        data[old] = time.time() - 30 * 86400
+        (docker_env / "state.json").write_text(json.dumps(data))
+
+        assert gc(14, state, dry_run=True) == [old]
+        assert sorted(list_derived()) == sorted([old, recent])
+        assert gc(14, state) == [old]
+        assert list_derived() == [recent]
+        assert old not in json.loads((docker_env / "state.json").read_text())
+
+    def test_unrecorded_images_are_collected(self, docker_env):
+        (docker_env / "images").write_text("repcid-derived/ubuntu_amd64:stale\n")
+        assert gc(14, str(docker_env / "state.json")) == ["repcid-derived/ubuntu_amd64:stale"]
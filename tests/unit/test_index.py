@@ -1,23 +1,46 @@
 """Unit tests for core/index.py"""
+import gzip
 import json
 import os
+import shutil
 import sys
 import tempfile
 
 import pytest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.packer import pack  # noqa: E402
 from core.index import (
     add_version,
+    apply_delta,
+    artifact_fields,
     create_index_mdata,
     create_pkg_md,
+    delta_path,
     edit_target,
+    canonical_json,
+    encoding_paths,
     get_version,
     greater_version,
+    index_generation,
+    inline_artifacts,
+    is_manifest,
+    load_index,
+    notes_path,
+    notes_ref,
     package_name,
+    read_notes,
+    rebuild_latest_by_target,
+    rebuild_version_order,
     remove_version,
+    shard_path,
     safe_write_json,
+    sorted_versions,
     update_version,
+    versions_in_range,
+    Version,
+    VERSION_CACHE_SIZE,
+    write_index,
 )
 
 
@@ -113,6 +136,46 @@ class TestGreaterVersion:
         assert greater_version("1.5.0", "2.0.0") is False
 
 
+class TestVersion:
+    def test_interned(self):
+        assert Version("1.2.3") is Version("1.2.3")
+
+    def test_cache_is_bounded(self):
+        first = Version("1.2.3")
+        for i in range(VERSION_CACHE_SIZE + 1):
+            Version(f"0.0.{i}")
+        assert Version("1.2.3") is not first
+        assert Version("1.2.3") == first
+
+    def test_hashable_and_equal(self):
+        assert len({Version("1.2.3"), Version("1.2.3"), Version("1.2.4")}) == 2
+
+    def test_numeric_not_lexical(self):
+        assert Version("1.10.0") > Version("1.9.0")
+
+    def test_prerelease_below_release(self):
+        assert Version("1.0.0-rc.1") < Version("1.0.0")
+        assert Version("1.0.0-rc.1") > Version("0.9.9")
+
+    def test_semver_spec_precedence_chain(self):
+        chain = ["1.0.0-alpha", "1.0.0-alpha.1", "1.0.0-alpha.beta", "1.0.0-beta",
+                 "1.0.0-beta.2", "1.0.0-beta.11", "1.0.0-rc.1", "1.0.0"]
+        assert sorted(reversed(chain), key=Version) == chain
+
+    def test_build_metadata_only_breaks_ties(self):
+        assert Version("1.0.0+b1") < Version("1.0.1")
+        assert Version("1.0.0+b1") != Version("1.0.0+b2")
+
+    def test_invalid_raises(self):
+        for bad in ("1.2", "01.2.3", "1.2.3-", "v1.2.3"):
+            with pytest.raises(ValueError):
+                Version(bad)
+
+    def test_greater_version_handles_prerelease(self):
+        assert greater_version("2.0.0", "2.0.0-rc.1") is True
+        assert greater_version("2.0.0-rc.1", "2.0.0") is False
+
+
 # ---------------------------------------------------------------------------
 # add_version
 # ---------------------------------------------------------------------------
@@ -124,6 +187,13 @@ class TestAddVersion:
         assert "newpkg" in md
         assert md["newpkg"]["latest"] == "1.0.0"
 
+    def test_reserved_names_are_rejected(self):
+        md = {}
+        for name in ("_index", "_delta", ""):
+            with pytest.raises(ValueError):
+                add_version(md, name, "1.0.0", "ubuntu", "amd64")
+        assert md == {}
+
     def test_higher_version_updates_latest(self):
         md = {}
         add_version(md, "p", "1.0.0", "ubuntu", "amd64")
@@ -193,6 +263,11 @@ class TestUpdateVersion:
         with pytest.raises(ValueError):
             update_version("1.0.0", "new")
 
+    def test_prerelease_bump_releases_it(self):
+        assert update_version("1.1.0-rc.1", "minor") == "1.1.0"
+        assert update_version("1.1.0-rc.1", "patch") == "1.1.0"
+        assert update_version("1.1.0-rc.1", "major") == "2.0.0"
+
     def test_invalid_format_raises(self):
         with pytest.raises(ValueError):
             update_version("1.0", "patch")
@@ -273,6 +348,64 @@ class TestGetVersion:
         add_version(md, "p", "1.0.0", "ubuntu", "amd64")
         assert get_version(md, "p", "debian", "amd64") is None
 
+    def test_index_without_map_falls_back_to_scan(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.2.0", "ubuntu", "amd64")
+        del md["p"]["latest_by_target"]
+        assert get_version(md, "p", "ubuntu", "amd64") == "1.2.0"
+
+
+# ---------------------------------------------------------------------------
+# latest_by_target
+# ---------------------------------------------------------------------------
+
+class TestLatestByTarget:
+    def test_tracks_each_target_independently(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.0.0", "arch", "amd64")
+        add_version(md, "p", "1.1.0", "ubuntu", "amd64")
+        assert md["p"]["latest_by_target"] == {"ubuntu_amd64": "1.1.0", "arch_amd64": "1.0.0"}
+
+    def test_older_version_does_not_lower_entry(self):
+        md = {}
+        add_version(md, "p", "2.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.5.0", "ubuntu", "amd64")
+        assert md["p"]["latest_by_target"]["ubuntu_amd64"] == "2.0.0"
+
+    def test_remove_falls_back_per_target(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.1.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.1.0", "arch", "amd64")
+        remove_version(md, "p", "1.1.0")
+        assert md["p"]["latest_by_target"] == {"ubuntu_amd64": "1.0.0"}
+
+    def test_add_to_legacy_index_derives_map_first(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.0.0", "arch", "amd64")
+        del md["p"]["latest_by_target"]
+        add_version(md, "p", "1.1.0", "ubuntu", "amd64")
+        assert md["p"]["latest_by_target"] == {"ubuntu_amd64": "1.1.0", "arch_amd64": "1.0.0"}
+
+    def test_edit_target_heals_stale_map(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        md["p"]["latest_by_target"] = {}
+        assert edit_target(md, "p", "1.0.0", "ubuntu", "amd64", "url", "https://x") is True
+        assert md["p"]["latest_by_target"] == {"ubuntu_amd64": "1.0.0"}
+
+    def test_rebuild_matches_incremental(self):
+        md = {}
+        for ver, os_name in (("1.0.0", "ubuntu"), ("1.2.0", "arch"), ("1.1.0", "ubuntu")):
+            add_version(md, "p", ver, os_name, "amd64")
+        expected = dict(md["p"]["latest_by_target"])
+        md["p"]["latest_by_target"] = {"bogus_x": "9.9.9"}
+        rebuild_latest_by_target(md)
+        assert md["p"]["latest_by_target"] == expected
+
 
 # ---------------------------------------------------------------------------
 # remove_version
@@ -317,6 +450,49 @@ class TestRemoveVersion:
         assert "1.0.0" not in md["p"]["versions"]
 
 
+class TestVersionOrder:
+    def test_insert_keeps_ascending_order(self):
+        md = {}
+        for ver in ("1.10.0", "1.2.0", "1.2.0-rc.1", "1.9.3"):
+            add_version(md, "p", ver, "ubuntu", "amd64")
+        assert md["p"]["version_order"] == ["1.2.0-rc.1", "1.2.0", "1.9.3", "1.10.0"]
+        assert md["p"]["latest"] == "1.10.0"
+
+    def test_new_target_on_existing_version_not_duplicated(self):
+        md = {}
+        add_version(md, "p", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "p", "1.0.0", "arch", "amd64")
+        assert md["p"]["version_order"] == ["1.0.0"]
+
+    def test_remove_promotes_from_store(self):
+        md = {}
+        for ver in ("1.0.0", "1.10.0", "1.9.0"):
+            add_version(md, "p", ver, "ubuntu", "amd64")
+        remove_version(md, "p", "1.10.0")
+        assert md["p"]["version_order"] == ["1.0.0", "1.9.0"]
+        assert md["p"]["latest"] == "1.9.0"
+
+    def test_range_query_inclusive(self):
+        md = {}
+        for ver in ("1.0.0", "1.1.0", "1.2.0", "2.0.0-rc.1", "2.0.0"):
+            add_version(md, "p", ver, "ubuntu", "amd64")
+        assert versions_in_range(md, "p", "1.1.0", "2.0.0-rc.1") == ["1.1.0", "1.2.0", "2.0.0-rc.1"]
+        assert versions_in_range(md, "p", low="2.0.0") == ["2.0.0"]
+        assert versions_in_range(md, "p", high="1.0.0") == ["1.0.0"]
+
+    def test_legacy_index_without_store(self):
+        md = {}
+        for ver in ("1.0.0", "1.2.0"):
+            add_version(md, "p", ver, "ubuntu", "amd64")
+        del md["p"]["version_order"]
+        assert sorted_versions(md, "p") == ["1.0.0", "1.2.0"]
+        add_version(md, "p", "1.1.0", "ubuntu", "amd64")
+        assert md["p"]["version_order"] == ["1.0.0", "1.1.0", "1.2.0"]
+        md["p"]["version_order"] = []
+        rebuild_version_order(md)
+        assert md["p"]["version_order"] == ["1.0.0", "1.1.0", "1.2.0"]
+
+
 # ---------------------------------------------------------------------------
 # safe_write_json
 # ---------------------------------------------------------------------------
@@ -351,3 +527,390 @@ class TestSafeWriteJson:
             safe_write_json(path, {"v": 2})
             with open(path) as f:
                 assert json.load(f) == {"v": 2}
+
+
+# ---------------------------------------------------------------------------
+# load_index / write_index
+# ---------------------------------------------------------------------------
+
+def _two_packages():
+    md = {}
+    add_version(md, "a", "1.0.0", "ubuntu", "amd64")
+    add_version(md, "b", "2.0.0", "ubuntu", "amd64")
+    return md
+
+
+class TestIndexLayouts:
+    def test_monolithic_roundtrip(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "monolithic")
+            with open(index) as f:
+                doc = json.load(f)
+            assert doc.pop("_index") == {"format": 1, "layout": "monolithic", "generation": 1}
+            assert doc == md
+            assert load_index(index) == md
+
+    def test_package_named_like_the_marker_is_not_dropped(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            with open(index, "w") as f:
+                json.dump({"_index": {"latest": "1.0.0", "versions": {}}}, f)
+            with pytest.raises(ValueError):
+                load_index(index)
+
+    def test_sharded_roundtrip(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            with open(index) as f:
+                manifest = json.load(f)
+            assert is_manifest(manifest)
+            assert manifest["packages"]["b"]["latest"] == "2.0.0"
+            assert manifest["packages"]["b"]["shard"] == "packages/b.json"
+            with open(os.path.join(d, "packages", "a.json")) as f:
+                assert json.load(f) == {"a": md["a"]}
+            assert load_index(index) == md
+
+    def test_sharded_rewrites_only_touched_shards(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            add_version(md, "b", "2.1.0", "ubuntu", "amd64")
+            written = write_index(index, md, "sharded")
+            assert written == [os.path.join(d, "packages", "b.json"), index]
+
+    def test_sharded_removes_shard_of_deleted_package(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            remove_version(md, "a", "1.0.0")
+            write_index(index, md, "sharded")
+            assert not os.path.exists(os.path.join(d, "packages", "a.json"))
+            assert list(load_index(index)) == ["b"]
+
+    def test_switch_to_monolithic_removes_the_shards(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            shards = os.path.join(d, "packages")
+            # Signatures sign_index.sh left next to a shard go with it
+            open(os.path.join(shards, "a.json.minisig"), "w").close()
+            written = write_index(index, md, "monolithic")
+            assert written == [index, os.path.join(shards, "a.json"), os.path.join(shards, "b.json")]
+            assert not os.path.exists(shards)
+            assert load_index(index) == md
+
+    def test_layout_from_environment(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            monkeypatch.setenv("INDEX_LAYOUT", "sharded")
+            write_index(index, _two_packages())
+            assert os.path.exists(os.path.join(d, "packages", "a.json"))
+
+    def test_unknown_layout_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            with pytest.raises(ValueError):
+                write_index(os.path.join(d, "index.json"), {}, "bogus")
+
+
+class TestIndexEncodings:
+    def test_compact_and_gzip_written_next_to_index(self, monkeypatch):
+        monkeypatch.setenv("INDEX_ENCODINGS", "min,gz")
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            write_index(index, _two_packages(), "monolithic")
+            paths = encoding_paths(index)
+            with open(index) as f:
+                doc = json.load(f)
+            with open(paths["min"], "rb") as f:
+                compact = f.read()
+            assert compact == canonical_json(doc)
+            assert b" " not in compact
+            with gzip.open(paths["gz"], "rb") as f:
+                assert f.read() == compact
+            assert not os.path.exists(paths["zst"])
+            assert os.path.getsize(paths["gz"]) < os.path.getsize(index)
+
+    def test_gzip_is_deterministic(self, monkeypatch):
+        monkeypatch.setenv("INDEX_ENCODINGS", "gz")
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            write_index(index, _two_packages(), "monolithic")
+            with open(encoding_paths(index)["gz"], "rb") as f:
+                first = f.read()
+            write_index(index, _two_packages(), "monolithic")
+            with open(encoding_paths(index)["gz"], "rb") as f:
+                assert f.read() == first
+
+    def test_disabled_encoding_is_removed_with_sidecars(self, monkeypatch):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            monkeypatch.setenv("INDEX_ENCODINGS", "min,gz")
+            write_index(index, _two_packages(), "monolithic")
+            gz = encoding_paths(index)["gz"]
+            open(f"{gz}.minisig", "w").close()
+            monkeypatch.setenv("INDEX_ENCODINGS", "min")
+            write_index(index, _two_packages(), "monolithic")
+            assert not os.path.exists(gz)
+            assert not os.path.exists(f"{gz}.minisig")
+
+    def test_sharded_shards_get_encodings(self, monkeypatch):
+        monkeypatch.setenv("INDEX_ENCODINGS", "min")
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            with open(os.path.join(d, "packages", "a.min.json")) as f:
+                assert json.load(f) == {"a": md["a"]}
+
+    @pytest.mark.skipif(shutil.which("zstd") is None, reason="zstd not installed")
+    def test_zstd_roundtrip(self, monkeypatch):
+        import subprocess
+        monkeypatch.setenv("INDEX_ENCODINGS", "min,zst")
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            write_index(index, _two_packages(), "monolithic")
+            paths = encoding_paths(index)
+            out = subprocess.run(["zstd", "-dc", paths["zst"]], capture_output=True, check=True).stdout
+            with open(paths["min"], "rb") as f:
+                assert out == f.read()
+
+    def test_unknown_encoding_raises(self, monkeypatch):
+        monkeypatch.setenv("INDEX_ENCODINGS", "brotli")
+        with tempfile.TemporaryDirectory() as d:
+            with pytest.raises(ValueError):
+                write_index(os.path.join(d, "index.json"), {}, "monolithic")
+
+
+# ---------------------------------------------------------------------------
+# artifact_fields / inline_artifacts
+# ---------------------------------------------------------------------------
+
+def _artifact(d, name="mypkg", version="1.0.0", target="ubuntu_amd64", sidecar=True):
+    os.makedirs(os.path.join(d, "build", name), exist_ok=True)
+    with open(os.path.join(d, "build", name, "bin"), "wb") as f:
+        f.write(b"x" * 5000)
+    tarball = os.path.join(d, f"{name}_v{version}_{target}.tar.gz")
+    meta = pack(os.path.join(d, "build"), name, tarball, threads=1)
+    with open(f"{tarball}.minisig", "w") as f:
+        f.write("untrusted comment: sig\nRWQ\n")
+    if not sidecar:
+        os.remove(f"{tarball}.meta.json")
+    return meta
+
+
+class TestArtifactFields:
+    def test_reads_the_packer_sidecar(self):
+        with tempfile.TemporaryDirectory() as d:
+            meta = _artifact(d)
+            fields = artifact_fields(d, "mypkg", "1.0.0", "ubuntu", "amd64")
+            assert fields == {
+                "digest": meta["sha256"],
+                "size": meta["size"],
+                "unpacked_size": meta["unpacked_size"],
+                "minisig": "untrusted comment: sig\nRWQ\n",
+            }
+
+    def test_scans_the_tarball_without_a_sidecar(self):
+        with tempfile.TemporaryDirectory() as d:
+            meta = _artifact(d, sidecar=False)
+            fields = artifact_fields(d, "mypkg", "1.0.0", "ubuntu", "amd64", minisig=False)
+            assert fields == {"digest": meta["sha256"], "size": meta["size"],
+                              "unpacked_size": meta["unpacked_size"]}
+
+    def test_stale_sidecar_of_the_same_size_is_not_trusted(self):
+        with tempfile.TemporaryDirectory() as d:
+            meta = _artifact(d)
+            tarball = os.path.join(d, "mypkg_v1.0.0_ubuntu_amd64.tar.gz")
+            with open(f"{tarball}.meta.json", "w") as f:
+                json.dump({**meta, "sha256": "00" * 32, "unpacked_size": 1}, f)
+            fields = artifact_fields(d, "mypkg", "1.0.0", "ubuntu", "amd64", minisig=False)
+            assert fields == {"digest": meta["sha256"], "size": meta["size"],
+                              "unpacked_size": meta["unpacked_size"]}
+
+    def test_signature_can_be_left_out(self, monkeypatch):
+        monkeypatch.setenv("INDEX_INLINE_MINISIG", "0")
+        with tempfile.TemporaryDirectory() as d:
+            _artifact(d)
+            assert "minisig" not in artifact_fields(d, "mypkg", "1.0.0", "ubuntu", "amd64")
+
+    def test_missing_tarball_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            with pytest.raises(OSError):
+                artifact_fields(d, "mypkg", "1.0.0", "ubuntu", "amd64")
+
+    def test_add_version_inlines_the_fields(self):
+        md = {}
+        add_version(md, "mypkg", "1.0.0", "ubuntu", "amd64",
+                    artifact={"digest": "ab" * 32, "size": 10, "unpacked_size": 20})
+        add_version(md, "mypkg", "1.0.0", "arch", "amd64")
+        targets = md["mypkg"]["versions"]["1.0.0"]["targets"]
+        assert targets["ubuntu_amd64"]["digest"] == "ab" * 32
+        assert targets["ubuntu_amd64"]["sha256"].endswith(".tar.gz.sha256")
+        assert targets["ubuntu_amd64"]["size"] == 10
+        assert targets["ubuntu_amd64"]["signature"].endswith(".tar.gz.minisig")
+        assert targets["arch_amd64"]["sha256"].endswith(".tar.gz.sha256")
+
+    def test_inline_artifacts_backfills_existing_targets(self):
+        md = {}
+        add_version(md, "mypkg", "1.0.0", "ubuntu", "amd64")
+        add_version(md, "mypkg", "1.0.0", "arch", "amd64")
+        # Written while the digest still went under "sha256"
+        md["mypkg"]["versions"]["1.0.0"]["targets"]["ubuntu_amd64"]["sha256"] = "cd" * 32
+        with tempfile.TemporaryDirectory() as d:
+            meta = _artifact(d)
+            assert inline_artifacts(md, d) == 1
+        targets = md["mypkg"]["versions"]["1.0.0"]["targets"]
+        assert targets["ubuntu_amd64"]["digest"] == meta["sha256"]
+        assert targets["ubuntu_amd64"]["sha256"] == "mypkg_v1.0.0_ubuntu_amd64.tar.gz.sha256"
+        assert "digest" not in targets["arch_amd64"]
+
+
+# ---------------------------------------------------------------------------
+# release notes sidecars
+# ---------------------------------------------------------------------------
+
+class TestReleaseNotes:
+    NOTES = "## 1.0.0\n\n- first release\n"
+
+    @pytest.mark.parametrize("layout", ["monolithic", "sharded"])
+    def test_write_moves_notes_into_a_sidecar(self, layout):
+        md = {}
+        add_version(md, "mypkg", "1.0.0", "ubuntu", "amd64", notes=self.NOTES)
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            write_index(index, md, layout)
+            ref = load_index(index)["mypkg"]["versions"]["1.0.0"]["notes"]
+            assert ref == notes_ref(self.NOTES)
+            assert ref["size"] == len(self.NOTES.encode())
+            assert notes_path(index, ref) == os.path.join(d, "notes", f"{ref['sha256']}.md")
+            assert read_notes(index, ref) == self.NOTES
+            with open(index) as f:
+                assert "first release" not in f.read()
+
+    def test_identical_notes_share_one_sidecar(self):
+        md = {}
+        add_version(md, "a", "1.0.0", "ubuntu", "amd64", notes=self.NOTES)
+        add_version(md, "b", "2.0.0", "ubuntu", "amd64", notes=self.NOTES)
+        with tempfile.TemporaryDirectory() as d:
+            write_index(os.path.join(d, "index.json"), md, "monolithic")
+            assert len(os.listdir(os.path.join(d, "notes"))) == 1
+
+    def test_inline_notes_of_an_older_index_are_read_as_is(self):
+        assert read_notes("/nonexistent/index.json", "old text") == "old text"
+
+    def test_tampered_sidecar_is_rejected(self):
+        md = {}
+        add_version(md, "mypkg", "1.0.0", "ubuntu", "amd64", notes=self.NOTES)
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            write_index(index, md, "monolithic")
+            ref = md["mypkg"]["versions"]["1.0.0"]["notes"]
+            with open(notes_path(index, ref), "a") as f:
+                f.write("injected\n")
+            with pytest.raises(ValueError):
+                read_notes(index, ref)
+
+
+# ---------------------------------------------------------------------------
+# generations / delta documents
+# ---------------------------------------------------------------------------
+
+class TestIndexDeltas:
+    @pytest.mark.parametrize("layout", ["monolithic", "sharded"])
+    def test_changes_bump_the_generation_and_leave_a_delta(self, layout):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, layout)
+            assert index_generation(index) == 1
+            assert not os.path.exists(delta_path(index, 1))
+            write_index(index, md, layout)
+            assert index_generation(index) == 1
+            add_version(md, "a", "1.1.0", "ubuntu", "amd64")
+            write_index(index, md, layout)
+            assert index_generation(index) == 2
+            with open(delta_path(index, 2)) as f:
+                delta = json.load(f)
+            assert (delta["from"], delta["to"]) == (1, 2)
+            assert set(delta["patch"]) == {"a"}
+            assert set(delta["patch"]["a"]) == {"latest", "latest_by_target", "versions"}
+            assert list(delta["patch"]["a"]["versions"]) == ["1.1.0"]
+
+    def test_client_catches_up_by_applying_deltas(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "monolithic")
+            client = load_index(index)
+            add_version(md, "a", "1.1.0", "arch", "amd64")
+            write_index(index, md, "monolithic")
+            remove_version(md, "b", "2.0.0")
+            write_index(index, md, "monolithic")
+            for generation in (2, 3):
+                with open(delta_path(index, generation)) as f:
+                    apply_delta(client, json.load(f), generation - 1)
+            assert client == load_index(index)
+
+    def test_delta_must_match_the_generation_and_digest(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "monolithic")
+            stale = load_index(index)
+            add_version(md, "a", "1.1.0", "ubuntu", "amd64")
+            write_index(index, md, "monolithic")
+            with open(delta_path(index, 2)) as f:
+                delta = json.load(f)
+            with pytest.raises(ValueError):
+                apply_delta(load_index(index), delta, 2)
+            stale["b"]["latest"] = "9.9.9"
+            with pytest.raises(ValueError):
+                apply_delta(stale, delta)
+
+    def test_sharded_write_only_reads_changed_shards(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "sharded")
+            # b is unchanged, so its shard is never parsed
+            with open(shard_path(index, "b"), "w") as f:
+                f.write("not json")
+            add_version(md, "a", "1.1.0", "ubuntu", "amd64")
+            write_index(index, md, "sharded")
+            with open(delta_path(index, 2)) as f:
+                assert set(json.load(f)["patch"]) == {"a"}
+
+    def test_unreadable_index_is_not_overwritten(self):
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = _two_packages()
+            write_index(index, md, "monolithic")
+            write_index(index, {}, "monolithic")
+            with open(index, "w") as f:
+                f.write("{truncated")
+            with pytest.raises(ValueError):
+                write_index(index, md, "monolithic")
+            with open(index) as f:
+                assert f.read() == "{truncated"
+            with open(os.path.join(d, "deltas", "head.json")) as f:
+                assert json.load(f)["generation"] == 2
+
+    def test_only_the_last_deltas_are_kept(self, monkeypatch):
+        monkeypatch.setenv("INDEX_DELTAS", "2")
+        with tempfile.TemporaryDirectory() as d:
+            index = os.path.join(d, "index.json")
+            md = {}
+            for minor in range(5):
+                add_version(md, "a", f"1.{minor}.0", "ubuntu", "amd64")
+                write_index(index, md, "monolithic")
+            assert sorted(os.listdir(os.path.join(d, "deltas"))) == ["4.json", "5.json", "head.json"]
+            with open(os.path.join(d, "deltas", "head.json")) as f:
+                head = json.load(f)
+            assert (head["generation"], head["oldest"]) == (5, 4)
@@ -0,0 +1,168 @@
+"""Unit tests for core/index_store.py (INDEX_BACKEND=sqlite)"""
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.index import (  # noqa: E402
+    add_version,
+    index_generation,
+    load_index,
+    remove_version,
+    write_index,
+)
+from core.index_store import (  # noqa: E402
+    IndexStore,
+    StoreError,
+    export_index,
+    latest_version,
+    open_store,
+    read_index,
+    save_index,
+    store_path,
+)
+from core.stage_commit import commit_pending  # noqa: E402
+
+STAGE_SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "core", "stage.py")
+
+
+@pytest.fixture(autouse=True)
+def _sqlite(monkeypatch):
+    monkeypatch.setenv("INDEX_BACKEND", "sqlite")
+    monkeypatch.delenv("INDEX_LOCK_HELD", raising=False)
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "metadata").mkdir()
+    return str(tmp_path / "metadata" / "index.json")
+
+
+def _history():
+    md = {}
+    for version in ("1.10.0", "1.2.0", "1.9.1"):
+        add_version(md, "demo", version, "ubuntu", "amd64")
+    add_version(md, "demo", "1.2.0", "arch", "amd64", notes="Fixes")
+    add_version(md, "other", "0.1.0", "alpine", "amd64")
+    return md
+
+
+class TestStore:
+    def test_packages_round_trip(self, index):
+        md = _history()
+        save_index(index, md)
+        assert read_index(index) == md
+        assert list(read_index(index)["demo"]["versions"]) == ["1.2.0", "1.9.1", "1.10.0"]
+        assert read_index(index, ["other", "missing"]) == {"other": md["other"]}
+        # Nothing is exported until sign time
+        assert not os.path.exists(index)
+
+    def test_named_save_only_touches_those_packages(self, index):
+        save_index(index, _history())
+        md = read_index(index, ["demo"])
+        remove_version(md, "demo", "1.10.0")
+        add_version(md, "demo", "2.0.0", "arch", "amd64")
+        save_index(index, md, ["demo"])
+        stored = read_index(index)
+        assert sorted(stored) == ["demo", "other"]
+        assert stored["demo"]["version_order"] == ["1.2.0", "1.9.1", "2.0.0"]
+        assert stored["demo"]["latest_by_target"] == {"arch_amd64": "2.0.0",
+                                                      "ubuntu_amd64": "1.9.1"}
+        save_index(index, {}, ["other"])
+        assert sorted(read_index(index)) == ["demo"]
+
+    def test_failed_transaction_leaves_the_store_unchanged(self, index):
+        save_index(index, _history())
+        store = IndexStore(store_path(index))
+        with pytest.raises(RuntimeError):
+            with store.transaction():
+                store.delete_package("other")
+                raise RuntimeError("crash mid-edit")
+        assert store.names() == ["demo", "other"]
+        store.close()
+
+    def test_latest_version_is_a_single_row(self, index):
+        save_index(index, _history())
+        assert latest_version(index, "demo", "ubuntu", "amd64") == "1.10.0"
+        assert latest_version(index, "demo", "alpine", "amd64") is None
+        assert latest_version(index, "missing", "ubuntu", "amd64") is None
+
+    def test_store_uses_wal(self, index):
+        open_store(index).close()
+        conn = sqlite3.connect(store_path(index))
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        conn.close()
+
+    def test_backend_selection(self, index, monkeypatch):
+        monkeypatch.setenv("INDEX_BACKEND", "json")
+        assert open_store(index) is None
+        save_index(index, _history())
+        assert sorted(load_index(index)) == ["demo", "other"]
+        assert not os.path.exists(store_path(index))
+        monkeypatch.setenv("INDEX_BACKEND", "postgres")
+        with pytest.raises(StoreError):
+            read_index(index)
+
+
+class TestExport:
+    def test_first_open_imports_index_json(self, index, monkeypatch):
+        monkeypatch.setenv("INDEX_BACKEND", "json")
+        write_index(index, _history())
+        monkeypatch.setenv("INDEX_BACKEND", "sqlite")
+        # Reads fall back to index.json and leave creating the store to a write
+        assert read_index(index, ["demo"])["demo"]["latest"] == "1.10.0"
+        assert latest_version(index, "demo", "ubuntu", "amd64") == "1.10.0"
+        assert not os.path.exists(store_path(index))
+        md = read_index(index, ["demo"])
+        add_version(md, "demo", "2.0.0", "arch", "amd64")
+        save_index(index, md, ["demo"])
+        assert sorted(read_index(index)) == ["demo", "other"]
+        assert read_index(index, ["demo"])["demo"]["latest"] == "2.0.0"
+        assert not [f for f in os.listdir(os.path.dirname(index)) if f.endswith(".tmp")]
+
+    def test_export_is_deterministic(self, index, tmp_path):
+        md = _history()
+        save_index(index, md)
+        export_index(index)
+        with open(index, "rb") as f:
+            first = f.read()
+        assert index_generation(index) == 1
+        # The same rows written in another order export the same bytes
+        other = str(tmp_path / "other" / "index.json")
+        os.makedirs(os.path.dirname(other))
+        save_index(other, {name: md[name] for name in reversed(list(md))})
+        export_index(other)
+        with open(other, "rb") as f:
+            assert f.read() == first
+        export_index(index)
+        assert index_generation(index) == 1
+        assert load_index(index) == read_index(index)
+
+    def test_export_needs_the_sqlite_backend(self, index, monkeypatch):
+        monkeypatch.setenv("INDEX_BACKEND", "json")
+        with pytest.raises(StoreError):
+            export_index(index)
+
+
+class TestStageWriters:
+    def test_concurrent_stage_runs_and_commits(self, tmp_path, index):
+        names = [f"pkg{i}" for i in range(4)]
+        procs = [
+            subprocess.Popen(
+                [sys.executable, STAGE_SCRIPT, name, "new", "--builders", "ubuntu_amd64",
+                 "--metadata-file", index, "--out-dir", str(tmp_path / "out" / name)],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            for name in names
+        ]
+        for proc in procs:
+            _, err = proc.communicate()
+            assert proc.returncode == 0, err
+        commit_pending({"index": index, "name": "demo", "version": "1.0.0",
+                        "url": "https://example.com/demo-v1.0.0", "notes": None,
+                        "targets": [["arch", "amd64"]]})
+        assert sorted(read_index(index)) == ["demo"] + names
+        export_index(index)
+        assert sorted(load_index(index)) == ["demo"] + names
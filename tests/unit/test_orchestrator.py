@@ -0,0 +1,208 @@
+"""Unit tests for core/orchestrator.py (overlapped publish)"""
+import asyncio
+import json
+import os
+import stat
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core import orchestrator, runs  # noqa: E402
+from core.orchestrator import FAIL, PASS, Orchestrator  # noqa: E402
+
+# Stand-ins for the pipeline steps: each one appends "<step> <arg>" lines to
+# $STEP_LOG, so the tests can check what ran and in which order. Builds of
+# the targets in $SLOW_BUILDS (default ubuntu_amd64) are slow; builds in
+# $FAIL_BUILD and publish phases in $FAIL_PUBLISH fail.
+SCRIPTS = {
+    "build_artifact.sh": """
+echo "build-start $2" >> "$STEP_LOG"
+case " ${SLOW_BUILDS:-ubuntu_amd64} " in *" $2 "*) sleep 0.6 ;; esac
+case " ${FAIL_BUILD:-} " in *" $2 "*) exit 1 ;; esac
+mkdir -p "$BUILD_ROOT/out/$1"
+echo "build-end $2" >> "$STEP_LOG"
+""",
+    "package_sign.sh": """
+[ -f "$BUILD_ROOT/out/${1%%_v*}/metadata.json" ] || exit 1
+touch "$BUILD_ROOT/out/$1.tar.gz" "$BUILD_ROOT/out/$1.tar.gz.minisig" "$BUILD_ROOT/out/$1.tar.gz.sha256"
+echo "package $1" >> "$STEP_LOG"
+""",
+    "publish_github.sh": """
+shift
+echo "publish-$PUBLISH_PHASE $*" >> "$STEP_LOG"
+case " ${FAIL_PUBLISH:-} " in *" $PUBLISH_PHASE "*) exit 1 ;; esac
+""",
+    "sign_index.sh": """
+echo "sign-index $INDEX_LOCK_HELD" >> "$STEP_LOG"
+""",
+    "stage_artifacts.sh": """
+echo "stage-artifacts $*" >> "$STEP_LOG"
+""",
+}
+
+CORE = {
+    "stage.py": """
+import json, os, sys
+args = sys.argv[1:]
+name = args[0]
+builders = args[args.index("--builders") + 1].split(",")
+out_dir = args[args.index("--out-dir") + 1]
+pending = args[args.index("--pending") + 1]
+os.makedirs(out_dir, exist_ok=True)
+with open(pending, "w") as f:
+    json.dump({"index": os.path.join(out_dir, "index.json"), "version": "1.0.0"}, f)
+print(f"Program {name} has been staged.")
+for b in builders:
+    pkg = f"{name}_v1.0.0_{b}"
+    with open(os.path.join(out_dir, pkg + "_md.json"), "w") as f:
+        json.dump({"name": name}, f)
+    print(f"{b}\\t{pkg}")
+""",
+    "stage_files.py": """
+import os, sys
+with open(os.environ["STEP_LOG"], "a") as f:
+    f.write(f"stage {sys.argv[3]}\\n")
+""",
+    "stage_commit.py": """
+import os, sys
+with open(os.environ["STEP_LOG"], "a") as f:
+    f.write(f"commit {sys.argv[3]}\\n")
+""",
+}
+
+BUILDERS = ["ubuntu_amd64", "arch_amd64"]
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    scripts, core = tmp_path / "scripts", tmp_path / "core"
+    scripts.mkdir()
+    core.mkdir()
+    for name, body in SCRIPTS.items():
+        script = scripts / name
+        script.write_text("#!/bin/sh\n" + body)
+        script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    for name, body in CORE.items():
+        (core / name).write_text(body)
+    (tmp_path / "src" / "app").mkdir(parents=True)
+    (tmp_path / "src" / "app" / "setup.sh").write_text("true\n")
+    log = tmp_path / "steps.log"
+    monkeypatch.setenv("STEP_LOG", str(log))
+    monkeypatch.delenv("INDEX_LOCK_HELD", raising=False)
+
+    def run(builders=BUILDERS, jobs=2, dry_run=False, run_id=None, resume=False):
+        if log.exists():
+            log.unlink()
+        orch = Orchestrator("app", "new", builders, str(tmp_path / "staging"),
+                            str(tmp_path / "builds"), jobs=jobs, dry_run=dry_run,
+                            scripts_dir=str(scripts), core_dir=str(core),
+                            working_dir=str(tmp_path), run_id=run_id, resume=resume,
+                            runs_dir=str(tmp_path / "runs"))
+        code = asyncio.run(orch.run())
+        steps = log.read_text().splitlines() if log.exists() else []
+        return orch, code, steps
+    return run
+
+
+class TestOrchestrator:
+    def test_fast_target_publishes_before_slow_build_ends(self, pipeline):
+        orch, code, steps = pipeline()
+        assert code == 0
+        assert orch.status == {"ubuntu_amd64": PASS, "arch_amd64": PASS}
+        assert steps.index("publish-upload app_v1.0.0_arch_amd64") < steps.index("build-end ubuntu_amd64")
+        assert [s for s in steps if s.startswith("publish-release")] == [
+            "publish-release app_v1.0.0_arch_amd64"]
+        # The index barrier runs once, after every target, with the lock held
+        barrier = steps[steps.index("commit arch_amd64,ubuntu_amd64"):]
+        assert barrier == [
+            "commit arch_amd64,ubuntu_amd64",
+            "sign-index 1",
+            "stage-artifacts app_v1.0.0_ubuntu_amd64 app_v1.0.0_arch_amd64 " + orch.staging_dir,
+            "publish-commit app_v1.0.0_ubuntu_amd64 app_v1.0.0_arch_amd64",
+        ]
+        assert sorted(os.listdir(orch.out_dir)) == sorted(
+            f"app_v1.0.0_{b}.tar.gz{ext}" for b in BUILDERS for ext in ("", ".minisig", ".sha256"))
+
+    def test_index_lock_is_not_held_during_uploads(self, pipeline, monkeypatch):
+        @contextmanager
+        def logged_lock(index_path, timeout=None):
+            with open(os.environ["STEP_LOG"], "a") as f:
+                f.write("lock\n")
+            yield
+            with open(os.environ["STEP_LOG"], "a") as f:
+                f.write("unlock\n")
+
+        monkeypatch.setattr(orchestrator, "index_lock", logged_lock)
+        _, code, steps = pipeline()
+        assert code == 0
+        locked = steps[steps.index("lock"):steps.index("unlock")]
+        assert [s.split()[0] for s in locked] == [
+            "lock", "commit", "sign-index", "stage-artifacts", "publish-commit"]
+        assert all(steps.index(s) < steps.index("lock")
+                   for s in steps if s.startswith(("publish-release", "publish-upload")))
+
+    def test_failed_target_is_left_out_of_the_index(self, pipeline, monkeypatch):
+        monkeypatch.setenv("FAIL_BUILD", "ubuntu_amd64")
+        orch, code, steps = pipeline()
+        assert code == 0
+        assert orch.status == {"ubuntu_amd64": FAIL, "arch_amd64": PASS}
+        assert not orch.summary()
+        assert "commit arch_amd64" in steps
+        assert "publish-upload app_v1.0.0_ubuntu_amd64" not in steps
+
+    def test_release_rolled_back_when_nothing_is_published(self, pipeline, monkeypatch):
+        monkeypatch.setenv("FAIL_PUBLISH", "upload")
+        orch, code, steps = pipeline(builders=["arch_amd64"])
+        assert code == 1
+        assert steps[-1] == "publish-rollback app_v1.0.0_arch_amd64"
+        assert not any(s.startswith("commit") for s in steps)
+
+    def test_failed_index_push_is_not_rolled_back_twice(self, pipeline, monkeypatch):
+        monkeypatch.setenv("FAIL_PUBLISH", "commit")
+        _, code, steps = pipeline()
+        assert code == 1
+        assert steps[-1].startswith("publish-commit")
+
+    def test_dry_run_stops_after_packaging(self, pipeline):
+        orch, code, steps = pipeline(dry_run=True)
+        assert code == 0
+        assert orch.status == {"ubuntu_amd64": PASS, "arch_amd64": PASS}
+        assert not any(s.startswith(("stage", "publish", "commit")) for s in steps)
+
+    def test_jobs_limit_builds_not_publishing(self, pipeline, monkeypatch):
+        monkeypatch.setenv("SLOW_BUILDS", "ubuntu_amd64 arch_amd64")
+        _, code, steps = pipeline(jobs=1)
+        assert code == 0
+        builds = [s for s in steps if s.startswith("build-")]
+        assert builds == ["build-start ubuntu_amd64", "build-end ubuntu_amd64",
+                          "build-start arch_amd64", "build-end arch_amd64"]
+        # The first target was published while the second one was building
+        assert steps.index("publish-upload app_v1.0.0_ubuntu_amd64") < steps.index("build-end arch_amd64")
+
+    def test_pending_record_names_the_locked_index(self, pipeline):
+        orch, _, _ = pipeline(dry_run=True)
+        with open(orch.pending) as f:
+            assert json.load(f)["index"].endswith("index.json")
+
+    def test_resume_reuses_targets_signed_by_the_failed_attempt(self, pipeline, monkeypatch,
+                                                                tmp_path):
+        runs_dir = str(tmp_path / "runs")
+        run_id = runs.start_run(runs_dir, "app", "/src/app", "new", BUILDERS, "/stage")
+        monkeypatch.setenv("FAIL_BUILD", "arch_amd64")
+        monkeypatch.setenv("FAIL_PUBLISH", "upload")
+        _, code, _ = pipeline(run_id=run_id)
+        assert code == 1
+        targets = runs.load_run(runs_dir, run_id)["targets"]
+        assert targets["ubuntu_amd64"]["state"] == runs.SIGNED
+        assert targets["arch_amd64"] == {"state": runs.FAILED, "step": "build"}
+        assert runs.load_run(runs_dir, run_id)["version"] == "1.0.0"
+
+        monkeypatch.delenv("FAIL_BUILD")
+        monkeypatch.delenv("FAIL_PUBLISH")
+        orch, code, steps = pipeline(run_id=run_id, resume=True)
+        assert code == 0
+        assert [s for s in steps if s.startswith("build-start")] == ["build-start arch_amd64"]
+        assert "publish-upload app_v1.0.0_ubuntu_amd64" in steps
+        assert runs.remaining(runs.load_run(runs_dir, run_id)) == []
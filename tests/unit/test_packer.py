@@ -0,0 +1,104 @@
+"""Unit tests for core/packer.py"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import tarfile
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+import core.packer as packer  # noqa: E402
+from core.packer import pack  # noqa: E402
+
+
+def _build_output(out_dir, payload=b"hello world\n"):
+    project = os.path.join(out_dir, "proj")
+    os.makedirs(os.path.join(project, "bin"))
+    with open(os.path.join(project, "bin", "program"), "wb") as f:
+        f.write(payload)
+    os.chmod(os.path.join(project, "bin", "program"), 0o755)
+    with open(os.path.join(project, "metadata.json"), "w") as f:
+        json.dump({"name": "proj", "version": "1.0.0"}, f)
+    return project
+
+
+class TestPack:
+    def test_archive_contains_project_tree(self):
+        with tempfile.TemporaryDirectory() as d:
+            _build_output(os.path.join(d, "out"))
+            tarball = os.path.join(d, "proj.tar.gz")
+            pack(os.path.join(d, "out"), "proj", tarball, threads=2)
+            with tarfile.open(tarball, "r:gz") as tar:
+                names = sorted(tar.getnames())
+                assert names == ["proj", "proj/bin", "proj/bin/program", "proj/metadata.json"]
+                assert tar.getmember("proj/bin/program").mode & 0o111
+
+    def test_sha256_sidecar_matches_archive(self):
+        with tempfile.TemporaryDirectory() as d:
+            _build_output(os.path.join(d, "out"))
+            tarball = os.path.join(d, "proj.tar.gz")
+            sidecar = pack(os.path.join(d, "out"), "proj", tarball)
+            with open(tarball, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with open(f"{tarball}.sha256") as f:
+                assert f.read() == f"{digest}  {tarball}\n"
+            assert sidecar["sha256"] == digest
+            assert sidecar["size"] == os.path.getsize(tarball)
+
+    def test_meta_sidecar_carries_project_metadata(self):
+        with tempfile.TemporaryDirectory() as d:
+            _build_output(os.path.join(d, "out"))
+            tarball = os.path.join(d, "proj.tar.gz")
+            pack(os.path.join(d, "out"), "proj", tarball)
+            with open(f"{tarball}.meta.json") as f:
+                meta = json.load(f)
+            assert meta["metadata"] == {"name": "proj", "version": "1.0.0"}
+            assert meta["files"] == 2
+            assert meta["archive"] == "proj.tar.gz"
+
+    def test_multi_chunk_output_is_valid_and_reproducible(self, monkeypatch):
+        monkeypatch.setattr(packer, "CHUNK_SIZE", 4096)
+        with tempfile.TemporaryDirectory() as d:
+            _build_output(os.path.join(d, "out"), payload=os.urandom(50_000))
+            out = os.path.join(d, "out")
+            first = os.path.join(d, "a.tar.gz")
+            second = os.path.join(d, "b.tar.gz")
+            meta = pack(out, "proj", first, threads=4)
+            pack(out, "proj", second, threads=1)
+            with open(first, "rb") as f1, open(second, "rb") as f2:
+                data = f1.read()
+                assert data == f2.read()
+            assert len(gzip.decompress(data)) == meta["unpacked_size"]
+
+    def test_missing_output_dir_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            with pytest.raises(FileNotFoundError):
+                pack(d, "missing", os.path.join(d, "x.tar.gz"))
+            assert os.listdir(d) == []
+
+    def test_failed_repack_leaves_no_stale_sidecars(self):
+        with tempfile.TemporaryDirectory() as d:
+            project = _build_output(os.path.join(d, "out"))
+            tarball = os.path.join(d, "proj.tar.gz")
+            pack(os.path.join(d, "out"), "proj", tarball)
+            with open(os.path.join(project, "bin", "program"), "wb") as f:
+                f.write(b"rebuilt\n")
+            with open(os.path.join(project, "metadata.json"), "w") as f:
+                f.write("{not json")
+            with pytest.raises(ValueError):
+                pack(os.path.join(d, "out"), "proj", tarball)
+            assert not os.path.exists(f"{tarball}.meta.json")
+            with open(tarball, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            with open(f"{tarball}.sha256") as f:
+                assert f.read().split()[0] == digest
+
+    def test_bad_pack_level_is_reported(self, monkeypatch, capsys):
+        monkeypatch.setenv("PACK_LEVEL", "fast")
+        monkeypatch.setattr(sys, "argv", ["packer.py", "out", "proj", "x.tar.gz"])
+        with pytest.raises(SystemExit) as exc:
+            packer.main()
+        assert "PACK_LEVEL must be a whole number" in str(exc.value)
@@ -0,0 +1,189 @@
+"""Unit tests for core/pool.py (against the tests/mocks/docker stand-in)"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.pool import (  # noqa: E402
+    acquire,
+    compose_service,
+    deps_digest,
+    drain,
+    pool_mounts,
+    release,
+    run_job,
+    spec_key,
+    status,
+)
+
+REPO = os.path.join(os.path.dirname(__file__), "..", "..")
+SCRIPT = os.path.join(REPO, "core", "pool.py")
+MOCKS = os.path.join(REPO, "tests", "mocks")
+BUILDERS = os.path.join(REPO, "builders")
+IMAGE = "local/builder:ubuntu22"
+
+
+@pytest.fixture
+def pool_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", f"{os.path.abspath(MOCKS)}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("DOCKER_MOCK_LOG", str(tmp_path / "docker.log"))
+    monkeypatch.setenv("DOCKER_MOCK_CONTAINERS", str(tmp_path / "containers"))
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _acquire(env, builder="ubuntu_amd64", image=IMAGE, **kwargs):
+    return acquire(builder, image, "", [], "copy", str(env / "pool"), **kwargs)
+
+
+def _state(env):
+    return json.loads((env / "pool" / "state.json").read_text())
+
+
+def _containers(env):
+    root = env / "containers"
+    return sorted(os.listdir(root)) if root.exists() else []
+
+
+class TestComposeService:
+    def test_reads_image_command_and_expanded_volumes(self, monkeypatch):
+        monkeypatch.setenv("WORKING_DIR", "/w")
+        monkeypatch.setenv("BUILD_ROOT", "/b")
+        monkeypatch.setenv("TOOLCHAIN_CACHE", "/c/windows_amd64")
+        spec = compose_service(os.path.join(BUILDERS, "windows_amd64-builder.yml"))
+        assert spec["image"] == "local/builder:windows-cross"
+        assert spec["command"] == "/bin/bash /startup/start.sh"
+        assert "/c/windows_amd64/cargo:/root/.cargo/registry" in spec["volumes"]
+        assert "in_progress:/in_progress" in spec["volumes"]
+
+    def test_pool_keeps_only_persistent_bind_mounts(self):
+        volumes = ["in_progress:/in_progress", "/w/data:/startup", "/b/src:/todo:ro",
+                   "/b/out:/complete", "/c:/cache"]
+        assert pool_mounts(volumes) == ["/w/data:/startup", "/c:/cache"]
+
+    def test_spec_key_depends_on_image_and_mounts(self):
+        assert spec_key("a", "", ["/x:/y"], "copy") == spec_key("a", "", ["/x:/y"], "copy")
+        assert spec_key("a", "", [], "copy") != spec_key("b", "", [], "copy")
+        assert spec_key("a", "", [], "copy") != spec_key("a", "", ["/x:/y"], "copy")
+
+
+class TestLifecycle:
+    def test_reuses_a_released_container(self, pool_env):
+        first = _acquire(pool_env)
+        release(first, str(pool_env / "pool"))
+        assert _acquire(pool_env) == first
+        assert _state(pool_env)[first]["jobs"] == 1
+        assert _containers(pool_env) == [first]
+
+    def test_recycles_after_max_jobs(self, pool_env):
+        first = _acquire(pool_env)
+        release(first, str(pool_env / "pool"), max_jobs=1)
+        assert _containers(pool_env) == []
+        assert _acquire(pool_env) != first
+
+    def test_replaces_an_unhealthy_container(self, pool_env):
+        first = _acquire(pool_env)
+        release(first, str(pool_env / "pool"))
+        os.unlink(pool_env / "containers" / first)  # container died
+        second = _acquire(pool_env)
+        assert second != first
+        assert list(_state(pool_env)) == [second]
+
+    def test_other_deps_replace_idle_container(self, pool_env):
+        src = pool_env / "src" / "a"
+        src.mkdir(parents=True)
+        assert deps_digest(str(src)) == ""
+        first = _acquire(pool_env, deps=deps_digest(str(src)))
+        release(first, str(pool_env / "pool"))
+        (src / "deps.json").write_text('{"apt": ["libssl-dev"]}')
+        second = _acquire(pool_env, deps=deps_digest(str(src)))
+        assert second != first
+        assert _containers(pool_env) == [second]
+
+    def test_other_image_replaces_idle_container(self, pool_env):
+        first = _acquire(pool_env)
+        release(first, str(pool_env / "pool"))
+        second = _acquire(pool_env, image="repcid-derived/ubuntu_amd64:abc")
+        assert _containers(pool_env) == [second]
+
+    def test_idle_timeout_removes_container(self, pool_env):
+        first = _acquire(pool_env)
+        release(first, str(pool_env / "pool"))
+        assert _acquire(pool_env, idle_timeout=-1) != first
+        assert first not in _containers(pool_env)
+
+    def test_dead_leaseholder_frees_the_container(self, pool_env):
+        first = _acquire(pool_env)
+        proc = subprocess.Popen(["true"])
+        proc.wait()  # a pid that no longer exists
+        data = _state(pool_env)
+        data[first]["lease"] = proc.pid
+        (pool_env / "pool" / "state.json").write_text(json.dumps(data))
+        assert _acquire(pool_env) == first
+
+
+class TestRunJob:
+    def test_builds_in_job_dir_and_collects_output(self, pool_env):
+        build_root = pool_env / "ns"
+        project = build_root / "src" / "hello"
+        project.mkdir(parents=True)
+        (project / "setup.sh").write_text(
+            "#!/bin/sh\nmkdir -p \"$1/out/bin\"\necho hi > \"$1/out/bin/program\"\n")
+        (build_root / "out").mkdir()
+        name = _acquire(pool_env)
+        rc = run_job(name, "hello", str(build_root), "/bin/bash /startup/start.sh",
+                     "copy", str(pool_env / "pool"))
+        assert rc == 0
+        assert (build_root / "out" / "hello" / "bin" / "program").read_text() == "hi\n"
+        # The per-job directory is gone; the container's own dir remains
+        assert os.listdir(pool_env / "pool" / name) == []
+
+
+class TestStatusAndDrain:
+    def test_status_reports_busy_and_idle(self, pool_env):
+        busy = _acquire(pool_env)
+        idle = _acquire(pool_env, builder="arch_amd64", image="local/builder:arch")
+        release(idle, str(pool_env / "pool"))
+        rows = {r["name"]: r for r in status(str(pool_env / "pool"))}
+        assert rows[busy]["state"] == "busy"
+        assert rows[idle]["state"] == "idle"
+        assert rows[idle]["healthy"] is True
+
+    def test_drain_removes_idle_and_marks_busy(self, pool_env):
+        busy = _acquire(pool_env)
+        idle = _acquire(pool_env, builder="arch_amd64", image="local/builder:arch")
+        release(idle, str(pool_env / "pool"))
+        removed, draining = drain(pool_dir=str(pool_env / "pool"))
+        assert removed == [idle]
+        assert draining == [busy]
+        release(busy, str(pool_env / "pool"))
+        assert _containers(pool_env) == []
+        assert _state(pool_env) == {}
+
+    def test_drain_removes_orphaned_containers(self, pool_env):
+        name = _acquire(pool_env)
+        (pool_env / "pool" / "state.json").write_text("{}")
+        removed, _ = drain(pool_dir=str(pool_env / "pool"))
+        assert removed == [name]
+        assert _containers(pool_env) == []
+
+    def test_drain_filters_by_builder(self, pool_env):
+        ubuntu = _acquire(pool_env)
+        release(ubuntu, str(pool_env / "pool"))
+        arch = _acquire(pool_env, builder="arch_amd64", image="local/builder:arch")
+        release(arch, str(pool_env / "pool"))
+        removed, _ = drain("arch_amd64", str(pool_env / "pool"))
+        assert removed == [arch]
+        assert _containers(pool_env) == [ubuntu]
+
+    def test_bad_env_number_is_a_clear_error(self, pool_env):
+        env = dict(os.environ, POOL_IDLE_TIMEOUT="30m")
+        proc = subprocess.run(
+            [sys.executable, SCRIPT, "--pool-dir", str(pool_env / "pool"), "status"],
+            env=env, capture_output=True, text=True,
+        )
+        assert proc.returncode == 1
+        assert "POOL_IDLE_TIMEOUT must be a number, got '30m'" in proc.stderr
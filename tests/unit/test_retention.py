@@ -0,0 +1,150 @@
+"""Unit tests for core/retention.py (repcid gc)"""
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.fsutil import file_lock  # noqa: E402
+from core.index import add_version, package_name  # noqa: E402
+from core.retention import (  # noqa: E402
+    RetentionError,
+    apply,
+    busy_projects,
+    collect,
+    orphans,
+    parse_since,
+    plan,
+    release_cleanup,
+    remove_orphans,
+)
+
+
+def _index(versions=("1.0.0", "1.1.0", "1.2.0", "2.0.0"), targets=("ubuntu_amd64",)):
+    md = {}
+    for version in versions:
+        for target in targets:
+            op_sys, arch = target.split("_")
+            add_version(md, "demo", version, op_sys, arch)
+    return md
+
+
+def _stage(staging, version, target="ubuntu_amd64"):
+    op_sys, arch = target.split("_")
+    pkg = package_name("demo", version, op_sys, arch)
+    (staging / "demo" / "signatures").mkdir(parents=True, exist_ok=True)
+    (staging / "demo" / f"{pkg}.tar.gz").write_bytes(b"x" * 100)
+    (staging / "demo" / "signatures" / f"{pkg}.tar.gz.minisig").write_text("sig")
+    (staging / "demo" / "signatures" / f"{pkg}.tar.gz.sha256").write_text("sum")
+    return pkg
+
+
+class TestPlan:
+    def test_keep_last_per_target(self):
+        md = _index()
+        assert plan(md, keep_last=2) == [("demo", "1.1.0", "ubuntu_amd64"),
+                                         ("demo", "1.0.0", "ubuntu_amd64")]
+
+    def test_target_counts_only_its_own_versions(self):
+        md = _index()
+        add_version(md, "demo", "1.0.0", "arch", "amd64")
+        # arch_amd64 only has 1.0.0, which is its latest
+        assert ("demo", "1.0.0", "arch_amd64") not in plan(md, keep_last=1)
+
+    def test_latest_is_always_kept(self):
+        md = _index(versions=("1.0.0",))
+        assert plan(md, keep_last=1, since=parse_since("2999-01-01")) == []
+
+    def test_since_keeps_recent_and_drops_undated(self):
+        md = _index()
+        md["demo"]["versions"]["1.0.0"]["published"] = "2020-01-01T00:00:00Z"
+        del md["demo"]["versions"]["1.1.0"]["published"]
+        assert plan(md, since=parse_since("2021-01-01")) == [("demo", "1.1.0", "ubuntu_amd64"),
+                                                             ("demo", "1.0.0", "ubuntu_amd64")]
+
+    def test_rules_are_a_union(self):
+        md = _index()
+        md["demo"]["versions"]["1.0.0"]["published"] = "2020-01-01T00:00:00Z"
+        md["demo"]["versions"]["1.1.0"]["published"] = "2020-01-01T00:00:00Z"
+        md["demo"]["versions"]["1.2.0"]["published"] = "2020-01-01T00:00:00Z"
+        assert plan(md, keep_last=2, since=parse_since("2021-01-01")) == [
+            ("demo", "1.1.0", "ubuntu_amd64"), ("demo", "1.0.0", "ubuntu_amd64")]
+
+    def test_rules_are_required(self):
+        with pytest.raises(RetentionError):
+            plan(_index())
+        with pytest.raises(RetentionError):
+            plan(_index(), keep_last=0)
+        with pytest.raises(RetentionError):
+            parse_since("last tuesday")
+
+
+class TestApply:
+    def test_drops_empty_versions_and_rebuilds_derived_fields(self):
+        md = _index(targets=("ubuntu_amd64", "arch_amd64"))
+        md["demo"]["latest"] = "1.0.0"  # stale
+        dropped = apply(md, [("demo", "1.0.0", "ubuntu_amd64"), ("demo", "1.0.0", "arch_amd64"),
+                             ("demo", "1.1.0", "arch_amd64")])
+        assert dropped == [("demo", "1.0.0")]
+        pkg = md["demo"]
+        assert pkg["version_order"] == ["1.1.0", "1.2.0", "2.0.0"]
+        assert list(pkg["versions"]["1.1.0"]["targets"]) == ["ubuntu_amd64"]
+        assert pkg["latest"] == "2.0.0"
+        assert pkg["latest_by_target"] == {"ubuntu_amd64": "2.0.0", "arch_amd64": "2.0.0"}
+
+
+class TestOrphans:
+    def test_unreferenced_artifacts_and_notes(self, tmp_path):
+        staging = tmp_path / "staging"
+        kept = _stage(staging, "2.0.0")
+        gone = _stage(staging, "1.0.0")
+        (staging / "index" / "notes").mkdir(parents=True)
+        (staging / "index" / "notes" / "dead.md").write_text("old notes")
+        (staging / "demo" / "README.md").write_text("not an artifact")
+        found = orphans(_index(versions=("2.0.0",)), str(staging))
+        assert sorted(os.path.basename(f) for f in found) == sorted(
+            [f"{gone}.tar.gz", f"{gone}.tar.gz.minisig", f"{gone}.tar.gz.sha256", "dead.md"])
+        assert not any(kept in f for f in found)
+
+    def test_busy_projects_are_skipped(self, tmp_path):
+        staging = tmp_path / "staging"
+        _stage(staging, "1.0.0")
+        locks = tmp_path / "locks"
+        locks.mkdir()
+        (locks / "project-other.lock").touch()
+        with file_lock(str(locks / "project-demo.lock")):
+            busy = busy_projects(str(locks))
+        assert busy == {"demo"}
+        assert orphans({}, str(staging), skip=busy) == []
+
+    def test_collect_reports_without_touching_anything(self, tmp_path):
+        staging = tmp_path / "staging"
+        for version in ("1.0.0", "1.1.0", "1.2.0", "2.0.0"):
+            _stage(staging, version)
+        md = _index()
+        report = collect(md, plan(md, keep_last=2), str(staging))
+        assert len(report["orphans"]) == 6
+        assert report["orphan_bytes"] == 2 * (100 + 3 + 3)
+        assert report["index_bytes"] > 0
+        assert len(md["demo"]["versions"]) == 4
+        remove_orphans(report["orphans"], str(staging))
+        assert sorted(os.listdir(staging / "demo")) == [
+            "demo_v1.2.0_ubuntu_amd64.tar.gz", "demo_v2.0.0_ubuntu_amd64.tar.gz", "signatures"]
+
+
+class TestReleaseCleanup:
+    def test_whole_releases_and_single_assets(self, tmp_path, monkeypatch):
+        log = tmp_path / "gh.log"
+        gh = tmp_path / "bin" / "gh"
+        gh.parent.mkdir()
+        gh.write_text(f'#!/bin/sh\necho "$*" >> "{log}"\n')
+        gh.chmod(gh.stat().st_mode | stat.S_IXUSR)
+        monkeypatch.setenv("PATH", f"{gh.parent}{os.pathsep}{os.environ['PATH']}")
+        removals = [("demo", "1.0.0", "ubuntu_amd64"), ("demo", "1.1.0", "arch_amd64")]
+        assert release_cleanup(removals, [("demo", "1.0.0")]) == []
+        calls = log.read_text().splitlines()
+        assert calls[0] == "release delete demo-v1.0.0 --yes --cleanup-tag"
+        assert calls[1:] == [
+            f"release delete-asset demo-v1.1.0 demo_v1.1.0_arch_amd64.tar.gz{ext} --yes"
+            for ext in ("", ".minisig", ".sha256")]
@@ -0,0 +1,127 @@
+"""Unit tests for core/runs.py (run manifests and resume)"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.runs import (  # noqa: E402
+    FAILED,
+    PENDING,
+    PUBLISHED,
+    SIGNED,
+    RunError,
+    finish,
+    load_run,
+    mark,
+    record_signed,
+    remaining,
+    restore,
+    reusable,
+    set_version,
+    start_run,
+)
+
+BUILDERS = ["ubuntu_amd64", "arch_amd64"]
+
+
+@pytest.fixture
+def runs_dir(tmp_path):
+    return str(tmp_path / "runs")
+
+
+def _start(runs_dir, run_id=None, builders=BUILDERS):
+    return start_run(runs_dir, "app", "/src/app", "patch", builders, "/stage", run_id)
+
+
+def _signed(tmp_path, runs_dir, run_id, builder, content=b"tarball"):
+    out = tmp_path / "out"
+    out.mkdir(exist_ok=True)
+    pkg = f"app_v1.0.1_{builder}"
+    (out / f"{pkg}.tar.gz").write_bytes(content)
+    (out / f"{pkg}.tar.gz.minisig").write_text("sig")
+    (out / f"{pkg}.tar.gz.sha256").write_text("sum")
+    return record_signed(runs_dir, run_id, builder, pkg, str(out))
+
+
+class TestManifest:
+    def test_new_run_records_every_target_pending(self, runs_dir):
+        run_id = _start(runs_dir)
+        run = load_run(runs_dir, run_id)
+        assert run_id.startswith("app-")
+        assert run["attempts"] == 1 and run["state"] == "running"
+        assert {b: t["state"] for b, t in run["targets"].items()} == {
+            "ubuntu_amd64": PENDING, "arch_amd64": PENDING}
+
+    def test_reopen_retries_failed_targets_and_keeps_the_rest(self, runs_dir):
+        run_id = _start(runs_dir)
+        mark(runs_dir, run_id, ["ubuntu_amd64"], PUBLISHED)
+        mark(runs_dir, run_id, ["arch_amd64"], FAILED, step="build")
+        assert _start(runs_dir, run_id, ["arch_amd64"]) == run_id
+        run = load_run(runs_dir, run_id)
+        assert run["attempts"] == 2
+        assert run["targets"]["arch_amd64"]["state"] == PENDING
+        assert remaining(run) == ["arch_amd64"]
+
+    def test_reopen_rejects_another_project(self, runs_dir):
+        run_id = _start(runs_dir)
+        with pytest.raises(RunError):
+            start_run(runs_dir, "other", "/src/other", "patch", BUILDERS, "/stage", run_id)
+
+    def test_version_is_fixed_once_resolved(self, runs_dir):
+        run_id = _start(runs_dir)
+        set_version(runs_dir, run_id, "1.0.1")
+        set_version(runs_dir, run_id, "1.0.1")
+        with pytest.raises(RunError):
+            set_version(runs_dir, run_id, "1.0.2")
+
+    def test_unknown_and_invalid_runs(self, runs_dir):
+        with pytest.raises(RunError):
+            load_run(runs_dir, "app-missing")
+        with pytest.raises(RunError):
+            mark(runs_dir, "../escape", ["ubuntu_amd64"], FAILED)
+
+
+class TestSignedArtifacts:
+    def test_signed_target_is_kept_and_restored(self, tmp_path, runs_dir):
+        run_id = _start(runs_dir)
+        entry = _signed(tmp_path, runs_dir, run_id, "ubuntu_amd64")
+        assert entry["state"] == SIGNED and entry["signed"]
+        # The next run of the project wipes builds/<project>/out
+        for name in os.listdir(tmp_path / "out"):
+            os.remove(tmp_path / "out" / name)
+        dest = tmp_path / "restored"
+        assert restore(runs_dir, run_id, "ubuntu_amd64", str(dest)) == "app_v1.0.1_ubuntu_amd64"
+        assert (dest / "app_v1.0.1_ubuntu_amd64.tar.gz").read_bytes() == b"tarball"
+        assert (dest / "app_v1.0.1_ubuntu_amd64.tar.gz.minisig").exists()
+
+    def test_changed_artifact_is_not_reused(self, tmp_path, runs_dir):
+        run_id = _start(runs_dir)
+        entry = _signed(tmp_path, runs_dir, run_id, "ubuntu_amd64")
+        assert reusable(entry)
+        with open(entry["artifact"], "ab") as f:
+            f.write(b"tampered")
+        assert not reusable(entry)
+        with pytest.raises(RunError):
+            restore(runs_dir, run_id, "ubuntu_amd64", str(tmp_path / "restored"))
+
+    def test_pending_target_is_not_reusable(self, tmp_path, runs_dir):
+        run_id = _start(runs_dir)
+        with pytest.raises(RunError):
+            restore(runs_dir, run_id, "arch_amd64", str(tmp_path / "restored"))
+
+    def test_finish_drops_published_artifacts(self, tmp_path, runs_dir):
+        run_id = _start(runs_dir)
+        _signed(tmp_path, runs_dir, run_id, "ubuntu_amd64")
+        _signed(tmp_path, runs_dir, run_id, "arch_amd64")
+        mark(runs_dir, run_id, ["ubuntu_amd64"], PUBLISHED)
+        assert finish(runs_dir, run_id) == "partial"
+        kept = sorted(os.listdir(os.path.join(runs_dir, run_id, "out")))
+        assert kept == [f"app_v1.0.1_arch_amd64.tar.gz{ext}" for ext in ("", ".minisig", ".sha256")]
+        mark(runs_dir, run_id, ["arch_amd64"], PUBLISHED)
+        assert finish(runs_dir, run_id) == "complete"
+        assert not os.path.exists(os.path.join(runs_dir, run_id, "out"))
+
+    def test_finish_without_progress_fails_the_run(self, runs_dir):
+        run_id = _start(runs_dir)
+        assert finish(runs_dir, run_id) == "failed"
@@ -0,0 +1,178 @@
+"""Unit tests for core/scheduler.py (publish queue daemon)"""
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.scheduler import (  # noqa: E402
+    CANCELLED,
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    QueueError,
+    Scheduler,
+    job_command,
+    parse_limits,
+    pick_next,
+    request,
+    wait_for,
+)
+
+
+def _job(project, builders=("ubuntu_amd64",)):
+    return {"project": project, "builders": list(builders)}
+
+
+class TestPickNext:
+    def test_first_queued_job_when_idle(self):
+        a, b = _job("a"), _job("b")
+        assert pick_next([a, b], [], 2, {}, 1) is a
+
+    def test_respects_worker_count(self):
+        assert pick_next([_job("b")], [_job("a", ["arch_amd64"])], 1, {}, 1) is None
+
+    def test_builder_limit_lets_other_builders_through(self):
+        busy = _job("a")
+        waiting, other = _job("b"), _job("c", ["arch_amd64"])
+        assert pick_next([waiting, other], [busy], 4, {}, 1) is other
+        assert pick_next([waiting], [busy], 4, {"ubuntu_amd64": 2}, 1) is waiting
+
+    def test_one_run_per_project_in_submit_order(self):
+        blocked = _job("a")
+        later_same_project = _job("a", ["arch_amd64"])
+        assert pick_next([blocked, later_same_project], [_job("x")], 4, {}, 1) is None
+        assert pick_next([_job("a")], [_job("a", ["arch_amd64"])], 4, {}, 1) is None
+
+    def test_parse_limits(self):
+        assert parse_limits("windows_amd64=1, ubuntu_amd64=3") == {
+            "windows_amd64": 1, "ubuntu_amd64": 3}
+        with pytest.raises(QueueError):
+            parse_limits("ubuntu_amd64")
+
+    def test_job_command_runs_repcid(self):
+        cmd = job_command({"source": "/q/src/1/app", "update_type": "patch",
+                           "builders": ["ubuntu_amd64", "arch_amd64"], "overlap": True,
+                           "notes": "hi"})
+        assert cmd[2:] == ["run", "/q/src/1/app", "patch", "-b", "ubuntu_amd64,arch_amd64",
+                           "--overlap", "--notes", "hi"]
+
+
+def _fake_command(job):
+    # Each project's setup.sh stands in for the pipeline
+    return ["sh", os.path.join(job["source"], "setup.sh")]
+
+
+@pytest.fixture
+def project(tmp_path):
+    def make(name, script="echo built\n"):
+        path = tmp_path / "projects" / name
+        path.mkdir(parents=True)
+        (path / "setup.sh").write_text(script)
+        return str(path)
+    return make
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    servers = []
+
+    def start(**kwargs):
+        sock = str(tmp_path / f"q{len(servers)}.sock")
+        server = Scheduler(sock, str(tmp_path / "queue"), command=_fake_command, **kwargs)
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05},
+                         daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _submit(server, path, builders=("ubuntu_amd64",)):
+    spec = {"project_path": path, "update_type": "patch", "builders": list(builders)}
+    return request(server.socket_path, {"op": "submit", "job": spec})["job"]
+
+
+def _drain(server, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        server.tick()
+        if not any(j["state"] in (QUEUED, RUNNING) for j in server.jobs.values()):
+            return
+        time.sleep(0.05)
+    raise AssertionError("queue did not drain")
+
+
+class TestScheduler:
+    def test_submitted_job_runs_from_a_snapshot(self, daemon, project, tmp_path):
+        server = daemon()
+        path = project("app")
+        job = _submit(server, path)
+        assert job["state"] == QUEUED
+        os.remove(os.path.join(path, "setup.sh"))  # submitter's tree may go away
+        _drain(server)
+        done = wait_for(server.socket_path, job["id"], timeout=5, interval=0.05)
+        assert done["state"] == SUCCEEDED and done["exit_code"] == 0
+        with open(done["log"]) as f:
+            assert f.read() == "built\n"
+        assert not os.path.exists(os.path.dirname(job["source"]))
+
+    def test_failed_job_reports_exit_code(self, daemon, project):
+        server = daemon()
+        job = _submit(server, project("bad", "exit 3\n"))
+        _drain(server)
+        done = request(server.socket_path, {"op": "status", "id": job["id"]})["jobs"][0]
+        assert done["state"] == FAILED and done["exit_code"] == 3
+
+    def test_builder_limit_serializes_jobs(self, daemon, project):
+        server = daemon(workers=4)
+        a = _submit(server, project("a", "sleep 0.3\n"))
+        b = _submit(server, project("b", "sleep 0.3\n"))
+        server.tick()
+        assert server.jobs[a["id"]]["state"] == RUNNING
+        assert server.jobs[b["id"]]["state"] == QUEUED
+        _drain(server)
+        assert server.jobs[b["id"]]["started"] >= server.jobs[a["id"]]["finished"]
+
+    def test_cancel_queued_and_running(self, daemon, project):
+        server = daemon(workers=1)
+        running = _submit(server, project("slow", "sleep 30\n"))
+        queued = _submit(server, project("next"), builders=["arch_amd64"])
+        server.tick()
+        reply = request(server.socket_path, {"op": "cancel", "id": queued["id"]})
+        assert reply["job"]["state"] == CANCELLED
+        request(server.socket_path, {"op": "cancel", "id": running["id"]})
+        _drain(server)
+        assert server.jobs[running["id"]]["state"] == CANCELLED
+        with pytest.raises(QueueError):
+            request(server.socket_path, {"op": "cancel", "id": running["id"]})
+
+    def test_queue_survives_a_restart(self, daemon, project, tmp_path):
+        first = daemon(workers=1)
+        running = _submit(first, project("slow", "sleep 30\n"))
+        queued = _submit(first, project("app"), builders=["arch_amd64"])
+        first.tick()
+        first.procs[running["id"]].kill()  # the daemon dies with its child
+        first.shutdown()
+        first.server_close()
+
+        second = daemon(workers=1)
+        assert second.jobs[running["id"]]["state"] == FAILED
+        assert "interrupted" in second.jobs[running["id"]]["error"]
+        assert second.jobs[queued["id"]]["state"] == QUEUED
+        _drain(second)
+        assert second.jobs[queued["id"]]["state"] == SUCCEEDED
+        with open(tmp_path / "queue" / "jobs" / f"{queued['id']}.json") as f:
+            assert json.load(f)["state"] == SUCCEEDED
+
+    def test_rejects_invalid_jobs(self, daemon, tmp_path):
+        server = daemon()
+        with pytest.raises(QueueError):
+            _submit(server, str(tmp_path / "missing"))
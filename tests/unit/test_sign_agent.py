@@ -0,0 +1,142 @@
+"""Unit tests for core/sign_agent.py"""
+import base64
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+import pytest
+
+pytest.importorskip("cryptography")
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey  # noqa: E402
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.sign_agent import (  # noqa: E402
+    AgentError,
+    SecretKey,
+    SignAgent,
+    _scrypt_params,
+    request,
+    wait_ready,
+    write_signature,
+)
+
+# Small scrypt cost so tests stay fast; the format is the same as minisign's
+TEST_OPSLIMIT = 32768
+TEST_MEMLIMIT = 1 << 20
+
+
+def _make_key(path, password, encrypted=True):
+    """Write a minisign-format secret key; returns the Ed25519 public key."""
+    private = Ed25519PrivateKey.generate()
+    seed = private.private_bytes_raw()
+    public = private.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    key_id = os.urandom(8)
+    secret = seed + public
+    checksum = hashlib.blake2b(b"Ed" + key_id + secret, digest_size=32).digest()
+    keynum_sk = bytearray(key_id + secret + checksum)
+    salt = os.urandom(32)
+    if encrypted:
+        n, r, p = _scrypt_params(TEST_OPSLIMIT, TEST_MEMLIMIT)
+        stream = hashlib.scrypt(password, salt=salt, n=n, r=r, p=p,
+                                maxmem=128 * r * (n + p + 2), dklen=len(keynum_sk))
+        keynum_sk = bytes(a ^ b for a, b in zip(keynum_sk, stream))
+    blob = (b"Ed" + (b"Sc" if encrypted else b"\0\0") + b"B2" + salt
+            + struct.pack("<QQ", TEST_OPSLIMIT, TEST_MEMLIMIT) + bytes(keynum_sk))
+    with open(path, "w") as f:
+        f.write("untrusted comment: minisign encrypted secret key\n")
+        f.write(base64.b64encode(blob).decode() + "\n")
+    return private.public_key(), key_id
+
+
+def _verify(public, key_id, file_path):
+    with open(f"{file_path}.minisig") as f:
+        lines = f.read().splitlines()
+    assert lines[0] == "untrusted comment: signature from minisign secret key"
+    sig_blob = base64.b64decode(lines[1])
+    assert sig_blob[:2] == b"ED"
+    assert sig_blob[2:10] == key_id
+    with open(file_path, "rb") as f:
+        prehash = hashlib.blake2b(f.read(), digest_size=64).digest()
+    public.verify(sig_blob[10:], prehash)
+    trusted = lines[2][len("trusted comment: "):]
+    public.verify(base64.b64decode(lines[3]), sig_blob[10:] + trusted.encode())
+    return trusted
+
+
+class TestScryptParams:
+    def test_minisign_default_limits(self):
+        # minisign encrypts with OPSLIMIT_SENSITIVE / MEMLIMIT_SENSITIVE
+        assert _scrypt_params(33554432, 1073741824) == (1 << 20, 8, 1)
+
+
+class TestSecretKey:
+    def test_signature_verifies(self):
+        with tempfile.TemporaryDirectory() as d:
+            public, key_id = _make_key(os.path.join(d, "ci.key"), b"pw")
+            key = SecretKey.load(os.path.join(d, "ci.key"), b"pw")
+            target = os.path.join(d, "pkg.tar.gz")
+            with open(target, "wb") as f:
+                f.write(b"artifact" * 1000)
+            write_signature(key, target)
+            trusted = _verify(public, key_id, target)
+            assert trusted.startswith("timestamp:")
+            assert trusted.endswith("\tfile:pkg.tar.gz\thashed")
+
+    def test_wrong_password_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            _make_key(os.path.join(d, "ci.key"), b"pw")
+            with pytest.raises(AgentError):
+                SecretKey.load(os.path.join(d, "ci.key"), b"nope")
+
+    def test_unencrypted_key(self):
+        with tempfile.TemporaryDirectory() as d:
+            public, key_id = _make_key(os.path.join(d, "ci.key"), b"", encrypted=False)
+            key = SecretKey.load(os.path.join(d, "ci.key"), b"")
+            target = os.path.join(d, "f")
+            open(target, "wb").close()
+            write_signature(key, target)
+            _verify(public, key_id, target)
+
+    def test_garbage_key_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            with open(os.path.join(d, "ci.key"), "w") as f:
+                f.write("key\n")
+            with pytest.raises(AgentError):
+                SecretKey.load(os.path.join(d, "ci.key"), b"pw")
+
+
+class TestAgent:
+    def test_signs_batch_over_socket_and_shuts_down(self):
+        with tempfile.TemporaryDirectory() as d:
+            public, key_id = _make_key(os.path.join(d, "ci.key"), b"pw")
+            key = SecretKey.load(os.path.join(d, "ci.key"), b"pw")
+            sock = os.path.join(d, "agent.sock")
+            agent = SignAgent(sock, key, jobs=2)
+            thread = threading.Thread(target=agent.serve_forever, kwargs={"poll_interval": 0.05})
+            thread.start()
+            try:
+                assert wait_ready(sock, 5)
+                assert oct(os.stat(sock).st_mode & 0o777) == "0o600"
+                files = []
+                for name in ("a.tar.gz", "index.json"):
+                    path = os.path.join(d, name)
+                    with open(path, "w") as f:
+                        f.write(name)
+                    files.append(path)
+                reply = request(sock, {"op": "sign", "files": files})
+                assert reply["signed"] == [f"{p}.minisig" for p in files]
+                for path in files:
+                    _verify(public, key_id, path)
+                with pytest.raises(AgentError):
+                    request(sock, {"op": "sign", "files": [os.path.join(d, "missing")]})
+                request(sock, {"op": "shutdown"})
+                thread.join(5)
+                assert not thread.is_alive()
+            finally:
+                agent.shutdown() if thread.is_alive() else None
+                agent.server_close()
+            assert not os.path.exists(sock)
@@ -90,6 +90,16 @@ class TestStageCLI:
                 idx = json.load(f)
             assert "3.1.4" in idx["myprog"]["versions"]
 
+    def test_explicit_prerelease_version_accepted(self):
+        with tempfile.TemporaryDirectory() as d:
+            mf = os.path.join(d, "metadata", "index.json")
+            od = os.path.join(d, "out")
+            rc, out, err, _, _ = run_stage("myprog", "new", "-b", "ubuntu_amd64",
+                                            "--version", "2.0.0-rc.1",
+                                            metadata_file=mf, out_dir=od)
+            assert rc == 0, err
+            assert out.strip().splitlines()[-1] == "myprog_v2.0.0-rc.1_ubuntu_amd64"
+
     def test_invalid_explicit_version_fails(self):
         with tempfile.TemporaryDirectory() as d:
             mf = os.path.join(d, "metadata", "index.json")
@@ -99,6 +109,11 @@ class TestStageCLI:
                                             metadata_file=mf, out_dir=od)
             assert rc != 0
 
+    def test_reserved_package_name_fails(self):
+        rc, out, err, mf, _ = run_stage("_index", "new", "-b", "ubuntu_amd64")
+        assert rc != 0
+        assert "reserved for index markers" in err
+
     def test_builder_os_arch_reflected_in_pkg_name(self):
         with tempfile.TemporaryDirectory() as d:
             mf = os.path.join(d, "metadata", "index.json")
@@ -172,3 +187,72 @@ class TestStageCLI:
             assert rc == 0, err
             assert os.path.exists(custom_mf)
             assert os.path.exists(custom_od)
+
+
+class TestStageBatch:
+    def test_batch_new_stages_all_targets_at_one_version(self):
+        with tempfile.TemporaryDirectory() as d:
+            mf = os.path.join(d, "metadata", "index.json")
+            od = os.path.join(d, "out")
+            rc, out, err, _, _ = run_stage("myprog", "new", "--builders", "ubuntu_amd64,arch_amd64",
+                                            metadata_file=mf, out_dir=od)
+            assert rc == 0, err
+            with open(mf) as f:
+                idx = json.load(f)
+            targets = idx["myprog"]["versions"]["1.0.0"]["targets"]
+            assert sorted(targets) == ["arch_amd64", "ubuntu_amd64"]
+            lines = [ln for ln in out.splitlines() if "\t" in ln]
+            assert lines == [
+                "ubuntu_amd64\tmyprog_v1.0.0_ubuntu_amd64",
+                "arch_amd64\tmyprog_v1.0.0_arch_amd64",
+            ]
+            for line in lines:
+                assert os.path.exists(os.path.join(od, line.split("\t")[1] + "_md.json"))
+
+    def test_batch_patch_bumps_once_for_all_targets(self):
+        with tempfile.TemporaryDirectory() as d:
+            mf = os.path.join(d, "metadata", "index.json")
+            od = os.path.join(d, "out")
+            run_stage("myprog", "new", "--builders", "ubuntu_amd64,arch_amd64",
+                      metadata_file=mf, out_dir=od)
+            rc, out, err, _, _ = run_stage("myprog", "patch", "--builders", "ubuntu_amd64,arch_amd64",
+                                            metadata_file=mf, out_dir=od)
+            assert rc == 0, err
+            with open(mf) as f:
+                idx = json.load(f)
+            assert idx["myprog"]["latest"] == "1.0.1"
+            assert sorted(idx["myprog"]["versions"]) == ["1.0.0", "1.0.1"]
+            assert sorted(idx["myprog"]["versions"]["1.0.1"]["targets"]) == ["arch_amd64", "ubuntu_amd64"]
+
+    def test_batch_skips_already_published_target(self):
+        with tempfile.TemporaryDirectory() as d:
+            mf = os.path.join(d, "metadata", "index.json")
+            od = os.path.join(d, "out")
+            run_stage("myprog", "new", "-b", "ubuntu_amd64", "--version", "2.0.0",
+                      metadata_file=mf, out_dir=od)
+            rc, out, err, _, _ = run_stage("myprog", "patch", "--builders", "ubuntu_amd64,arch_amd64",
+                                            "--version", "2.0.0",
+                                            metadata_file=mf, out_dir=od)
+            assert rc == 0, err
+            assert "nothing to do" in out
+            lines = [ln for ln in out.splitlines() if "\t" in ln]
+            assert lines == ["arch_amd64\tmyprog_v2.0.0_arch_amd64"]
+
+    def test_batch_nothing_to_stage_leaves_index_untouched(self):
+        with tempfile.TemporaryDirectory() as d:
+            mf = os.path.join(d, "metadata", "index.json")
+            od = os.path.join(d, "out")
+            run_stage("myprog", "new", "--builders", "ubuntu_amd64,arch_amd64", "--version", "2.0.0",
+                      metadata_file=mf, out_dir=od)
+            with open(mf) as f:
+                before = f.read()
+            for name in os.listdir(od):
+                os.unlink(os.path.join(od, name))
+            rc, out, err, _, _ = run_stage("myprog", "patch", "--builders", "ubuntu_amd64,arch_amd64",
+                                            "--version", "2.0.0",
+                                            metadata_file=mf, out_dir=od)
+            assert rc == 0, err
+            assert "has been staged" not in out
+            with open(mf) as f:
+                assert f.read() == before
+            assert os.listdir(od) == []
@@ -0,0 +1,129 @@
+"""Unit tests for index locking, stage.py --pending and core/stage_commit.py"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.fsutil import LockTimeout, file_lock  # noqa: E402
+from core.index import index_lock, index_lock_path, load_index  # noqa: E402
+from core.packer import pack  # noqa: E402
+from core.stage_commit import CommitError, commit_pending  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+STAGE_SCRIPT = os.path.join(REPO_ROOT, "core", "stage.py")
+
+
+@pytest.fixture(autouse=True)
+def _no_inherited_lock(monkeypatch):
+    monkeypatch.delenv("INDEX_LOCK_HELD", raising=False)
+
+
+def _stage(tmp_path, name, *extra, builders="ubuntu_amd64"):
+    return subprocess.Popen(
+        [sys.executable, STAGE_SCRIPT, name, "new", "--builders", builders,
+         "--metadata-file", str(tmp_path / "metadata" / "index.json"),
+         "--out-dir", str(tmp_path / "out" / name), *extra],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+
+
+def _pending(tmp_path, name="demo", version="1.0.0", targets=(("ubuntu", "amd64"),)):
+    return {
+        "index": str(tmp_path / "metadata" / "index.json"),
+        "name": name,
+        "version": version,
+        "url": f"https://example.com/{name}-v{version}",
+        "notes": None,
+        "targets": [list(t) for t in targets],
+    }
+
+
+class TestIndexLock:
+    def test_times_out_while_held(self, tmp_path):
+        index = str(tmp_path / "index.json")
+        with file_lock(index_lock_path(index)):
+            with pytest.raises(LockTimeout):
+                with index_lock(index, timeout=0.1):
+                    pass
+
+    def test_skipped_when_held_by_parent(self, tmp_path, monkeypatch):
+        index = str(tmp_path / "index.json")
+        monkeypatch.setenv("INDEX_LOCK_HELD", "1")
+        with file_lock(index_lock_path(index)):
+            with index_lock(index, timeout=0):
+                pass
+
+    def test_concurrent_stage_runs_keep_every_package(self, tmp_path):
+        names = [f"pkg{i}" for i in range(6)]
+        procs = [_stage(tmp_path, name) for name in names]
+        for proc in procs:
+            _, err = proc.communicate()
+            assert proc.returncode == 0, err
+        assert sorted(load_index(str(tmp_path / "metadata" / "index.json"))) == names
+
+
+class TestPendingStage:
+    def test_pending_leaves_index_untouched(self, tmp_path):
+        pending = tmp_path / "stage.json"
+        proc = _stage(tmp_path, "demo", "--pending", str(pending),
+                      builders="ubuntu_amd64,arch_amd64")
+        out, err = proc.communicate()
+        assert proc.returncode == 0, err
+        assert "ubuntu_amd64\tdemo_v1.0.0_ubuntu_amd64" in out
+        assert load_index(str(tmp_path / "metadata" / "index.json")) == {}
+        record = json.loads(pending.read_text())
+        assert record["version"] == "1.0.0"
+        assert record["targets"] == [["ubuntu", "amd64"], ["arch", "amd64"]]
+        assert (tmp_path / "out" / "demo" / "demo_v1.0.0_arch_amd64_md.json").exists()
+
+
+class TestCommitPending:
+    def test_merges_into_an_index_changed_meanwhile(self, tmp_path):
+        pending = _pending(tmp_path)
+        # Another project publishes after this run reserved its version
+        proc = _stage(tmp_path, "other")
+        assert proc.wait() == 0
+        commit_pending(pending)
+        index = load_index(pending["index"])
+        assert sorted(index) == ["demo", "other"]
+        assert index["demo"]["latest"] == "1.0.0"
+
+    def test_builders_limit_the_commit(self, tmp_path):
+        pending = _pending(tmp_path, targets=(("ubuntu", "amd64"), ("arch", "amd64")))
+        assert commit_pending(pending, ["arch_amd64"]) == [("arch", "amd64")]
+        targets = load_index(pending["index"])["demo"]["versions"]["1.0.0"]["targets"]
+        assert list(targets) == ["arch_amd64"]
+
+    def test_conflict_writes_nothing(self, tmp_path):
+        commit_pending(_pending(tmp_path))
+        before = (tmp_path / "metadata" / "index.json").read_text()
+        both = _pending(tmp_path, targets=(("arch", "amd64"), ("ubuntu", "amd64")))
+        with pytest.raises(CommitError):
+            commit_pending(both)
+        assert (tmp_path / "metadata" / "index.json").read_text() == before
+
+    def test_artifacts_are_inlined_into_the_targets(self, tmp_path):
+        (tmp_path / "build" / "demo").mkdir(parents=True)
+        (tmp_path / "build" / "demo" / "bin").write_bytes(b"demo")
+        out = tmp_path / "out"
+        meta = pack(str(tmp_path / "build"), "demo", str(out / "demo_v1.0.0_ubuntu_amd64.tar.gz"))
+        (out / "demo_v1.0.0_ubuntu_amd64.tar.gz.minisig").write_text("sig\n")
+        commit_pending(_pending(tmp_path), artifacts_dir=str(out))
+        target = load_index(str(tmp_path / "metadata" / "index.json"))["demo"]["versions"][
+            "1.0.0"]["targets"]["ubuntu_amd64"]
+        assert target["digest"] == meta["sha256"]
+        assert target["sha256"] == "demo_v1.0.0_ubuntu_amd64.tar.gz.sha256"
+        assert (target["size"], target["unpacked_size"]) == (meta["size"], meta["unpacked_size"])
+        assert target["minisig"] == "sig\n"
+
+    def test_missing_artifact_writes_nothing(self, tmp_path):
+        with pytest.raises(OSError):
+            commit_pending(_pending(tmp_path), artifacts_dir=str(tmp_path / "out"))
+        assert not (tmp_path / "metadata" / "index.json").exists()
+
+    def test_nothing_to_commit(self, tmp_path):
+        with pytest.raises(CommitError):
+            commit_pending(_pending(tmp_path), ["arch_amd64"])
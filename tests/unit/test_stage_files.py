@@ -0,0 +1,99 @@
+"""Unit tests for core/stage_files.py and the fsutil placement helpers"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core import fsutil  # noqa: E402
+from core.stage_files import stage_packages  # noqa: E402
+
+PKGS = ("test_v1.0.0_ubuntu_amd64", "test_v1.0.0_arch_amd64")
+
+
+def _artifacts(out_dir, pkg, size=1000, sidecar=True):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, f"{pkg}.tar.gz"), "wb") as f:
+        f.write(b"x" * size)
+    for suffix in (".minisig", ".sha256") + ((".meta.json",) if sidecar else ()):
+        with open(os.path.join(out_dir, f"{pkg}.tar.gz{suffix}"), "w") as f:
+            f.write("s")
+
+
+class TestLinkOrCopy:
+    def test_hardlinks_on_same_filesystem(self):
+        with tempfile.TemporaryDirectory() as d:
+            src, dst = os.path.join(d, "a"), os.path.join(d, "b")
+            with open(src, "w") as f:
+                f.write("data")
+            assert fsutil.link_or_copy(src, dst) == "hardlink"
+            assert os.path.samefile(src, dst)
+
+    def test_existing_link_is_left_alone(self):
+        with tempfile.TemporaryDirectory() as d:
+            src, dst = os.path.join(d, "a"), os.path.join(d, "b")
+            with open(src, "w") as f:
+                f.write("data")
+            os.link(src, dst)
+            assert fsutil.link_or_copy(src, dst) == "hardlink"
+            assert os.path.samefile(src, dst)
+
+    def test_falls_back_to_copy(self, monkeypatch):
+        def _no_link(*_):
+            raise OSError(18, "Invalid cross-device link")
+        monkeypatch.setattr(fsutil.os, "link", _no_link)
+        monkeypatch.setattr(fsutil, "reflink", lambda src, dst: False)
+        with tempfile.TemporaryDirectory() as d:
+            src, dst = os.path.join(d, "a"), os.path.join(d, "b")
+            with open(src, "w") as f:
+                f.write("data")
+            assert fsutil.link_or_copy(src, dst) == "copy"
+            assert not os.path.samefile(src, dst)
+            with open(dst) as f:
+                assert f.read() == "data"
+
+    def test_failed_reflink_leaves_no_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            src, dst = os.path.join(d, "a"), os.path.join(d, "b")
+            with open(src, "w") as f:
+                f.write("data")
+            if not fsutil.reflink(src, dst):
+                assert not os.path.exists(dst)
+
+
+class TestStagePackages:
+    def test_places_artifacts_in_staging_layout(self):
+        with tempfile.TemporaryDirectory() as d:
+            out, staging = os.path.join(d, "out"), os.path.join(d, "staging")
+            for pkg in PKGS:
+                _artifacts(out, pkg)
+            stage_packages(staging, out, list(PKGS))
+            for pkg in PKGS:
+                assert os.path.isfile(os.path.join(staging, "test", f"{pkg}.tar.gz"))
+                assert os.path.isfile(os.path.join(staging, "test", f"{pkg}.tar.gz.meta.json"))
+                assert os.path.isfile(os.path.join(staging, "test", "signatures", f"{pkg}.tar.gz.minisig"))
+                assert os.path.isfile(os.path.join(staging, "test", "signatures", f"{pkg}.tar.gz.sha256"))
+
+    def test_links_tarballs_and_copies_sidecars(self):
+        with tempfile.TemporaryDirectory() as d:
+            out, staging = os.path.join(d, "out"), os.path.join(d, "staging")
+            for pkg in PKGS:
+                _artifacts(out, pkg, size=1000)
+            totals = stage_packages(staging, out, list(PKGS))
+            assert totals["hardlink"] == {"files": 2, "bytes": 2000}
+            assert totals["copy"] == {"files": 6, "bytes": 6}
+            sig = os.path.join(staging, "test", "signatures", f"{PKGS[0]}.tar.gz.minisig")
+            assert not os.path.samefile(sig, os.path.join(out, f"{PKGS[0]}.tar.gz.minisig"))
+
+    def test_sidecar_is_optional(self):
+        with tempfile.TemporaryDirectory() as d:
+            out, staging = os.path.join(d, "out"), os.path.join(d, "staging")
+            _artifacts(out, PKGS[0], sidecar=False)
+            totals = stage_packages(staging, out, [PKGS[0]])
+            assert sum(t["files"] for t in totals.values()) == 3
+
+    def test_missing_artifact_raises(self):
+        with tempfile.TemporaryDirectory() as d:
+            with pytest.raises(FileNotFoundError, match=PKGS[0]):
+                stage_packages(os.path.join(d, "staging"), d, [PKGS[0]])
@@ -0,0 +1,83 @@
+"""Unit tests for core/toolchain_cache.py"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.toolchain_cache import TOOLCHAINS, begin, entries, prune, stats  # noqa: E402
+
+
+def _write(path, content="x", age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    if age:
+        past = time.time() - age
+        os.utime(path, (past, past))
+
+
+class TestBegin:
+    def test_creates_toolchain_dirs(self):
+        with tempfile.TemporaryDirectory() as d:
+            begin(os.path.join(d, "ubuntu_amd64"))
+            assert sorted(os.listdir(os.path.join(d, "ubuntu_amd64"))) == sorted(TOOLCHAINS)
+
+    def test_resets_atime_to_mtime(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "b", "pip", "http", "blob")
+            _write(path, age=100)
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            begin(os.path.join(d, "b"))
+            st = os.stat(path)
+            assert st.st_atime == st.st_mtime
+
+
+class TestStats:
+    def test_counts_reads_as_hits_and_writes_as_misses(self):
+        with tempfile.TemporaryDirectory() as d:
+            builder = os.path.join(d, "b")
+            hit = os.path.join(builder, "pip", "hit")
+            idle = os.path.join(builder, "pip", "idle")
+            _write(hit, age=100)
+            _write(idle, age=100)
+            since = begin(builder)
+            # Simulate the build: one cached file read, one new file written
+            now = time.time() + 1
+            os.utime(hit, (now, os.stat(hit).st_mtime))
+            _write(os.path.join(builder, "pip", "new"))
+            result = stats(builder, since)
+            assert result["pip"]["hits"] == 1
+            assert result["pip"]["misses"] == 1
+            assert result["pip"]["files"] == 3
+            assert result["go-mod"] == {"hits": 0, "misses": 0, "files": 0, "bytes": 0}
+
+    def test_marks_touched_toolchains_as_used(self):
+        with tempfile.TemporaryDirectory() as d:
+            builder = os.path.join(d, "b")
+            since = begin(builder)
+            _write(os.path.join(builder, "go-mod", "m"))
+            stats(builder, since)
+            assert os.path.exists(os.path.join(builder, "go-mod", ".last_used"))
+            assert not os.path.exists(os.path.join(builder, "pip", ".last_used"))
+
+
+class TestPrune:
+    def test_evicts_least_recently_used_toolchain(self):
+        with tempfile.TemporaryDirectory() as d:
+            now = time.time()
+            for age, builder, toolchain in ((300, "a", "pip"), (200, "a", "go-mod"), (100, "b", "pip")):
+                root = os.path.join(d, builder, toolchain)
+                _write(os.path.join(root, "blob"), "x" * 100)
+                marker = os.path.join(root, ".last_used")
+                _write(marker)
+                os.utime(marker, (now - age, now - age))
+            evicted = prune(d, 250)
+            assert evicted == [os.path.join("a", "pip")]
+            assert sorted(os.path.relpath(p, d) for _, _, p in entries(d)) == [
+                os.path.join("a", "go-mod"), os.path.join("b", "pip")]
+
+    def test_under_cap_evicts_nothing(self):
+        with tempfile.TemporaryDirectory() as d:
+            _write(os.path.join(d, "a", "pip", "blob"), "x" * 10)
+            assert prune(d, 1024) == []
@@ -0,0 +1,126 @@
+"""Unit tests for core/uploader.py (against the tests/mocks/gh stand-in)"""
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+from core.uploader import UploadError, local_digest, plan, upload  # noqa: E402
+
+MOCKS = os.path.join(os.path.dirname(__file__), "..", "mocks")
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "..", "core", "uploader.py")
+TAG = "test-v1.0.0"
+
+
+@pytest.fixture
+def gh_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", f"{os.path.abspath(MOCKS)}{os.pathsep}{os.environ['PATH']}")
+    state = tmp_path / "gh_state.json"
+    state.write_text(json.dumps({"releases": {TAG: {"title": "t", "assets": []}}}))
+    monkeypatch.setenv("GH_MOCK_STATE", str(state))
+    monkeypatch.setenv("GH_MOCK_LOG", str(tmp_path / "gh.log"))
+    return tmp_path
+
+
+def _assets(env):
+    state = json.loads((env / "gh_state.json").read_text())
+    return {a["name"]: a for a in state["releases"][TAG]["assets"]}
+
+
+def _upload_calls(env):
+    log = env / "gh.log"
+    return [l for l in log.read_text().splitlines() if "release upload" in l] if log.exists() else []
+
+
+def _files(env, n=3):
+    paths = []
+    for i in range(n):
+        path = env / f"pkg{i}.tar.gz"
+        path.write_bytes(f"artifact-{i}".encode() * 100)
+        paths.append(str(path))
+    return paths
+
+
+class TestLocalDigest:
+    def test_hashes_file(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "a")
+            with open(path, "wb") as f:
+                f.write(b"data")
+            assert local_digest(path) == f"sha256:{hashlib.sha256(b'data').hexdigest()}"
+
+    def test_ignores_stale_sidecar_of_the_same_size(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "a.tar.gz")
+            with open(path, "wb") as f:
+                f.write(b"data")
+            with open(f"{path}.meta.json", "w") as f:
+                json.dump({"sha256": "ab" * 32, "size": 4}, f)
+            assert local_digest(path) == f"sha256:{hashlib.sha256(b'data').hexdigest()}"
+
+
+class TestPlan:
+    def test_remote_without_digest_is_reuploaded(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "a")
+            open(path, "wb").close()
+            to_upload, unchanged = plan([path], {"a": {"size": 0, "digest": None}})
+            assert to_upload == [path] and unchanged == []
+
+
+class TestUpload:
+    def test_uploads_all_then_skips_identical(self, gh_env):
+        files = _files(gh_env)
+        result = upload(TAG, files, jobs=3, retries=0, backoff=0)
+        assert sorted(result["uploaded"]) == ["pkg0.tar.gz", "pkg1.tar.gz", "pkg2.tar.gz"]
+        assert _assets(gh_env)["pkg1.tar.gz"]["digest"] == local_digest(files[1])
+
+        (gh_env / "gh.log").unlink()
+        result = upload(TAG, files, jobs=3, retries=0, backoff=0)
+        assert result["uploaded"] == []
+        assert len(result["skipped"]) == 3
+        assert _upload_calls(gh_env) == []
+
+    def test_changed_asset_is_replaced(self, gh_env):
+        files = _files(gh_env)
+        upload(TAG, files, jobs=2, retries=0, backoff=0)
+        with open(files[0], "ab") as f:
+            f.write(b"rebuilt")
+        result = upload(TAG, files, jobs=2, retries=0, backoff=0)
+        assert result["uploaded"] == ["pkg0.tar.gz"]
+        assert len(_assets(gh_env)) == 3
+        assert _assets(gh_env)["pkg0.tar.gz"]["digest"] == local_digest(files[0])
+
+    def test_transient_failure_is_retried(self, gh_env, monkeypatch):
+        monkeypatch.setenv("GH_MOCK_UPLOAD_FAILURES", "2")
+        result = upload(TAG, _files(gh_env, 1), jobs=1, retries=2, backoff=0)
+        assert result["failed"] == {}
+        assert len(_upload_calls(gh_env)) == 3
+
+    def test_exhausted_retries_are_reported(self, gh_env, monkeypatch):
+        monkeypatch.setenv("GH_MOCK_FAIL_OP", "upload")
+        result = upload(TAG, _files(gh_env, 2), jobs=2, retries=1, backoff=0)
+        assert sorted(result["failed"]) == ["pkg0.tar.gz", "pkg1.tar.gz"]
+        assert result["uploaded"] == []
+        assert len(_upload_calls(gh_env)) == 4
+
+    def test_missing_release_raises(self, gh_env):
+        with pytest.raises(UploadError):
+            upload("nope-v0.0.1", _files(gh_env, 1), retries=0, backoff=0)
+
+    def test_missing_file_raises(self, gh_env):
+        with pytest.raises(UploadError):
+            upload(TAG, [str(gh_env / "absent.tar.gz")], retries=0, backoff=0)
+
+
+class TestMain:
+    def test_bad_env_number_is_a_clear_error(self):
+        env = dict(os.environ, UPLOAD_RETRIES="3x")
+        proc = subprocess.run([sys.executable, SCRIPT, TAG, "pkg.tar.gz"],
+                              env=env, capture_output=True, text=True)
+        assert proc.returncode == 1
+        assert "uploader: UPLOAD_RETRIES must be a whole number, got '3x'" in proc.stderr